@@ -5,23 +5,31 @@ FastAPI Web应用 - 后端 API
 """
 
 import os
+import json
 import base64
+import shutil
+import asyncio
 import tempfile
 import threading
-from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 import uuid
 from fastapi import FastAPI, UploadFile, File, HTTPException, Response, Body
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from picture_to_text import PictureToText, HEIC_SUPPORT
+from ocr_backends import create_ocr_backend
+from image_utils import HEIC_SUPPORT, heic_to_jpeg, heic_cache_stats
 from text_processor import TextProcessor
 from text_to_speech import TextToSpeech
 from task_manager import task_manager, TaskStatus
-from PIL import Image
+from http_pool import http_pool
+from phash_index import PerceptualHashIndex, text_signature
+from result_cache import sha256_file
+from audio_assembly import AudioAssemblyError, assemble_audio, slice_audio
 import glob
 import time
 
@@ -69,11 +77,25 @@ async def add_cors_header(request, call_next):
         response.headers["Access-Control-Allow-Credentials"] = "true"
     return response
 
+@app.on_event("shutdown")
+async def close_http_clients():
+    """关闭异步上游客户端的 keep-alive 连接"""
+    await http_pool.aclose()
+
 # 配置
 UPLOAD_FOLDER = 'Picture books'
 USER_UPLOAD_FOLDER = 'static/uploads'
 AUDIO_FOLDER = 'static/audio'
 MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
+MAX_BATCH_FILES = 32  # 批量上传单次最多页数
+LLM_STREAM = os.getenv('LLM_STREAM', '1') == '1'  # 流式文本处理，分段完成即开始合成语音
+TTS_STREAM_WORKERS = int(os.getenv('TTS_STREAM_WORKERS', '4'))  # 每个任务同时合成的音频数（全局上限见 TTS_MAX_CONCURRENCY）
+TTS_ASSEMBLE_MAIN = os.getenv('TTS_ASSEMBLE_MAIN', '1') == '1'  # 完整正文的音频由分段音频拼接，不再单独合成
+TTS_SSML_BATCH = os.getenv('TTS_SSML_BATCH', '0') == '1'  # 一页的指导语和分段放进一个 SSML 文档一次合成，按时间点切分
+TTS_LAZY = os.getenv('TTS_LAZY', '0') == '1'  # 任务在文本处理后即完成，音频在第一次播放时才合成
+TTS_PREFETCH = int(os.getenv('TTS_PREFETCH', '1'))  # 按需合成某一段时，在后台预取其后的分段数
+TASK_VOICE_NAME = "ja-JP-Neural2-B"
+TASK_SPEAKING_RATE = 0.75
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'heic', 'heif', 'gif', 'bmp'}
 
 # 确保目录存在
@@ -94,6 +116,7 @@ class TTSRequest(BaseModel):
     voice_name: Optional[str] = "ja-JP-Neural2-B"
     model: Optional[str] = None
     speaking_rate: Optional[float] = 0.75
+    url_only: Optional[bool] = False  # 只返回缓存音频的静态 URL，不返回 base64
 
 
 class TTSAudioRequest(BaseModel):
@@ -104,11 +127,11 @@ class TTSAudioRequest(BaseModel):
 ocr = None
 text_processor = None
 try:
-    ocr = PictureToText()
-    print("✅ OCR 模块已初始化")
+    ocr = create_ocr_backend()
+    print(f"✅ OCR 模块已初始化 (后端: {ocr.name})")
 except Exception as e:
     print(f"⚠️  OCR 模块初始化失败: {str(e)}")
-    print("   提示：需要设置 GOOGLE_CLOUD_API_KEY 环境变量")
+    print("   提示：需要设置 GOOGLE_CLOUD_API_KEY 环境变量，或设置 OCR_BACKEND=local 使用本地 OCR")
 
 try:
     text_processor = TextProcessor()
@@ -117,6 +140,9 @@ except Exception as e:
     print(f"⚠️  文本处理模块初始化失败: {str(e)}")
     print("   提示：需要设置 SUPER_MIND_API_KEY 或 AI_BUILDER_TOKEN 环境变量")
 
+# 页面感知哈希索引：同一页面重拍时复用已完成的结果（默认关闭，候选页面需经内容哈希或 OCR 文本确认）
+phash_index = PerceptualHashIndex() if os.getenv('PHASH_REUSE', '0') == '1' else None
+
 # 初始化TTS（如果可用）
 tts = None
 try:
@@ -143,31 +169,659 @@ def secure_filename(filename: str) -> str:
     return filename
 
 
-def process_image_task(task_id: str, image_path: str):
+def pin_cached_audio(url: str, audio_path: str) -> bool:
+    """
+    把音频缓存中的文件硬链接（跨文件系统时复制）为任务文件
+    
+    缓存目录超出上限时会删除最久未使用的文件，任务结果和复用的结果不能直接引用缓存 URL；
+    硬链接不额外占用空间，缓存淘汰后任务文件仍然可用
+    
+    Returns:
+        是否成功（缓存文件已被淘汰时返回 False）
+    """
+    tmp_path = f"{audio_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            os.link(url.lstrip('/'), tmp_path)
+        except OSError:
+            shutil.copyfile(url.lstrip('/'), tmp_path)
+        os.replace(tmp_path, audio_path)
+        return True
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def synthesize_to_file(text: str, audio_filename: str) -> Optional[str]:
+    """
+    合成日语语音并保存到音频目录（audio_filename）
+    
+    启用音频缓存时由缓存文件硬链接得到任务文件（pin_cached_audio），同一段文本仍然只合成一次，
+    缓存淘汰不会让已完成任务的音频 URL 失效
+    
+    Args:
+        text: 要朗读的文本
+        audio_filename: 保存的文件名
+        
+    Returns:
+        音频 URL，合成失败时返回 None
+    """
+    tts_result = tts.synthesize_japanese(
+        text=text,
+        voice_name=TASK_VOICE_NAME,
+        speaking_rate=TASK_SPEAKING_RATE,
+        output_format="mp3"
+    )
+    if 'error' in tts_result:
+        return None
+    
+    audio_path = os.path.join(AUDIO_FOLDER, audio_filename)
+    if not (tts_result.get('audio_url') and pin_cached_audio(tts_result['audio_url'], audio_path)):
+        with open(audio_path, 'wb') as f:
+            f.write(tts_result['audio_content'])
+    return f'/static/audio/{audio_filename}'
+
+
+class TaskAudio:
+    """
+    单个任务的语音合成：文本一确定就提交合成，不必等整个文本处理结束
+    - 每个任务最多 TTS_STREAM_WORKERS 段同时合成，所有任务共用 TextToSpeech 的全局并发上限
+    - 每段完成时立即更新进度（progress.tts_items / tts_done / tts_total）和部分结果中的 audio_urls
+    - 记录从任务开始到第一段音频生成的时间（time_to_first_audio）
+    - 完整正文可以由分段音频拼接（assemble），同时得到各分段在正文音频中的偏移表（audio_offsets）
+    - TTS_SSML_BATCH 模式下一页只请求一次 TTS（submit_marked），再按 <mark> 时间点在本地切出各段
+    """
+    
+    def __init__(self, task_id: str, task_start: float):
+        self.task_id = task_id
+        self.task_start = task_start
+        self.executor = ThreadPoolExecutor(max_workers=TTS_STREAM_WORKERS)
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Tuple[str, Future]] = {}
+        self.states: Dict[str, str] = {}
+        self.audio_urls: Dict[str, str] = {}
+        self.audio_offsets: Dict[str, List[Dict]] = {}
+        self.first_audio_recorded = False
+        self.batch: Optional[Tuple[str, Future]] = None
+    
+    def _set_state(self, key: str, state: str, url: Optional[str] = None):
+        """记录一段音频的状态（pending / processing / completed / failed）并发布进度"""
+        with self.lock:
+            self.states[key] = state
+            if url:
+                self.audio_urls[key] = url
+            done = sum(1 for s in self.states.values() if s in ('completed', 'failed'))
+            task_manager.update_progress(self.task_id, {
+                'tts_items': {key: state},
+                'tts_done': done,
+                'tts_total': len(self.states)
+            })
+            if url:
+                task_manager.update_partial_result(self.task_id, {'audio_urls': dict(self.audio_urls)})
+    
+    def _synthesize(self, key: str, text: str) -> Optional[str]:
+        self._set_state(key, 'processing')
+        try:
+            url = synthesize_to_file(text, f"{self.task_id}_{key}.mp3")
+        except Exception as e:
+            print(f"[任务 {self.task_id}] 音频 {key} 合成失败: {str(e)}")
+            url = None
+        self._set_state(key, 'completed' if url else 'failed', url)
+        if url:
+            self._record_first_audio()
+        return url
+    
+    def _record_first_audio(self):
+        with self.lock:
+            first = not self.first_audio_recorded
+            self.first_audio_recorded = True
+        if first:
+            elapsed = time.time() - self.task_start
+            print(f"[任务 {self.task_id}] 首段音频已生成，距任务开始 {elapsed:.2f} 秒")
+            task_manager.update_task_metrics(self.task_id, {'time_to_first_audio': round(elapsed, 3)})
+    
+    def _publish_offsets(self, key: str, offsets: List[Dict]):
+        with self.lock:
+            self.audio_offsets[key] = offsets
+            task_manager.update_partial_result(self.task_id, {'audio_offsets': dict(self.audio_offsets)})
+    
+    def submit(self, key: str, text: str):
+        """
+        提交一段文本的合成（同一 key 相同文本只合成一次）
+        
+        Args:
+            key: 音频名称（segment_0 / main / instruction），也是 audio_urls 的键
+            text: 要朗读的文本
+        """
+        if not text or not text.strip():
+            return
+        with self.lock:
+            previous = self.jobs.get(key)
+            if previous and previous[0] == text:
+                return
+        if previous:
+            # 文本有变化时先等旧任务写完文件，避免新旧结果互相覆盖
+            previous[1].result()
+        self._set_state(key, 'pending')
+        future = self.executor.submit(self._synthesize, key, text)
+        with self.lock:
+            self.jobs[key] = (text, future)
+    
+    def _assemble(self, key: str, part_keys: List[str], part_futures: List[Future],
+                  fallback_text: str) -> Optional[str]:
+        """拼接已完成的分段（由 _chain_assemble 在全部分段完成后提交，不在线程池中等待）"""
+        self._set_state(key, 'processing')
+        urls = []
+        for future in part_futures:
+            url = None if future.exception() else future.result()
+            if not url:
+                break
+            urls.append(url)
+        
+        try:
+            if len(urls) < len(part_keys):
+                raise AudioAssemblyError("有分段音频合成失败")
+            parts = []
+            for url in urls:
+                with open(url.lstrip('/'), 'rb') as f:
+                    parts.append(f.read())
+            audio, offsets = assemble_audio(parts, "mp3")
+            audio_filename = f"{self.task_id}_{key}.mp3"
+            with open(os.path.join(AUDIO_FOLDER, audio_filename), 'wb') as f:
+                f.write(audio)
+        except (OSError, AudioAssemblyError) as e:
+            # 拼接不了时退回到整段合成（在当前线程中完成，不再占用线程池）
+            print(f"[任务 {self.task_id}] 音频 {key} 无法由分段拼接（{str(e)}），改为整段合成")
+            return self._synthesize(key, fallback_text)
+        
+        for part_key, offset in zip(part_keys, offsets):
+            offset['key'] = part_key
+        self._publish_offsets(key, offsets)
+        url = f'/static/audio/{audio_filename}'
+        self._set_state(key, 'completed', url)
+        return url
+    
+    def _chain_assemble(self, key: str, part_keys: List[str], part_futures: List[Future],
+                        fallback_text: str) -> Future:
+        """
+        全部分段完成后（done-callback）再把拼接提交到线程池，等待分段时不占用线程，
+        与分段的完成顺序和线程数无关（TTS_STREAM_WORKERS=1 时也不会互相等待）
+        
+        Returns:
+            拼接结果（音频 URL，失败时为 None）的 Future
+        """
+        result = Future()
+        remaining = [len(part_futures)]
+        
+        def finish(done: Future):
+            result.set_result(None if done.exception() else done.result())
+        
+        def on_part_done(_):
+            with self.lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                self.executor.submit(self._assemble, key, part_keys, part_futures, fallback_text) \
+                    .add_done_callback(finish)
+            except RuntimeError:
+                # 任务已结束（线程池已关闭）
+                self._set_state(key, 'failed')
+                result.set_result(None)
+        
+        for future in part_futures:
+            future.add_done_callback(on_part_done)
+        return result
+    
+    def assemble(self, key: str, part_keys: List[str], fallback_text: str):
+        """
+        提交一条由分段音频拼接的音轨（等分段合成完成后在本地拼接，段间静音见 TTS_SEGMENT_SILENCE_MS）
+        
+        拼接使用此刻各分段的合成任务；之后某个分段换了文本时，再次调用会重新拼接
+        
+        Args:
+            key: 音频名称（main）
+            part_keys: 按朗读顺序排列的分段名称（需已提交）
+            fallback_text: 有分段失败或无法拼接时直接合成的文本
+        """
+        if not part_keys:
+            self.submit(key, fallback_text)
+            return
+        with self.lock:
+            parts = [self.jobs.get(part_key) for part_key in part_keys]
+            previous = self.jobs.get(key)
+        if not all(parts):
+            self.submit(key, fallback_text)
+            return
+        # 标记包含各分段的文本：分段重新提交后，相同的 part_keys 也会重新拼接
+        marker = json.dumps([fallback_text, part_keys, [text for text, _ in parts]], ensure_ascii=False)
+        if previous and previous[0] == marker:
+            return
+        if previous:
+            # 与 submit 相同：先等旧任务写完文件和偏移表，避免旧的拼接结果覆盖新的
+            previous[1].result()
+        self._set_state(key, 'pending')
+        future = self._chain_assemble(key, part_keys, [future for _, future in parts], fallback_text)
+        with self.lock:
+            self.jobs[key] = (marker, future)
+    
+    def _save_slice(self, key: str, text: str, audio: bytes) -> Optional[str]:
+        """保存切出的一段音频为任务文件，分段同时写入音频缓存（与逐段合成的结果共用）"""
+        if key != 'main':
+            tts.cache_audio(text, audio, TASK_VOICE_NAME, TASK_SPEAKING_RATE, "mp3")
+        audio_filename = f"{self.task_id}_{key}.mp3"
+        with open(os.path.join(AUDIO_FOLDER, audio_filename), 'wb') as f:
+            f.write(audio)
+        return f'/static/audio/{audio_filename}'
+    
+    def _synthesize_marked(self, parts: List[Tuple[str, str]], main_keys: List[str], main_text: str,
+                           futures: Dict[str, Future]):
+        keys = [key for key, _ in parts] + ['main']
+        for key in keys:
+            self._set_state(key, 'processing')
+        try:
+            result = tts.synthesize_marked(parts, TASK_VOICE_NAME, TASK_SPEAKING_RATE, "mp3")
+            if 'error' in result:
+                raise AudioAssemblyError(result['error'])
+            
+            # 每段从自己的 <mark> 到下一段的 <mark>；完整正文从第一个分段到最后一个分段结束
+            starts = [result['timepoints'][key] for key, _ in parts]
+            ends = starts[1:] + [None]
+            positions = [i for i, (key, _) in enumerate(parts) if key in main_keys]
+            ranges = list(zip(starts, ends)) + [(starts[positions[0]], ends[positions[-1]])]
+            slices = slice_audio(result['audio_content'], result['audio_format'], ranges)
+            
+            urls = {key: self._save_slice(key, text, audio) for (key, text), (audio, _, _) in zip(parts, slices)}
+            main_audio, main_start, _ = slices[-1]
+            urls['main'] = self._save_slice('main', main_text, main_audio)
+        except Exception as e:
+            print(f"[任务 {self.task_id}] SSML 合成失败（{str(e)}），改为逐段合成")
+            self._fallback_each(parts, main_keys, main_text, futures)
+            return
+        
+        self._publish_offsets('main', [
+            {'index': index, 'key': parts[i][0], 'start': round(slices[i][1] - main_start, 3),
+             'end': round(slices[i][2] - main_start, 3)}
+            for index, i in enumerate(positions)
+        ])
+        for key in keys:
+            self._set_state(key, 'completed', urls[key])
+            futures[key].set_result(urls[key])
+        self._record_first_audio()
+        print(f"[任务 {self.task_id}] SSML 一次合成 {len(parts)} 段音频并在本地切分")
+    
+    def _fallback_each(self, parts: List[Tuple[str, str]], main_keys: List[str], main_text: str,
+                       futures: Dict[str, Future]):
+        """退回逐段合成，结果转交给 submit_marked 登记的 Future（正文按配置拼接或整段合成）"""
+        jobs = [(key, self._synthesize, (key, text)) for key, text in parts]
+        if not TTS_ASSEMBLE_MAIN:
+            jobs.append(('main', self._synthesize, ('main', main_text)))
+        for key, function, args in jobs:
+            target = futures[key]
+            try:
+                future = self.executor.submit(function, *args)
+            except RuntimeError:
+                # 任务已结束（线程池已关闭）
+                self._set_state(key, 'failed')
+                target.set_result(None)
+                continue
+            future.add_done_callback(
+                lambda done, target=target: target.set_result(None if done.exception() else done.result())
+            )
+        if TTS_ASSEMBLE_MAIN:
+            self._chain_assemble('main', main_keys, [futures[key] for key in main_keys], main_text) \
+                .add_done_callback(lambda done: futures['main'].set_result(done.result()))
+    
+    def submit_marked(self, parts: List[Tuple[str, str]], main_keys: List[str], main_text: str):
+        """
+        一次 SSML 请求合成多段音频：每段前插入 <mark>，按返回的时间点在本地切出各段，
+        完整正文（main）取 main_keys 覆盖的范围，同时得到偏移表；
+        各段都已命中缓存时直接逐段提交，请求失败或无法切分时退回逐段合成
+        
+        Args:
+            parts: (音频名称, 文本) 列表，按朗读顺序
+            main_keys: 组成完整正文的分段名称（需包含在 parts 中）
+            main_text: 退回逐段合成时完整正文的文本
+        """
+        parts = [(key, text) for key, text in parts if text and text.strip()]
+        main_keys = [key for key, _ in parts if key in main_keys]
+        if not main_keys:
+            for key, text in parts:
+                self.submit(key, text)
+            self.submit('main', main_text)
+            return
+        if tts.cache is not None and all(
+                tts.lookup_cached(text, TASK_VOICE_NAME, TASK_SPEAKING_RATE, "mp3") for _, text in parts):
+            for key, text in parts:
+                self.submit(key, text)
+            if TTS_ASSEMBLE_MAIN:
+                self.assemble('main', main_keys, main_text)
+            else:
+                self.submit('main', main_text)
+            return
+        
+        marker = json.dumps([parts, main_keys, main_text], ensure_ascii=False)
+        with self.lock:
+            previous = self.batch
+        if previous and previous[0] == marker:
+            return
+        if previous:
+            previous[1].result()
+        
+        futures = {key: Future() for key, _ in parts + [('main', main_text)]}
+        for key in futures:
+            self._set_state(key, 'pending')
+        with self.lock:
+            for key, text in parts:
+                self.jobs[key] = (text, futures[key])
+            self.jobs['main'] = (marker, futures['main'])
+            self.batch = (marker, self.executor.submit(self._synthesize_marked, parts, main_keys,
+                                                       main_text, futures))
+    
+    def submit_page(self, processed_text: Dict):
+        """
+        提交一页的全部音频：分段、完整正文和指导语（已提交的相同文本不会重复合成）
+        
+        Args:
+            processed_text: 文本处理结果（或拆分模式下先完成的日语部分）
+        """
+        segments = processed_text.get('segments', [])
+        segment_keys = [f'segment_{idx}' for idx in range(len(segments))]
+        main_text = processed_text.get('main_text', '') or processed_text.get('japanese_text', '')
+        instruction = processed_text.get('instruction', '')
+        if TTS_SSML_BATCH and segment_keys:
+            self.submit_marked([('instruction', instruction)] + list(zip(segment_keys, segments)),
+                               segment_keys, main_text)
+            return
+        
+        for key, segment in zip(segment_keys, segments):
+            self.submit(key, segment)
+        if TTS_ASSEMBLE_MAIN:
+            self.assemble('main', segment_keys, main_text)
+        else:
+            self.submit('main', main_text)
+        self.submit('instruction', instruction)
+    
+    def results(self) -> Dict[str, str]:
+        """等待所有合成完成，返回 key → 音频 URL（按提交顺序，跳过失败的）"""
+        try:
+            audio_urls = {}
+            for key, (_, future) in list(self.jobs.items()):
+                url = future.result()
+                if url:
+                    audio_urls[key] = url
+            return audio_urls
+        finally:
+            self.shutdown()
+    
+    def shutdown(self):
+        """释放线程池（已提交的合成继续完成）"""
+        self.executor.shutdown(wait=False)
+
+
+def page_audio_texts(processed_text: Dict) -> Dict[str, str]:
+    """
+    一页的音频名称 → 朗读文本（指导语、完整正文、各分段，跳过空文本）
+    
+    Args:
+        processed_text: 文本处理结果
+    """
+    texts = {
+        'instruction': processed_text.get('instruction', ''),
+        'main': processed_text.get('main_text', '') or processed_text.get('japanese_text', '')
+    }
+    for idx, segment in enumerate(processed_text.get('segments', [])):
+        texts[f'segment_{idx}'] = segment
+    return {key: text for key, text in texts.items() if text and text.strip()}
+
+
+def lazy_audio_url(task_id: str, key: str) -> str:
+    """按需合成模式下的占位音频 URL"""
+    return f'/api/task/{task_id}/audio/{key}'
+
+
+class LazyAudio:
+    """
+    按需合成（TTS_LAZY）：任务只返回占位 URL，某段音频第一次被请求时才合成
+    - 同一任务同一段的并发请求合并为一次合成（single-flight），后到的请求等待同一个结果
+    - 请求某个分段时，在后台预取其后 TTS_PREFETCH 段，顺序播放时下一段通常已经就绪
+    - 合成结果写入音频缓存，已合成的 URL 按 LRU 保留最近的 max_entries 条
+    """
+    
+    def __init__(self, prefetch: int = TTS_PREFETCH, max_entries: int = 4096):
+        self.prefetch = prefetch
+        self.max_entries = max_entries
+        self.executor = ThreadPoolExecutor(max_workers=TTS_STREAM_WORKERS)
+        self.lock = threading.Lock()
+        self.inflight: Dict[Tuple[str, str], Future] = {}
+        self.urls: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._stats = {
+            'requests': 0,
+            'ready': 0,
+            'coalesced': 0,
+            'synthesized': 0,
+            'prefetched': 0,
+            'failed': 0
+        }
+    
+    def _claim(self, name: Tuple[str, str], prefetch: bool) -> Tuple[Optional[str], Optional[Future], bool]:
+        """
+        查找已合成的 URL 或正在进行的合成，都没有时登记一个新的合成（调用方需持有锁）
+        
+        Returns:
+            (已合成的 URL, 合成的 Future, 是否由调用方负责合成)
+        """
+        url = self.urls.get(name)
+        if url and os.path.exists(url.lstrip('/')):
+            self.urls.move_to_end(name)
+            return url, None, False
+        future = self.inflight.get(name)
+        if future is not None:
+            return None, future, False
+        future = Future()
+        self.inflight[name] = future
+        self._stats['prefetched' if prefetch else 'synthesized'] += 1
+        return None, future, True
+    
+    def _synthesize(self, name: Tuple[str, str], text: str, future: Future) -> Optional[str]:
+        task_id, key = name
+        try:
+            url = synthesize_to_file(text, f"{task_id}_{key}.mp3")
+        except Exception as e:
+            print(f"[任务 {task_id}] 音频 {key} 按需合成失败: {str(e)}")
+            url = None
+        with self.lock:
+            del self.inflight[name]
+            if url:
+                self.urls[name] = url
+                while len(self.urls) > self.max_entries:
+                    self.urls.popitem(last=False)
+            else:
+                self._stats['failed'] += 1
+        future.set_result(url)
+        return url
+    
+    def _request(self, name: Tuple[str, str]) -> Tuple[Optional[str], Optional[Future], bool]:
+        """登记一次请求并查找已合成的 URL 或正在进行的合成（见 _claim）"""
+        with self.lock:
+            self._stats['requests'] += 1
+            url, future, leader = self._claim(name, prefetch=False)
+            if url:
+                self._stats['ready'] += 1
+            elif not leader:
+                self._stats['coalesced'] += 1
+        return url, future, leader
+    
+    def get(self, task_id: str, key: str, text: str) -> Optional[str]:
+        """
+        获取一段音频的 URL，未合成时合成（同一段同时只合成一次，正在预取时等待预取结果）
+        
+        Args:
+            task_id: 任务ID
+            key: 音频名称（segment_0 / main / instruction）
+            text: 朗读文本
+            
+        Returns:
+            音频 URL，合成失败时返回 None
+        """
+        name = (task_id, key)
+        url, future, leader = self._request(name)
+        if url:
+            return url
+        if leader:
+            return self._synthesize(name, text, future)
+        return future.result()
+    
+    async def get_async(self, task_id: str, key: str, text: str) -> Optional[str]:
+        """
+        get 的异步版本：合成在 LazyAudio 自己的线程池中进行，等待合成（包括合并的并发请求）时
+        只挂起协程，不占用 FastAPI 的线程池
+        """
+        name = (task_id, key)
+        url, future, leader = self._request(name)
+        if url:
+            return url
+        if leader:
+            self.executor.submit(self._synthesize, name, text, future)
+        return await asyncio.wrap_future(future)
+    
+    def prefetch_after(self, task_id: str, key: str, texts: Dict[str, str]):
+        """
+        在后台合成 key 之后的 prefetch 个分段（已合成或正在合成的跳过）
+        
+        预取在返回前就已登记，紧接着到来的请求会等待同一个合成，不会重复请求
+        """
+        if not key.startswith('segment_'):
+            return
+        index = int(key.split('_', 1)[1])
+        for offset in range(1, self.prefetch + 1):
+            name = (task_id, f'segment_{index + offset}')
+            if name[1] not in texts:
+                break
+            with self.lock:
+                _, future, leader = self._claim(name, prefetch=True)
+            if leader:
+                self.executor.submit(self._synthesize, name, texts[name[1]], future)
+    
+    def stats(self) -> Dict:
+        """按需合成统计：请求数、已就绪、合并的并发请求、合成和预取次数"""
+        with self.lock:
+            stats = dict(self._stats)
+            stats['inflight'] = len(self.inflight)
+            stats['entries'] = len(self.urls)
+        stats['enabled'] = TTS_LAZY
+        stats['prefetch'] = self.prefetch
+        return stats
+
+
+lazy_audio = LazyAudio()
+
+
+def _audio_files_exist(result: Dict) -> bool:
+    """检查结果中引用的音频文件是否仍然存在（按需合成的占位 URL 要求来源任务仍然存在）"""
+    for url in result.get('audio_urls', {}).values():
+        if url.startswith('/api/task/'):
+            if task_manager.get_task(url.split('/')[3]) is None:
+                return False
+        elif not os.path.exists(url.lstrip('/')):
+            return False
+    return True
+
+
+def page_content_hash(image_path: str) -> Optional[str]:
+    """页面文件内容的 SHA-256（用于确认感知哈希候选），文件无法读取时返回 None"""
+    try:
+        return sha256_file(image_path)
+    except OSError:
+        return None
+
+
+def reuse_similar_result(task_id: str, page_hash: Optional[int], content_hash: Optional[str] = None,
+                         signature: Optional[str] = None) -> bool:
+    """
+    如果索引中有同一页面（重拍）的已完成结果，直接复用
+    感知哈希相近的页面只是候选，需要文件内容哈希或 OCR 文本签名相同才复用
+    
+    Args:
+        task_id: 任务ID
+        page_hash: 上传时计算的页面哈希
+        content_hash: 页面文件内容的 SHA-256（OCR 之前确认）
+        signature: OCR 文本签名（OCR 之后确认）
+        
+    Returns:
+        是否已复用结果并完成任务
+    """
+    if phash_index is None or page_hash is None:
+        return False
+    
+    match = phash_index.find(page_hash, content_hash=content_hash, signature=signature)
+    if match is None or not _audio_files_exist(match['result']):
+        return False
+    
+    print(f"[任务 {task_id}] 复用相似页面的结果 (来源任务 {match['task_id']}, 相似度 {match['similarity']:.2%})")
+    task_manager.update_task_metrics(task_id, {
+        'phash_match': {
+            'similarity': round(match['similarity'], 4),
+            'confirmed_by': match['confirmed_by'],
+            'source_task_id': match['task_id'],
+            'source_filename': match['filename']
+        }
+    })
+    task_manager.update_task_status(
+        task_id,
+        TaskStatus.COMPLETED,
+        progress={'ocr': 'completed', 'text_processing': 'completed', 'tts': 'completed'},
+        result=match['result']
+    )
+    return True
+
+
+def process_image_task(task_id: str, image_path: str, ocr_result: Optional[Dict] = None,
+                       page_hash: Optional[int] = None):
     """
     后台线程处理图片任务
     执行 OCR -> 文本处理 -> TTS 生成流程
+    
+    Args:
+        task_id: 任务ID
+        image_path: 图片路径
+        ocr_result: 已有的OCR结果（批量上传时由批量OCR提供），为 None 时在此执行OCR
+        page_hash: 页面感知哈希，匹配到重拍的同一页面（经内容哈希或 OCR 文本确认）时直接复用结果，完成后登记到索引
     """
+    task_start = time.time()
     try:
         # 更新状态：开始处理
         task_manager.update_task_status(task_id, TaskStatus.PROCESSING)
         
+        # 文件内容完全相同时不必 OCR；否则在 OCR 之后按文本签名确认
+        content_hash = page_content_hash(image_path) if phash_index is not None and page_hash is not None else None
+        if ocr_result is None and reuse_similar_result(task_id, page_hash, content_hash=content_hash):
+            return
+        
         # Step 1: OCR识别
-        if ocr is None:
+        if ocr_result is None:
+            if ocr is None:
+                task_manager.update_task_status(
+                    task_id,
+                    TaskStatus.FAILED,
+                    error="OCR 模块未初始化，请检查 GOOGLE_CLOUD_API_KEY 环境变量"
+                )
+                return
+            
             task_manager.update_task_status(
-                task_id,
-                TaskStatus.FAILED,
-                error="OCR 模块未初始化，请检查 GOOGLE_CLOUD_API_KEY 环境变量"
+                task_id, 
+                TaskStatus.PROCESSING,
+                progress={'ocr': 'processing'}
             )
-            return
-        
-        task_manager.update_task_status(
-            task_id, 
-            TaskStatus.PROCESSING,
-            progress={'ocr': 'processing'}
-        )
+            
+            ocr_result = ocr.extract_text(image_path, detection_type="DOCUMENT_TEXT_DETECTION")
         
-        ocr_result = ocr.extract_text(image_path, detection_type="DOCUMENT_TEXT_DETECTION")
+        # 记录上传给 OCR 的图片体积（预处理前后），本地识别时记录引擎名称
+        if ocr_result.get('payload'):
+            task_manager.update_task_metrics(task_id, {'ocr_payload': ocr_result['payload']})
+        if ocr_result.get('engine'):
+            task_manager.update_task_metrics(task_id, {'ocr_engine': ocr_result['engine']})
         
         if 'error' in ocr_result:
             task_manager.update_task_status(
@@ -177,13 +831,18 @@ def process_image_task(task_id: str, image_path: str):
             )
             return
         
+        signature = text_signature(ocr_result.get('full_text'))
+        if reuse_similar_result(task_id, page_hash, signature=signature):
+            return
+        
         task_manager.update_task_status(
             task_id,
             TaskStatus.OCR_COMPLETED,
             progress={'ocr': 'completed'}
         )
         
-        # Step 2: 文本处理
+        # Step 2: 文本处理（流式模式下，每个分段一完成就开始合成语音）
+        task_audio = TaskAudio(task_id, task_start) if tts and not TTS_LAZY else None
         processed_text = None
         if ocr_result.get('full_text'):
             if text_processor is None:
@@ -201,11 +860,30 @@ def process_image_task(task_id: str, image_path: str):
                 
                 print(f"[任务 {task_id}] 开始文本处理...")
                 text_processing_start = time.time()
-                processed_text = text_processor.process_ocr_text(ocr_result.get('full_text', ''))
+                if LLM_STREAM:
+                    def on_text_event(event: str, data: Dict):
+                        if event == 'segment' and task_audio and not TTS_SSML_BATCH:
+                            task_audio.submit(f"segment_{data['index']}", data['text'])
+                        elif event == 'japanese_result':
+                            # 拆分模式：日语部分先完成，翻译返回前就发布结果并开始合成完整正文和指导语
+                            ready = time.time() - task_start
+                            print(f"[任务 {task_id}] 日语结果已发布，距任务开始 {ready:.2f} 秒")
+                            task_manager.update_partial_result(task_id, {'processed_text': data})
+                            task_manager.update_task_metrics(task_id, {'japanese_ready_time': round(ready, 3)})
+                            if task_audio:
+                                task_audio.submit_page(data)
+                    
+                    processed_text = text_processor.process_ocr_text_stream(
+                        ocr_result.get('full_text', ''), on_event=on_text_event
+                    )
+                else:
+                    processed_text = text_processor.process_ocr_text(ocr_result.get('full_text', ''))
                 text_processing_duration = time.time() - text_processing_start
                 print(f"[任务 {task_id}] 文本处理完成，耗时: {text_processing_duration:.2f} 秒")
             
             if processed_text.get('error'):
+                if task_audio:
+                    task_audio.shutdown()
                 task_manager.update_task_status(
                     task_id,
                     TaskStatus.FAILED,
@@ -221,78 +899,35 @@ def process_image_task(task_id: str, image_path: str):
         
         # Step 3: TTS生成（如果TTS可用且有文本）
         audio_urls = {}
-        if tts and processed_text:
+        audio_offsets = {}
+        if task_audio and processed_text:
             task_manager.update_task_status(
                 task_id,
                 TaskStatus.TTS_GENERATING,
                 progress={'tts': 'processing'}
             )
             
-            # 为每个分段生成音频
-            segments = processed_text.get('segments', [])
-            if segments:
-                for idx, segment in enumerate(segments):
-                    if segment.strip():
-                        tts_result = tts.synthesize_japanese(
-                            text=segment,
-                            voice_name="ja-JP-Neural2-B",
-                            speaking_rate=0.75,
-                            output_format="mp3"
-                        )
-                        
-                        if 'error' not in tts_result:
-                            # 保存音频文件
-                            audio_filename = f"{task_id}_segment_{idx}.mp3"
-                            audio_path = os.path.join(AUDIO_FOLDER, audio_filename)
-                            
-                            with open(audio_path, 'wb') as f:
-                                f.write(tts_result['audio_content'])
-                            
-                            audio_urls[f'segment_{idx}'] = f'/static/audio/{audio_filename}'
+            # 分段音频（流式模式下已提前开始的分段不会重复合成）、完整正文和指导语
+            task_audio.submit_page(processed_text)
             
-            # 为完整正文生成音频
-            main_text = processed_text.get('main_text', '') or processed_text.get('japanese_text', '')
-            if main_text.strip():
-                tts_result = tts.synthesize_japanese(
-                    text=main_text,
-                    voice_name="ja-JP-Neural2-B",
-                    speaking_rate=0.75,
-                    output_format="mp3"
-                )
-                
-                if 'error' not in tts_result:
-                    audio_filename = f"{task_id}_main.mp3"
-                    audio_path = os.path.join(AUDIO_FOLDER, audio_filename)
-                    
-                    with open(audio_path, 'wb') as f:
-                        f.write(tts_result['audio_content'])
-                    
-                    audio_urls['main'] = f'/static/audio/{audio_filename}'
-            
-            # 为指导语生成音频（如果有）
-            instruction = processed_text.get('instruction', '')
-            if instruction.strip():
-                tts_result = tts.synthesize_japanese(
-                    text=instruction,
-                    voice_name="ja-JP-Neural2-B",
-                    speaking_rate=0.75,
-                    output_format="mp3"
-                )
-                
-                if 'error' not in tts_result:
-                    audio_filename = f"{task_id}_instruction.mp3"
-                    audio_path = os.path.join(AUDIO_FOLDER, audio_filename)
-                    
-                    with open(audio_path, 'wb') as f:
-                        f.write(tts_result['audio_content'])
-                    
-                    audio_urls['instruction'] = f'/static/audio/{audio_filename}'
+            audio_urls = task_audio.results()
+            audio_offsets = task_audio.audio_offsets
             
             task_manager.update_task_status(
                 task_id,
                 TaskStatus.TTS_GENERATING,
                 progress={'tts': 'completed'}
             )
+        elif task_audio:
+            task_audio.shutdown()
+        elif tts and TTS_LAZY and processed_text:
+            # 按需合成：只返回占位 URL，第一次播放时才合成
+            audio_urls = {key: lazy_audio_url(task_id, key) for key in page_audio_texts(processed_text)}
+            task_manager.update_task_status(
+                task_id,
+                TaskStatus.TTS_GENERATING,
+                progress={'tts': 'completed', 'tts_mode': 'lazy'}
+            )
         
         # 组装最终结果
         result = {
@@ -302,7 +937,8 @@ def process_image_task(task_id: str, image_path: str):
                 'language': ocr_result.get('language', [])
             },
             'processed_text': processed_text,
-            'audio_urls': audio_urls
+            'audio_urls': audio_urls,
+            'audio_offsets': audio_offsets
         }
         
         # 更新任务为完成状态
@@ -312,6 +948,11 @@ def process_image_task(task_id: str, image_path: str):
             result=result
         )
         
+        if phash_index is not None and page_hash is not None:
+            task = task_manager.get_task(task_id)
+            phash_index.add(page_hash, result, task_id, task['filename'] if task else image_path,
+                            content_hash=content_hash, signature=signature)
+        
     except Exception as e:
         # 处理异常
         task_manager.update_task_status(
@@ -321,6 +962,57 @@ def process_image_task(task_id: str, image_path: str):
         )
 
 
+def process_batch_task(tasks: List[Tuple[str, str, Optional[int]]]):
+    """
+    后台线程处理批量上传
+    所有页面通过一次（或少数几次）批量OCR请求识别，之后每页独立进入文本处理和TTS流程
+    与已完成页面相似（重拍）的页面直接复用结果，不参与批量OCR
+    
+    Args:
+        tasks: (task_id, image_path, page_hash) 列表，顺序与上传顺序一致
+    """
+    tasks = [task for task in tasks if not reuse_similar_result(task[0], task[2])]
+    if not tasks:
+        return
+    
+    if ocr is None:
+        for task_id, _, _ in tasks:
+            task_manager.update_task_status(
+                task_id,
+                TaskStatus.FAILED,
+                error="OCR 模块未初始化，请检查 GOOGLE_CLOUD_API_KEY 环境变量"
+            )
+        return
+    
+    for task_id, _, _ in tasks:
+        task_manager.update_task_status(
+            task_id,
+            TaskStatus.PROCESSING,
+            progress={'ocr': 'processing'}
+        )
+    
+    try:
+        ocr_results = ocr.extract_text_batch(
+            [image_path for _, image_path, _ in tasks],
+            detection_type="DOCUMENT_TEXT_DETECTION"
+        )
+    except Exception as e:
+        for task_id, _, _ in tasks:
+            task_manager.update_task_status(
+                task_id,
+                TaskStatus.FAILED,
+                error=f"处理失败: {str(e)}"
+            )
+        return
+    
+    # 每页的文本处理和TTS并行进行
+    for (task_id, image_path, page_hash), ocr_result in zip(tasks, ocr_results):
+        thread = threading.Thread(target=process_image_task,
+                                  args=(task_id, image_path, ocr_result, page_hash))
+        thread.daemon = True
+        thread.start()
+
+
 @app.get("/")
 def root():
     """根路径 - 如果有前端构建文件，返回前端页面；否则返回 API 信息"""
@@ -335,17 +1027,40 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "upload": "/api/upload",
+            "upload_batch": "/api/upload/batch",
             "task": "/api/task/{task_id}",
+            "task_audio": "/api/task/{task_id}/audio/{key}",
             "tts": "/api/tts",
             "tts_audio": "/api/tts/audio",
             "ocr": "/api/ocr/{filename}",
-            "images": "/images/{filename}"
+            "images": "/images/{filename}",
+            "stats": "/api/stats"
         }
     }
 
 
+@app.get("/api/stats")
+def api_stats():
+    """API端点 - 获取缓存等运行统计信息"""
+    return {
+        'success': True,
+        'ocr_cache': ocr.cache_stats() if ocr else {'enabled': False},
+        'ocr_routing': ocr.stats() if hasattr(ocr, 'stats') else None,
+        'llm_cache': text_processor.cache_stats() if text_processor else {'enabled': False},
+        'llm_models': text_processor.router_stats() if text_processor else {'enabled': False},
+        'llm_fuzzy_index': text_processor.fuzzy_index_stats() if text_processor else {'enabled': False},
+        'translation_memory': text_processor.translation_memory_stats() if text_processor else {'enabled': False},
+        'heic_cache': heic_cache_stats(),
+        'tts_cache': tts.cache_stats() if tts else {'enabled': False},
+        'tts_concurrency': tts.concurrency_stats() if tts else {'enabled': False},
+        'tts_lazy': lazy_audio.stats(),
+        'http_pools': http_pool.stats(),
+        'phash_index': phash_index.stats() if phash_index else {'enabled': False}
+    }
+
+
 @app.get("/api/ocr/{filename:path}")
-def api_ocr(filename: str):
+async def api_ocr(filename: str):
     """API端点 - 获取单个图片的OCR结果"""
     if ocr is None:
         raise HTTPException(
@@ -359,7 +1074,7 @@ def api_ocr(filename: str):
         raise HTTPException(status_code=404, detail="文件不存在")
     
     try:
-        result = ocr.extract_text(image_path, detection_type="DOCUMENT_TEXT_DETECTION")
+        result = await ocr.extract_text_async(image_path, detection_type="DOCUMENT_TEXT_DETECTION")
         return {
             'success': True,
             'filename': filename,
@@ -395,40 +1110,33 @@ def serve_image(filename: str):
             if not HEIC_SUPPORT:
                 raise HTTPException(status_code=500, detail="HEIC 格式不支持，请安装 pillow-heif")
             
-            img = Image.open(image_path)
-            
-            # 转换为 RGB 模式
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = rgb_img
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # 创建临时字节流
-            img_io = BytesIO()
-            img.save(img_io, 'JPEG', quality=95)
-            img_io.seek(0)
+            # 共享的内存转换缓存：同一文件只解码一次
+            jpeg_data = heic_to_jpeg(image_path, quality=95)
             
             return Response(
-                content=img_io.getvalue(),
+                content=jpeg_data,
                 media_type='image/jpeg',
                 headers={
                     'Content-Disposition': f'inline; filename={os.path.splitext(filename)[0]}.jpg'
                 }
             )
+        except HTTPException:
+            raise
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f'HEIC 转换失败: {str(e)}')
+            raise HTTPException(status_code=500, detail=str(e))
     else:
         # 其他格式直接返回
         return FileResponse(image_path)
 
 
 @app.post("/api/tts")
-def api_tts(data: TTSRequest):
-    """API端点 - 将日语文本转换为音频（返回 base64）"""
+async def api_tts(data: TTSRequest):
+    """
+    API端点 - 将日语文本转换为音频（返回 base64）
+    
+    同一段文本和语音参数命中音频缓存时不再请求 TTS API；响应中的 audio_url 是缓存文件的固定 URL，
+    url_only 为 true 时只返回 URL，客户端可以直接播放并由浏览器缓存
+    """
     if not tts:
         raise HTTPException(
             status_code=503,
@@ -439,8 +1147,8 @@ def api_tts(data: TTSRequest):
         if not data.text:
             raise HTTPException(status_code=400, detail='文本内容为空')
         
-        # 调用TTS API
-        result = tts.synthesize_japanese(
+        # 调用TTS API（异步，不占用线程池）
+        result = await tts.synthesize_japanese_async(
             text=data.text,
             voice_name=data.voice_name or "ja-JP-Neural2-B",
             speaking_rate=data.speaking_rate or 0.75,
@@ -451,16 +1159,18 @@ def api_tts(data: TTSRequest):
         if "error" in result:
             raise HTTPException(status_code=500, detail=result['error'])
         
-        # 返回音频数据（base64编码）
-        audio_base64 = base64.b64encode(result['audio_content']).decode('utf-8')
-        
-        return {
+        response = {
             'success': True,
-            'audio_data': audio_base64,
             'audio_format': result['audio_format'],
             'voice_name': result['voice_name'],
-            'model': result.get('model', 'default')
+            'model': result.get('model', 'default'),
+            'audio_url': result.get('audio_url'),
+            'cache_hit': result.get('cache_hit', False)
         }
+        # 返回音频数据（base64编码）；只要 URL 且缓存文件存在时省略
+        if not (data.url_only and result.get('audio_url')):
+            response['audio_data'] = base64.b64encode(result['audio_content']).decode('utf-8')
+        return response
     
     except HTTPException:
         raise
@@ -469,7 +1179,7 @@ def api_tts(data: TTSRequest):
 
 
 @app.post("/api/tts/audio")
-def api_tts_audio(data: TTSAudioRequest):
+async def api_tts_audio(data: TTSAudioRequest):
     """API端点 - 直接返回音频文件（用于HTML5 audio标签）"""
     if not tts:
         raise HTTPException(
@@ -481,8 +1191,8 @@ def api_tts_audio(data: TTSAudioRequest):
         if not data.text:
             raise HTTPException(status_code=400, detail="文本内容为空")
         
-        # 调用TTS API
-        result = tts.synthesize_japanese(
+        # 调用TTS API（异步，不占用线程池）
+        result = await tts.synthesize_japanese_async(
             text=data.text,
             voice_name="ja-JP-Neural2-B",
             speaking_rate=data.speaking_rate or 0.75,
@@ -492,13 +1202,19 @@ def api_tts_audio(data: TTSAudioRequest):
         if "error" in result:
             raise HTTPException(status_code=500, detail=result['error'])
         
-        # 返回音频文件
+        # 返回音频文件（X-Audio-Url 为缓存文件的固定 URL，之后可以直接 GET）
+        headers = {
+            'Content-Disposition': 'inline; filename=speech.mp3',
+            'X-Cache': 'HIT' if result.get('cache_hit') else 'MISS'
+        }
+        if result.get('cache_key'):
+            headers['ETag'] = f'"{result["cache_key"]}"'
+        if result.get('audio_url'):
+            headers['X-Audio-Url'] = result['audio_url']
         return Response(
             content=result['audio_content'],
             media_type='audio/mpeg',
-            headers={
-                'Content-Disposition': 'inline; filename=speech.mp3'
-            }
+            headers=headers
         )
     
     except HTTPException:
@@ -507,6 +1223,87 @@ def api_tts_audio(data: TTSAudioRequest):
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
 
+def _default_extension(content_type: Optional[str]) -> str:
+    """根据 Content-Type 推断文件扩展名"""
+    content_type = content_type or 'image/jpeg'
+    if 'jpeg' in content_type or 'jpg' in content_type:
+        return '.jpg'
+    elif 'png' in content_type:
+        return '.png'
+    return '.jpg'  # 默认使用jpg
+
+
+async def read_upload_file(file: UploadFile) -> Tuple[str, bytes]:
+    """
+    读取并校验上传的文件（不写入磁盘）
+    
+    Args:
+        file: 上传的文件
+        
+    Returns:
+        (保存用的文件名, 文件内容)
+    """
+    # 如果没有文件名，生成一个默认文件名
+    if not file.filename:
+        filename = f"upload_{int(time.time())}{_default_extension(file.content_type)}"
+    else:
+        filename = file.filename
+    
+    # 验证文件扩展名
+    if not allowed_file(filename):
+        raise HTTPException(
+            status_code=400,
+            detail=f'不支持的文件格式。支持的格式: {", ".join(ALLOWED_EXTENSIONS)}'
+        )
+    
+    # 读取文件内容
+    contents = await file.read()
+    
+    # 检查文件大小
+    if len(contents) > MAX_CONTENT_LENGTH:
+        raise HTTPException(status_code=400, detail="文件大小超过限制（10MB）")
+    
+    # 生成安全的文件名
+    filename = secure_filename(filename)
+    # 添加时间戳避免文件名冲突
+    timestamp = int(time.time())
+    name, ext = os.path.splitext(filename)
+    if not ext:  # 如果没有扩展名，根据Content-Type添加
+        ext = _default_extension(file.content_type)
+    filename = f"{name}_{timestamp}{ext}"
+    
+    return filename, contents
+
+
+def write_upload_file(filename: str, contents: bytes) -> str:
+    """把已校验的文件内容写入上传目录，返回文件路径"""
+    filepath = os.path.join(USER_UPLOAD_FOLDER, filename)
+    with open(filepath, 'wb') as f:
+        f.write(contents)
+    return filepath
+
+
+async def save_upload_file(file: UploadFile) -> Tuple[str, str]:
+    """
+    校验并保存上传的文件
+    
+    Args:
+        file: 上传的文件
+        
+    Returns:
+        (保存后的文件名, 文件路径)
+    """
+    filename, contents = await read_upload_file(file)
+    return filename, write_upload_file(filename, contents)
+
+
+async def compute_page_hash(filepath: str) -> Optional[int]:
+    """计算上传图片的感知哈希（在线程池中解码，不阻塞事件循环）"""
+    if phash_index is None:
+        return None
+    return await asyncio.to_thread(phash_index.compute, filepath)
+
+
 @app.options("/api/upload")
 async def options_upload():
     """处理CORS预检请求"""
@@ -522,61 +1319,15 @@ async def options_upload():
 @app.post("/api/upload")
 async def api_upload(file: UploadFile = File(...)):
     """API端点 - 上传图片文件"""
-    # 如果没有文件名，生成一个默认文件名
-    if not file.filename:
-        # 检查Content-Type来确定文件类型
-        content_type = file.content_type or 'image/jpeg'
-        if 'jpeg' in content_type or 'jpg' in content_type:
-            ext = '.jpg'
-        elif 'png' in content_type:
-            ext = '.png'
-        else:
-            ext = '.jpg'  # 默认使用jpg
-        filename = f"upload_{int(time.time())}{ext}"
-    else:
-        filename = file.filename
-    
-    # 验证文件扩展名
-    if not allowed_file(filename):
-        raise HTTPException(
-            status_code=400,
-            detail=f'不支持的文件格式。支持的格式: {", ".join(ALLOWED_EXTENSIONS)}'
-        )
-    
     try:
-        # 读取文件内容
-        contents = await file.read()
-        
-        # 检查文件大小
-        if len(contents) > MAX_CONTENT_LENGTH:
-            raise HTTPException(status_code=400, detail="文件大小超过限制（10MB）")
-        
-        # 生成安全的文件名
-        filename = secure_filename(filename)
-        # 添加时间戳避免文件名冲突
-        timestamp = int(time.time())
-        name, ext = os.path.splitext(filename)
-        if not ext:  # 如果没有扩展名，根据Content-Type添加
-            content_type = file.content_type or 'image/jpeg'
-            if 'jpeg' in content_type or 'jpg' in content_type:
-                ext = '.jpg'
-            elif 'png' in content_type:
-                ext = '.png'
-            else:
-                ext = '.jpg'
-        filename = f"{name}_{timestamp}{ext}"
-        
-        filepath = os.path.join(USER_UPLOAD_FOLDER, filename)
-        
-        # 保存文件
-        with open(filepath, 'wb') as f:
-            f.write(contents)
+        filename, filepath = await save_upload_file(file)
+        page_hash = await compute_page_hash(filepath)
         
         # 创建任务
         task_id = task_manager.create_task(filename, filepath)
         
         # 启动后台线程处理任务
-        thread = threading.Thread(target=process_image_task, args=(task_id, filepath))
+        thread = threading.Thread(target=process_image_task, args=(task_id, filepath, None, page_hash))
         thread.daemon = True
         thread.start()
         
@@ -603,6 +1354,68 @@ async def api_upload(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f'上传失败: {str(e)}')
 
 
+@app.options("/api/upload/batch")
+async def options_upload_batch():
+    """处理CORS预检请求"""
+    return await options_upload()
+
+@app.post("/api/upload/batch")
+async def api_upload_batch(files: List[UploadFile] = File(...)):
+    """API端点 - 批量上传多页图片，批量OCR后按页拆分为独立任务"""
+    if not files:
+        raise HTTPException(status_code=400, detail="没有上传文件")
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"单次最多上传 {MAX_BATCH_FILES} 张图片")
+    
+    # 先校验全部文件，任何一个不合格都不保存文件、不创建任务
+    uploads = [await read_upload_file(file) for file in files]
+    
+    tasks = []
+    pages = []
+    try:
+        for filename, contents in uploads:
+            filepath = write_upload_file(filename, contents)
+            pages.append({'task_id': None, 'filename': filename, 'filepath': filepath})
+            page_hash = await compute_page_hash(filepath)
+            task_id = task_manager.create_task(filename, filepath)
+            pages[-1]['task_id'] = task_id
+            tasks.append((task_id, filepath, page_hash))
+    except Exception as e:
+        # 保存中途失败：已创建的任务标记为失败，删除已保存的文件
+        for page in pages:
+            if page['task_id']:
+                task_manager.update_task_status(page['task_id'], TaskStatus.FAILED, error=f'批量上传失败: {str(e)}')
+            if os.path.exists(page['filepath']):
+                os.remove(page['filepath'])
+        raise HTTPException(status_code=500, detail=f'上传失败: {str(e)}')
+    
+    try:
+        # 启动后台线程：一次批量OCR，然后按页处理
+        thread = threading.Thread(target=process_batch_task, args=(tasks,))
+        thread.daemon = True
+        thread.start()
+        
+        response_data = {
+            'success': True,
+            'tasks': [{'task_id': page['task_id'], 'filename': page['filename']} for page in pages],
+            'message': f'{len(pages)} 个文件上传成功，正在处理...'
+        }
+        
+        return JSONResponse(
+            content=response_data,
+            headers={
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "POST, OPTIONS",
+                "Access-Control-Allow-Headers": "*",
+            }
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'上传失败: {str(e)}')
+
+
 @app.get("/api/task/{task_id}")
 def api_get_task(task_id: str):
     """API端点 - 查询任务状态"""
@@ -619,12 +1432,16 @@ def api_get_task(task_id: str):
         'status': task['status'],
         'progress': task['progress'],
         'created_at': task['created_at'],
-        'updated_at': task['updated_at']
+        'updated_at': task['updated_at'],
+        'metrics': task.get('metrics', {})
     }
     
     # 如果任务完成，包含结果
     if task['status'] == TaskStatus.COMPLETED.value and task['result']:
         response['result'] = task['result']
+    elif task.get('partial_result'):
+        # 未完成时返回已发布的部分结果（如拆分模式下先完成的日语正文和分段）
+        response['partial_result'] = task['partial_result']
     
     # 如果任务失败，包含错误信息
     if task['status'] == TaskStatus.FAILED.value and task['error']:
@@ -633,6 +1450,38 @@ def api_get_task(task_id: str):
     return response
 
 
+@app.get("/api/task/{task_id}/audio/{key}")
+async def api_task_audio(task_id: str, key: str):
+    """
+    API端点 - 按需合成并返回任务中的一段音频（TTS_LAZY 模式下 audio_urls 中的占位 URL）
+    
+    同一段的并发请求只合成一次；请求分段时在后台预取后面的分段。
+    响应头 X-Audio-Url 为任务音频文件的 URL，之后可以直接 GET。
+    占位 URL 依赖内存中的任务（保留 task_ttl，默认1小时），任务过期后返回 404，需要长期保存的音频应使用 X-Audio-Url
+    """
+    if not tts:
+        raise HTTPException(status_code=503, detail="TTS服务未初始化")
+    
+    task = task_manager.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期（占位音频 URL 只在任务保留期内有效）")
+    processed_text = (task.get('result') or {}).get('processed_text') or \
+        (task.get('partial_result') or {}).get('processed_text')
+    texts = page_audio_texts(processed_text or {})
+    if key not in texts:
+        raise HTTPException(status_code=404, detail="音频不存在")
+    
+    url = await lazy_audio.get_async(task_id, key, texts[key])
+    lazy_audio.prefetch_after(task_id, key, texts)
+    if not url:
+        raise HTTPException(status_code=500, detail="音频合成失败")
+    return FileResponse(
+        url.lstrip('/'),
+        media_type='audio/mpeg',
+        headers={'X-Audio-Url': url}
+    )
+
+
 # 挂载前端静态文件（必须在所有 API 路由之后）
 if FRONTEND_BUILD_DIR.exists():
     # 挂载 Next.js 的 _next 静态资源
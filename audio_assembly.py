@@ -0,0 +1,333 @@
+"""
+音频拼接模块 - 把已合成的分段音频拼接为完整正文的音频，不再把正文整段送去 TTS
+- MP3：按帧解析（跳过 ID3 标签和 Xing/Info/VBRI 信息帧），逐帧拼接，段间插入全零的静音帧，时长精确到帧
+- WAV（LINEAR16）：用 wave 模块读取 PCM，段间插入零采样后重新写出
+- 同时生成分段偏移表（每段在拼接结果中的起止秒数），前端可以按分段跳转
+- 反方向：按时间点把一条音轨切分为多段（SSML 一次合成后在本地切出各分段）
+"""
+
+import io
+import os
+import wave
+from typing import Dict, List, Optional, Tuple
+
+# MPEG 版本位 → 名称（01 为保留值）
+_MPEG_VERSIONS = {0b00: '2.5', 0b10: '2', 0b11: '1'}
+
+# Layer III 比特率（kbps），按 MPEG1 / MPEG2、2.5 区分
+_BITRATES = {
+    '1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    '2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+_SAMPLE_RATES = {
+    '1': [44100, 48000, 32000],
+    '2': [22050, 24000, 16000],
+    '2.5': [11025, 12000, 8000],
+}
+
+
+class AudioAssemblyError(ValueError):
+    """分段音频无法拼接（格式无法解析或各段参数不一致）"""
+
+
+def _skip_id3v2(data: bytes) -> int:
+    """跳过开头的 ID3v2 标签，返回第一帧的起始位置"""
+    if len(data) >= 10 and data[:3] == b'ID3':
+        size = (data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | (data[9] & 0x7f)
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _parse_header(header: bytes) -> Dict:
+    """
+    解析 4 字节的 MPEG 音频帧头
+
+    Returns:
+        version、sample_rate、channels、samples、length（帧长度），不是有效的 Layer III 帧头时返回空字典
+    """
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return {}
+    version = _MPEG_VERSIONS.get((header[1] >> 3) & 0b11)
+    layer = (header[1] >> 1) & 0b11
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0b11
+    if version is None or layer != 0b01 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return {}
+
+    bitrate = _BITRATES['1' if version == '1' else '2'][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 1
+    coefficient = 144 if version == '1' else 72
+    return {
+        'version': version,
+        'sample_rate': sample_rate,
+        'channels': 1 if (header[3] >> 6) == 0b11 else 2,
+        'samples': 1152 if version == '1' else 576,
+        'length': coefficient * bitrate // sample_rate + padding
+    }
+
+
+def mp3_frames(data: bytes) -> Tuple[List[bytes], Dict]:
+    """
+    把 MP3 数据拆分为音频帧
+
+    Args:
+        data: MP3 文件内容
+
+    Returns:
+        (音频帧列表, 流参数)，流参数包含 version、sample_rate、channels、samples（每帧采样数）
+
+    Raises:
+        AudioAssemblyError: 没有找到音频帧，或各帧的采样率/声道数不一致
+    """
+    frames = []
+    info = None
+    position = _skip_id3v2(data)
+    while position + 4 <= len(data):
+        header = _parse_header(data[position:position + 4])
+        if not header or position + header['length'] > len(data):
+            # 跳过帧之间的垃圾字节；末尾的 ID3v1 标签（TAG）和不完整的帧直接结束
+            if data[position:position + 3] == b'TAG':
+                break
+            position += 1
+            continue
+        frame = data[position:position + header['length']]
+        position += header['length']
+
+        if info is None:
+            info = {key: header[key] for key in ('version', 'sample_rate', 'channels', 'samples')}
+            # VBR 信息帧（Xing / Info / VBRI）记录的是原文件的帧数，拼接后不再正确，丢弃
+            if any(tag in frame[4:48] for tag in (b'Xing', b'Info', b'VBRI')):
+                continue
+        elif (header['sample_rate'], header['channels']) != (info['sample_rate'], info['channels']):
+            raise AudioAssemblyError("MP3 帧的采样率或声道数不一致")
+        frames.append(frame)
+
+    if info is None or not frames:
+        raise AudioAssemblyError("没有找到 MP3 音频帧")
+    return frames, info
+
+
+def _reservoir_frames(frames: List[bytes], index: int) -> int:
+    """
+    从第 index 帧开始切分时需要带上的前置帧数
+
+    Layer III 的帧可以借用前面帧的主数据（bit reservoir，main_data_begin 字节），
+    切分点之前的帧要一并保留，否则切出的第一帧无法正确解码
+    """
+    header = _parse_header(frames[index][:4])
+    crc = 0 if frames[index][1] & 0x01 else 2
+    side = frames[index][4 + crc:]
+    if header['version'] == '1':
+        main_data_begin = (side[0] << 1) | (side[1] >> 7)
+    else:
+        main_data_begin = side[0]
+
+    count, available = 0, 0
+    while available < main_data_begin and index - count > 0:
+        count += 1
+        previous = frames[index - count]
+        previous_header = _parse_header(previous[:4])
+        previous_crc = 0 if previous[1] & 0x01 else 2
+        if previous_header['version'] == '1':
+            side_length = 17 if previous_header['channels'] == 1 else 32
+        else:
+            side_length = 9 if previous_header['channels'] == 1 else 17
+        available += len(previous) - 4 - previous_crc - side_length
+    return count
+
+
+def _silent_frame(reference: bytes) -> bytes:
+    """与参考帧参数相同的静音帧：不带 CRC、不补位，侧信息和主数据全为零"""
+    header = bytearray(reference[:4])
+    header[1] |= 0x01           # protection bit = 1：无 CRC
+    header[2] &= 0xFD           # padding = 0
+    length = _parse_header(bytes(header))['length']
+    return bytes(header) + b'\x00' * (length - 4)
+
+
+def _offsets(durations: List[float], gap: float) -> List[Dict]:
+    """各段的起止时间（秒），段间间隔为 gap"""
+    offsets, position = [], 0.0
+    for index, duration in enumerate(durations):
+        offsets.append({'index': index, 'start': round(position, 3), 'end': round(position + duration, 3)})
+        position += duration + gap
+    return offsets
+
+
+def concat_mp3(parts: List[bytes], silence_ms: int) -> Tuple[bytes, List[Dict]]:
+    """
+    逐帧拼接 MP3，段间插入静音帧
+
+    Args:
+        parts: 各段 MP3 数据
+        silence_ms: 段间静音时长（毫秒），按帧取整
+
+    Returns:
+        (拼接后的 MP3, 分段偏移表)
+    """
+    parsed = [mp3_frames(part) for part in parts]
+    info = parsed[0][1]
+    for _, other in parsed[1:]:
+        if (other['sample_rate'], other['channels'], other['version']) != \
+                (info['sample_rate'], info['channels'], info['version']):
+            raise AudioAssemblyError("各段 MP3 的采样率、声道数或 MPEG 版本不一致，无法逐帧拼接")
+
+    frame_duration = info['samples'] / info['sample_rate']
+    silent_count = int(round(silence_ms / 1000 / frame_duration))
+    silence = _silent_frame(parsed[0][0][0]) * silent_count
+
+    output = io.BytesIO()
+    for index, (frames, _) in enumerate(parsed):
+        if index and silent_count:
+            output.write(silence)
+        output.write(b''.join(frames))
+    return output.getvalue(), _offsets([len(frames) * frame_duration for frames, _ in parsed],
+                                       silent_count * frame_duration)
+
+
+def concat_wav(parts: List[bytes], silence_ms: int) -> Tuple[bytes, List[Dict]]:
+    """
+    拼接 WAV（PCM），段间插入零采样
+
+    Args:
+        parts: 各段 WAV 数据
+        silence_ms: 段间静音时长（毫秒）
+
+    Returns:
+        (拼接后的 WAV, 分段偏移表)
+    """
+    params, chunks = None, []
+    for part in parts:
+        try:
+            with wave.open(io.BytesIO(part), 'rb') as reader:
+                current = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+                chunks.append(reader.readframes(reader.getnframes()))
+        except (wave.Error, EOFError) as e:
+            raise AudioAssemblyError(f"无法解析 WAV: {str(e)}")
+        if params is not None and current != params:
+            raise AudioAssemblyError("各段 WAV 的声道数、采样宽度或采样率不一致")
+        params = current
+
+    channels, width, rate = params
+    frame_size = channels * width
+    silent_frames = int(round(silence_ms / 1000 * rate))
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(width)
+        writer.setframerate(rate)
+        for index, chunk in enumerate(chunks):
+            if index and silent_frames:
+                writer.writeframes(b'\x00' * silent_frames * frame_size)
+            writer.writeframes(chunk)
+    return output.getvalue(), _offsets([len(chunk) / frame_size / rate for chunk in chunks],
+                                       silent_frames / rate)
+
+
+def slice_mp3(data: bytes, ranges: List[Tuple[float, Optional[float]]]) -> List[Tuple[bytes, float, float]]:
+    """
+    按时间范围逐帧切分 MP3（切分点取最近的帧边界，并带上 bit reservoir 需要的前置帧）
+
+    Args:
+        data: MP3 数据
+        ranges: 各段的 (起点, 终点) 秒数，终点为 None 表示到音频结束
+
+    Returns:
+        各段的 (MP3 数据, 对齐后的起点, 对齐后的终点)，前置帧不计入起止时间
+    """
+    frames, info = mp3_frames(data)
+    frame_duration = info['samples'] / info['sample_rate']
+    slices = []
+    for start, end in ranges:
+        first = min(max(int(round(start / frame_duration)), 0), len(frames))
+        last = len(frames) if end is None else min(max(int(round(end / frame_duration)), first), len(frames))
+        if first == last:
+            raise AudioAssemblyError(f"切分范围为空: {start:.3f}-{end}")
+        prime = _reservoir_frames(frames, first)
+        slices.append((b''.join(frames[first - prime:last]),
+                       round(first * frame_duration, 3), round(last * frame_duration, 3)))
+    return slices
+
+
+def slice_wav(data: bytes, ranges: List[Tuple[float, Optional[float]]]) -> List[Tuple[bytes, float, float]]:
+    """
+    按时间范围切分 WAV（精确到采样）
+
+    参数和返回值与 slice_mp3 相同
+    """
+    try:
+        with wave.open(io.BytesIO(data), 'rb') as reader:
+            channels, width, rate = reader.getnchannels(), reader.getsampwidth(), reader.getframerate()
+            pcm = reader.readframes(reader.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise AudioAssemblyError(f"无法解析 WAV: {str(e)}")
+
+    frame_size = channels * width
+    total = len(pcm) // frame_size
+    slices = []
+    for start, end in ranges:
+        first = min(max(int(round(start * rate)), 0), total)
+        last = total if end is None else min(max(int(round(end * rate)), first), total)
+        if first == last:
+            raise AudioAssemblyError(f"切分范围为空: {start:.3f}-{end}")
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as writer:
+            writer.setnchannels(channels)
+            writer.setsampwidth(width)
+            writer.setframerate(rate)
+            writer.writeframes(pcm[first * frame_size:last * frame_size])
+        slices.append((output.getvalue(), round(first / rate, 3), round(last / rate, 3)))
+    return slices
+
+
+def slice_audio(data: bytes, audio_format: str,
+                ranges: List[Tuple[float, Optional[float]]]) -> List[Tuple[bytes, float, float]]:
+    """
+    按时间范围把一条音轨切分为多段
+
+    Args:
+        data: 音频数据
+        audio_format: mp3 或 wav
+        ranges: 各段的 (起点, 终点) 秒数，终点为 None 表示到音频结束
+
+    Returns:
+        各段的 (音频数据, 对齐后的起点, 对齐后的终点)
+
+    Raises:
+        AudioAssemblyError: 格式不支持、无法解析或切分范围为空
+    """
+    if audio_format == "mp3":
+        return slice_mp3(data, ranges)
+    if audio_format == "wav":
+        return slice_wav(data, ranges)
+    raise AudioAssemblyError(f"不支持切分的音频格式: {audio_format}")
+
+
+def assemble_audio(parts: List[bytes], audio_format: str = "mp3",
+                   silence_ms: int = None) -> Tuple[bytes, List[Dict]]:
+    """
+    把分段音频拼接为一条音轨
+
+    Args:
+        parts: 各段音频数据（按朗读顺序）
+        audio_format: mp3 或 wav
+        silence_ms: 段间静音时长（毫秒），默认读取 TTS_SEGMENT_SILENCE_MS（默认400）
+
+    Returns:
+        (拼接后的音频, 分段偏移表)，偏移表每项包含 index、start、end（秒）
+
+    Raises:
+        AudioAssemblyError: 没有分段、格式不支持或无法解析
+    """
+    if not parts:
+        raise AudioAssemblyError("没有可拼接的分段音频")
+    if silence_ms is None:
+        silence_ms = int(os.getenv('TTS_SEGMENT_SILENCE_MS', '400'))
+    if audio_format == "mp3":
+        return concat_mp3(parts, silence_ms)
+    if audio_format == "wav":
+        return concat_wav(parts, silence_ms)
+    raise AudioAssemblyError(f"不支持拼接的音频格式: {audio_format}")
@@ -0,0 +1,258 @@
+"""
+语音缓存模块 - 按内容寻址的 TTS 音频缓存（内存 LRU + 磁盘两级）
+- 缓存键：规范化文本（NFKC、折叠空白）+ 语音 + 语速 + 音调 + 音量 + 模型 + 编码 的 SHA-256
+- 磁盘层保存在静态目录下（默认 static/audio/cache），文件名就是缓存键，
+  同一段文本的 URL 固定不变，浏览器和 CDN 可以长期缓存
+- 磁盘层按总字节数限制（TTS_CACHE_DISK_MB），超出时删除最久未使用的文件：启动时按修改时间建立 LRU 索引，
+  之后写入和命中只更新索引（命中时刷新修改时间，重启后顺序不变），淘汰不再扫描目录
+- 被淘汰的文件的 URL 随之失效，需要长期保留的音频（如任务结果）应链接或复制到缓存目录之外
+- 处理流程、/api/tts 和 /api/tts/audio 共用同一个缓存，重放不再请求 TTS API
+"""
+
+import os
+import re
+import time
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from result_cache import make_cache_key
+
+# 超过该时间（秒）的 .tmp 文件视为异常退出留下的临时文件；更新的可能正被其他进程写入
+_TMP_GRACE_SECONDS = 600
+
+
+def normalize_tts_text(text: str) -> str:
+    """规范化朗读文本：NFKC（统一全角/半角）并折叠空白，朗读结果相同的文本得到相同的键"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+class AudioCache:
+    """TTS 音频的两级缓存：按字节数限制的内存 LRU + 按字节数限制的静态目录音频文件"""
+
+    def __init__(self, cache_dir: Optional[str] = None,
+                 url_prefix: Optional[str] = None,
+                 max_memory_bytes: Optional[int] = None,
+                 max_disk_bytes: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 磁盘层目录，默认读取 TTS_CACHE_DIR（默认 static/audio/cache），空字符串表示只使用内存层
+            url_prefix: 磁盘文件对应的 URL 前缀，默认由 cache_dir 推出（/static/...）
+            max_memory_bytes: 内存层最多保留的音频字节数，默认读取 TTS_CACHE_MEMORY_MB（默认32）
+            max_disk_bytes: 磁盘层最多保留的音频字节数，默认读取 TTS_CACHE_DISK_MB（默认1024），0 表示不限制
+        """
+        self.cache_dir = cache_dir if cache_dir is not None else os.getenv('TTS_CACHE_DIR', 'static/audio/cache')
+        self.cache_dir = self.cache_dir or None
+        self.url_prefix = url_prefix or (f"/{self.cache_dir.strip('/')}" if self.cache_dir else None)
+        self.max_memory_bytes = max_memory_bytes if max_memory_bytes is not None else \
+            int(float(os.getenv('TTS_CACHE_MEMORY_MB', '32')) * 1024 * 1024)
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else \
+            int(float(os.getenv('TTS_CACHE_DISK_MB', '1024')) * 1024 * 1024)
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self.lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'disk_evictions': 0
+        }
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for _, path, size in sorted(self._disk_files()):
+                self._disk[path] = size
+                self._disk_bytes += size
+            self._prune_disk()
+
+    def _disk_files(self) -> List[Tuple[float, str, int]]:
+        """
+        扫描磁盘层的音频文件 (修改时间, 路径, 字节数)，只在启动时调用；
+        顺带删除超过 _TMP_GRACE_SECONDS 的临时文件（更新的临时文件可能正被其他进程写入）
+        """
+        files = []
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith('.tmp'):
+                    if now - stat.st_mtime > _TMP_GRACE_SECONDS:
+                        os.remove(entry.path)
+                    continue
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+            except OSError:
+                continue
+        return files
+
+    def _touch_disk(self, path: str, size: int):
+        """在磁盘层 LRU 索引中登记或刷新一个文件并更新字节总数"""
+        with self.lock:
+            self._disk_bytes += size - self._disk.pop(path, 0)
+            self._disk[path] = size
+
+    def _prune_disk(self, keep: Optional[str] = None):
+        """磁盘层超出字节上限时按 LRU 索引删除最久未使用的文件（keep 为刚写入的文件，不删除）"""
+        while True:
+            with self.lock:
+                if not self.max_disk_bytes or self._disk_bytes <= self.max_disk_bytes:
+                    return
+                victim = next((path for path in self._disk if path != keep), None)
+                if victim is None:
+                    return
+                self._disk_bytes -= self._disk.pop(victim)
+                self._stats['disk_evictions'] += 1
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+
+    @staticmethod
+    def key(text: str, voice_name: str, speaking_rate: float, pitch: float,
+            volume_gain_db: float, model: Optional[str], audio_format: str) -> str:
+        """
+        生成缓存键
+
+        Args:
+            text: 朗读文本
+            voice_name: 语音名称
+            speaking_rate: 语速
+            pitch: 音调
+            volume_gain_db: 音量增益
+            model: TTS 模型（None 表示默认模型）
+            audio_format: 输出格式（mp3 / wav / ogg）
+
+        Returns:
+            32 位十六进制字符串
+        """
+        return make_cache_key(
+            normalize_tts_text(text), voice_name, float(speaking_rate), float(pitch),
+            float(volume_gain_db), model or "default", audio_format
+        )[:32]
+
+    def path(self, key: str, audio_format: str) -> Optional[str]:
+        """磁盘文件路径；未启用磁盘层时返回 None"""
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{key}.{audio_format}")
+
+    def url(self, key: str, audio_format: str) -> Optional[str]:
+        """磁盘文件的静态 URL；未启用磁盘层时返回 None"""
+        if not self.url_prefix:
+            return None
+        return f"{self.url_prefix}/{key}.{audio_format}"
+
+    def _remember(self, name: str, audio: bytes):
+        """写入内存层并按字节数淘汰（调用方需持有锁）"""
+        if len(audio) > self.max_memory_bytes:
+            return
+        if name in self._memory:
+            self._memory_bytes -= len(self._memory.pop(name))
+        self._memory[name] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats['evictions'] += 1
+
+    def get(self, key: str, audio_format: str) -> Optional[bytes]:
+        """
+        查询缓存
+
+        Args:
+            key: 缓存键
+            audio_format: 输出格式
+
+        Returns:
+            音频数据，未命中时返回 None
+        """
+        name = f"{key}.{audio_format}"
+        with self.lock:
+            audio = self._memory.get(name)
+            if audio is not None:
+                self._memory.move_to_end(name)
+                self._stats['memory_hits'] += 1
+                return audio
+
+        path = self.path(key, audio_format)
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    audio = f.read()
+            except OSError as e:
+                print(f"[TTS 缓存] 读取失败 {path}: {str(e)}")
+                audio = None
+            if audio:
+                try:
+                    os.utime(path)  # 刷新修改时间，重启后仍按最近使用淘汰
+                except OSError:
+                    pass
+                self._touch_disk(path, len(audio))
+                with self.lock:
+                    self._remember(name, audio)
+                    self._stats['disk_hits'] += 1
+                return audio
+
+        with self.lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key: str, audio_format: str, audio: bytes) -> Optional[str]:
+        """
+        写入缓存（磁盘文件先写临时文件再替换，读取方不会看到不完整的音频）
+        磁盘层超出字节上限时删除最久未使用的文件，之前返回的这些文件的 URL 随之失效
+
+        Args:
+            key: 缓存键
+            audio_format: 输出格式
+            audio: 音频数据
+
+        Returns:
+            磁盘文件的静态 URL；未启用磁盘层或写入失败时返回 None
+        """
+        with self.lock:
+            self._remember(f"{key}.{audio_format}", audio)
+            self._stats['writes'] += 1
+
+        path = self.path(key, audio_format)
+        if not path:
+            return None
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[TTS 缓存] 写入失败 {path}: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        self._touch_disk(path, len(audio))
+        self._prune_disk(keep=path)
+        return self.url(key, audio_format)
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self.lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['disk_bytes'] = self._disk_bytes
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hits'] = hits
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        stats['max_memory_bytes'] = self.max_memory_bytes
+        stats['max_disk_bytes'] = self.max_disk_bytes
+        stats['persistent'] = bool(self.cache_dir)
+        return stats
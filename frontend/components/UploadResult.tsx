@@ -1,4 +1,7 @@
-import { getStaticUrl } from '@/lib/api';
+'use client';
+
+import { useRef } from 'react';
+import { getAudioUrl, AudioOffset } from '@/lib/api';
 
 interface UploadResultProps {
   result: {
@@ -13,6 +16,7 @@ interface UploadResultProps {
       chinese_translation?: string;
     };
     audio_urls?: Record<string, string>;
+    audio_offsets?: Record<string, AudioOffset[]>;
   };
   onReset: () => void;
 }
@@ -20,6 +24,19 @@ interface UploadResultProps {
 export default function UploadResult({ result, onReset }: UploadResultProps) {
   const processedText = result.processed_text;
   const audioUrls = result.audio_urls || {};
+  const mainOffsets = result.audio_offsets?.main || [];
+  const mainAudioRef = useRef<HTMLAudioElement | null>(null);
+
+  // 正文音频由分段拼接时，按偏移表跳转到该分段开始播放
+  const playFromSegment = (idx: number) => {
+    const offset = mainOffsets.find((item) => item.index === idx);
+    const audio = mainAudioRef.current;
+    if (!offset || !audio) {
+      return;
+    }
+    audio.currentTime = offset.start;
+    audio.play();
+  };
 
   return (
     <div className="result-section">
@@ -33,7 +50,7 @@ export default function UploadResult({ result, onReset }: UploadResultProps) {
                 <h4>📋 指导语</h4>
                 <p>{processedText.instruction}</p>
                 {audioUrls.instruction && (
-                  <audio controls src={getStaticUrl(audioUrls.instruction.replace('/static/', ''))} />
+                  <audio controls preload="none" src={getAudioUrl(audioUrls.instruction)} />
                 )}
               </div>
             )}
@@ -46,7 +63,12 @@ export default function UploadResult({ result, onReset }: UploadResultProps) {
                   {processedText.main_text || processedText.japanese_text}
                 </p>
                 {audioUrls.main && (
-                  <audio controls src={getStaticUrl(audioUrls.main.replace('/static/', ''))} />
+                  <audio
+                    ref={mainAudioRef}
+                    controls
+                    preload="none"
+                    src={getAudioUrl(audioUrls.main)}
+                  />
                 )}
               </div>
             )}
@@ -69,11 +91,19 @@ export default function UploadResult({ result, onReset }: UploadResultProps) {
                     {audioUrls[`segment_${idx}`] && (
                       <audio
                         controls
-                        src={getStaticUrl(
-                          audioUrls[`segment_${idx}`].replace('/static/', '')
-                        )}
+                        preload="none"
+                        src={getAudioUrl(audioUrls[`segment_${idx}`])}
                       />
                     )}
+                    {audioUrls.main && mainOffsets.some((item) => item.index === idx) && (
+                      <button
+                        className="btn"
+                        style={{ marginLeft: '10px' }}
+                        onClick={() => playFromSegment(idx)}
+                      >
+                        从这里播放正文
+                      </button>
+                    )}
                   </div>
                 ))}
               </div>
@@ -68,10 +68,19 @@ export interface TaskResult {
     ocr: OCRResult;
     processed_text?: ProcessedText;
     audio_urls?: Record<string, string>;
+    audio_offsets?: Record<string, AudioOffset[]>;
   };
   error?: string;
 }
 
+// 分段在拼接音轨（如 main）中的起止时间（秒）
+export interface AudioOffset {
+  index: number;
+  key?: string;
+  start: number;
+  end: number;
+}
+
 export interface UploadResponse {
   success: boolean;
   task_id: string;
@@ -86,6 +95,8 @@ export interface TTSResponse {
   audio_format?: string;
   voice_name?: string;
   model?: string;
+  audio_url?: string | null;
+  cache_hit?: boolean;
   error?: string;
 }
 
@@ -194,6 +205,35 @@ export async function generateTTS(
   return response.json();
 }
 
+/**
+ * 获取 TTS 音频的固定 URL（服务端按文本和语音参数缓存，同一段文本总是同一个 URL）
+ * 未启用服务端磁盘缓存时返回 null
+ */
+export async function getTTSAudioUrl(
+  text: string,
+  speakingRate: number = 0.75
+): Promise<string | null> {
+  const response = await fetch(`${API_BASE_URL}/api/tts`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      text,
+      speaking_rate: speakingRate,
+      url_only: true,
+    }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || error.error || 'TTS 生成失败');
+  }
+
+  const data: TTSResponse = await response.json();
+  return data.audio_url ? `${API_BASE_URL}${data.audio_url}` : null;
+}
+
 /**
  * 生成 TTS 音频（返回音频文件）
  */
@@ -234,3 +274,13 @@ export function getStaticUrl(path: string): string {
   return `${API_BASE_URL}/static/${path}`;
 }
 
+/**
+ * 任务结果中音频的完整 URL：静态文件（/static/...）或按需合成的占位地址（/api/task/{id}/audio/{key}）
+ */
+export function getAudioUrl(url: string): string {
+  if (url.startsWith('/static/')) {
+    return getStaticUrl(url.replace('/static/', ''));
+  }
+  return `${API_BASE_URL}${url}`;
+}
+
@@ -3,7 +3,10 @@
  */
 
 import { useState, useRef } from 'react';
-import { generateTTSAudio } from '../api';
+import { generateTTSAudio, getTTSAudioUrl } from '../api';
+
+// 文本 + 语速 → 服务端缓存音频的固定 URL，重放时不再请求 /api/tts
+const audioUrlCache = new Map<string, string>();
 
 export function useTTS() {
   const [loading, setLoading] = useState(false);
@@ -20,9 +23,25 @@ export function useTTS() {
     setError(null);
 
     try {
-      // 生成音频
-      const audioBlob = await generateTTSAudio(text, speakingRate);
-      const audioUrl = URL.createObjectURL(audioBlob);
+      // 优先使用服务端缓存音频的固定 URL（浏览器可缓存），不可用时退回到直接下载音频
+      const cacheKey = `${speakingRate}\u001f${text}`;
+      let audioUrl = audioUrlCache.get(cacheKey) || null;
+      if (!audioUrl) {
+        audioUrl = await getTTSAudioUrl(text, speakingRate);
+        if (audioUrl) {
+          audioUrlCache.set(cacheKey, audioUrl);
+        }
+      }
+      const isObjectUrl = !audioUrl;
+      if (!audioUrl) {
+        const audioBlob = await generateTTSAudio(text, speakingRate);
+        audioUrl = URL.createObjectURL(audioBlob);
+      }
+      const releaseUrl = () => {
+        if (isObjectUrl) {
+          URL.revokeObjectURL(audioUrl as string);
+        }
+      };
 
       // 创建或更新音频元素
       if (audioRef.current) {
@@ -37,13 +56,12 @@ export function useTTS() {
       await audio.play();
 
       // 清理 URL 对象
-      audio.addEventListener('ended', () => {
-        URL.revokeObjectURL(audioUrl);
-      });
+      audio.addEventListener('ended', releaseUrl);
 
       audio.addEventListener('error', () => {
         setError('音频播放失败');
-        URL.revokeObjectURL(audioUrl);
+        audioUrlCache.delete(cacheKey);
+        releaseUrl();
       });
 
       setLoading(false);
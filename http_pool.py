@@ -0,0 +1,291 @@
+"""
+HTTP 连接池模块 - 所有上游 API（Vision / LLM / TTS）共用的 keep-alive 会话
+- 按主机配置连接池大小，复用 TCP+TLS 连接
+- 对 429/5xx 和连接错误做带抖动的指数退避重试
+- 记录每个主机的请求数、重试数、耗时和新建连接数
+- 同步接口基于 requests，异步接口（async_post）基于 httpx.AsyncClient，共用同一套配置和统计
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 触发重试的 HTTP 状态码
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def raise_for_status(response):
+    """
+    状态码 >= 400 时抛出 requests.exceptions.HTTPError
+    同时适用于 requests 和 httpx 的响应，使同步/异步调用方可以共用异常处理
+
+    Args:
+        response: requests.Response 或 httpx.Response
+    """
+    if response.status_code >= 400:
+        raise requests.exceptions.HTTPError(
+            f"{response.status_code} Error for url: {response.url}",
+            response=response if isinstance(response, requests.Response) else None
+        )
+
+
+def _parse_pool_sizes(value: str) -> Dict[str, int]:
+    """
+    解析按主机的连接池大小配置
+
+    Args:
+        value: 形如 "vision.googleapis.com=4,space.ai-builders.com=8" 的字符串
+
+    Returns:
+        主机名到连接池大小的字典
+    """
+    sizes = {}
+    for item in value.split(','):
+        if '=' in item:
+            host, size = item.split('=', 1)
+            if host.strip() and size.strip().isdigit():
+                sizes[host.strip()] = int(size.strip())
+    return sizes
+
+
+class HTTPPool:
+    """共享的 HTTP 连接池（基于 requests.Session + urllib3 Retry）"""
+
+    def __init__(self,
+                 pool_maxsize: Optional[int] = None,
+                 host_pool_sizes: Optional[Dict[str, int]] = None,
+                 max_retries: Optional[int] = None,
+                 backoff_factor: Optional[float] = None,
+                 backoff_jitter: Optional[float] = None):
+        """
+        初始化连接池
+
+        Args:
+            pool_maxsize: 每个主机默认的最大连接数，默认读取 HTTP_POOL_MAXSIZE（默认10）
+            host_pool_sizes: 按主机覆盖连接池大小，默认读取 HTTP_POOL_SIZES
+            max_retries: 最大重试次数，默认读取 HTTP_MAX_RETRIES（默认2）
+            backoff_factor: 指数退避基数（秒），默认读取 HTTP_BACKOFF_FACTOR（默认0.5）
+            backoff_jitter: 退避随机抖动上限（秒），默认读取 HTTP_BACKOFF_JITTER（默认0.3）
+        """
+        self.pool_maxsize = pool_maxsize or int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+        self.host_pool_sizes = host_pool_sizes if host_pool_sizes is not None else \
+            _parse_pool_sizes(os.getenv('HTTP_POOL_SIZES', ''))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('HTTP_MAX_RETRIES', '2'))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else \
+            float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+        self.backoff_jitter = backoff_jitter if backoff_jitter is not None else \
+            float(os.getenv('HTTP_BACKOFF_JITTER', '0.3'))
+
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._stats: Dict[str, Dict] = {}
+        # 异步客户端按 (事件循环, 主机) 创建，httpx.AsyncClient 不能跨事件循环使用
+        # 值中保留事件循环引用，避免循环被回收后 id 被新循环复用
+        self._async_clients: Dict[Tuple[int, str], Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+    def _retry_policy(self) -> Retry:
+        """
+        构建重试策略：只重试连接错误和 429/5xx，不重试读超时（避免长请求被成倍放大）
+        backoff_jitter 需要 urllib3>=2（见 requirements.txt）
+        """
+        return Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=self.max_retries,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=None,  # 上游调用都是 POST，同样需要重试
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            respect_retry_after_header=True,
+            raise_on_status=False  # 重试耗尽后返回最后一次响应，由调用方处理状态码
+        )
+
+    def pool_size_for(self, host: str) -> int:
+        """返回指定主机的连接池大小"""
+        return self.host_pool_sizes.get(host, self.pool_maxsize)
+
+    def _ensure_stats(self, host: str, size: int):
+        """初始化主机的统计项（调用方需持有锁）"""
+        if host not in self._stats:
+            self._stats[host] = {
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'total_time': 0.0,
+                'pool_maxsize': size
+            }
+
+    def _ensure_adapter(self, url: str) -> str:
+        """为 URL 所属主机挂载专用的 adapter，返回主机名"""
+        parts = urlsplit(url)
+        host = parts.netloc
+        with self.lock:
+            if host not in self._adapters:
+                size = self.pool_size_for(parts.hostname or host)
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=size,
+                    max_retries=self._retry_policy()
+                )
+                self.session.mount(f"{parts.scheme}://{host}", adapter)
+                self._adapters[host] = adapter
+                self._ensure_stats(host, size)
+        return host
+
+    def _record(self, host: str, elapsed: float, retries: int = 0, error: bool = False):
+        """记录一次请求的统计"""
+        with self.lock:
+            stats = self._stats[host]
+            stats['requests'] += 1
+            stats['retries'] += retries
+            stats['total_time'] += elapsed
+            if error:
+                stats['errors'] += 1
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        发送请求（经过连接池和重试策略）
+
+        Args:
+            method: HTTP 方法
+            url: 请求地址
+            kwargs: 传给 requests 的其他参数（json / headers / timeout / stream 等）
+
+        Returns:
+            requests.Response，异常与 requests 保持一致
+        """
+        host = self._ensure_adapter(url)
+        start = time.time()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            self._record(host, time.time() - start, error=True)
+            raise
+
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', None) or ()
+        self._record(host, time.time() - start, retries=len(retries), error=response.status_code >= 400)
+        return response
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """发送 POST 请求，参数与 requests.post 相同"""
+        return self.request('POST', url, **kwargs)
+
+    def _async_client(self, url: str) -> Tuple[str, httpx.AsyncClient]:
+        """获取当前事件循环中 URL 所属主机的异步客户端"""
+        parts = urlsplit(url)
+        host = parts.netloc
+        loop = asyncio.get_running_loop()
+        key = (id(loop), host)
+        with self.lock:
+            _, client = self._async_clients.get(key, (None, None))
+            if client is None or client.is_closed:
+                size = self.pool_size_for(parts.hostname or host)
+                client = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=size, max_keepalive_connections=size)
+                )
+                self._async_clients[key] = (loop, client)
+                self._ensure_stats(host, size)
+        return host, client
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """计算第 attempt 次重试前的等待时间（与同步重试策略一致）"""
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_factor * (2 ** attempt) + random.uniform(0, self.backoff_jitter)
+
+    async def async_request(self, method: str, url: str, timeout: Optional[float] = None,
+                            **kwargs) -> httpx.Response:
+        """
+        发送异步请求（非阻塞，带与同步接口相同的重试策略）
+
+        httpx 的网络异常会转换为对应的 requests 异常，调用方可以沿用同步版本的异常处理。
+
+        Args:
+            method: HTTP 方法
+            url: 请求地址
+            timeout: 超时时间（秒）
+            kwargs: 传给 httpx 的其他参数（json / headers 等）
+
+        Returns:
+            httpx.Response
+        """
+        host, client = self._async_client(url)
+        start = time.time()
+        attempt = 0
+        while True:
+            try:
+                response = await client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.ConnectError as e:
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                self._record(host, time.time() - start, retries=attempt, error=True)
+                raise requests.exceptions.ConnectionError(str(e))
+            except httpx.TimeoutException as e:
+                self._record(host, time.time() - start, retries=attempt, error=True)
+                raise requests.exceptions.Timeout(str(e))
+            except httpx.HTTPError as e:
+                self._record(host, time.time() - start, retries=attempt, error=True)
+                raise requests.exceptions.RequestException(str(e))
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, response.headers.get('Retry-After')))
+                attempt += 1
+                continue
+
+            self._record(host, time.time() - start, retries=attempt, error=response.status_code >= 400)
+            return response
+
+    async def async_post(self, url: str, **kwargs) -> httpx.Response:
+        """发送异步 POST 请求，参数与 post 相同"""
+        return await self.async_request('POST', url, **kwargs)
+
+    async def aclose(self):
+        """关闭当前事件循环中的异步客户端"""
+        loop_id = id(asyncio.get_running_loop())
+        with self.lock:
+            keys = [key for key in self._async_clients if key[0] == loop_id]
+            clients = [self._async_clients.pop(key)[1] for key in keys]
+        for client in clients:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        获取每个主机的连接池统计
+
+        Returns:
+            主机名 → 统计信息，其中 connections_created 远小于 requests 说明连接被复用
+        """
+        with self.lock:
+            result = {}
+            for host, stats in self._stats.items():
+                host_stats = dict(stats)
+                host_stats['connections_created'] = 0
+                host_stats['idle_connections'] = 0
+                if host in self._adapters:
+                    # 通过 RecentlyUsedContainer 的公开接口（keys / get）取连接池，不读私有的 _container
+                    pools = self._adapters[host].poolmanager.pools
+                    for key in pools.keys():
+                        pool = pools.get(key)
+                        if pool is None:
+                            continue
+                        host_stats['connections_created'] += pool.num_connections
+                        host_stats['idle_connections'] += pool.pool.qsize() if pool.pool else 0
+                host_stats['avg_time'] = stats['total_time'] / stats['requests'] if stats['requests'] else 0.0
+                result[host] = host_stats
+            return result
+
+
+# 全局连接池实例
+http_pool = HTTPPool()
@@ -0,0 +1,190 @@
+"""
+图片处理工具模块
+- HEIC/HEIF → JPEG 内存转换（按源文件和修改时间缓存，每次上传最多解码一次）
+- OCR 前的图片预处理：限制最长边、可选灰度化、按目标质量重新编码为 JPEG
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageOps
+
+# 尝试导入 pillow-heif 以支持 HEIC 格式
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORT = True
+except ImportError:
+    HEIC_SUPPORT = False
+    print("⚠️  pillow-heif 未安装，HEIC 格式可能无法处理。安装命令: pip install pillow-heif")
+
+HEIC_EXTENSIONS = ('.heic', '.heif')
+
+# HEIC 转换结果缓存：(绝对路径, mtime_ns, 文件大小, 质量) → JPEG 字节
+HEIC_CACHE_MAX_ENTRIES = int(os.getenv('HEIC_CACHE_MAX_ENTRIES', '32'))
+_heic_cache: "OrderedDict[Tuple, bytes]" = OrderedDict()
+_heic_lock = threading.Lock()
+_heic_stats = {'hits': 0, 'misses': 0}
+
+
+def is_heic(image_path: str) -> bool:
+    """根据扩展名判断是否为 HEIC/HEIF 图片"""
+    return os.path.splitext(image_path)[1].lower() in HEIC_EXTENSIONS
+
+
+def to_rgb(img: Image.Image) -> Image.Image:
+    """
+    转换为 RGB 模式，透明背景填充为白色
+
+    Args:
+        img: PIL 图片
+
+    Returns:
+        RGB 模式的图片
+    """
+    if img.mode in ('RGBA', 'LA', 'P'):
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        rgb_img.paste(img, mask=img.split()[-1])
+        return rgb_img
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def heic_to_jpeg(image_path: str, quality: int = 95) -> bytes:
+    """
+    在内存中将 HEIC 图片转换为 JPEG 字节（不写临时文件）
+
+    结果按 (源文件, 修改时间, 大小, 质量) 缓存，同一上传文件的 OCR 和
+    图片预览只解码一次；文件被覆盖后修改时间变化，缓存自动失效。
+
+    Args:
+        image_path: HEIC 图片文件路径
+        quality: JPEG 编码质量
+
+    Returns:
+        JPEG 二进制数据
+    """
+    if not HEIC_SUPPORT:
+        raise ValueError("HEIC 格式不支持，请安装 pillow-heif: pip install pillow-heif")
+
+    stat = os.stat(image_path)
+    key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, quality)
+
+    with _heic_lock:
+        if key in _heic_cache:
+            _heic_cache.move_to_end(key)
+            _heic_stats['hits'] += 1
+            return _heic_cache[key]
+        _heic_stats['misses'] += 1
+
+    try:
+        with open(image_path, 'rb') as f:
+            img = Image.open(BytesIO(f.read()))
+            # 转换为 RGB 模式（HEIC 可能是 RGBA）
+            img = to_rgb(img)
+
+        output = BytesIO()
+        img.save(output, 'JPEG', quality=quality)
+        data = output.getvalue()
+    except Exception as e:
+        raise Exception(f"HEIC 转换失败: {str(e)}")
+
+    with _heic_lock:
+        _heic_cache[key] = data
+        while len(_heic_cache) > HEIC_CACHE_MAX_ENTRIES:
+            _heic_cache.popitem(last=False)
+
+    return data
+
+
+def heic_cache_stats() -> Dict:
+    """返回 HEIC 转换缓存的统计信息"""
+    with _heic_lock:
+        return {
+            **_heic_stats,
+            'entries': len(_heic_cache),
+            'max_entries': HEIC_CACHE_MAX_ENTRIES
+        }
+
+
+def read_image_bytes(image_path: str) -> bytes:
+    """
+    读取图片字节，HEIC 自动转换为 JPEG（使用共享的转换缓存）
+
+    Args:
+        image_path: 图片文件路径
+
+    Returns:
+        图片二进制数据
+    """
+    if is_heic(image_path):
+        return heic_to_jpeg(image_path)
+    with open(image_path, 'rb') as f:
+        return f.read()
+
+
+def preprocess_image(
+    image_path: str,
+    max_edge: Optional[int] = 2048,
+    grayscale: bool = False,
+    jpeg_quality: int = 85
+) -> Tuple[bytes, Dict]:
+    """
+    OCR 前预处理图片，缩小上传体积
+
+    先按 EXIF 方向旋正，再等比缩放到最长边不超过 max_edge，
+    可选转换为灰度，最后以 jpeg_quality 重新编码为 JPEG。
+    如果图片无需缩放且重新编码后反而更大，则保留原始字节。
+
+    Args:
+        image_path: 图片文件路径（HEIC 先经过共享的内存转换缓存）
+        max_edge: 最长边像素上限，None 或 0 表示不缩放
+        grayscale: 是否转换为灰度
+        jpeg_quality: JPEG 编码质量（1-95）
+
+    Returns:
+        (处理后的图片字节, 统计信息) 统计信息包含:
+        - bytes_before / bytes_after: 处理前后字节数
+        - size_before / size_after: 处理前后尺寸 [宽, 高]
+        - reencoded: 是否使用了重新编码的结果
+    """
+    bytes_before = os.path.getsize(image_path)
+    original = read_image_bytes(image_path)
+
+    img = Image.open(BytesIO(original))
+    size_before = list(img.size)
+    original_format = img.format
+    img = ImageOps.exif_transpose(img)
+
+    resized = False
+    if max_edge and max(img.size) > max_edge:
+        img = img.copy()
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        resized = True
+
+    img = img.convert('L') if grayscale else to_rgb(img)
+
+    output = BytesIO()
+    img.save(output, 'JPEG', quality=jpeg_quality, optimize=True)
+    encoded = output.getvalue()
+
+    # 未缩放、原本就是浏览器/Vision 可直接识别的格式，且重新编码没有变小时保留原图
+    keep_original = (
+        not resized and not grayscale
+        and original_format in ('JPEG', 'PNG', 'GIF', 'BMP', 'WEBP')
+        and len(encoded) >= len(original)
+    )
+    data = original if keep_original else encoded
+
+    return data, {
+        'bytes_before': bytes_before,
+        'bytes_after': len(data),
+        'size_before': size_before,
+        'size_after': list(img.size) if not keep_original else size_before,
+        'reencoded': not keep_original or is_heic(image_path)
+    }
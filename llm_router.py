@@ -0,0 +1,144 @@
+"""
+LLM 模型路由模块 - 按观测到的延迟在多个模型之间选择，并决定对冲请求的等待时间
+- 每个模型维护 EWMA 延迟和最近的延迟样本（用于计算 p90）
+- 失败按超时时间计入 EWMA，出故障的模型自动排到后面
+- 路由顺序：有样本的模型按 EWMA 从低到高，没有样本的模型保持配置顺序排在后面
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class ModelRouter:
+    """按模型统计延迟，给出路由顺序和对冲延迟"""
+
+    def __init__(self, alpha: float = 0.3,
+                 hedge_delay: Optional[str] = None,
+                 default_delay: Optional[float] = None,
+                 min_delay: Optional[float] = None,
+                 failure_penalty: float = 60.0,
+                 window: int = 50,
+                 min_samples: int = 5):
+        """
+        初始化路由器
+
+        Args:
+            alpha: EWMA 平滑系数（越大越偏向最近的请求）
+            hedge_delay: 对冲延迟，"p90" 表示使用主模型最近延迟的 p90，也可以是固定秒数，
+                         默认读取 LLM_HEDGE_DELAY（默认 "p90"）
+            default_delay: 样本不足时的对冲延迟（秒），默认读取 LLM_HEDGE_DEFAULT_DELAY（默认10）
+            min_delay: 对冲延迟下限（秒），默认读取 LLM_HEDGE_MIN_DELAY（默认2）
+            failure_penalty: 请求失败时计入 EWMA 的延迟（秒），与 LLM 请求超时一致
+            window: 计算 p90 时保留的最近样本数
+            min_samples: 使用 p90 所需的最少样本数
+        """
+        self.alpha = alpha
+        self.hedge_delay_setting = (hedge_delay or os.getenv('LLM_HEDGE_DELAY', 'p90')).strip().lower()
+        self.default_delay = default_delay if default_delay is not None else \
+            float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '10'))
+        self.min_delay = min_delay if min_delay is not None else float(os.getenv('LLM_HEDGE_MIN_DELAY', '2'))
+        self.failure_penalty = failure_penalty
+        self.window = window
+        self.min_samples = min_samples
+
+        self.lock = threading.Lock()
+        self._models: Dict[str, Dict] = {}
+
+    def _entry(self, model: str) -> Dict:
+        """模型的统计项（调用方需持有锁）"""
+        if model not in self._models:
+            self._models[model] = {
+                'ewma': None,
+                'samples': deque(maxlen=self.window),
+                'requests': 0,
+                'errors': 0,
+                'wins': 0,
+                'hedges': 0
+            }
+        return self._models[model]
+
+    def record(self, model: str, duration: float, ok: bool):
+        """
+        记录一次请求
+
+        Args:
+            model: 模型名称
+            duration: 请求耗时（秒）
+            ok: 是否得到有效结果
+        """
+        with self.lock:
+            entry = self._entry(model)
+            entry['requests'] += 1
+            latency = duration
+            if ok:
+                entry['samples'].append(duration)
+            else:
+                entry['errors'] += 1
+                latency = max(duration, self.failure_penalty)
+            entry['ewma'] = latency if entry['ewma'] is None else \
+                self.alpha * latency + (1 - self.alpha) * entry['ewma']
+
+    def record_win(self, model: str, hedged: bool):
+        """记录被采用的结果来自哪个模型，以及本次是否发出了对冲请求"""
+        with self.lock:
+            self._entry(model)['wins'] += 1
+            if hedged:
+                self._entry(model)['hedges'] += 1
+
+    def order(self, models: List[str]) -> List[str]:
+        """
+        按 EWMA 延迟给出路由顺序
+
+        Args:
+            models: 配置的模型列表（按优先级）
+
+        Returns:
+            排序后的模型列表；都没有样本时保持配置顺序
+        """
+        with self.lock:
+            ewma = {model: self._models[model]['ewma'] for model in models if model in self._models}
+        known = sorted((m for m in models if ewma.get(m) is not None), key=lambda m: ewma[m])
+        return known + [m for m in models if ewma.get(m) is None]
+
+    def percentile(self, model: str, q: float = 0.9) -> Optional[float]:
+        """模型最近成功请求延迟的分位数，样本不足时返回 None"""
+        with self.lock:
+            samples = sorted(self._models[model]['samples']) if model in self._models else []
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self, model: str) -> float:
+        """
+        向下一个模型发出对冲请求之前，等待当前模型的时间
+
+        Args:
+            model: 当前（先发出请求的）模型
+
+        Returns:
+            等待秒数
+        """
+        if self.hedge_delay_setting != 'p90':
+            return max(self.min_delay, float(self.hedge_delay_setting))
+        p90 = self.percentile(model)
+        return max(self.min_delay, p90 if p90 is not None else self.default_delay)
+
+    def stats(self) -> Dict:
+        """各模型的延迟统计"""
+        with self.lock:
+            models = {
+                model: {
+                    'ewma': round(entry['ewma'], 3) if entry['ewma'] is not None else None,
+                    'requests': entry['requests'],
+                    'errors': entry['errors'],
+                    'wins': entry['wins'],
+                    'hedges': entry['hedges']
+                }
+                for model, entry in self._models.items()
+            }
+        for model in models:
+            p90 = self.percentile(model)
+            models[model]['p90'] = round(p90, 3) if p90 is not None else None
+        return {'hedge_delay': self.hedge_delay_setting, 'models': models}
@@ -0,0 +1,253 @@
+"""
+近似文本索引模块 - 识别同一页重新识别后略有不同的 OCR 文本
+- MinHash：字符 n-gram（shingle）集合的签名，签名相同位置的比例估计 Jaccard 相似度
+- LSH：签名按 band 分桶，只和至少一个 band 完全相同的文本比较，查询不随条目数线性增长
+- 确认：签名估计的相似度只用于筛选候选，复用前用保存的规范化文本计算精确的 Jaccard 相似度，
+  阈值很高（默认0.98），短页面上改动一个词（如 しろい → くろい）也不会复用
+- 签名和规范化文本保存为追加写入的 JSON Lines 文件，指向 LLM 结果缓存中的条目
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 签名估计值的误差余量：估计值不低于 min_similarity - 余量的条目才计算精确相似度
+_ESTIMATE_MARGIN = 0.05
+
+
+def normalize_shingle_text(text: str) -> str:
+    """NFKC 并去掉空白（换行和分写的差异不影响结果）"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', text))
+
+
+def text_shingles(text: str, size: int = 3) -> Set[str]:
+    """
+    文本的字符 n-gram 集合（NFKC 并去掉空白，换行和分写的差异不影响结果）
+
+    Args:
+        text: 文本
+        size: n-gram 长度
+
+    Returns:
+        shingle 集合；文本短于 size 时为整段文本
+    """
+    normalized = normalize_shingle_text(text)
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    """两个集合的 Jaccard 相似度"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashIndex:
+    """MinHash/LSH 索引：OCR 文本签名 → LLM 结果缓存键"""
+
+    def __init__(self, index_path: Optional[str] = None,
+                 max_entries: Optional[int] = None,
+                 min_similarity: Optional[float] = None,
+                 num_perm: int = 128,
+                 bands: int = 32,
+                 shingle_size: int = 3,
+                 min_length: int = 20):
+        """
+        初始化索引
+
+        Args:
+            index_path: 签名文件（JSON Lines）路径，None 表示只保存在内存中
+            max_entries: 最多保留的文本数，超出时淘汰最早的，默认读取 LLM_FUZZY_MAX_ENTRIES（默认2000）
+            min_similarity: 复用结果所需的最低 Jaccard 相似度（由保存的文本精确计算），
+                            默认读取 LLM_FUZZY_MIN_SIMILARITY（默认0.98）
+            num_perm: 签名长度（哈希函数个数）
+            bands: LSH band 数，必须整除 num_perm
+            shingle_size: 字符 n-gram 长度
+            min_length: 短于该长度（去掉空白后）的文本不参与近似匹配
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须是 bands ({bands}) 的整数倍")
+        self.index_path = index_path or None
+        self.max_entries = max_entries or int(os.getenv('LLM_FUZZY_MAX_ENTRIES', '2000'))
+        self.min_similarity = min_similarity if min_similarity is not None else \
+            float(os.getenv('LLM_FUZZY_MIN_SIMILARITY', '0.98'))
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_length = min_length
+
+        # 固定种子的哈希函数参数，重启后签名保持一致
+        rng = random.Random(1)
+        self._permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                              for _ in range(num_perm)]
+
+        self.lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._buckets: Dict[tuple, Set[str]] = {}
+        self._lines = 0
+        self._stats = {'lookups': 0, 'matches': 0, 'unconfirmed': 0, 'additions': 0}
+        self._load()
+
+    def signature(self, text: str) -> Optional[List[int]]:
+        """
+        计算文本的 MinHash 签名
+
+        Args:
+            text: OCR 文本
+
+        Returns:
+            长度为 num_perm 的签名；文本过短时返回 None
+        """
+        if len(re.sub(r'\s+', '', text)) < self.min_length:
+            return None
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+                  for shingle in text_shingles(text, self.shingle_size)]
+        return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+                for a, b in self._permutations]
+
+    def similarity(self, a: List[int], b: List[int]) -> float:
+        """由签名估计 Jaccard 相似度"""
+        return sum(1 for x, y in zip(a, b) if x == y) / self.num_perm
+
+    def _band_keys(self, signature: List[int], scope: str) -> List[tuple]:
+        return [(scope, band, tuple(signature[band * self.rows:(band + 1) * self.rows]))
+                for band in range(self.bands)]
+
+    def _insert(self, entry: Dict):
+        """加入内存索引并按需淘汰最早的条目（调用方需持有锁）"""
+        key = entry['key']
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        for band_key in self._band_keys(entry['signature'], entry['scope']):
+            self._buckets.setdefault(band_key, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        """从内存索引中删除条目（调用方需持有锁）"""
+        entry = self._entries.pop(key)
+        for band_key in self._band_keys(entry['signature'], entry['scope']):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _load(self):
+        """从磁盘加载签名"""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    if len(entry.get('signature', [])) == self.num_perm:
+                        self._insert(entry)
+                    self._lines += 1
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[MINHASH] 读取索引失败，重新建立: {str(e)}")
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _append(self, entry: Dict):
+        """追加写入一条签名，文件行数超过两倍上限时按当前条目重写（调用方需持有锁）"""
+        if not self.index_path:
+            return
+        directory = os.path.dirname(self.index_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        try:
+            if self._lines >= 2 * self.max_entries:
+                tmp_path = f"{self.index_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for item in self._entries.values():
+                        f.write(json.dumps(item) + '\n')
+                os.replace(tmp_path, self.index_path)
+                self._lines = len(self._entries)
+            else:
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+                self._lines += 1
+        except OSError as e:
+            print(f"[MINHASH] 写入索引失败: {str(e)}")
+
+    def find(self, signature: List[int], text: str, scope: str = "") -> Optional[Dict]:
+        """
+        查找经过确认的最相似文本
+
+        签名估计的相似度只用于筛选候选；候选还要与保存的文本计算精确 Jaccard 相似度，
+        达到 min_similarity 才算同一页面。没有保存文本的旧条目无法确认，不会复用。
+
+        Args:
+            signature: 新文本的签名
+            text: 新文本
+            scope: 作用域（如模型 + prompt 版本），只在相同作用域内匹配
+
+        Returns:
+            包含 key（结果缓存键）和 similarity（精确 Jaccard 相似度）的字典；没有经过确认的文本时返回 None
+        """
+        shingles = text_shingles(text, self.shingle_size)
+        with self.lock:
+            self._stats['lookups'] += 1
+            candidates = set()
+            for band_key in self._band_keys(signature, scope):
+                candidates |= self._buckets.get(band_key, set())
+
+            best, best_similarity, unconfirmed = None, 0.0, False
+            for key in candidates:
+                entry = self._entries[key]
+                if self.similarity(signature, entry['signature']) < self.min_similarity - _ESTIMATE_MARGIN:
+                    continue
+                similarity = jaccard(shingles, text_shingles(entry['text'], self.shingle_size)) \
+                    if entry.get('text') else 0.0
+                if similarity < self.min_similarity:
+                    unconfirmed = True
+                elif similarity > best_similarity:
+                    best, best_similarity = key, similarity
+
+            if best is None:
+                if unconfirmed:
+                    self._stats['unconfirmed'] += 1
+                return None
+            self._stats['matches'] += 1
+            return {'key': best, 'similarity': best_similarity}
+
+    def add(self, signature: List[int], key: str, text: str, scope: str = ""):
+        """
+        登记文本签名
+
+        Args:
+            signature: 文本签名
+            key: 对应的结果缓存键
+            text: 文本（保存规范化后的形式，用于确认候选）
+            scope: 作用域
+        """
+        entry = {'key': key, 'scope': scope, 'signature': signature,
+                 'text': normalize_shingle_text(text), 'created_at': time.time()}
+        with self.lock:
+            self._insert(entry)
+            self._stats['additions'] += 1
+            self._append(entry)
+
+    def stats(self) -> Dict:
+        """索引统计"""
+        with self.lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['min_similarity'] = self.min_similarity
+            return stats
@@ -0,0 +1,393 @@
+"""
+OCR 后端模块 - 可替换的 OCR 引擎
+- OCRBackend: 后端基类，所有后端返回与 PictureToText.extract_text 相同结构的结果
+- TesseractBackend: 本地离线 OCR（Tesseract，日语），不依赖网络和 API 配额
+- OCRRouter: 干净、高对比度的页面先走本地引擎，置信度不足或其他页面走 Google Vision
+- create_ocr_backend: 按 OCR_BACKEND 环境变量（vision / local / auto）创建后端
+"""
+
+import os
+import re
+import time
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import Dict, List, Optional
+from PIL import Image, ImageOps
+from image_utils import read_image_bytes
+
+# 尝试导入 pytesseract 以支持本地 OCR（还需要系统安装 tesseract 和 jpn 语言包）
+try:
+    import pytesseract
+    TESSERACT_SUPPORT = True
+except ImportError:
+    TESSERACT_SUPPORT = False
+
+# 去掉 Tesseract 在日文字符之间插入的空格
+_CJK_SPACE = re.compile(r'(?<=[^\x00-\x7F])[ \t]+(?=[^\x00-\x7F])')
+
+# Tesseract 语言包 → BCP-47 语言代码（与 Vision 返回的 languageCode 一致）
+_TESSERACT_LANGUAGES = {
+    'jpn': 'ja',
+    'jpn_vert': 'ja',
+    'chi_sim': 'zh',
+    'chi_sim_vert': 'zh',
+    'chi_tra': 'zh',
+    'chi_tra_vert': 'zh',
+    'eng': 'en',
+    'kor': 'ko'
+}
+
+
+class OCRBackend(ABC):
+    """OCR 后端基类"""
+
+    name = "base"
+
+    @abstractmethod
+    def extract_text(self, image_path: str, detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict:
+        """
+        识别图片中的文本
+
+        Args:
+            image_path: 图片文件路径
+            detection_type: 检测类型（"TEXT_DETECTION" 或 "DOCUMENT_TEXT_DETECTION"）
+
+        Returns:
+            包含 full_text、text_blocks（可选 language / error）的字典
+        """
+
+    async def extract_text_async(self, image_path: str,
+                                 detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict:
+        """extract_text 的异步版本，默认在线程池中执行"""
+        return await asyncio.to_thread(self.extract_text, image_path, detection_type)
+
+    def extract_text_batch(self, image_paths: List[str],
+                           detection_type: str = "DOCUMENT_TEXT_DETECTION") -> List[Dict]:
+        """批量识别，结果顺序与输入一致；默认逐张调用 extract_text"""
+        results = []
+        for image_path in image_paths:
+            try:
+                results.append(self.extract_text(image_path, detection_type))
+            except Exception as e:
+                results.append({"full_text": "", "text_blocks": [], "error": str(e)})
+        return results
+
+    def cache_stats(self) -> Dict:
+        """结果缓存统计，默认没有缓存"""
+        return {'enabled': False}
+
+
+def analyze_page(image_path: str, sample_edge: int = 512) -> Dict:
+    """
+    估计页面是否为适合本地 OCR 的"干净"页面（白底黑字、色彩少）
+
+    在缩小的样本上统计：
+    - bimodal: 接近纯黑或纯白的像素占比，越高说明对比度越高、背景越干净
+    - saturation: 平均饱和度，绘本插图、彩色背景会明显偏高
+    - ink: 深色像素占比，过低可能是空白页，过高可能是照片
+
+    Args:
+        image_path: 图片文件路径
+        sample_edge: 统计用样本的最长边
+
+    Returns:
+        包含 bimodal、saturation、ink 的字典
+    """
+    img = Image.open(BytesIO(read_image_bytes(image_path)))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((sample_edge, sample_edge))
+    img = img.convert('RGB')
+
+    gray = img.convert('L').histogram()
+    total = sum(gray) or 1
+    dark = sum(gray[:80])
+    light = sum(gray[176:])
+    saturation = img.convert('HSV').split()[1].histogram()
+    mean_saturation = sum(value * count for value, count in enumerate(saturation)) / total / 255
+
+    return {
+        'bimodal': (dark + light) / total,
+        'saturation': mean_saturation,
+        'ink': dark / total
+    }
+
+
+class TesseractBackend(OCRBackend):
+    """本地 Tesseract OCR（CPU，无需网络），适合印刷体练习册等简单页面"""
+
+    name = "tesseract"
+
+    def __init__(self, lang: Optional[str] = None,
+                 psm: Optional[int] = None,
+                 max_edge: Optional[int] = None):
+        """
+        初始化
+
+        Args:
+            lang: Tesseract 语言包，默认读取 TESSERACT_LANG（默认 "jpn"，竖排可用 "jpn_vert"）
+            psm: 页面分割模式，默认读取 TESSERACT_PSM（默认6：单个均匀文本块）
+            max_edge: 识别前最长边像素上限，默认读取 TESSERACT_MAX_EDGE（默认2400）
+        """
+        if not TESSERACT_SUPPORT:
+            raise ValueError("pytesseract 未安装，无法使用本地 OCR。安装命令: pip install pytesseract")
+
+        self.lang = lang or os.getenv('TESSERACT_LANG', 'jpn')
+        self.psm = psm if psm is not None else int(os.getenv('TESSERACT_PSM', '6'))
+        self.max_edge = max_edge if max_edge is not None else int(os.getenv('TESSERACT_MAX_EDGE', '2400'))
+
+        # 确认 tesseract 可执行文件和语言包存在
+        try:
+            languages = pytesseract.get_languages(config='')
+        except Exception as e:
+            raise ValueError(f"tesseract 不可用: {str(e)}")
+        missing = [l for l in self.lang.split('+') if l not in languages]
+        if missing:
+            raise ValueError(f"tesseract 缺少语言包: {', '.join(missing)}")
+
+    def _language_codes(self) -> List[Dict]:
+        """语言包对应的 BCP-47 语言代码（去重，保持顺序；未知语言包原样返回）"""
+        codes = []
+        for lang in self.lang.split('+'):
+            code = _TESSERACT_LANGUAGES.get(lang, lang)
+            if code not in codes:
+                codes.append(code)
+        return [{"languageCode": code} for code in codes]
+
+    def _load_image(self, image_path: str) -> Image.Image:
+        """读取图片并转为适合 Tesseract 的灰度图"""
+        img = Image.open(BytesIO(read_image_bytes(image_path)))
+        img = ImageOps.exif_transpose(img)
+        if self.max_edge and max(img.size) > self.max_edge:
+            img = img.copy()
+            img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+        return img.convert('L')
+
+    def extract_text(self, image_path: str, detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict:
+        """
+        使用 Tesseract 识别图片中的文本
+
+        Args:
+            image_path: 图片文件路径
+            detection_type: 为兼容接口保留，本地引擎不区分检测类型
+
+        Returns:
+            与 PictureToText.extract_text 相同结构的字典，额外包含：
+            - confidence: 所有词的平均置信度（0-1）
+            - engine: "tesseract"
+        """
+        start = time.time()
+        try:
+            data = pytesseract.image_to_data(
+                self._load_image(image_path),
+                lang=self.lang,
+                config=f"--psm {self.psm}",
+                output_type=pytesseract.Output.DICT
+            )
+        except Exception as e:
+            return {"full_text": "", "text_blocks": [], "error": f"本地OCR失败: {str(e)}", "engine": self.name}
+
+        # 按 (块, 段落, 行) 组合词语，段落作为文本块
+        paragraphs: Dict = {}
+        confidences = []
+        for i, word in enumerate(data['text']):
+            conf = float(data['conf'][i])
+            if conf < 0 or not word.strip():
+                continue
+            confidences.append(conf / 100)
+            key = (data['block_num'][i], data['par_num'][i])
+            lines = paragraphs.setdefault(key, {'lines': {}, 'confidences': []})
+            lines['lines'].setdefault(data['line_num'][i], []).append(word)
+            lines['confidences'].append(conf / 100)
+
+        text_blocks = []
+        for key in sorted(paragraphs):
+            paragraph = paragraphs[key]
+            lines = [_CJK_SPACE.sub('', " ".join(words)) for _, words in sorted(paragraph['lines'].items())]
+            text_blocks.append({
+                "text": "".join(lines),
+                "confidence": sum(paragraph['confidences']) / len(paragraph['confidences'])
+            })
+            paragraph['text'] = "\n".join(lines)
+
+        full_text = "\n".join(paragraphs[key]['text'] for key in sorted(paragraphs))
+        if full_text:
+            full_text += "\n"
+
+        print(f"[OCR] 本地识别完成: {len(full_text)} 字符, 耗时 {time.time() - start:.2f} 秒")
+        return {
+            "full_text": full_text,
+            "text_blocks": text_blocks,
+            "language": self._language_codes(),
+            "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+            "engine": self.name
+        }
+
+
+class OCRRouter(OCRBackend):
+    """
+    OCR 路由：干净的高对比度页面先用本地引擎识别，
+    本地结果置信度不足、识别失败或页面不干净时交给远程引擎（Google Vision）
+    """
+
+    name = "router"
+
+    def __init__(self, remote: Optional[OCRBackend] = None,
+                 local: Optional[OCRBackend] = None,
+                 min_bimodal: Optional[float] = None,
+                 max_saturation: Optional[float] = None,
+                 min_confidence: Optional[float] = None):
+        """
+        初始化
+
+        Args:
+            remote: 远程后端（通常是 PictureToText），为 None 时只使用本地引擎
+            local: 本地后端（通常是 TesseractBackend），为 None 时全部交给远程后端
+            min_bimodal: 走本地引擎所需的最低黑白像素占比，默认读取 OCR_LOCAL_MIN_CONTRAST（默认0.9）
+            max_saturation: 走本地引擎允许的最高平均饱和度，默认读取 OCR_LOCAL_MAX_SATURATION（默认0.15）
+            min_confidence: 接受本地结果的最低平均置信度，默认读取 OCR_LOCAL_MIN_CONFIDENCE（默认0.75）
+        """
+        if remote is None and local is None:
+            raise ValueError("OCR 路由至少需要一个后端")
+
+        self.remote = remote
+        self.local = local
+        self.min_bimodal = min_bimodal if min_bimodal is not None else \
+            float(os.getenv('OCR_LOCAL_MIN_CONTRAST', '0.9'))
+        self.max_saturation = max_saturation if max_saturation is not None else \
+            float(os.getenv('OCR_LOCAL_MAX_SATURATION', '0.15'))
+        self.min_confidence = min_confidence if min_confidence is not None else \
+            float(os.getenv('OCR_LOCAL_MIN_CONFIDENCE', '0.75'))
+
+        self.lock = threading.Lock()
+        self._stats = {'local': 0, 'fallback': 0, 'remote': 0}
+
+    def _count(self, key: str):
+        with self.lock:
+            self._stats[key] += 1
+
+    def is_clean_page(self, image_path: str) -> bool:
+        """判断页面是否适合本地引擎"""
+        try:
+            page = analyze_page(image_path)
+        except Exception as e:
+            print(f"[OCR] 页面分析失败，交给远程引擎: {str(e)}")
+            return False
+        return (page['bimodal'] >= self.min_bimodal
+                and page['saturation'] <= self.max_saturation
+                and 0.002 <= page['ink'] <= 0.4)
+
+    def _try_local(self, image_path: str, detection_type: str) -> Optional[Dict]:
+        """
+        尝试本地识别
+
+        Returns:
+            可接受的本地结果；页面不干净、识别失败或置信度不足时返回 None
+        """
+        if self.local is None:
+            return None
+        if not self.is_clean_page(image_path):
+            return None
+
+        result = self.local.extract_text(image_path, detection_type)
+        if 'error' not in result and result.get('full_text', '').strip() \
+                and result.get('confidence', 0.0) >= self.min_confidence:
+            return result
+
+        print(f"[OCR] 本地结果置信度不足 ({result.get('confidence', 0.0):.2f})，改用远程引擎")
+        self._count('fallback')
+        return None
+
+    def extract_text(self, image_path: str, detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict:
+        """按页面质量选择引擎识别文本（没有远程后端时全部交给本地引擎）"""
+        if self.remote is None:
+            self._count('local')
+            return self.local.extract_text(image_path, detection_type)
+        result = self._try_local(image_path, detection_type)
+        if result is not None:
+            self._count('local')
+            return result
+        self._count('remote')
+        return self.remote.extract_text(image_path, detection_type)
+
+    async def extract_text_async(self, image_path: str,
+                                 detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict:
+        """extract_text 的异步版本：本地识别在线程池中执行，远程请求走异步客户端"""
+        if self.remote is None:
+            self._count('local')
+            return await self.local.extract_text_async(image_path, detection_type)
+        result = await asyncio.to_thread(self._try_local, image_path, detection_type)
+        if result is not None:
+            self._count('local')
+            return result
+        self._count('remote')
+        return await self.remote.extract_text_async(image_path, detection_type)
+
+    def extract_text_batch(self, image_paths: List[str],
+                           detection_type: str = "DOCUMENT_TEXT_DETECTION") -> List[Dict]:
+        """批量识别：能本地识别的页面先处理，其余页面合并为一次远程批量请求"""
+        if self.remote is None:
+            with self.lock:
+                self._stats['local'] += len(image_paths)
+            return self.local.extract_text_batch(image_paths, detection_type)
+        results: List[Optional[Dict]] = [None] * len(image_paths)
+        remote_indexes = []
+        for index, image_path in enumerate(image_paths):
+            try:
+                results[index] = self._try_local(image_path, detection_type)
+            except Exception as e:
+                results[index] = {"full_text": "", "text_blocks": [], "error": str(e)}
+            if results[index] is None:
+                remote_indexes.append(index)
+            else:
+                self._count('local')
+
+        if remote_indexes:
+            remote_results = self.remote.extract_text_batch(
+                [image_paths[index] for index in remote_indexes], detection_type
+            )
+            for index, result in zip(remote_indexes, remote_results):
+                self._count('remote')
+                results[index] = result
+        return results
+
+    def cache_stats(self) -> Dict:
+        """远程后端的结果缓存统计"""
+        return self.remote.cache_stats() if self.remote else {'enabled': False}
+
+    def stats(self) -> Dict:
+        """路由统计：local 为本地识别页数，fallback 为本地置信度不足改走远程的页数"""
+        with self.lock:
+            return dict(self._stats)
+
+
+def create_ocr_backend(backend: Optional[str] = None) -> OCRBackend:
+    """
+    按配置创建 OCR 后端
+
+    Args:
+        backend: "vision"（只用 Google Vision）、"local"（只用本地 Tesseract）
+                 或 "auto"（路由），默认读取 OCR_BACKEND（默认 "vision"）
+
+    Returns:
+        OCR 后端实例
+    """
+    backend = (backend or os.getenv('OCR_BACKEND', 'vision')).lower()
+
+    if backend == 'local':
+        return TesseractBackend()
+
+    from picture_to_text import PictureToText
+
+    if backend == 'auto':
+        try:
+            local = TesseractBackend()
+        except ValueError as e:
+            print(f"⚠️  本地 OCR 不可用，全部使用 Google Vision: {str(e)}")
+            local = None
+        return OCRRouter(remote=PictureToText(), local=local)
+
+    if backend != 'vision':
+        raise ValueError(f"未知的 OCR_BACKEND: {backend}（可选 vision / local / auto）")
+    return PictureToText()
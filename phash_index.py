@@ -0,0 +1,241 @@
+"""
+感知哈希索引模块 - 识别同一页面的重拍照片
+- dHash（差异哈希）：对轻微的角度、光照、裁剪和压缩变化保持稳定
+- 按汉明距离查找近似页面作为候选；同一版式、文字不同的练习册页面哈希也非常接近，
+  所以候选还要经过确认（文件内容哈希相同，或 OCR 文本签名相同）才复用已完成任务的 OCR / 文本处理 / TTS 结果
+- 哈希列表保存为 JSON，任务结果复用 ResultCache 的内存 + 磁盘存储
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import tempfile
+import threading
+import unicodedata
+from io import BytesIO
+from typing import Dict, List, Optional
+from PIL import Image, ImageOps
+from image_utils import read_image_bytes
+from result_cache import ResultCache, make_cache_key
+
+
+def dhash(image_path: str, hash_size: int = 16) -> int:
+    """
+    计算图片的差异哈希（dHash）
+
+    先按 EXIF 方向旋正并转为灰度，缩放到 (hash_size+1) x hash_size，
+    比较每行相邻像素的明暗得到 hash_size*hash_size 位的整数。
+
+    Args:
+        image_path: 图片文件路径（HEIC 经过共享的内存转换缓存）
+        hash_size: 哈希边长，位数为其平方
+
+    Returns:
+        哈希值
+    """
+    img = Image.open(BytesIO(read_image_bytes(image_path)))
+    img = ImageOps.exif_transpose(img)
+    img.draft('L', (hash_size * 8, hash_size * 8))  # JPEG 可直接按缩小尺寸解码
+    img = img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(img.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个哈希值的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+def text_signature(text: Optional[str]) -> Optional[str]:
+    """
+    OCR 文本签名：NFKC 规范化并去掉空白后的哈希，重拍时的换行和空格差异不影响签名
+
+    Args:
+        text: OCR 全文
+
+    Returns:
+        签名字符串；没有文字时返回 None（空白页面之间不能互相确认）
+    """
+    normalized = re.sub(r'\s+', '', unicodedata.normalize('NFKC', text or ''))
+    if not normalized:
+        return None
+    return make_cache_key('text', normalized)[:32]
+
+
+class PerceptualHashIndex:
+    """页面感知哈希索引：哈希 → 已完成任务的结果"""
+
+    def __init__(self, index_path: Optional[str] = None,
+                 max_entries: Optional[int] = None,
+                 min_similarity: Optional[float] = None,
+                 hash_size: int = 16):
+        """
+        初始化索引
+
+        Args:
+            index_path: 哈希列表 JSON 路径，默认读取 PHASH_INDEX_PATH（默认 cache/phash_index.json），
+                        为空字符串时只保存在内存中；结果存放在同目录的 phash_results/ 下
+            max_entries: 最多保留的页面数，超出时淘汰最早的，默认读取 PHASH_MAX_ENTRIES（默认1000）
+            min_similarity: 成为候选所需的最低相似度（1 - 汉明距离/位数），
+                            默认读取 PHASH_MIN_SIMILARITY（默认0.95）
+            hash_size: dHash 边长
+        """
+        if index_path is None:
+            index_path = os.getenv('PHASH_INDEX_PATH', 'cache/phash_index.json')
+        self.index_path = index_path or None
+        self.max_entries = max_entries or int(os.getenv('PHASH_MAX_ENTRIES', '1000'))
+        self.min_similarity = min_similarity if min_similarity is not None else \
+            float(os.getenv('PHASH_MIN_SIMILARITY', '0.95'))
+        self.hash_size = hash_size
+        self.bits = hash_size * hash_size
+
+        self.lock = threading.Lock()
+        self._entries: List[Dict] = []
+        self._stats = {'lookups': 0, 'matches': 0, 'unconfirmed': 0, 'additions': 0}
+        # 有磁盘层时内存只保留最近的结果，否则内存需要容纳全部页面
+        self.results = ResultCache(
+            name="PHASH",
+            max_entries=64 if self.index_path else self.max_entries,
+            cache_dir=os.path.join(os.path.dirname(self.index_path) or '.', 'phash_results')
+            if self.index_path else None
+        )
+        self._load()
+
+    def _load(self):
+        """从磁盘加载哈希列表"""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            self._entries = [dict(entry, hash=int(entry['hash'], 16)) for entry in entries]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[PHASH] 读取索引失败，重新建立: {str(e)}")
+            self._entries = []
+
+    def _save(self):
+        """原子写入哈希列表（调用方需持有锁）"""
+        if not self.index_path:
+            return
+        directory = os.path.dirname(self.index_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        entries = [dict(entry, hash=format(entry['hash'], 'x')) for entry in self._entries]
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"[PHASH] 写入索引失败: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def compute(self, image_path: str) -> Optional[int]:
+        """计算图片哈希，图片无法解码时返回 None"""
+        try:
+            return dhash(image_path, self.hash_size)
+        except Exception as e:
+            print(f"[PHASH] 计算哈希失败: {str(e)}")
+            return None
+
+    def similarity(self, a: int, b: int) -> float:
+        """两个哈希的相似度（0-1）"""
+        return 1 - hamming_distance(a, b) / self.bits
+
+    def find(self, page_hash: int, content_hash: Optional[str] = None,
+             signature: Optional[str] = None) -> Optional[Dict]:
+        """
+        查找经过确认的相似页面
+
+        感知哈希达到阈值的页面只是候选，还需要文件内容哈希相同或 OCR 文本签名相同才算同一页面。
+
+        Args:
+            page_hash: 新页面的哈希
+            content_hash: 新页面文件内容的 SHA-256
+            signature: 新页面 OCR 文本的签名（text_signature）
+
+        Returns:
+            包含 result、similarity、task_id、filename、confirmed_by 的字典；
+            没有经过确认的页面或结果已失效时返回 None
+        """
+        with self.lock:
+            self._stats['lookups'] += 1
+            candidates = []
+            for entry in self._entries:
+                similarity = 1 - hamming_distance(page_hash, entry['hash']) / self.bits
+                if similarity >= self.min_similarity:
+                    candidates.append((similarity, entry))
+        candidates.sort(key=lambda item: item[0], reverse=True)
+
+        for similarity, entry in candidates:
+            if content_hash and entry.get('content_hash') == content_hash:
+                confirmed_by = 'content_hash'
+            elif signature and entry.get('signature') == signature:
+                confirmed_by = 'text_signature'
+            else:
+                continue
+
+            result = self.results.get(entry['key'])
+            if result is None:
+                continue
+            with self.lock:
+                self._stats['matches'] += 1
+            print(f"[PHASH] 命中相似页面: {entry['filename']} (相似度 {similarity:.2%}，{confirmed_by} 确认)")
+            return {
+                'result': result,
+                'similarity': similarity,
+                'task_id': entry['task_id'],
+                'filename': entry['filename'],
+                'confirmed_by': confirmed_by
+            }
+
+        if candidates:
+            with self.lock:
+                self._stats['unconfirmed'] += 1
+        return None
+
+    def add(self, page_hash: int, result: Dict, task_id: str, filename: str,
+            content_hash: Optional[str] = None, signature: Optional[str] = None):
+        """
+        登记已完成任务的结果
+
+        Args:
+            page_hash: 页面哈希
+            result: 任务结果
+            task_id: 任务ID
+            filename: 原始文件名
+            content_hash: 页面文件内容的 SHA-256
+            signature: 页面 OCR 文本的签名
+        """
+        key = uuid.uuid4().hex
+        self.results.set(key, result)
+        with self.lock:
+            self._entries.append({
+                'hash': page_hash,
+                'key': key,
+                'task_id': task_id,
+                'filename': filename,
+                'content_hash': content_hash,
+                'signature': signature,
+                'created_at': time.time()
+            })
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+            self._stats['additions'] += 1
+            self._save()
+
+    def stats(self) -> Dict:
+        """索引统计"""
+        with self.lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['min_similarity'] = self.min_similarity
+            return stats
@@ -6,33 +6,59 @@ Picture to Text 功能模块
 import os
 import base64
 import json
-import tempfile
-from typing import Dict, List, Optional
+import asyncio
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import requests
-from PIL import Image
-
-# 尝试导入 pillow-heif 以支持 HEIC 格式
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    HEIC_SUPPORT = True
-except ImportError:
-    HEIC_SUPPORT = False
-    print("⚠️  pillow-heif 未安装，HEIC 格式可能无法处理。安装命令: pip install pillow-heif")
+from http_pool import http_pool, raise_for_status
+from result_cache import ResultCache, make_cache_key, sha256_file
+from image_utils import HEIC_SUPPORT, is_heic, heic_to_jpeg, read_image_bytes, preprocess_image
+from ocr_backends import OCRBackend
 
 # 加载环境变量
 load_dotenv()
 
-class PictureToText:
+class PictureToText(OCRBackend):
     """图片转文字类，使用Google Cloud Vision API"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    name = "vision"
+    
+    # images:annotate 单次请求限制（Vision API 文档：每请求最多16张图片，JSON请求体最大10MB）
+    MAX_IMAGES_PER_REQUEST = 16
+    MAX_REQUEST_BYTES = 9 * 1024 * 1024  # 留出 JSON 结构本身的余量
+    
+    # 部分响应字段掩码（fields 参数）：只下载 _parse_image_response 实际用到的字段，
+    # 省去每个符号的 boundingBox 顶点、detectedBreak 等数据的下载和 JSON 解析
+    RESPONSE_FIELDS = {
+        "DOCUMENT_TEXT_DETECTION": (
+            "responses(error,fullTextAnnotation(text,pages(property/detectedLanguages,"
+            "blocks/paragraphs(confidence,words/symbols/text))))"
+        ),
+        "TEXT_DETECTION": "responses(error,textAnnotations(description,boundingPoly))",
+    }
+    
+    def __init__(self, api_key: Optional[str] = None,
+                 language_hints: Optional[List[str]] = None,
+                 cache: Optional[ResultCache] = None,
+                 use_cache: bool = True,
+                 preprocess: Optional[bool] = None,
+                 max_edge: Optional[int] = None,
+                 grayscale: Optional[bool] = None,
+                 jpeg_quality: Optional[int] = None,
+                 field_mask: Optional[bool] = None):
         """
         初始化
         
         Args:
             api_key: Google Cloud API Key，如果不提供则从环境变量读取
+            language_hints: 语言提示，默认为 ["ja"]
+            cache: OCR结果缓存，不提供则按环境变量创建默认缓存
+            use_cache: 是否启用OCR结果缓存
+            preprocess: 是否在上传前预处理图片（缩放/重新编码），默认读取 OCR_PREPROCESS（默认开启）
+            max_edge: 预处理时最长边像素上限，默认读取 OCR_MAX_EDGE（默认2048）
+            grayscale: 预处理时是否转为灰度，默认读取 OCR_GRAYSCALE（默认关闭）
+            jpeg_quality: 预处理时的 JPEG 质量，默认读取 OCR_JPEG_QUALITY（默认85）
+            field_mask: 是否只请求需要的响应字段，默认读取 OCR_FIELD_MASK（默认开启）
         """
         self.api_key = api_key or os.getenv('GOOGLE_CLOUD_API_KEY')
         if not self.api_key:
@@ -40,47 +66,41 @@ class PictureToText:
         
         # Google Cloud Vision API REST端点
         self.api_url = f"https://vision.googleapis.com/v1/images:annotate?key={self.api_key}"
+        self.language_hints = language_hints or ["ja"]
+        
+        # 上传前的图片预处理配置
+        self.preprocess = preprocess if preprocess is not None else os.getenv('OCR_PREPROCESS', '1') == '1'
+        self.max_edge = max_edge if max_edge is not None else int(os.getenv('OCR_MAX_EDGE', '2048'))
+        self.grayscale = grayscale if grayscale is not None else os.getenv('OCR_GRAYSCALE', '0') == '1'
+        self.jpeg_quality = jpeg_quality if jpeg_quality is not None else int(os.getenv('OCR_JPEG_QUALITY', '85'))
+        self.field_mask = field_mask if field_mask is not None else os.getenv('OCR_FIELD_MASK', '1') == '1'
+        
+        # OCR结果缓存（按图片内容 SHA-256 + 检测类型 + 语言提示）
+        self.cache = None
+        if use_cache:
+            self.cache = cache or ResultCache(
+                name="OCR",
+                max_entries=int(os.getenv('OCR_CACHE_MAX_ENTRIES', '256')),
+                cache_dir=os.getenv('OCR_CACHE_DIR', 'cache/ocr') or None,
+                max_disk_bytes=int(float(os.getenv('OCR_CACHE_DISK_MB', '512')) * 1024 * 1024)
+            )
     
-    def _convert_heic_to_jpg(self, image_path: str) -> str:
+    def _convert_heic_to_jpg(self, image_path: str) -> bytes:
         """
-        将 HEIC 格式图片转换为 JPG 格式
+        将 HEIC 格式图片转换为 JPG 格式（内存中完成，结果按文件和修改时间缓存）
         
         Args:
             image_path: HEIC 图片文件路径
             
         Returns:
-            转换后的临时 JPG 文件路径
+            JPG 二进制数据
         """
-        if not HEIC_SUPPORT:
-            raise ValueError("HEIC 格式不支持，请安装 pillow-heif: pip install pillow-heif")
-        
-        try:
-            img = Image.open(image_path)
-            # 创建临时文件
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            temp_path = temp_file.name
-            temp_file.close()
-            
-            # 转换为 RGB 模式（HEIC 可能是 RGBA）
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = rgb_img
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # 保存为 JPG
-            img.save(temp_path, 'JPEG', quality=95)
-            return temp_path
-        except Exception as e:
-            raise Exception(f"HEIC 转换失败: {str(e)}")
+        return heic_to_jpeg(image_path)
     
     def _encode_image(self, image_path: str) -> str:
         """
         将图片编码为base64字符串
-        自动处理 HEIC 格式转换
+        自动处理 HEIC 格式转换和上传前预处理
         
         Args:
             image_path: 图片文件路径
@@ -88,61 +108,102 @@ class PictureToText:
         Returns:
             base64编码的图片字符串
         """
-        # 检查是否为 HEIC 格式
-        file_ext = os.path.splitext(image_path)[1].lower()
-        temp_file = None
+        return self._prepare_image(image_path)[0]
+    
+    def _prepare_image(self, image_path: str) -> Tuple[str, Dict]:
+        """
+        读取图片并编码为base64，返回编码结果和上传体积统计
         
-        try:
-            if file_ext in ['.heic', '.heif']:
-                # 转换为 JPG
-                converted_path = self._convert_heic_to_jpg(image_path)
-                temp_file = converted_path
-                image_path = converted_path
+        Args:
+            image_path: 图片文件路径
             
-            with open(image_path, 'rb') as image_file:
-                return base64.b64encode(image_file.read()).decode('UTF-8')
-        finally:
-            # 清理临时文件
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.unlink(temp_file)
-                except:
-                    pass
+        Returns:
+            (base64编码的图片字符串, 统计信息 bytes_before/bytes_after 等)
+        """
+        # 检查是否为 HEIC 格式
+        heic = is_heic(image_path)
+        if heic and not HEIC_SUPPORT:
+            raise ValueError("HEIC 格式不支持，请安装 pillow-heif: pip install pillow-heif")
+        
+        if self.preprocess:
+            try:
+                data, stats = preprocess_image(
+                    image_path,
+                    max_edge=self.max_edge,
+                    grayscale=self.grayscale,
+                    jpeg_quality=self.jpeg_quality
+                )
+                return base64.b64encode(data).decode('UTF-8'), stats
+            except Exception as e:
+                if heic:
+                    raise
+                print(f"[OCR] 图片预处理失败，使用原图: {str(e)}")
+        
+        # HEIC 在内存中转换为 JPG，其他格式直接读取
+        data = read_image_bytes(image_path)
+        return base64.b64encode(data).decode('UTF-8'), {
+            'bytes_before': os.path.getsize(image_path),
+            'bytes_after': len(data),
+            'reencoded': heic
+        }
     
-    def detect_text(self, image_path: str, detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict:
+    def _build_image_request(self, image_path: str, detection_type: str) -> Tuple[Dict, Dict]:
         """
-        检测图片中的文本
+        构建单张图片的 annotate 请求项
         
         Args:
             image_path: 图片文件路径
             detection_type: 检测类型
-                - "TEXT_DETECTION": 通用文本检测
-                - "DOCUMENT_TEXT_DETECTION": 文档文本检测（推荐用于打印文本，支持复杂布局）
-        
+            
         Returns:
-            包含识别结果的字典
+            (requests 数组中的一项, 上传体积统计)
         """
         # 编码图片
-        image_content = self._encode_image(image_path)
+        image_content, payload_stats = self._prepare_image(image_path)
         
-        # 构建请求体
-        request_body = {
-            "requests": [
+        return {
+            "image": {
+                "content": image_content
+            },
+            "features": [
                 {
-                    "image": {
-                        "content": image_content
-                    },
-                    "features": [
-                        {
-                            "type": detection_type,
-                            "maxResults": 10
-                        }
-                    ],
-                    "imageContext": {
-                        "languageHints": ["ja"]  # 提示API这是日语内容
-                    }
+                    "type": detection_type,
+                    "maxResults": 10
                 }
-            ]
+            ],
+            "imageContext": {
+                "languageHints": self.language_hints  # 提示API这是日语内容
+            }
+        }, payload_stats
+    
+    def _response_fields(self, detection_type: str, full_geometry: bool) -> Optional[str]:
+        """
+        返回本次请求使用的 fields 字段掩码
+        
+        Args:
+            detection_type: 检测类型
+            full_geometry: 调用方是否需要完整的几何信息（需要时不使用掩码）
+            
+        Returns:
+            fields 参数，None 表示请求完整响应
+        """
+        if full_geometry or not self.field_mask:
+            return None
+        return self.RESPONSE_FIELDS.get(detection_type)
+    
+    def _annotate(self, image_requests: List[Dict], fields: Optional[str] = None) -> Dict:
+        """
+        发送 images:annotate 请求（一次可包含多张图片）
+        
+        Args:
+            image_requests: requests 数组
+            fields: 部分响应字段掩码，None 表示返回完整响应
+            
+        Returns:
+            API 返回的 JSON
+        """
+        request_body = {
+            "requests": image_requests
         }
         
         # 发送请求
@@ -151,28 +212,191 @@ class PictureToText:
         }
         
         try:
-            response = requests.post(self.api_url, json=request_body, headers=headers)
+            params = {"fields": fields} if fields else None
+            response = http_pool.post(self.api_url, json=request_body, headers=headers, params=params, timeout=30)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             raise Exception(f"API请求失败: {str(e)}")
     
-    def extract_text(self, image_path: str, detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict[str, any]:
+    async def _annotate_async(self, image_requests: List[Dict], fields: Optional[str] = None) -> Dict:
+        """
+        发送 images:annotate 请求（非阻塞版本）
+        
+        Args:
+            image_requests: requests 数组
+            fields: 部分响应字段掩码，None 表示返回完整响应
+            
+        Returns:
+            API 返回的 JSON
+        """
+        request_body = {
+            "requests": image_requests
+        }
+        
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            params = {"fields": fields} if fields else None
+            response = await http_pool.async_post(self.api_url, json=request_body, headers=headers,
+                                                  params=params, timeout=30)
+            raise_for_status(response)
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"API请求失败: {str(e)}")
+    
+    def detect_text(self, image_path: str, detection_type: str = "DOCUMENT_TEXT_DETECTION") -> Dict:
+        """
+        检测图片中的文本
+        
+        Args:
+            image_path: 图片文件路径
+            detection_type: 检测类型
+                - "TEXT_DETECTION": 通用文本检测
+                - "DOCUMENT_TEXT_DETECTION": 文档文本检测（推荐用于打印文本，支持复杂布局）
+        
+        Returns:
+            包含识别结果的字典
+        """
+        return self._annotate([self._build_image_request(image_path, detection_type)[0]])
+    
+    def _cache_key(self, image_path: str, detection_type: str, full_geometry: bool = False) -> str:
+        """
+        生成OCR缓存键：图片内容 SHA-256 + 检测类型 + 语言提示
+        
+        Args:
+            image_path: 图片文件路径
+            detection_type: 检测类型
+            full_geometry: 结果是否包含完整几何信息
+            
+        Returns:
+            缓存键
+        """
+        return make_cache_key(
+            sha256_file(image_path),
+            detection_type,
+            ",".join(self.language_hints),
+            self._preprocess_signature(),
+            "geometry" if full_geometry else "text"
+        )
+    
+    def _preprocess_signature(self) -> str:
+        """预处理配置签名（不同配置可能得到不同识别结果，需分开缓存）"""
+        if not self.preprocess:
+            return "original"
+        return f"edge={self.max_edge};gray={int(self.grayscale)};q={self.jpeg_quality}"
+    
+    def cache_stats(self) -> Dict:
+        """返回OCR缓存统计信息（未启用缓存时返回 enabled=False）"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.stats()}
+    
+    def extract_text(self, image_path: str, detection_type: str = "DOCUMENT_TEXT_DETECTION",
+                     full_geometry: bool = False) -> Dict[str, any]:
         """
         提取图片中的文本并返回结构化结果
+        相同图片内容的成功结果会被缓存，重复调用不再请求 API
         
         Args:
             image_path: 图片文件路径
             detection_type: 检测类型
+            full_geometry: 是否需要完整几何信息；默认只请求文本相关字段，
+                为 True 时请求完整响应，DOCUMENT_TEXT_DETECTION 的文本块额外包含 bounding_box
         
         Returns:
             包含以下字段的字典:
             - full_text: 完整识别的文本
             - text_blocks: 文本块列表（带位置信息）
             - confidence: 置信度（如果有）
+            - payload: 本次上传的图片体积统计（命中缓存时没有此字段）
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(image_path, detection_type, full_geometry)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"[OCR] 命中缓存: {os.path.basename(image_path)}")
+                return cached
+        
+        result = self._extract_text_uncached(image_path, detection_type, full_geometry)
+        
+        # 只缓存成功的结果，错误结果下次重试
+        if cache_key and 'error' not in result:
+            self._store(cache_key, result)
+        
+        return result
+    
+    def _store(self, cache_key: str, result: Dict):
+        """写入缓存（上传体积统计只属于本次请求，不写入缓存）"""
+        self.cache.set(cache_key, {k: v for k, v in result.items() if k != 'payload'})
+    
+    def _extract_text_uncached(self, image_path: str, detection_type: str,
+                               full_geometry: bool = False) -> Dict[str, any]:
+        """
+        调用 API 提取文本（不经过缓存）
+        
+        Args:
+            image_path: 图片文件路径
+            detection_type: 检测类型
+            full_geometry: 是否需要完整几何信息
+        
+        Returns:
+            与 extract_text 相同结构的字典
+        """
+        image_request, payload_stats = self._build_image_request(image_path, detection_type)
+        result = self._annotate([image_request], self._response_fields(detection_type, full_geometry))
+        return self._parse_single_result(result, detection_type, payload_stats, full_geometry)
+    
+    async def extract_text_async(self, image_path: str,
+                                 detection_type: str = "DOCUMENT_TEXT_DETECTION",
+                                 full_geometry: bool = False) -> Dict[str, any]:
+        """
+        extract_text 的异步版本：图片读取/预处理在线程中执行，API 请求不阻塞事件循环
+        
+        Args:
+            image_path: 图片文件路径
+            detection_type: 检测类型
+            full_geometry: 是否需要完整几何信息
+        
+        Returns:
+            与 extract_text 相同结构的字典
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = await asyncio.to_thread(self._cache_key, image_path, detection_type, full_geometry)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"[OCR] 命中缓存: {os.path.basename(image_path)}")
+                return cached
+        
+        image_request, payload_stats = await asyncio.to_thread(
+            self._build_image_request, image_path, detection_type
+        )
+        result = await self._annotate_async([image_request], self._response_fields(detection_type, full_geometry))
+        parsed = self._parse_single_result(result, detection_type, payload_stats, full_geometry)
+        
+        if cache_key and 'error' not in parsed:
+            self._store(cache_key, parsed)
+        
+        return parsed
+    
+    def _parse_single_result(self, result: Dict, detection_type: str, payload_stats: Dict,
+                             full_geometry: bool = False) -> Dict[str, any]:
         """
-        result = self.detect_text(image_path, detection_type)
+        解析只包含一张图片的 annotate 返回
         
+        Args:
+            result: API 返回的 JSON
+            detection_type: 检测类型
+            payload_stats: 本次上传的图片体积统计
+            full_geometry: 是否提取几何信息
+        
+        Returns:
+            与 extract_text 相同结构的字典
+        """
         # 解析响应
         if 'responses' not in result or len(result['responses']) == 0:
             return {
@@ -181,8 +405,95 @@ class PictureToText:
                 "error": "未检测到文本"
             }
         
-        response = result['responses'][0]
+        parsed = self._parse_image_response(result['responses'][0], detection_type, full_geometry)
+        parsed['payload'] = payload_stats
+        return parsed
+    
+    def extract_text_batch(self, image_paths: List[str],
+                           detection_type: str = "DOCUMENT_TEXT_DETECTION") -> List[Dict[str, any]]:
+        """
+        批量提取多张图片中的文本，多张图片打包进同一个 annotate 请求
+        
+        每个请求最多 MAX_IMAGES_PER_REQUEST 张图片，且请求体不超过
+        MAX_REQUEST_BYTES；超出时自动拆分为多个请求。已缓存的图片不再发送。
         
+        Args:
+            image_paths: 图片文件路径列表
+            detection_type: 检测类型
+        
+        Returns:
+            与 image_paths 顺序一致的结果列表，每项结构与 extract_text 相同
+            （单张失败时该项包含 error 字段，不影响其他图片）
+        """
+        results: List[Optional[Dict]] = [None] * len(image_paths)
+        cache_keys: List[Optional[str]] = [None] * len(image_paths)
+        
+        # 先查缓存，只编码未命中的图片
+        pending = []
+        for index, image_path in enumerate(image_paths):
+            if self.cache is not None:
+                cache_keys[index] = self._cache_key(image_path, detection_type)
+                cached = self.cache.get(cache_keys[index])
+                if cached is not None:
+                    print(f"[OCR] 命中缓存: {os.path.basename(image_path)}")
+                    results[index] = cached
+                    continue
+            try:
+                image_request, payload_stats = self._build_image_request(image_path, detection_type)
+            except Exception as e:
+                results[index] = {"full_text": "", "text_blocks": [], "error": str(e)}
+                continue
+            pending.append((index, image_request, payload_stats))
+        
+        # 按图片数量和请求体大小打包
+        batches = []
+        current, current_bytes = [], 0
+        for item in pending:
+            item_bytes = len(item[1]["image"]["content"])
+            if current and (len(current) >= self.MAX_IMAGES_PER_REQUEST or
+                            current_bytes + item_bytes > self.MAX_REQUEST_BYTES):
+                batches.append(current)
+                current, current_bytes = [], 0
+            current.append(item)
+            current_bytes += item_bytes
+        if current:
+            batches.append(current)
+        
+        for batch in batches:
+            print(f"[OCR] 批量请求: {len(batch)} 张图片")
+            try:
+                result = self._annotate([image_request for _, image_request, _ in batch],
+                                        self._response_fields(detection_type, False))
+                responses = result.get('responses', [])
+            except Exception as e:
+                for index, _, _ in batch:
+                    results[index] = {"full_text": "", "text_blocks": [], "error": str(e)}
+                continue
+            
+            for position, (index, _, payload_stats) in enumerate(batch):
+                if position >= len(responses):
+                    results[index] = {"full_text": "", "text_blocks": [], "error": "未检测到文本"}
+                    continue
+                results[index] = self._parse_image_response(responses[position], detection_type)
+                if cache_keys[index] and 'error' not in results[index]:
+                    self._store(cache_keys[index], results[index])
+                results[index]['payload'] = payload_stats
+        
+        return results
+    
+    def _parse_image_response(self, response: Dict, detection_type: str,
+                              full_geometry: bool = False) -> Dict[str, any]:
+        """
+        解析 annotate 返回中单张图片的结果
+        
+        Args:
+            response: responses 数组中的一项
+            detection_type: 检测类型
+            full_geometry: 是否为 DOCUMENT_TEXT_DETECTION 的文本块附加段落 bounding_box
+        
+        Returns:
+            与 extract_text 相同结构的字典
+        """
         # 检查是否有错误
         if 'error' in response:
             return {
@@ -213,10 +524,13 @@ class PictureToText:
                                                     word_text = "".join([s['text'] for s in word['symbols']])
                                                     block_text += word_text
                                         if block_text:
-                                            text_blocks.append({
+                                            text_block = {
                                                 "text": block_text,
                                                 "confidence": paragraph.get('confidence', 0)
-                                            })
+                                            }
+                                            if full_geometry:
+                                                text_block["bounding_box"] = paragraph.get('boundingBox', {})
+                                            text_blocks.append(text_block)
                 
                 return {
                     "full_text": full_text,
@@ -0,0 +1,183 @@
+"""
+Prompt 模板注册表 - 文本处理使用的 LLM prompt
+- legacy: 原始模板，OCR 文本在第一句，任何两次请求都没有共同前缀
+- system_first: 固定说明放在 system 消息，OCR 文本放在最后的 user 消息，
+  所有请求共享同一前缀，上游的 prompt 缓存（prefix caching）可以命中
+- cleanup / translate: 拆分模式下并发发出的两个请求，分别只输出日语部分和中文翻译
+- json: 与 system_first 相同的说明，输出为 JSON 对象（见 structured_output.py），不依赖分节标题解析
+"""
+
+import hashlib
+from typing import Dict, List
+
+# 输出格式说明（两个模板共用，保证 _parse_response 的解析规则不变）
+OUTPUT_FORMAT = """请严格按照以下格式输出（不要添加任何其他说明）：
+
+指导语：
+[指导语内容，如果没有则留空]
+
+正文：
+[处理后的日语正文]
+
+分段：
+[段落1]
+[段落2]
+[段落3]
+...
+
+中文翻译：
+[对应的中文翻译]"""
+
+# 拆分模式：日语清理请求的输出格式（不含中文翻译）
+CLEANUP_OUTPUT_FORMAT = OUTPUT_FORMAT.split("\n\n中文翻译：")[0]
+
+# 结构化输出格式（字段与 structured_output.RESULT_SCHEMA 一致）
+JSON_OUTPUT_FORMAT = """请只输出一个 JSON 对象（不要使用代码块，不要添加任何其他说明），字段如下：
+
+{"instruction": "指导语内容，如果没有则为空字符串", "main_text": "处理后的日语正文", "segments": ["段落1", "段落2"], "chinese_translation": "对应的中文翻译"}"""
+
+TASK_STEPS = """1. 去噪：删除页码、教材级别（如 4A）、水印等无关信息。
+2. 去重：删除重复的注音假名。
+3. 合并：将断行合并为自然的句子。
+4. 识别指导语：识别出指导语（如"でてきたものは？げんきよく読みましょう。"这类教学指导），如果没有指导语则留空。
+5. 识别正文：识别出实际的故事内容。
+6. 分段：将正文按语义分成合适的段落，每段2-3句，适合单独朗读。"""
+
+
+class PromptTemplate:
+    """一个 prompt 模板：可选的 system 消息 + 包含 {raw_text} 的 user 消息"""
+
+    def __init__(self, name: str, user_template: str, system: str = "", output_format: str = "sections"):
+        """
+        Args:
+            name: 模板名称
+            user_template: user 消息模板，必须包含 {raw_text}
+            system: system 消息（固定内容），为空时不发送 system 消息
+            output_format: 输出格式，sections（分节标题，_parse_response 解析）或 json（结构化输出）
+        """
+        if '{raw_text}' not in user_template:
+            raise ValueError(f"模板 {name} 缺少 {{raw_text}} 占位符")
+        if output_format not in ("sections", "json"):
+            raise ValueError(f"模板 {name} 的输出格式无效: {output_format}")
+        self.name = name
+        self.user_template = user_template
+        self.system = system
+        self.output_format = output_format
+
+    @property
+    def version(self) -> str:
+        """模板内容的指纹，用于缓存键"""
+        content = f"{self.name}\x1f{self.system}\x1f{self.user_template}"
+        if self.output_format != "sections":
+            content += f"\x1f{self.output_format}"
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+
+    def build_messages(self, raw_text: str) -> List[Dict[str, str]]:
+        """
+        构建 chat/completions 的 messages
+
+        Args:
+            raw_text: 发送给 LLM 的 OCR 文本
+
+        Returns:
+            messages 列表
+        """
+        messages = []
+        if self.system:
+            messages.append({"role": "system", "content": self.system})
+        messages.append({"role": "user", "content": self.user_template.replace('{raw_text}', raw_text)})
+        return messages
+
+
+_TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register_prompt_template(template: PromptTemplate):
+    """注册（或覆盖）一个 prompt 模板"""
+    _TEMPLATES[template.name] = template
+
+
+def get_prompt_template(name: str) -> PromptTemplate:
+    """
+    按名称获取 prompt 模板
+
+    Args:
+        name: 模板名称
+
+    Returns:
+        PromptTemplate
+    """
+    if name not in _TEMPLATES:
+        raise ValueError(f"未知的 prompt 模板: {name}（可选 {', '.join(sorted(_TEMPLATES))}）")
+    return _TEMPLATES[name]
+
+
+def prompt_template_names() -> List[str]:
+    """已注册的模板名称"""
+    return sorted(_TEMPLATES)
+
+
+register_prompt_template(PromptTemplate(
+    name="legacy",
+    user_template=f"""你是一个日语绘本专家。以下是从图片中 OCR 提取的碎片内容：{{raw_text}}
+
+请执行：
+
+{TASK_STEPS}
+
+{OUTPUT_FORMAT}"""
+))
+
+register_prompt_template(PromptTemplate(
+    name="system_first",
+    system=f"""你是一个日语绘本专家。用户会发送从图片中 OCR 提取的碎片内容。
+
+请执行：
+
+{TASK_STEPS}
+
+{OUTPUT_FORMAT}""",
+    user_template="OCR 提取的碎片内容：\n{raw_text}"
+))
+
+register_prompt_template(PromptTemplate(
+    name="cleanup",
+    system=f"""你是一个日语绘本专家。用户会发送从图片中 OCR 提取的碎片内容。
+
+请执行：
+
+{TASK_STEPS}
+
+{CLEANUP_OUTPUT_FORMAT}""",
+    user_template="OCR 提取的碎片内容：\n{raw_text}"
+))
+
+register_prompt_template(PromptTemplate(
+    name="translate",
+    system="""你是一个日语绘本专家。用户会发送从图片中 OCR 提取的碎片内容。
+
+请执行：
+
+1. 忽略页码、教材级别（如 4A）、水印、重复的注音假名等无关信息，将断行合并为自然的句子。
+2. 忽略指导语（如"でてきたものは？げんきよく読みましょう。"这类教学指导），只保留故事正文。
+3. 将正文翻译为适合儿童的中文，每句日语对应一句中文，按原文顺序逐行输出。
+
+请严格按照以下格式输出（不要添加任何其他说明）：
+
+中文翻译：
+[对应的中文翻译]""",
+    user_template="OCR 提取的碎片内容：\n{raw_text}"
+))
+
+register_prompt_template(PromptTemplate(
+    name="json",
+    system=f"""你是一个日语绘本专家。用户会发送从图片中 OCR 提取的碎片内容。
+
+请执行：
+
+{TASK_STEPS}
+
+{JSON_OUTPUT_FORMAT}""",
+    user_template="OCR 提取的碎片内容：\n{raw_text}",
+    output_format="json"
+))
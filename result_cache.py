@@ -0,0 +1,266 @@
+"""
+结果缓存模块 - 内存 LRU + 磁盘持久化两级缓存（可选 TTL 过期）
+用于缓存 OCR、LLM 等上游 API 的结果，避免对同一内容重复请求
+- 磁盘层可按总字节数限制（max_disk_bytes）：启动时按修改时间建立索引，之后写入和命中只更新索引，
+  超出时删除最久未使用的文件；不设上限也没有 TTL 时磁盘层只增不减，需要运维定期清理
+- clear() 只清空内存层
+"""
+
+import os
+import copy
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 超过该时间（秒）的 .tmp 文件视为异常退出留下的临时文件；更新的可能正被其他进程写入
+_TMP_GRACE_SECONDS = 600
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容的 SHA-256
+
+    Args:
+        path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        十六进制摘要字符串
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(*parts) -> str:
+    """
+    由多个组成部分生成缓存键
+
+    Args:
+        parts: 参与计算的值（会转换为字符串）
+
+    Returns:
+        SHA-256 十六进制字符串
+    """
+    joined = '\x1f'.join(str(p) for p in parts)
+    return hashlib.sha256(joined.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """两级结果缓存：有界内存 LRU + 可选的磁盘 JSON 存储"""
+
+    def __init__(self, name: str, max_entries: int = 256, cache_dir: Optional[str] = None,
+                 ttl: Optional[float] = None, max_disk_bytes: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            name: 缓存名称（用于日志和统计）
+            max_entries: 内存层最多保留的条目数
+            cache_dir: 磁盘层目录，None 表示只使用内存层
+            ttl: 条目有效期（秒），None 或 0 表示永不过期；磁盘层按文件修改时间判断
+            max_disk_bytes: 磁盘层最多保留的字节数，None 或 0 表示不限制
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.ttl = ttl or None
+        self.max_disk_bytes = max_disk_bytes or None
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._written_at: Dict[str, float] = {}
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self.lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'disk_evictions': 0
+        }
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self.max_disk_bytes:
+                for _, path, size in sorted(self._disk_files()):
+                    self._disk[path] = size
+                    self._disk_bytes += size
+                self._prune_disk()
+
+    def _disk_files(self) -> List[Tuple[float, str, int]]:
+        """
+        扫描磁盘层的缓存文件 (修改时间, 路径, 字节数)，只在启动时调用；
+        顺带删除超过 _TMP_GRACE_SECONDS 的临时文件
+        """
+        files = []
+        now = time.time()
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith('.tmp'):
+                        if now - stat.st_mtime > _TMP_GRACE_SECONDS:
+                            os.remove(path)
+                    elif name.endswith('.json'):
+                        files.append((stat.st_mtime, path, stat.st_size))
+                except OSError:
+                    continue
+        return files
+
+    def _touch_disk(self, path: str, size: Optional[int] = None):
+        """在磁盘层索引中登记或刷新一个文件（size 为 None 时表示删除）"""
+        if not self.max_disk_bytes:
+            return
+        with self.lock:
+            self._disk_bytes -= self._disk.pop(path, 0)
+            if size is not None:
+                self._disk[path] = size
+                self._disk_bytes += size
+
+    def _prune_disk(self, keep: Optional[str] = None):
+        """磁盘层超出字节上限时删除最久未使用的文件（keep 为刚写入的文件，不删除）"""
+        while True:
+            with self.lock:
+                if not self.max_disk_bytes or self._disk_bytes <= self.max_disk_bytes:
+                    return
+                victim = next((path for path in self._disk if path != keep), None)
+                if victim is None:
+                    return
+                self._disk_bytes -= self._disk.pop(victim)
+                self._stats['disk_evictions'] += 1
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+
+    def _disk_path(self, key: str) -> str:
+        """返回缓存键对应的磁盘文件路径（按前两位分目录）"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, value: Dict, written_at: Optional[float] = None):
+        """写入内存层并按 LRU 淘汰（调用方需持有锁）"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        self._written_at[key] = written_at if written_at is not None else time.time()
+        while len(self._memory) > self.max_entries:
+            evicted, _ = self._memory.popitem(last=False)
+            self._written_at.pop(evicted, None)
+            self._stats['evictions'] += 1
+
+    def _expired(self, written_at: float) -> bool:
+        """判断写入时间为 written_at 的条目是否已过期"""
+        return self.ttl is not None and time.time() - written_at > self.ttl
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的值（副本），未命中返回 None
+        """
+        with self.lock:
+            if key in self._memory:
+                if not self._expired(self._written_at[key]):
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return copy.deepcopy(self._memory[key])
+                del self._memory[key]
+                del self._written_at[key]
+                self._stats['expirations'] += 1
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    written_at = os.path.getmtime(path)
+                    if self._expired(written_at):
+                        os.remove(path)
+                        self._touch_disk(path)
+                        with self.lock:
+                            self._stats['expirations'] += 1
+                            self._stats['misses'] += 1
+                        return None
+                    with open(path, 'r', encoding='utf-8') as f:
+                        value = json.load(f)
+                    # 只刷新索引中的顺序，不修改文件时间（TTL 按写入时间计算）
+                    self._touch_disk(path, os.path.getsize(path))
+                    with self.lock:
+                        self._remember(key, value, written_at)
+                        self._stats['disk_hits'] += 1
+                    return copy.deepcopy(value)
+                except (OSError, ValueError) as e:
+                    print(f"[{self.name}缓存] 读取磁盘缓存失败，忽略: {str(e)}")
+
+        with self.lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key: str, value: Dict):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 可 JSON 序列化的值
+        """
+        value = copy.deepcopy(value)
+        with self.lock:
+            self._remember(key, value)
+            self._stats['writes'] += 1
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            temp_path = None
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # 先写临时文件再原子替换，避免并发读到半个文件
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(value, f, ensure_ascii=False)
+                os.replace(temp_path, path)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"[{self.name}缓存] 写入磁盘缓存失败: {str(e)}")
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return
+            self._touch_disk(path, os.path.getsize(path))
+            self._prune_disk(keep=path)
+
+    def clear(self):
+        """清空内存层（磁盘层保留，由 max_disk_bytes / ttl 或运维清理）"""
+        with self.lock:
+            self._memory.clear()
+            self._written_at.clear()
+
+    def stats(self) -> Dict:
+        """
+        获取缓存统计信息
+
+        Returns:
+            包含命中/未命中次数、命中率和条目数的字典
+        """
+        with self.lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_bytes'] = self._disk_bytes if self.max_disk_bytes else None
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hits'] = hits
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['persistent'] = bool(self.cache_dir)
+        stats['ttl'] = self.ttl
+        stats['max_disk_bytes'] = self.max_disk_bytes
+        return stats
@@ -0,0 +1,278 @@
+"""
+结构化输出模块 - LLM 以 JSON 返回文本处理结果（LLM_PROMPT_TEMPLATE=json）
+- RESULT_SCHEMA: 请求时通过 response_format 发送的 JSON Schema
+- parse_structured_output: 一次 json.loads 解析并校验字段；只有解析失败时才运行本地修复
+  （去掉代码块标记、多余的逗号、字符串中的换行，补全被截断的括号），不重新请求 LLM
+- StreamingJsonParser: 流式输出的增量解析器，每个分段的字符串结束时立即回调
+"""
+
+import re
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 结构化输出的字段（与分节格式的 指导语 / 正文 / 分段 / 中文翻译 对应）
+RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "instruction": {"type": "string"},
+        "main_text": {"type": "string"},
+        "segments": {"type": "array", "items": {"type": "string"}},
+        "chinese_translation": {"type": "string"}
+    },
+    "required": ["instruction", "main_text", "segments", "chinese_translation"],
+    "additionalProperties": False
+}
+
+_STRING_FIELDS = ("instruction", "main_text", "chinese_translation")
+_CODE_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+
+class StructuredOutputError(ValueError):
+    """LLM 的 JSON 输出无法解析或不符合 RESULT_SCHEMA"""
+
+
+def response_format(mode: str) -> Optional[Dict]:
+    """
+    chat/completions 的 response_format 参数
+
+    Args:
+        mode: json_schema（按 RESULT_SCHEMA 约束）、json_object（只要求合法 JSON）或 none（不发送）
+
+    Returns:
+        response_format 参数；mode 为 none 时返回 None
+    """
+    if mode == 'json_schema':
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "picture_book_page", "strict": True, "schema": RESULT_SCHEMA}
+        }
+    if mode == 'json_object':
+        return {"type": "json_object"}
+    if mode == 'none':
+        return None
+    raise ValueError(f"未知的 response_format: {mode}（可选 json_schema / json_object / none）")
+
+
+def _escape_control_characters(text: str) -> str:
+    """转义字符串内部未转义的换行和制表符，并补全被截断的字符串和括号"""
+    output = []
+    stack = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == '\n':
+                ch = '\\n'
+            elif ch == '\r':
+                ch = ''
+            elif ch == '\t':
+                ch = '\\t'
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]' and stack:
+            stack.pop()
+        output.append(ch)
+
+    if in_string:
+        if escape:
+            output.pop()
+        output.append('"')
+    repaired = ''.join(output).rstrip()
+    if stack:
+        # 输出被截断（如达到 max_tokens）：去掉末尾不完整的键值对后补全括号
+        repaired = re.sub(r',\s*("[^"]*"\s*:?\s*)?$', '', repaired)
+        repaired += ''.join(reversed(stack))
+    return repaired
+
+
+def repair_json(content: str) -> str:
+    """
+    修复常见的 JSON 格式问题（只在 json.loads 失败时调用）
+
+    Args:
+        content: LLM 的原始输出
+
+    Returns:
+        修复后的文本（不保证能解析）
+    """
+    text = _CODE_FENCE.sub('', content.strip())
+    start = text.find('{')
+    if start < 0:
+        return text
+    end = text.rfind('}')
+    text = text[start:] if end < start else text[start:end + 1]
+    try:
+        json.loads(text)
+        return text
+    except ValueError:
+        pass
+    text = _escape_control_characters(text)
+    return _TRAILING_COMMA.sub(r'\1', text)
+
+
+def _validate(data) -> Dict:
+    """按 RESULT_SCHEMA 校验并规范化（去掉首尾空白和空分段）"""
+    if not isinstance(data, dict):
+        raise StructuredOutputError("顶层不是 JSON 对象")
+    result = {}
+    for field in _STRING_FIELDS:
+        value = data.get(field, "")
+        if value is None:
+            value = ""
+        if not isinstance(value, str):
+            raise StructuredOutputError(f"字段 {field} 不是字符串")
+        result[field] = value.strip()
+
+    segments = data.get("segments")
+    if not isinstance(segments, list) or not all(isinstance(s, str) for s in segments):
+        raise StructuredOutputError("字段 segments 不是字符串数组")
+    result["segments"] = [s.strip() for s in segments if s.strip()]
+
+    if not result["main_text"]:
+        raise StructuredOutputError("缺少正文 main_text")
+    if not result["segments"]:
+        raise StructuredOutputError("缺少分段 segments")
+    result["japanese_text"] = result["main_text"]
+    return result
+
+
+def parse_structured_output(content: str) -> Tuple[Dict, bool]:
+    """
+    解析 LLM 的 JSON 输出
+
+    Args:
+        content: LLM 的原始输出
+
+    Returns:
+        (与 _parse_response 相同结构的字典, 是否经过修复)
+
+    Raises:
+        StructuredOutputError: 修复后仍无法解析或字段不符合 RESULT_SCHEMA
+    """
+    try:
+        return _validate(json.loads(content)), False
+    except ValueError as e:
+        if isinstance(e, StructuredOutputError):
+            raise
+        error = e
+
+    try:
+        return _validate(json.loads(repair_json(content))), True
+    except StructuredOutputError:
+        raise
+    except ValueError:
+        raise StructuredOutputError(f"JSON 解析失败: {str(error)}")
+
+
+class StreamingJsonParser:
+    """
+    JSON 流式输出的增量解析器（与 StreamingSectionParser 接口相同）
+    逐字符跟踪对象/数组层级，顶层字段或 segments 中的字符串结束时立即回调，
+    LLM 还在输出后面的分段和翻译时前面的分段就可以开始合成语音
+    """
+
+    # 顶层字段 → 回调事件类型
+    EVENTS = {
+        'instruction': 'instruction',
+        'main_text': 'main_text',
+        'chinese_translation': 'chinese_translation'
+    }
+
+    def __init__(self, on_event: Optional[Callable[[str, Dict], None]] = None):
+        """
+        初始化
+
+        Args:
+            on_event: 回调 on_event(事件类型, 数据)
+        """
+        self.on_event = on_event
+        self.parts: List[str] = []
+        self.segment_count = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._expect_key = False
+        self._key = None
+
+    def _emit(self, event: str, data: Dict):
+        """触发回调，回调中的异常不影响继续接收 LLM 输出"""
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event, data)
+        except Exception as e:
+            print(f"[文本处理] 流式回调失败 ({event}): {str(e)}")
+
+    def feed(self, chunk: str):
+        """
+        接收一段流式输出
+
+        Args:
+            chunk: LLM 增量输出的文本
+        """
+        self.parts.append(chunk)
+        for ch in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._close_string(''.join(self._string))
+                    continue
+                self._string.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._string = []
+            elif ch == '{':
+                self._stack.append('{')
+                self._expect_key = True
+            elif ch == '[':
+                self._stack.append('[')
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+            elif ch == ',':
+                self._expect_key = bool(self._stack) and self._stack[-1] == '{'
+            elif ch == ':':
+                self._expect_key = False
+
+    def finish(self) -> str:
+        """
+        输出结束
+
+        Returns:
+            完整的 LLM 输出
+        """
+        return ''.join(self.parts)
+
+    def _close_string(self, raw: str):
+        """
+        一个字符串结束：记录顶层键名，或对顶层字段值、segments 元素触发回调
+
+        字符串中未转义的换行等控制字符（最终解析时由 repair_json 修复）照常解码；
+        其他无法解码的转义保留原文，分段不会被跳过，回调的序号与最终结果一致
+        """
+        try:
+            text = json.loads(f'"{raw}"', strict=False)
+        except ValueError:
+            text = raw
+        if self._stack == ['{']:
+            if self._expect_key:
+                self._key = text
+            elif self._key in self.EVENTS and text.strip():
+                self._emit(self.EVENTS[self._key], {'text': text.strip()})
+        elif self._stack == ['{', '['] and self._key == 'segments' and text.strip():
+            self._emit('segment', {'index': self.segment_count, 'text': text.strip()})
+            self.segment_count += 1
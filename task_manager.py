@@ -58,7 +58,9 @@ class TaskManager:
             'created_at': datetime.now().isoformat(),
             'updated_at': datetime.now().isoformat(),
             'result': None,
-            'error': None
+            'partial_result': None,
+            'error': None,
+            'metrics': {}
         }
         
         with self.lock:
@@ -109,6 +111,50 @@ class TaskManager:
                     task['error'] = error
                     task['status'] = TaskStatus.FAILED.value
     
+    def update_progress(self, task_id: str, progress: Dict):
+        """
+        更新进度信息（不改变任务状态），值为字典的项与已有字典合并
+        
+        Args:
+            task_id: 任务ID
+            progress: 进度信息
+        """
+        with self.lock:
+            if task_id in self.tasks:
+                task = self.tasks[task_id]
+                for key, value in progress.items():
+                    if isinstance(value, dict) and isinstance(task['progress'].get(key), dict):
+                        task['progress'][key].update(value)
+                    else:
+                        task['progress'][key] = value
+                task['updated_at'] = datetime.now().isoformat()
+    
+    def update_partial_result(self, task_id: str, partial: Dict):
+        """
+        发布部分结果（如翻译完成前的日语正文和分段），任务完成前可通过查询接口获取
+        
+        Args:
+            task_id: 任务ID
+            partial: 部分结果，与已有部分结果合并
+        """
+        with self.lock:
+            if task_id in self.tasks:
+                task = self.tasks[task_id]
+                task['partial_result'] = {**(task.get('partial_result') or {}), **partial}
+                task['updated_at'] = datetime.now().isoformat()
+    
+    def update_task_metrics(self, task_id: str, metrics: Dict):
+        """
+        记录任务的性能/体积等指标（不改变任务状态）
+        
+        Args:
+            task_id: 任务ID
+            metrics: 指标数据，与已有指标合并
+        """
+        with self.lock:
+            if task_id in self.tasks:
+                self.tasks[task_id]['metrics'].update(metrics)
+    
     def cleanup_old_tasks(self):
         """清理过期任务"""
         current_time = time.time()
@@ -0,0 +1,232 @@
+"""
+本地 OpenAI 兼容的模拟 LLM 服务器（/v1/chat/completions）
+用于离线基准测试和手动联调：可配置首字延迟、输出速度（token/秒）和回复内容，支持 stream: true（SSE）
+
+在测试中使用：
+    with MockLLMServer(latency=0.05, tokens_per_second=400) as server:
+        processor.api_url = server.url
+
+按请求定制回复（延迟、错误状态码、usage）：
+    def responder(request):
+        if "11ばんめ" in request_text(request):
+            return {"status": 400}
+        return {"content": canned_response(request_text(request)), "delay": 0.3}
+
+手动运行（其他进程通过 LLM_BASE_URL=http://127.0.0.1:8001/v1 使用）：
+    python tests/mock_llm_server.py --port 8001 --latency 0.5 --tokens-per-second 80
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Union
+
+_SENTENCE_END = re.compile(r'(?<=[。！？!?])')
+
+
+def canned_response(raw_text: str, json_output: bool = False) -> str:
+    """
+    按 OCR 文本生成一份格式正确的回复（正文为输入的句子，每2句一段，翻译为占位文本）
+
+    Args:
+        raw_text: 请求中的 OCR 文本
+        json_output: 是否按 json 模板的格式输出
+
+    Returns:
+        回复内容
+    """
+    sentences = [s.strip() for s in _SENTENCE_END.split(re.sub(r'\s+', ' ', raw_text)) if s.strip()]
+    sentences = sentences or [raw_text.strip() or "。"]
+    main_text = "".join(sentences)
+    segments = ["".join(sentences[i:i + 2]) for i in range(0, len(sentences), 2)]
+    translation = "\n".join(f"（第{i + 1}句的翻译）" for i in range(len(sentences)))
+    if json_output:
+        return json.dumps({"instruction": "", "main_text": main_text, "segments": segments,
+                           "chinese_translation": translation}, ensure_ascii=False)
+    return f"指导语：\n\n正文：\n{main_text}\n\n分段：\n" + "\n".join(segments) + f"\n\n中文翻译：\n{translation}"
+
+
+def request_text(request: Dict) -> str:
+    """从请求的最后一条消息中取出 OCR 文本"""
+    content = request['messages'][-1]['content']
+    return content.split("OCR 提取的碎片内容：", 1)[-1].lstrip("\n")
+
+
+class MockLLMServer:
+    """在后台线程运行的模拟 LLM 服务器"""
+
+    def __init__(self, latency: float = 0.05,
+                 tokens_per_second: float = 0,
+                 jitter: float = 0.0,
+                 responder: Optional[Callable[[Dict], Union[str, Dict]]] = None,
+                 streaming: bool = True,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 seed: int = 1):
+        """
+        初始化
+
+        Args:
+            latency: 首字延迟（秒）
+            tokens_per_second: 输出速度，0 表示回复立即全部返回；token 数按回复字符数估算
+            jitter: 延迟的随机波动比例（0.2 表示 ±20%）
+            responder: responder(请求体) 返回回复内容，默认按 canned_response 生成；
+                       也可以返回字典，键为 content、delay（在 latency 之外的额外延迟，秒）、
+                       status（非 200 时返回错误响应）和 usage
+            streaming: 是否支持 SSE；False 时忽略请求中的 stream 参数，返回普通 JSON
+            host: 监听地址
+            port: 监听端口，0 表示随机端口
+            seed: 随机波动的种子
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.responder = responder or self._default_responder
+        self.streaming = streaming
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.requests: List[Dict] = []
+        # 正在处理的请求数和峰值（测试并发上限用）
+        self.active = 0
+        self.peak = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """chat/completions 的完整地址"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    @property
+    def base_url(self) -> str:
+        """可直接用作 LLM_BASE_URL 的地址"""
+        return self.url.rsplit('/chat/completions', 1)[0]
+
+    @staticmethod
+    def _default_responder(request: Dict) -> str:
+        system = request['messages'][0]['content'] if len(request['messages']) > 1 else ""
+        return canned_response(request_text(request), json_output='JSON 对象' in system)
+
+    def _scaled(self, seconds: float) -> float:
+        if not self.jitter:
+            return seconds
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, seconds * factor)
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with mock.lock:
+                    mock.requests.append(request)
+                    mock.active += 1
+                    mock.peak = max(mock.peak, mock.active)
+                try:
+                    self._reply(request)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with mock.lock:
+                        mock.active -= 1
+
+            def _reply(self, request: Dict):
+                reply = mock.responder(request)
+                if not isinstance(reply, dict):
+                    reply = {"content": reply}
+                content = reply.get('content', '')
+                usage = reply.get('usage') or {
+                    "prompt_tokens": sum(len(m['content']) for m in request['messages']),
+                    "completion_tokens": len(content)
+                }
+                time.sleep(mock._scaled(mock.latency) + reply.get('delay', 0))
+                status = reply.get('status', 200)
+                if status != 200:
+                    self._send_json(status, {"error": {"message": "模拟的上游错误"}})
+                elif request.get('stream') and mock.streaming:
+                    self._stream(content, usage)
+                else:
+                    if mock.tokens_per_second:
+                        time.sleep(mock._scaled(len(content) / mock.tokens_per_second))
+                    self._send_json(200, {"choices": [{"message": {"content": content}}], "usage": usage})
+
+            def _send_json(self, status: int, response: Dict):
+                body = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, content: str, usage: Dict):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                step = 8
+                for i in range(0, len(content), step):
+                    chunk = {"choices": [{"delta": {"content": content[i:i + step]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    if mock.tokens_per_second:
+                        time.sleep(mock._scaled(step / mock.tokens_per_second))
+                self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MockLLMServer":
+        """在后台线程启动"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务器"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务器（OpenAI 兼容）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.5, help="首字延迟（秒）")
+    parser.add_argument('--tokens-per-second', type=float, default=80, help="输出速度，0 表示立即返回")
+    parser.add_argument('--jitter', type=float, default=0.2, help="延迟随机波动比例")
+    args = parser.parse_args()
+
+    server = MockLLMServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                           jitter=args.jitter, host=args.host, port=args.port)
+    print(f"模拟 LLM 服务器已启动: LLM_BASE_URL={server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
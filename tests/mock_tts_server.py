@@ -0,0 +1,205 @@
+"""
+本地模拟 Google Cloud Text-to-Speech 服务器（/v1/text:synthesize 和 /v1beta1/text:synthesize）
+返回确定性的音频和 SSML <mark> 时间点，用于离线测试分段切分和手动联调：
+- MP3：MPEG2 Layer III、24kHz、单声道，每个字符一帧（24ms），帧的主数据填充该字符所在分段的序号
+  （第一段为 1，<mark> 之前的文本为 0），停顿为全零帧
+- LINEAR16：WAV，每个字符 576 个采样，采样值同上
+- enableTimePointing 包含 SSML_MARK 时，返回每个 <mark> 所在的秒数
+- fail_next 让接下来的 N 个请求返回 400；broken 为 True 时返回无法解析的音频；peak 记录最大同时请求数
+
+在测试中使用：
+    with MockTTSServer(latency=0.05) as server:
+        tts.api_url = server.url
+
+手动运行（其他进程通过 TTS_BASE_URL=http://127.0.0.1:8002 使用）：
+    python tests/mock_tts_server.py --port 8002 --latency 0.3
+"""
+
+import io
+import re
+import sys
+import json
+import time
+import wave
+import base64
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+# MPEG2 Layer III、24kHz、32kbps、单声道：每帧 576 个采样，96 字节（4 字节帧头 + 9 字节侧信息 + 83 字节主数据）
+MP3_HEADER = bytes([0xFF, 0xF3, 0x44, 0xC4])
+SAMPLES_PER_CHAR = 576
+SAMPLE_RATE = 24000
+SECONDS_PER_CHAR = SAMPLES_PER_CHAR / SAMPLE_RATE
+
+_TOKEN = re.compile(r'<mark\s+name="([^"]*)"\s*/>|<break\s+time="(\d+)ms"\s*/>|<[^>]+>|([^<]+)')
+
+
+def parse_ssml(ssml: str) -> Tuple[List[Tuple[int, int]], Dict[str, float]]:
+    """
+    把 SSML 展开为逐帧的内容
+
+    Returns:
+        (帧列表, 时间点)：每帧为 (分段序号, 字符码)，停顿帧的分段序号为 0；时间点为标记名 → 秒数
+    """
+    frames, timepoints, part = [], {}, 0
+    for mark, pause, text in _TOKEN.findall(ssml):
+        if mark:
+            part += 1
+            timepoints[mark] = round(len(frames) * SECONDS_PER_CHAR, 6)
+        elif pause:
+            frames.extend([(0, 0)] * int(round(int(pause) / 1000 / SECONDS_PER_CHAR)))
+        elif text:
+            text = re.sub(r'\s+', '', text.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&'))
+            frames.extend((part, ord(char)) for char in text)
+    return frames, timepoints
+
+
+def mp3_frame(part: int) -> bytes:
+    """一帧 MP3：侧信息全零（main_data_begin = 0），主数据填充分段序号"""
+    return MP3_HEADER + b'\x00' * 9 + bytes([part % 256]) * 83
+
+
+def encode(frames: List[Tuple[int, int]], audio_encoding: str) -> bytes:
+    """把逐帧内容编码为 MP3 或 WAV"""
+    if audio_encoding == "LINEAR16":
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(SAMPLE_RATE)
+            writer.writeframes(b''.join(part.to_bytes(2, 'little') * SAMPLES_PER_CHAR for part, _ in frames))
+        return output.getvalue()
+    return b''.join(mp3_frame(part) for part, _ in frames)
+
+
+def part_of_frame(frame: bytes) -> int:
+    """由 MP3 帧的主数据读出分段序号（测试中检查切分结果用）"""
+    return frame[-1]
+
+
+class MockTTSServer:
+    """在后台线程运行的模拟 TTS 服务器"""
+
+    def __init__(self, latency: float = 0.05, host: str = '127.0.0.1', port: int = 0):
+        """
+        初始化
+
+        Args:
+            latency: 每个请求的延迟（秒）
+            host: 监听地址
+            port: 监听端口，0 表示随机端口
+        """
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests: List[Dict] = []
+        self.fail_next = 0
+        self.broken = False
+        self.active = 0
+        self.peak = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """可直接用作 TTS_BASE_URL 的地址"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        """v1 text:synthesize 的完整地址（可直接赋给 TextToSpeech.api_url）"""
+        return f"{self.base_url}/v1/text:synthesize?key=test-key"
+
+    def synthesize(self, request: Dict, path: str) -> Tuple[int, Dict]:
+        """按请求体生成响应 (状态码, 响应体)"""
+        with self.lock:
+            self.requests.append(request)
+            if self.fail_next:
+                self.fail_next -= 1
+                return 400, {"error": {"message": "模拟的请求错误（如 SSML 无效）"}}
+
+        if self.broken:
+            return 200, {"audioContent": base64.b64encode(b'not an audio file').decode()}
+        if 'ssml' in request['input']:
+            frames, timepoints = parse_ssml(request['input']['ssml'])
+        else:
+            frames = [(1, ord(char)) for char in re.sub(r'\s+', '', request['input']['text'])]
+            timepoints = {}
+        response = {"audioContent": base64.b64encode(
+            encode(frames, request['audioConfig']['audioEncoding'])).decode()}
+        if 'SSML_MARK' in request.get('enableTimePointing', []):
+            if '/v1beta1/' not in path:
+                return 400, {"error": {"message": "enableTimePointing 只在 v1beta1 端点可用"}}
+            response["timepoints"] = [{"markName": name, "timeSeconds": seconds}
+                                      for name, seconds in timepoints.items()]
+        return 200, response
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with mock.lock:
+                    mock.active += 1
+                    mock.peak = max(mock.peak, mock.active)
+                time.sleep(mock.latency)
+                with mock.lock:
+                    mock.active -= 1
+                status, response = mock.synthesize(request, self.path)
+                body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MockTTSServer":
+        """在后台线程启动"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务器"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MockTTSServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 Google Cloud TTS 服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8002)
+    parser.add_argument('--latency', type=float, default=0.3, help="每个请求的延迟（秒）")
+    args = parser.parse_args()
+
+    server = MockTTSServer(latency=args.latency, host=args.host, port=args.port)
+    print(f"模拟 TTS 服务器已启动: TTS_BASE_URL={server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+测试由分段音频拼接完整正文音频
+用全零主数据的 MP3 帧构造分段音频，验证逐帧拼接、静音帧、ID3/Xing 头的处理、WAV 拼接和分段偏移表；
+再用本地模拟 TTS 服务器（mock_tts_server.py）验证完整正文不再单独合成，拼接失败时退回整段合成
+"""
+
+import sys
+import os
+import io
+import re
+import time
+import wave
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_assembly import AudioAssemblyError, assemble_audio, mp3_frames
+from audio_cache import AudioCache
+from task_manager import task_manager
+from tests.mock_tts_server import MockTTSServer
+from text_to_speech import TextToSpeech
+
+# MPEG2 Layer III、24kHz、32kbps、单声道（与 Google TTS 的 MP3 输出相同）：每帧 576 个采样，96 字节
+HEADER = bytes([0xFF, 0xF3, 0x44, 0xC4])
+FRAME = HEADER + b'\x00' * 92
+FRAME_SECONDS = 576 / 24000
+
+
+def make_mp3(frame_count: int, id3: bool = False, xing: bool = False) -> bytes:
+    """构造 MP3：可选 ID3v2 标签和 Xing 信息帧，末尾附 ID3v1 标签"""
+    data = b''
+    if id3:
+        data += b'ID3\x03\x00\x00\x00\x00\x00\x05' + b'\x00' * 5
+    if xing:
+        data += HEADER + b'\x00' * 9 + b'Xing' + b'\x00' * 79
+    return data + FRAME * frame_count + b'TAG' + b'\x00' * 125
+
+
+def make_wav(frame_count: int, rate: int = 24000) -> bytes:
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(b'\x01\x00' * frame_count)
+    return output.getvalue()
+
+
+def test_mp3_frames():
+    """跳过 ID3 标签、Xing 信息帧和 ID3v1 标签"""
+    frames, info = mp3_frames(make_mp3(10, id3=True, xing=True))
+    assert len(frames) == 10
+    assert info == {'version': '2', 'sample_rate': 24000, 'channels': 1, 'samples': 576}
+
+    try:
+        mp3_frames(b'not an mp3 file')
+        assert False, "应当抛出 AudioAssemblyError"
+    except AudioAssemblyError:
+        pass
+
+
+def test_concat_mp3_offsets():
+    """段间插入按帧取整的静音，偏移表与帧数一致"""
+    audio, offsets = assemble_audio([make_mp3(10, xing=True), make_mp3(20, id3=True), make_mp3(5)],
+                                    "mp3", silence_ms=240)
+    frames, _ = mp3_frames(audio)
+    # 240ms = 10 帧静音，两个间隔
+    assert len(frames) == 10 + 20 + 5 + 2 * 10
+    assert [o['index'] for o in offsets] == [0, 1, 2]
+    assert offsets[0] == {'index': 0, 'start': 0.0, 'end': round(10 * FRAME_SECONDS, 3)}
+    assert offsets[1]['start'] == round(20 * FRAME_SECONDS, 3)
+    assert offsets[2]['end'] == round(55 * FRAME_SECONDS, 3)
+
+    silent, _ = assemble_audio([make_mp3(3), make_mp3(3)], "mp3", silence_ms=0)
+    assert len(silent) == 6 * len(FRAME)
+
+    mismatched = make_mp3(3).replace(HEADER, bytes([0xFF, 0xF3, 0x40, 0xC4]))  # 22.05kHz
+    try:
+        assemble_audio([make_mp3(3), mismatched], "mp3")
+        assert False, "采样率不一致时应当抛出 AudioAssemblyError"
+    except AudioAssemblyError:
+        pass
+
+
+def test_concat_wav():
+    """LINEAR16 拼接：段间插入零采样"""
+    audio, offsets = assemble_audio([make_wav(2400), make_wav(4800)], "wav", silence_ms=100)
+    with wave.open(io.BytesIO(audio), 'rb') as reader:
+        assert reader.getnframes() == 2400 + 2400 + 4800
+        assert reader.getframerate() == 24000
+    assert offsets == [{'index': 0, 'start': 0.0, 'end': 0.1}, {'index': 1, 'start': 0.2, 'end': 0.4}]
+
+    try:
+        assemble_audio([make_wav(10), make_wav(10, rate=16000)], "wav")
+        assert False, "采样率不一致时应当抛出 AudioAssemblyError"
+    except AudioAssemblyError:
+        pass
+
+
+def _frame_count(text: str) -> int:
+    """模拟 TTS 服务器为每个非空白字符返回一帧"""
+    return len(re.sub(r'\s+', '', text))
+
+
+def _texts(server):
+    return [request['input']['text'] for request in server.requests]
+
+
+def _run_task(app_fastapi, segments, main_text):
+    task_id = task_manager.create_task("page.png", "page.png")
+    task_audio = app_fastapi.TaskAudio(task_id, time.time())
+    for idx, segment in enumerate(segments):
+        task_audio.submit(f'segment_{idx}', segment)
+    task_audio.assemble('main', [f'segment_{idx}' for idx in range(len(segments))], main_text)
+    return task_id, task_audio.results(), task_audio.audio_offsets
+
+
+def test_task_audio_assembles_main():
+    """完整正文由分段音频拼接，不再请求 TTS；拼接失败时退回整段合成"""
+    import app_fastapi
+
+    original_tts = app_fastapi.tts
+    with MockTTSServer(latency=0) as server, tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            os.makedirs(app_fastapi.AUDIO_FOLDER)
+            tts = TextToSpeech(api_key="test-key", cache=AudioCache(cache_dir="static/audio/cache"))
+            tts.api_url = server.url
+            app_fastapi.tts = tts
+
+            segments = ["あおい そら。", "しろい くも。"]
+            task_id, audio_urls, audio_offsets = _run_task(app_fastapi, segments, "あおい そら。しろい くも。")
+            assert sorted(_texts(server)) == sorted(segments)
+            assert audio_urls['main'] == f'/static/audio/{task_id}_main.mp3'
+            with open(audio_urls['main'].lstrip('/'), 'rb') as f:
+                frames, _ = mp3_frames(f.read())
+            silence = int(round(0.4 / FRAME_SECONDS))
+            assert len(frames) == _frame_count(segments[0]) + _frame_count(segments[1]) + silence
+            assert [o['key'] for o in audio_offsets['main']] == ['segment_0', 'segment_1']
+            assert audio_offsets['main'][1]['start'] == round((_frame_count(segments[0]) + silence) * FRAME_SECONDS, 3)
+            task = task_manager.get_task(task_id)
+            assert task['partial_result']['audio_offsets'] == audio_offsets
+            assert task['progress']['tts_items']['main'] == 'completed'
+
+            # 分段增加后重新拼接：旧的拼接结果不会覆盖新的
+            task_audio = app_fastapi.TaskAudio(task_manager.create_task("page.png", "page.png"), time.time())
+            segments = ["あおい そら。", "しろい くも。", "きいろい はな。"]
+            for idx, segment in enumerate(segments[:2]):
+                task_audio.submit(f'segment_{idx}', segment)
+            task_audio.assemble('main', ['segment_0', 'segment_1'], "".join(segments[:2]))
+            task_audio.submit('segment_2', segments[2])
+            task_audio.assemble('main', ['segment_0', 'segment_1', 'segment_2'], "".join(segments))
+            audio_urls = task_audio.results()
+            with open(audio_urls['main'].lstrip('/'), 'rb') as f:
+                frames, _ = mp3_frames(f.read())
+            assert len(frames) == sum(_frame_count(segment) for segment in segments) + 2 * silence
+            assert [o['key'] for o in task_audio.audio_offsets['main']] == ['segment_0', 'segment_1', 'segment_2']
+
+            # 分段换了文本后用相同的分段名称重新拼接：使用新的分段音频
+            task_audio = app_fastapi.TaskAudio(task_manager.create_task("page.png", "page.png"), time.time())
+            segments = ["あおい そら。", "しろい くも。"]
+            for idx, segment in enumerate(segments):
+                task_audio.submit(f'segment_{idx}', segment)
+            task_audio.assemble('main', ['segment_0', 'segment_1'], "".join(segments))
+            segments[1] = "くろい おおきな くも。"
+            task_audio.submit('segment_1', segments[1])
+            task_audio.assemble('main', ['segment_0', 'segment_1'], "".join(segments[:1] + ["しろい くも。"]))
+            audio_urls = task_audio.results()
+            with open(audio_urls['main'].lstrip('/'), 'rb') as f:
+                frames, _ = mp3_frames(f.read())
+            assert len(frames) == sum(_frame_count(segment) for segment in segments) + silence
+
+            # 只有一个线程时，等待未完成的分段不占用线程，之后提交的合成照常进行
+            task_audio = app_fastapi.TaskAudio(task_manager.create_task("page.png", "page.png"), time.time())
+            task_audio.executor.shutdown()
+            task_audio.executor = ThreadPoolExecutor(max_workers=1)
+            pending = Future()
+            task_audio.jobs['segment_0'] = ("ちゃいろの つち。", pending)
+            task_audio.assemble('main', ['segment_0'], "ちゃいろの つち。")
+            task_audio.submit('instruction', "よんで みよう。")
+            assert task_audio.jobs['instruction'][1].result(timeout=5)
+            pending.set_result(None)
+            assert 'main' in task_audio.results()
+
+            server.requests.clear()
+            server.broken = True
+            _, audio_urls, audio_offsets = _run_task(app_fastapi, ["みどりの き。"], "みどりの き。ほんぶん。")
+            assert "みどりの き。ほんぶん。" in _texts(server)
+            assert 'main' in audio_urls and audio_offsets == {}
+        finally:
+            os.chdir(cwd)
+            app_fastapi.tts = original_tts
+
+
+if __name__ == "__main__":
+    test_mp3_frames()
+    test_concat_mp3_offsets()
+    test_concat_wav()
+    test_task_audio_assembles_main()
+    print("✅ 音频拼接测试通过")
@@ -0,0 +1,115 @@
+"""
+测试共享 HTTP 连接池：连接复用、429/5xx 重试和按主机统计
+使用本地 HTTP 服务器，不访问外部网络
+"""
+
+import sys
+import os
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_pool import HTTPPool
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """前 fail_count 次请求返回 503，之后返回 200"""
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+    fail_count = 0
+    calls = 0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        FlakyHandler.calls += 1
+        status = 503 if FlakyHandler.calls <= FlakyHandler.fail_count else 200
+        body = json.dumps({"ok": status == 200}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def test_connections_are_reused():
+    """多次请求同一主机只建立一个连接"""
+    FlakyHandler.calls, FlakyHandler.fail_count = 0, 0
+    server = _start_server()
+    try:
+        pool = HTTPPool(max_retries=0)
+        url = f"http://127.0.0.1:{server.server_port}/v1/test"
+        for _ in range(5):
+            assert pool.post(url, json={"a": 1}, timeout=5).status_code == 200
+
+        stats = pool.stats()[f"127.0.0.1:{server.server_port}"]
+        assert stats['requests'] == 5
+        assert stats['connections_created'] == 1
+    finally:
+        server.shutdown()
+
+
+def test_retries_on_503():
+    """5xx 响应按退避策略重试，成功后返回最终响应"""
+    FlakyHandler.calls, FlakyHandler.fail_count = 0, 2
+    server = _start_server()
+    try:
+        pool = HTTPPool(max_retries=3, backoff_factor=0.01, backoff_jitter=0.01)
+        url = f"http://127.0.0.1:{server.server_port}/v1/test"
+        response = pool.post(url, json={}, timeout=5)
+
+        assert response.status_code == 200
+        assert FlakyHandler.calls == 3
+        assert pool.stats()[f"127.0.0.1:{server.server_port}"]['retries'] == 2
+    finally:
+        server.shutdown()
+
+
+def test_async_post_reuses_connection_and_retries():
+    """异步接口同样复用连接并按策略重试"""
+    FlakyHandler.calls, FlakyHandler.fail_count = 0, 1
+    server = _start_server()
+    try:
+        pool = HTTPPool(max_retries=2, backoff_factor=0.01, backoff_jitter=0.01)
+        url = f"http://127.0.0.1:{server.server_port}/v1/test"
+
+        async def run():
+            responses = await asyncio.gather(*[pool.async_post(url, json={}, timeout=5) for _ in range(3)])
+            await pool.aclose()
+            return responses
+
+        responses = asyncio.run(run())
+        assert [r.status_code for r in responses] == [200, 200, 200]
+        stats = pool.stats()[f"127.0.0.1:{server.server_port}"]
+        assert stats['requests'] == 3
+        assert stats['retries'] == 1
+    finally:
+        server.shutdown()
+
+
+def test_per_host_pool_size():
+    """按主机覆盖连接池大小"""
+    pool = HTTPPool(pool_maxsize=10, host_pool_sizes={"vision.googleapis.com": 4})
+    assert pool.pool_size_for("vision.googleapis.com") == 4
+    assert pool.pool_size_for("texttospeech.googleapis.com") == 10
+
+
+if __name__ == "__main__":
+    test_connections_are_reused()
+    test_retries_on_503()
+    test_async_post_reuses_connection_and_retries()
+    test_per_host_pool_size()
+    print("✅ 连接池测试通过")
@@ -0,0 +1,169 @@
+"""
+测试 OCR 前的图片预处理，并提供上传体积基准测试
+
+pytest 只运行离线的合成图片测试；直接运行本脚本会对 Picture books/ 中的
+示例图片做基准测试（体积、编码耗时、估算上传耗时），
+如果配置了 GOOGLE_CLOUD_API_KEY，还会对比预处理前后的识别结果是否一致。
+"""
+
+import sys
+import os
+import time
+import base64
+import difflib
+import tempfile
+from io import BytesIO
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from image_utils import HEIC_SUPPORT, heic_to_jpeg, heic_cache_stats, preprocess_image
+
+SAMPLE_IMAGES = [
+    "Picture books/Kumon test.png",
+    "Picture books/Kumon test2.png",
+    "Picture books/Kumon test3.png",
+    "Picture books/short para 1.png",
+    "Picture books/short para 2.png",
+    "Picture books/Qiaohu1.HEIC",
+    "Picture books/Qiaohu2.HEIC"
+]
+
+
+def _make_page(path: str, size=(4032, 3024)):
+    """生成一张类似手机拍摄的大尺寸"书页"图片"""
+    img = Image.new('RGB', size, (245, 240, 230))
+    draw = ImageDraw.Draw(img)
+    for row in range(40):
+        y = 100 + row * 70
+        draw.text((120, y), "natsu ni sunahama de suikawari wo shimasu. " * 3, fill=(20, 20, 20))
+        # 模拟纸张纹理的噪点
+        for x in range(0, size[0], 37):
+            draw.point((x, y + 30), fill=(200 + row % 40, 190, 180))
+    img.save(path, 'PNG')
+
+
+def test_preprocess_caps_longest_edge_and_shrinks():
+    """大图被缩放到最长边上限，并显著变小"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "page.png")
+        _make_page(path)
+
+        data, stats = preprocess_image(path, max_edge=2048, jpeg_quality=85)
+
+        assert max(stats['size_after']) == 2048
+        assert stats['bytes_after'] == len(data)
+        assert stats['bytes_after'] < stats['bytes_before']
+
+
+def test_preprocess_keeps_small_original():
+    """无需缩放且重新编码不会变小时保留原图"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "small.png")
+        Image.new('RGB', (200, 100), (255, 255, 255)).save(path, 'PNG')
+
+        data, stats = preprocess_image(path, max_edge=2048, jpeg_quality=85)
+
+        with open(path, 'rb') as f:
+            assert data == f.read()
+        assert stats['reencoded'] is False
+
+
+def test_preprocess_grayscale():
+    """灰度选项输出单通道 JPEG"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "page.png")
+        _make_page(path, size=(1000, 800))
+
+        data, _ = preprocess_image(path, max_edge=2048, grayscale=True)
+
+        out_path = os.path.join(tmp, "out.jpg")
+        with open(out_path, 'wb') as f:
+            f.write(data)
+        assert Image.open(out_path).mode == 'L'
+
+
+def test_heic_to_jpeg_decodes_once_per_mtime():
+    """同一 HEIC 文件只解码一次，文件更新后重新解码"""
+    if not HEIC_SUPPORT:
+        print("⚠️  pillow-heif 未安装，跳过 HEIC 测试")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "page.heic")
+        Image.new('RGB', (64, 48), (200, 10, 10)).save(path, 'HEIF')
+
+        misses = heic_cache_stats()['misses']
+        first = heic_to_jpeg(path)
+        second = heic_to_jpeg(path)
+        assert first == second
+        assert heic_cache_stats()['misses'] == misses + 1
+        assert Image.open(BytesIO(first)).format == 'JPEG'
+
+        # 覆盖文件（修改时间变化）后缓存失效
+        Image.new('RGB', (64, 48), (10, 10, 200)).save(path, 'HEIF')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+        heic_to_jpeg(path)
+        assert heic_cache_stats()['misses'] == misses + 2
+
+
+def benchmark_sample_pages(uplink_mbps: float = 10.0):
+    """对示例图片做预处理基准测试"""
+    print("=" * 60)
+    print(f"OCR 图片预处理基准测试（估算上行带宽 {uplink_mbps} Mbps）")
+    print("=" * 60)
+
+    ocr_raw = ocr_pre = None
+    if os.getenv('GOOGLE_CLOUD_API_KEY'):
+        from picture_to_text import PictureToText
+        ocr_raw = PictureToText(use_cache=False, preprocess=False)
+        ocr_pre = PictureToText(use_cache=False, preprocess=True)
+    else:
+        print("⚠️  未设置 GOOGLE_CLOUD_API_KEY，只比较体积，不比较识别结果")
+
+    total_before = total_after = 0
+    for image_path in SAMPLE_IMAGES:
+        if not os.path.exists(image_path):
+            print(f"\n⚠️  图片不存在: {image_path}")
+            continue
+
+        start = time.time()
+        data, stats = preprocess_image(image_path)
+        encoded = base64.b64encode(data)
+        prep_time = time.time() - start
+
+        # base64 体积才是实际请求体大小
+        body_before = stats['bytes_before'] * 4 / 3
+        body_after = len(encoded)
+        upload_before = body_before * 8 / (uplink_mbps * 1e6)
+        upload_after = body_after * 8 / (uplink_mbps * 1e6)
+        total_before += stats['bytes_before']
+        total_after += stats['bytes_after']
+
+        print(f"\n📷 {image_path}")
+        print(f"  尺寸: {stats['size_before']} → {stats['size_after']}")
+        print(f"  字节: {stats['bytes_before']:,} → {stats['bytes_after']:,} "
+              f"({stats['bytes_after'] / stats['bytes_before']:.0%})")
+        print(f"  预处理+编码耗时: {prep_time * 1000:.0f} ms")
+        print(f"  估算上传耗时: {upload_before:.2f} 秒 → {upload_after:.2f} 秒")
+
+        if ocr_raw and ocr_pre:
+            raw_text = ocr_raw.extract_text(image_path).get('full_text', '')
+            pre_text = ocr_pre.extract_text(image_path).get('full_text', '')
+            ratio = difflib.SequenceMatcher(None, raw_text, pre_text).ratio()
+            mark = "✅" if raw_text == pre_text else ("⚠️ " if ratio > 0.95 else "❌")
+            print(f"  {mark} 识别结果相似度: {ratio:.2%}")
+
+    if total_before:
+        print("\n" + "-" * 60)
+        print(f"合计: {total_before:,} → {total_after:,} 字节 ({total_after / total_before:.0%})")
+
+
+if __name__ == "__main__":
+    test_preprocess_caps_longest_edge_and_shrinks()
+    test_preprocess_keeps_small_original()
+    test_preprocess_grayscale()
+    test_heic_to_jpeg_decodes_once_per_mtime()
+    print("✅ 预处理测试通过\n")
+    benchmark_sample_pages(float(os.getenv('BENCH_UPLINK_MBPS', '10')))
@@ -0,0 +1,89 @@
+"""
+测试 LLM 结果缓存
+使用本地模拟 LLM 服务器（mock_llm_server.py）返回固定回复，不调用真实 LLM
+"""
+
+import sys
+import os
+import time
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache
+from tests.mock_llm_server import MockLLMServer
+from text_processor import TextProcessor
+
+LLM_CONTENT = """指导语：
+
+正文：
+なつに すなはまで すいかわりを します。
+
+分段：
+なつに すなはまで すいかわりを します。
+
+中文翻译：
+夏天在沙滩上玩劈西瓜。"""
+
+
+def _server():
+    return MockLLMServer(latency=0, responder=lambda request: LLM_CONTENT)
+
+
+def _processor(server, cache):
+    processor = TextProcessor(api_key="test-key", cache=cache)
+    processor.api_url = server.url
+    return processor
+
+
+def test_normalized_text_hits_cache():
+    """全角/半角和空白不同的同一段文本只调用一次 LLM"""
+    with _server() as server:
+        processor = _processor(server, ResultCache("LLM"))
+        first = processor.process_ocr_text("なつに　すなはまで\nすいかわりを します。 ４Ａ")
+        second = processor.process_ocr_text("なつに すなはまで すいかわりを  します。 4A")
+
+        assert len(server.requests) == 1
+        assert first['_performance']['cache_hit'] is False
+        assert second['_performance']['cache_hit'] is True
+        assert second['segments'] == first['segments']
+        assert processor.cache_stats()['hits'] == 1
+
+
+def test_prompt_version_and_model_in_key():
+    """模型或 prompt 版本不同的处理器不共享缓存结果"""
+    with _server() as server:
+        cache = ResultCache("LLM")
+        processor = _processor(server, cache)
+        processor.process_ocr_text("すいかわり")
+
+        other_model = _processor(server, cache)
+        other_model.model = "gpt-5"
+        other_model.process_ocr_text("すいかわり")
+
+        new_prompt = _processor(server, cache)
+        new_prompt.prompt_version = "changed"
+        new_prompt.process_ocr_text("すいかわり")
+
+        assert len(server.requests) == 3
+
+
+def test_cache_ttl_and_disk():
+    """过期条目不再命中，磁盘层在新实例中可用"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        ResultCache("LLM", cache_dir=cache_dir, ttl=60).set("key", {"main_text": "テスト"})
+        assert ResultCache("LLM", cache_dir=cache_dir, ttl=60).get("key") == {"main_text": "テスト"}
+
+        cache = ResultCache("LLM", ttl=0.05)
+        cache.set("key", {"main_text": "テスト"})
+        time.sleep(0.1)
+        assert cache.get("key") is None
+        assert cache.stats()['expirations'] == 1
+
+
+if __name__ == "__main__":
+    test_normalized_text_hits_cache()
+    test_prompt_version_and_model_in_key()
+    test_cache_ttl_and_disk()
+    print("✅ LLM 缓存测试通过")
@@ -0,0 +1,131 @@
+"""
+测试长文本分块并发处理
+使用本地模拟 LLM 服务器（mock_llm_server.py）按请求内容生成回复，验证分块边界、并发上限、合并顺序和流式分段的顺序
+"""
+
+import sys
+import os
+import time
+import asyncio
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache
+from tests.mock_llm_server import MockLLMServer, request_text
+from text_processor import TextProcessor, split_text_chunks
+
+# 12 行、每行约 40 字符的长文本
+LINES = [f"{i}ばんめの ぺーじでは こぐまが もりの なかを あるいて いきます。" for i in range(12)]
+LONG_TEXT = '\n'.join(LINES)
+DELAY = 0.3
+
+
+def _responder(fail_marker=None):
+    """把收到的 OCR 文本逐行当作分段返回；第一块最慢，后面的块先完成；包含 fail_marker 的块返回错误"""
+    def respond(request):
+        text = request_text(request)
+        lines = text.split('\n')
+        delay = DELAY * (2 if lines[0] == LINES[0] else 1)
+        if fail_marker and fail_marker in text:
+            return {"status": 400, "delay": delay}
+
+        instruction = "げんきよく読みましょう。"
+        translation = '\n'.join(f"译{line.split('ばんめ')[0]}" for line in lines)
+        content = f"指导语：\n{instruction}\n\n正文：\n{text}\n\n分段：\n" + '\n'.join(lines) + \
+            f"\n\n中文翻译：\n{translation}"
+        return {"content": content, "delay": delay, "usage": {"prompt_tokens": 100, "completion_tokens": 50}}
+    return respond
+
+
+def _server():
+    return MockLLMServer(latency=0, responder=_responder())
+
+
+def _processor(server, chunk_chars=150, chunk_workers=3):
+    processor = TextProcessor(api_key="test-key", cache=ResultCache("LLM"), denoise=False,
+                              prompt_template="system_first",
+                              chunk_chars=chunk_chars, chunk_workers=chunk_workers)
+    processor.api_url = server.url
+    return processor
+
+
+def test_split_text_chunks():
+    """在行/句子边界切分，长度均衡且不超过上限，拼接后与原文一致"""
+    chunks = split_text_chunks(LONG_TEXT, 150)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 150 for chunk in chunks)
+    assert '\n'.join(chunks) == LONG_TEXT
+    assert all(chunk.endswith('。') for chunk in chunks)
+    assert max(len(chunk) for chunk in chunks) - min(len(chunk) for chunk in chunks) <= len(LINES[0]) + 1
+
+    # 优先在空行（段落）处切分
+    paragraphs = "あいうえお。" * 10 + "\n\n" + "かきくけこ。" * 10
+    assert split_text_chunks(paragraphs, 80) == ["あいうえお。" * 10, "かきくけこ。" * 10]
+
+    # 没有标点的长行按字数硬切
+    assert [len(chunk) for chunk in split_text_chunks("あ" * 1000, 300)] == [250, 250, 250, 250]
+    assert split_text_chunks("みじかい", 150) == ["みじかい"]
+    assert split_text_chunks("長い文", 0) == ["長い文"]
+
+
+def test_chunks_processed_concurrently_and_merged_in_order():
+    """分块有界并发，合并结果保持原文顺序"""
+    with _server() as server:
+        processor = _processor(server)
+        chunk_count = len(split_text_chunks(LONG_TEXT, 150))
+        start = time.time()
+        result = processor.process_ocr_text(LONG_TEXT)
+        elapsed = time.time() - start
+
+        assert 'error' not in result
+        assert result['segments'] == LINES
+        assert result['main_text'] == LONG_TEXT
+        assert result['instruction'] == "げんきよく読みましょう。"
+        assert result['chinese_translation'].split('\n') == [f"译{i}" for i in range(12)]
+        performance = result['_performance']
+        assert performance['chunks'] == chunk_count
+        assert performance['usage']['prompt_tokens'] == 100 * chunk_count
+        assert 1 < server.peak <= 3
+        # 串行至少需要 (chunk_count + 1) * delay
+        assert elapsed < (chunk_count + 1) * DELAY
+
+        # 整段结果命中缓存
+        assert processor.process_ocr_text(LONG_TEXT)['_performance']['cache_hit'] is True
+        assert len(server.requests) == chunk_count
+
+
+def test_stream_segments_in_order():
+    """流式模式下后面的块先完成，分段事件仍按原文顺序、连续编号"""
+    with _server() as server:
+        events = []
+        result = _processor(server).process_ocr_text_stream(
+            LONG_TEXT, on_event=lambda event, data: events.append((event, data))
+        )
+        segments = [data for event, data in events if event == 'segment']
+        assert [data['index'] for data in segments] == list(range(len(LINES)))
+        assert [data['text'] for data in segments] == LINES
+        assert [event for event, _ in events if event != 'segment'] == \
+            ['instruction', 'main_text', 'chinese_translation']
+        assert result['_performance']['stream'] is True
+
+
+def test_async_and_chunk_failure():
+    """异步版本同样分块；任意一块失败时整体返回错误，成功的块已写入缓存"""
+    with _server() as server:
+        processor = _processor(server)
+        result = asyncio.run(processor.process_ocr_text_async(LONG_TEXT))
+        assert result['segments'] == LINES
+        assert 1 < server.peak <= 3
+
+        server.responder = _responder(fail_marker="11ばんめ")
+        failed = _processor(server, chunk_chars=120).process_ocr_text(LONG_TEXT)
+        assert 'error' in failed and '块处理失败' in failed['error']
+
+
+if __name__ == "__main__":
+    test_split_text_chunks()
+    test_chunks_processed_concurrently_and_merged_in_order()
+    test_stream_segments_in_order()
+    test_async_and_chunk_failure()
+    print("✅ 分块并发处理测试通过")
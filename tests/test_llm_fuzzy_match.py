@@ -0,0 +1,125 @@
+"""
+测试近似 OCR 文本的结果复用（MinHash/LSH）
+使用本地模拟 LLM 服务器（mock_llm_server.py），验证同一页重新识别（断行、分写不同）时不再请求 LLM，只差一个词的页面仍然请求 LLM
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minhash_index import MinHashIndex, jaccard, text_shingles
+from result_cache import ResultCache
+from tests.mock_llm_server import MockLLMServer
+from text_processor import TextProcessor
+
+PAGE = """なつに すなはまで すいかわりを します。
+しろい かもめが そらを とんで います。
+おとうさんが おおきな すいかを もって きました。
+みんなで たのしく あそびました。"""
+
+# 同一页重新识别：断行位置和分写不同（规范化后的精确缓存键不同）
+RESHOT = """なつに すなはまで すいかわりを
+します。しろい かもめが そらをとんで います。
+おとうさんが おおきな すいかを もって きました。
+みんなで たのしく あそびました。"""
+
+# 只差一个词的另一页（しろい → くろい）：估计相似度很高，但不能复用
+ONE_WORD = PAGE.replace("しろい", "くろい")
+
+OTHER_PAGE = """くまの こが もりの なかで はちみつを みつけました。
+きの うえには ことりが うたって います。"""
+
+
+LLM_CONTENT = f"指导语：\n\n正文：\n{PAGE}\n\n分段：\n{PAGE}\n\n中文翻译：\n夏天在沙滩上玩劈西瓜。"
+
+
+def _server():
+    return MockLLMServer(latency=0, responder=lambda request: LLM_CONTENT)
+
+
+def _processor(server, cache=None):
+    processor = TextProcessor(api_key="test-key", cache=cache or ResultCache("LLM"), denoise=False,
+                              use_translation_memory=False, use_fuzzy_match=True)
+    processor.api_url = server.url
+    return processor
+
+
+def test_signature_estimates_jaccard():
+    """签名估计的相似度接近真实 Jaccard 相似度"""
+    index = MinHashIndex()
+    for a, b in [(PAGE, RESHOT), (PAGE, ONE_WORD), (PAGE, OTHER_PAGE)]:
+        exact = jaccard(text_shingles(a), text_shingles(b))
+        estimate = index.similarity(index.signature(a), index.signature(b))
+        assert abs(exact - estimate) < 0.1, (exact, estimate)
+    assert index.signature("みじかい") is None
+
+
+def test_reshot_text_reuses_result():
+    """重新识别的文本复用已有结果，_performance 记录匹配分数；不同页面仍请求 LLM"""
+    with _server() as server:
+        processor = _processor(server)
+        first = processor.process_ocr_text(PAGE)
+        second = processor.process_ocr_text(RESHOT)
+        assert len(server.requests) == 1
+        assert second['_performance']['cache_hit'] is True
+        assert second['_performance']['fuzzy_match_score'] >= processor.fuzzy_index.min_similarity
+        assert second['segments'] == first['segments']
+
+        # 之后同样的文本直接命中精确缓存
+        assert 'fuzzy_match_score' not in processor.process_ocr_text(RESHOT)['_performance']
+
+        processor.process_ocr_text(OTHER_PAGE)
+        assert len(server.requests) == 2
+
+        # 只差一个词：签名估计的相似度达到候选范围，但精确相似度不够，不复用
+        assert jaccard(text_shingles(PAGE), text_shingles(ONE_WORD)) < processor.fuzzy_index.min_similarity
+        result = processor.process_ocr_text(ONE_WORD)
+        assert 'fuzzy_match_score' not in result['_performance']
+        assert len(server.requests) == 3
+        assert processor.fuzzy_index_stats()['unconfirmed'] == 1
+
+        # 模型不同时不复用
+        processor.model = "gpt-5"
+        processor.process_ocr_text(RESHOT.replace("みんなで", "みんな で"))
+        assert len(server.requests) == 4
+
+
+def test_index_persists_with_disk_cache():
+    """索引与磁盘缓存保存在同一目录，新实例可以继续匹配"""
+    with _server() as server, tempfile.TemporaryDirectory() as cache_dir:
+        _processor(server, ResultCache("LLM", cache_dir=cache_dir)).process_ocr_text(PAGE)
+        assert os.path.exists(os.path.join(cache_dir, 'minhash_index.jsonl'))
+
+        restarted = _processor(server, ResultCache("LLM", cache_dir=cache_dir))
+        events = []
+        result = restarted.process_ocr_text_stream(RESHOT, on_event=lambda e, d: events.append(e))
+        assert len(server.requests) == 1
+        assert result['_performance']['fuzzy_match_score'] >= 0.98
+        assert 'segment' in events
+
+
+def test_eviction_and_compaction():
+    """超过上限时淘汰最早的条目，签名文件定期重写"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'index.jsonl')
+        index = MinHashIndex(index_path=path, max_entries=2)
+        texts = [f"{i}ばんめの ぺーじ です。くまの こが もりを あるきます。" * 2 for i in range(5)]
+        for i, text in enumerate(texts):
+            index.add(index.signature(text), f"key{i}", text)
+        assert index.stats()['entries'] == 2
+        assert index.find(index.signature(texts[4]), texts[4])['key'] == "key4"
+
+        with open(path, encoding='utf-8') as f:
+            assert len(f.readlines()) <= 4
+        assert MinHashIndex(index_path=path, max_entries=2).stats()['entries'] == 2
+
+
+if __name__ == "__main__":
+    test_signature_estimates_jaccard()
+    test_reshot_text_reuses_result()
+    test_index_persists_with_disk_cache()
+    test_eviction_and_compaction()
+    print("✅ 近似文本复用测试通过")
@@ -0,0 +1,132 @@
+"""
+测试多模型对冲请求和按延迟路由
+本地模拟 LLM 服务器（mock_llm_server.py）按请求中的模型名称模拟慢模型、快模型和返回无效内容的模型
+"""
+
+import sys
+import os
+import time
+import asyncio
+from collections import Counter
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_router import ModelRouter
+from tests.mock_llm_server import MockLLMServer
+from text_processor import TextProcessor
+
+LLM_CONTENT = """指导语：
+
+正文：
+しろい かもめが とんで います。
+
+分段：
+しろい かもめが とんで います。
+
+中文翻译：
+白色的海鸥在飞。"""
+
+# 模型名称 → (延迟秒数, 回复内容)
+MODELS = {
+    "slow-model": (1.5, LLM_CONTENT),
+    "fast-model": (0.05, LLM_CONTENT),
+    "broken-model": (0.05, ""),
+}
+
+
+def _respond(request):
+    """按 model 字段决定延迟和回复内容"""
+    delay, content = MODELS[request['model']]
+    return {"content": content, "delay": delay}
+
+
+def _server():
+    return MockLLMServer(latency=0, responder=_respond)
+
+
+def _calls(server):
+    """每个模型收到的请求数"""
+    return Counter(request['model'] for request in server.requests)
+
+
+def _processor(server, models, hedge_delay="0.2"):
+    processor = TextProcessor(api_key="test-key", model=models[0], fallback_models=models[1:],
+                              router=ModelRouter(hedge_delay=hedge_delay, min_delay=0),
+                              use_cache=False, use_translation_memory=False)
+    processor.api_url = server.url
+    return processor
+
+
+def test_router_ewma_and_p90():
+    """EWMA 决定路由顺序，失败按超时计入；对冲延迟使用 p90"""
+    router = ModelRouter(hedge_delay="p90", default_delay=10, min_delay=0.5)
+    assert router.order(["a", "b"]) == ["a", "b"]
+    assert router.hedge_delay("a") == 10
+
+    for duration in [1.0, 1.2, 0.9, 1.1, 3.0, 1.0, 1.0, 1.1, 0.8, 1.0]:
+        router.record("a", duration, True)
+    router.record("b", 0.4, True)
+    assert router.order(["a", "b", "c"]) == ["b", "a", "c"]
+    assert router.hedge_delay("a") == 3.0
+
+    router.record("b", 0.5, False)
+    assert router.order(["a", "b"]) == ["a", "b"]
+    assert router.stats()['models']['b']['errors'] == 1
+
+
+def test_hedge_to_faster_model():
+    """主模型超过对冲延迟未返回时向备用模型发出请求，采用先返回的结果"""
+    with _server() as server:
+        processor = _processor(server, ["slow-model", "fast-model"])
+        start = time.time()
+        result = processor.process_ocr_text("しろい かもめが とんで います。")
+        elapsed = time.time() - start
+
+        assert elapsed < 1.0
+        assert result['main_text'] == "しろい かもめが とんで います。"
+        assert result['_performance']['model'] == "fast-model"
+        assert result['_performance']['hedged'] is True
+        assert _calls(server) == Counter({"slow-model": 1, "fast-model": 1})
+
+        # 慢模型的请求在后台完成后计入统计，此后快模型排在前面，不再需要对冲
+        time.sleep(1.6)
+        assert processor.router.order(processor._models()) == ["fast-model", "slow-model"]
+        second = processor.process_ocr_text("あおい うみで およぎます。")
+        assert second['_performance']['hedged'] is False
+        assert _calls(server)["slow-model"] == 1
+
+
+def test_invalid_response_falls_back_immediately():
+    """主模型返回无法解析的内容时立即换下一个模型，不等待对冲延迟"""
+    with _server() as server:
+        processor = _processor(server, ["broken-model", "fast-model"], hedge_delay="5")
+        start = time.time()
+        result = processor.process_ocr_text("しろい かもめ")
+        assert time.time() - start < 1.0
+        assert result['_performance']['model'] == "fast-model"
+        assert result['_performance']['attempts'] == 2
+        assert processor.router_stats()['models']['broken-model']['errors'] == 1
+
+
+def test_async_and_stream_hedging():
+    """异步和流式调用同样对冲；流式回调只来自一个模型"""
+    with _server() as server:
+        result = asyncio.run(_processor(server, ["slow-model", "fast-model"]).process_ocr_text_async("かもめ"))
+        assert result['_performance']['model'] == "fast-model"
+
+        events = []
+        streamed = _processor(server, ["slow-model", "fast-model"]).process_ocr_text_stream(
+            "かもめが とぶ", on_event=lambda event, data: events.append(event)
+        )
+        assert streamed['_performance']['model'] == "fast-model"
+        assert events.count('segment') == 1
+        assert events.count('chinese_translation') == 1
+
+
+if __name__ == "__main__":
+    test_router_ewma_and_p90()
+    test_hedge_to_faster_model()
+    test_invalid_response_falls_back_immediately()
+    test_async_and_stream_hedging()
+    print("✅ 多模型对冲测试通过")
@@ -0,0 +1,116 @@
+"""
+测试日语清理/分段与中文翻译拆分为两个并发请求
+本地模拟 LLM 服务器（mock_llm_server.py）按 system prompt 区分两种请求，翻译请求较慢，
+验证日语结果在翻译完成前先返回
+"""
+
+import sys
+import os
+import time
+import asyncio
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.mock_llm_server import MockLLMServer
+from text_processor import TextProcessor
+
+CLEANUP_CONTENT = """指导语：
+げんきよく読みましょう。
+
+正文：
+しろい かもめが とんで います。あおい うみが ひろがって います。
+
+分段：
+しろい かもめが とんで います。
+あおい うみが ひろがって います。"""
+
+TRANSLATE_CONTENT = """中文翻译：
+白色的海鸥在飞。
+蓝色的大海一望无际。"""
+
+TRANSLATE_DELAY = 0.8
+USAGE = {"prompt_tokens": 100, "completion_tokens": 50}
+
+
+def _is_translation(request) -> bool:
+    system = request['messages'][0]['content']
+    return "中文翻译：" in system and "分段：" not in system
+
+
+def _server(fail_translation=False):
+    """清理请求立即返回，翻译请求延迟返回（fail_translation 时返回空内容）"""
+    def respond(request):
+        if _is_translation(request):
+            return {"content": "" if fail_translation else TRANSLATE_CONTENT, "delay": TRANSLATE_DELAY,
+                    "usage": USAGE}
+        return {"content": CLEANUP_CONTENT, "usage": USAGE}
+    return MockLLMServer(latency=0, responder=respond)
+
+
+def _calls(server):
+    """按到达顺序记录的请求类型"""
+    return ['translate' if _is_translation(request) else 'cleanup' for request in server.requests]
+
+
+def _processor(server):
+    processor = TextProcessor(api_key="test-key", use_cache=False, use_translation_memory=False,
+                              split_translation=True)
+    processor.api_url = server.url
+    return processor
+
+
+def test_japanese_result_before_translation():
+    """日语结果先于翻译到达，最终结果合并两个请求"""
+    with _server() as server:
+        events = []
+        start = time.time()
+        result = _processor(server).process_ocr_text_stream(
+            "しろい かもめが とんで います。あおい うみが ひろがって います。",
+            on_event=lambda event, data: events.append((event, data, time.time() - start))
+        )
+        elapsed = time.time() - start
+
+        japanese = [(data, at) for event, data, at in events if event == 'japanese_result']
+        assert len(japanese) == 1
+        data, ready_at = japanese[0]
+        assert ready_at < TRANSLATE_DELAY / 2
+        assert data['main_text'] == "しろい かもめが とんで います。あおい うみが ひろがって います。"
+        assert data['segments'] == ["しろい かもめが とんで います。", "あおい うみが ひろがって います。"]
+
+        # 两个请求并发：总耗时约等于较慢的翻译请求
+        assert sorted(_calls(server)) == ['cleanup', 'translate']
+        assert elapsed < TRANSLATE_DELAY + 0.5
+        assert result['instruction'] == "げんきよく読みましょう。"
+        assert result['chinese_translation'] == "白色的海鸥在飞。\n蓝色的大海一望无际。"
+        assert result['_performance']['split'] is True
+        assert result['_performance']['japanese_time'] < result['_performance']['total_time']
+        assert result['_performance']['usage']['prompt_tokens'] == 200
+        assert [event for event, _, _ in events][-1] == 'chinese_translation'
+
+
+def test_async_split():
+    """异步调用同样并发发出两个请求"""
+    with _server() as server:
+        result = asyncio.run(_processor(server).process_ocr_text_async("しろい かもめが とんで います。"))
+        assert sorted(_calls(server)) == ['cleanup', 'translate']
+        assert result['segments'][0] == "しろい かもめが とんで います。"
+        assert result['chinese_translation'].startswith("白色的海鸥")
+
+
+def test_translation_failure():
+    """翻译请求失败时整体返回错误，日语结果已经通过事件发布"""
+    with _server(fail_translation=True) as server:
+        events = []
+        result = _processor(server).process_ocr_text_stream(
+            "しろい かもめが とんで います。", on_event=lambda event, data: events.append(event)
+        )
+        assert 'japanese_result' in events
+        assert result['error'].startswith("翻译请求失败")
+
+
+if __name__ == "__main__":
+    test_japanese_result_before_translation()
+    test_async_split()
+    test_translation_failure()
+    print("✅ 拆分翻译测试通过")
@@ -0,0 +1,98 @@
+"""
+测试流式 LLM 文本处理和增量分节解析
+使用本地模拟 LLM 服务器（mock_llm_server.py）按 SSE 逐块输出固定回复，验证分段在翻译输出之前就已回调
+"""
+
+import sys
+import os
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache
+from tests.mock_llm_server import MockLLMServer
+from text_processor import TextProcessor, StreamingSectionParser
+
+LLM_CONTENT = """指导语：
+でてきたものは？げんきよく読みましょう。
+
+正文：
+なつに すなはまで すいかわりを します。
+しろい かもめが とんで います。
+
+分段：
+なつに すなはまで すいかわりを します。
+しろい かもめが とんで います。
+
+中文翻译：
+夏天在沙滩上玩劈西瓜。
+白色的海鸥在飞。"""
+
+
+def _server(streaming=True):
+    """每 8 个字符一块，每块之间停顿 0.01 秒"""
+    return MockLLMServer(latency=0, tokens_per_second=800, streaming=streaming,
+                         responder=lambda request: LLM_CONTENT)
+
+
+def _processor(server):
+    processor = TextProcessor(api_key="test-key", cache=ResultCache("LLM"))
+    processor.api_url = server.url
+    return processor
+
+
+def test_parser_matches_full_parse():
+    """逐字输入时的回调与完整解析结果一致"""
+    events = []
+    parser = StreamingSectionParser(lambda event, data: events.append((event, data)))
+    for char in LLM_CONTENT:
+        parser.feed(char)
+    parser.finish()
+
+    parsed = TextProcessor(api_key="test-key", use_cache=False)._parse_response(LLM_CONTENT)
+    assert [e for e, _ in events] == ['instruction', 'main_text', 'segment', 'segment', 'chinese_translation']
+    assert events[0][1]['text'] == parsed['instruction']
+    assert events[1][1]['text'] == parsed['main_text']
+    assert [d['text'] for e, d in events if e == 'segment'] == parsed['segments']
+    assert events[-1][1]['text'] == parsed['chinese_translation']
+
+
+def test_segments_arrive_before_translation_finishes():
+    """流式模式下第一个分段在 LLM 输出结束前回调，最终结果与非流式一致，并写入缓存"""
+    with _server() as server:
+        processor = _processor(server)
+        timeline = []
+        start = time.time()
+        result = processor.process_ocr_text_stream(
+            "なつに すなはまで", on_event=lambda event, data: timeline.append((event, time.time() - start))
+        )
+        finished = time.time() - start
+
+        first_segment = next(t for e, t in timeline if e == 'segment')
+        assert first_segment < finished * 0.8
+        assert result['segments'] == processor._parse_response(LLM_CONTENT)['segments']
+        assert result['_performance']['stream'] is True
+        assert result['_performance']['first_token_time'] is not None
+
+        # 缓存命中时按顺序重放事件
+        replayed = []
+        cached = processor.process_ocr_text_stream("なつに すなはまで", on_event=lambda e, d: replayed.append(e))
+        assert cached['_performance']['cache_hit'] is True
+        assert replayed == [e for e, _ in timeline]
+
+
+def test_non_streaming_server_fallback():
+    """服务端忽略 stream 参数返回普通 JSON 时仍能解析并回调"""
+    with _server(streaming=False) as server:
+        events = []
+        result = _processor(server).process_ocr_text_stream("すいかわり", on_event=lambda e, d: events.append(e))
+        assert events.count('segment') == 2
+        assert result['chinese_translation'].startswith("夏天")
+
+
+if __name__ == "__main__":
+    test_parser_matches_full_parse()
+    test_segments_arrive_before_translation_finishes()
+    test_non_streaming_server_fallback()
+    print("✅ 流式文本处理测试通过")
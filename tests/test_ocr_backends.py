@@ -0,0 +1,184 @@
+"""
+测试可替换的 OCR 后端和本地/远程路由
+用假后端验证路由逻辑；安装了 pytesseract 和 tesseract jpn 语言包时测试本地引擎
+直接运行本脚本会对 Picture books/ 中的示例图片比较本地和 Vision 的耗时
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from ocr_backends import OCRBackend, OCRRouter, TesseractBackend, analyze_page, create_ocr_backend
+
+SAMPLE_IMAGES = [
+    "Picture books/Kumon test.png",
+    "Picture books/Kumon test2.png",
+    "Picture books/short para 1.png",
+    "Picture books/Qiaohu1.HEIC"
+]
+
+
+class FakeBackend(OCRBackend):
+    """返回固定结果并记录调用的假后端"""
+
+    def __init__(self, name, confidence=0.95):
+        self.name = name
+        self.confidence = confidence
+        self.calls = []
+
+    def extract_text(self, image_path, detection_type="DOCUMENT_TEXT_DETECTION"):
+        self.calls.append(image_path)
+        return {"full_text": f"{self.name}:{os.path.basename(image_path)}", "text_blocks": [],
+                "confidence": self.confidence, "engine": self.name}
+
+
+def _clean_page(path: str):
+    """白底黑字的练习册页面"""
+    img = Image.new('RGB', (800, 600), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for row in range(12):
+        draw.rectangle((60, 40 + row * 45, 700, 60 + row * 45), fill=(0, 0, 0))
+    img.save(path, 'PNG')
+
+
+def _picture_page(path: str):
+    """色彩丰富的绘本页面"""
+    img = Image.new('RGB', (800, 600), (250, 200, 60))
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((100, 100, 500, 500), fill=(40, 120, 220))
+    draw.rectangle((520, 80, 760, 560), fill=(200, 60, 80))
+    img.save(path, 'PNG')
+
+
+def test_analyze_page_separates_worksheet_and_picture():
+    """练习册页面对比度高、饱和度低，绘本页面相反"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clean, picture = os.path.join(tmp, "clean.png"), os.path.join(tmp, "picture.png")
+        _clean_page(clean)
+        _picture_page(picture)
+
+        router = OCRRouter(remote=FakeBackend("vision"), local=FakeBackend("tesseract"))
+        assert analyze_page(clean)['bimodal'] > 0.95
+        assert analyze_page(picture)['saturation'] > 0.3
+        assert router.is_clean_page(clean)
+        assert not router.is_clean_page(picture)
+
+
+def test_router_prefers_local_for_clean_pages():
+    """干净页面走本地，其余页面走远程；批量时远程页面合并请求且保持顺序"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clean, picture = os.path.join(tmp, "clean.png"), os.path.join(tmp, "picture.png")
+        _clean_page(clean)
+        _picture_page(picture)
+        remote, local = FakeBackend("vision"), FakeBackend("tesseract")
+        router = OCRRouter(remote=remote, local=local)
+
+        results = router.extract_text_batch([picture, clean, picture])
+
+        assert [r['engine'] for r in results] == ["vision", "tesseract", "vision"]
+        assert local.calls == [clean]
+        assert router.stats() == {'local': 1, 'fallback': 0, 'remote': 2}
+
+
+def test_router_falls_back_on_low_confidence():
+    """本地结果置信度不足时改用远程结果"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clean = os.path.join(tmp, "clean.png")
+        _clean_page(clean)
+        router = OCRRouter(remote=FakeBackend("vision"), local=FakeBackend("tesseract", confidence=0.4))
+
+        assert router.extract_text(clean)['engine'] == "vision"
+        assert router.stats()['fallback'] == 1
+
+
+def test_router_without_remote():
+    """没有远程后端时所有页面都交给本地引擎，不做质量判断"""
+    with tempfile.TemporaryDirectory() as tmp:
+        picture = os.path.join(tmp, "picture.png")
+        _picture_page(picture)
+        router = OCRRouter(local=FakeBackend("tesseract", confidence=0.4))
+
+        assert router.extract_text(picture)['engine'] == "tesseract"
+        assert asyncio.run(router.extract_text_async(picture))['engine'] == "tesseract"
+        assert [r['engine'] for r in router.extract_text_batch([picture, picture])] == ["tesseract"] * 2
+        assert router.stats() == {'local': 4, 'fallback': 0, 'remote': 0}
+
+
+def test_base_backend_is_abstract():
+    """OCRBackend 不能直接实例化；Tesseract 语言包映射为 BCP-47 语言代码"""
+    try:
+        OCRBackend()
+        assert False, "应当抛出 TypeError"
+    except TypeError:
+        pass
+
+    backend = TesseractBackend.__new__(TesseractBackend)
+    backend.lang = "jpn_vert+jpn+chi_sim+eng"
+    assert backend._language_codes() == [{"languageCode": "ja"}, {"languageCode": "zh"}, {"languageCode": "en"}]
+
+
+def test_unknown_backend_rejected():
+    """未知的 OCR_BACKEND 配置报错"""
+    try:
+        create_ocr_backend("unknown")
+    except ValueError:
+        return
+    raise AssertionError("应当拒绝未知后端")
+
+
+def test_tesseract_backend():
+    """本地引擎识别合成页面（需要 tesseract 和 jpn 语言包）"""
+    try:
+        backend = TesseractBackend()
+    except ValueError as e:
+        print(f"⚠️  跳过本地 OCR 测试: {str(e)}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "page.png")
+        _clean_page(path)
+        result = backend.extract_text(path)
+        assert 'full_text' in result and result['engine'] == "tesseract"
+
+
+def benchmark_sample_pages():
+    """比较本地引擎和 Google Vision 在示例图片上的耗时"""
+    print("=" * 60)
+    print("OCR 后端对比（本地 Tesseract vs Google Vision）")
+    print("=" * 60)
+
+    backends = []
+    for name in ("local", "vision"):
+        try:
+            backends.append(create_ocr_backend(name))
+        except Exception as e:
+            print(f"⚠️  {name} 后端不可用: {str(e)}")
+
+    for image_path in SAMPLE_IMAGES:
+        if not os.path.exists(image_path):
+            print(f"\n⚠️  图片不存在: {image_path}")
+            continue
+        print(f"\n📷 {image_path}  页面分析: {analyze_page(image_path)}")
+        for backend in backends:
+            start = time.time()
+            result = backend.extract_text(image_path)
+            print(f"  {backend.name:>10}: {(time.time() - start) * 1000:7.0f} ms  "
+                  f"{len(result.get('full_text', ''))} 字符  {result.get('error', '')}")
+
+
+if __name__ == "__main__":
+    test_analyze_page_separates_worksheet_and_picture()
+    test_router_prefers_local_for_clean_pages()
+    test_router_falls_back_on_low_confidence()
+    test_router_without_remote()
+    test_base_backend_is_abstract()
+    test_unknown_backend_rejected()
+    test_tesseract_backend()
+    print("✅ OCR 后端测试通过\n")
+    benchmark_sample_pages()
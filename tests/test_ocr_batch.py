@@ -0,0 +1,71 @@
+"""
+测试批量 OCR 的请求打包和结果顺序
+用假的 annotate 函数代替 Vision API
+"""
+
+import sys
+import os
+import base64
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from picture_to_text import PictureToText
+
+
+class FakeBatchOCR(PictureToText):
+    """记录每次 annotate 请求的图片数量，返回以图片内容为文本的假结果"""
+
+    def __init__(self):
+        super().__init__(api_key="test-key", use_cache=False)
+        self.batch_sizes = []
+
+    def _annotate(self, image_requests, fields=None):
+        self.batch_sizes.append(len(image_requests))
+        return {
+            "responses": [
+                {"fullTextAnnotation": {"text": base64.b64decode(r["image"]["content"]).decode(), "pages": [{}]}}
+                for r in image_requests
+            ]
+        }
+
+
+def test_extract_text_batch_packs_and_keeps_order():
+    """超过单请求图片上限时拆分请求，结果顺序与输入一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(20):
+            path = os.path.join(tmp, f"page_{i}.png")
+            with open(path, 'wb') as f:
+                f.write(f"page {i}".encode())
+            paths.append(path)
+
+        ocr = FakeBatchOCR()
+        results = ocr.extract_text_batch(paths)
+
+        assert ocr.batch_sizes == [16, 4]
+        assert [r["full_text"] for r in results] == [f"page {i}" for i in range(20)]
+
+
+def test_extract_text_batch_respects_payload_limit():
+    """请求体超过大小上限时提前拆分"""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(3):
+            path = os.path.join(tmp, f"page_{i}.png")
+            with open(path, 'wb') as f:
+                f.write(b"x" * 300)
+            paths.append(path)
+
+        ocr = FakeBatchOCR()
+        ocr.MAX_REQUEST_BYTES = 900  # 每张约 400 字节 base64
+        ocr.extract_text_batch(paths)
+
+        assert ocr.batch_sizes == [2, 1]
+
+
+if __name__ == "__main__":
+    test_extract_text_batch_packs_and_keeps_order()
+    test_extract_text_batch_respects_payload_limit()
+    print("✅ 批量 OCR 测试通过")
@@ -0,0 +1,116 @@
+"""
+测试 OCR 结果缓存
+不调用真实 API，用计数的假识别函数验证命中/未命中行为
+"""
+
+import sys
+import os
+import json
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache
+from picture_to_text import PictureToText
+
+
+class CountingOCR(PictureToText):
+    """用假结果代替 Vision API 调用，并记录调用次数"""
+
+    def __init__(self, **kwargs):
+        super().__init__(api_key="test-key", **kwargs)
+        self.calls = 0
+
+    def _extract_text_uncached(self, image_path, detection_type, full_geometry=False):
+        self.calls += 1
+        return {"full_text": "なつにすなはまで", "text_blocks": [], "language": []}
+
+
+def _write_image(directory: str, name: str, content: bytes) -> str:
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_result_cache_lru_eviction():
+    """内存层超过上限时淘汰最久未使用的条目"""
+    cache = ResultCache("test", max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a")
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['memory_entries'] == 2
+
+
+def test_result_cache_disk_tier():
+    """磁盘层在新实例中仍可命中"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        ResultCache("test", cache_dir=cache_dir).set("key", {"full_text": "テスト"})
+
+        cache = ResultCache("test", cache_dir=cache_dir)
+        assert cache.get("key") == {"full_text": "テスト"}
+        assert cache.stats()['disk_hits'] == 1
+
+
+def test_result_cache_failed_write_leaves_no_temp_file():
+    """无法序列化的值写磁盘失败时删除临时文件"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ResultCache("test", cache_dir=cache_dir)
+        cache.set("key", {"value": object()})
+        assert [name for _, _, names in os.walk(cache_dir) for name in names] == []
+
+
+def test_result_cache_disk_limit():
+    """磁盘层超出字节上限时删除最久未使用的文件，重启后按已有文件计算字节数"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        size = len(json.dumps({"v": 1}))
+        cache = ResultCache("test", max_entries=0, cache_dir=cache_dir, max_disk_bytes=2 * size)
+        cache.set("a1", {"v": 1})
+        cache.set("b2", {"v": 2})
+        assert cache.get("a1") == {"v": 1}  # 命中后 b2 成为最久未使用的文件
+        cache.set("c3", {"v": 3})
+        assert cache.get("b2") is None
+        assert cache.get("a1") == {"v": 1} and cache.get("c3") == {"v": 3}
+        stats = cache.stats()
+        assert stats['disk_evictions'] == 1 and stats['disk_bytes'] == 2 * size
+
+        restarted = ResultCache("test", cache_dir=cache_dir, max_disk_bytes=size)
+        assert restarted.stats()['disk_bytes'] == size
+        assert sum(len(names) for _, _, names in os.walk(cache_dir)) == 1
+
+
+def test_extract_text_uses_content_hash():
+    """相同内容的不同文件只调用一次 API，不同检测类型分别缓存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ocr = CountingOCR(cache=ResultCache("OCR", cache_dir=os.path.join(tmp, "cache")))
+        first = _write_image(tmp, "page.png", b"same page bytes")
+        second = _write_image(tmp, "page_retake.png", b"same page bytes")
+        other = _write_image(tmp, "other.png", b"another page")
+
+        ocr.extract_text(first)
+        ocr.extract_text(second)
+        assert ocr.calls == 1
+
+        ocr.extract_text(other)
+        ocr.extract_text(first, detection_type="TEXT_DETECTION")
+        assert ocr.calls == 3
+
+        stats = ocr.cache_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 3
+
+
+if __name__ == "__main__":
+    test_result_cache_lru_eviction()
+    test_result_cache_disk_tier()
+    test_result_cache_failed_write_leaves_no_temp_file()
+    test_result_cache_disk_limit()
+    test_extract_text_uses_content_hash()
+    print("✅ OCR 缓存测试通过")
@@ -0,0 +1,122 @@
+"""
+测试页面感知哈希索引：同一页面重拍后仍能匹配，不同页面不匹配；
+同一版式、文字不同的练习册页面哈希接近，但没有内容哈希或 OCR 文本确认时不复用
+使用合成图片，不调用外部 API
+"""
+
+import sys
+import os
+import random
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageEnhance
+from phash_index import PerceptualHashIndex, dhash, text_signature
+
+BACKGROUND = (250, 248, 240)
+
+
+def _make_page(path: str, seed: int) -> Image.Image:
+    """生成一张带插图和文字行的绘本页面"""
+    rand = random.Random(seed)
+    img = Image.new('RGB', (1200, 1600), BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((rand.randint(100, 600), rand.randint(100, 500), rand.randint(700, 1100), rand.randint(600, 900)),
+                 fill=(rand.randint(0, 255), rand.randint(0, 255), rand.randint(0, 255)))
+    for row in range(rand.randint(5, 12)):
+        y = 950 + row * 50
+        draw.rectangle((100, y, 100 + rand.randint(300, 1000), y + 25), fill=(20, 20, 20))
+    img.save(path, 'PNG')
+    return img
+
+
+def _make_worksheet(path: str, words):
+    """生成版式相同的练习册页面：标题、题号方框和每行的题目文字，只有文字不同"""
+    img = Image.new('RGB', (1200, 1600), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((80, 60, 1120, 160), outline=(0, 0, 0), width=4)
+    for row, word in enumerate(words):
+        y = 260 + row * 120
+        draw.rectangle((100, y, 160, y + 60), outline=(0, 0, 0), width=3)
+        draw.text((200, y + 20), word, fill=(0, 0, 0))
+        draw.line((200, y + 80, 1100, y + 80), fill=(0, 0, 0), width=2)
+    img.save(path, 'PNG')
+
+
+def _reshoot(img: Image.Image, path: str):
+    """模拟重拍：轻微裁剪、缩放、变暗并以 JPEG 保存"""
+    shot = img.crop((8, 10, 1192, 1590)).resize((900, 1200))
+    ImageEnhance.Brightness(shot).enhance(0.9).save(path, 'JPEG', quality=75)
+
+
+def test_reshot_page_is_similar():
+    """重拍的同一页面相似度高于阈值，不同页面低于阈值"""
+    with tempfile.TemporaryDirectory() as tmp:
+        page = _make_page(os.path.join(tmp, "page.png"), seed=1)
+        _reshoot(page, os.path.join(tmp, "retake.jpg"))
+        _make_page(os.path.join(tmp, "other.png"), seed=2)
+
+        index = PerceptualHashIndex(index_path="")
+        original = dhash(os.path.join(tmp, "page.png"))
+        assert index.similarity(original, dhash(os.path.join(tmp, "retake.jpg"))) >= index.min_similarity
+        assert index.similarity(original, dhash(os.path.join(tmp, "other.png"))) < index.min_similarity
+
+
+def test_index_finds_and_persists_results():
+    """登记的结果可以按相似页面查到，并在新实例中保留"""
+    with tempfile.TemporaryDirectory() as tmp:
+        page = _make_page(os.path.join(tmp, "page.png"), seed=1)
+        _reshoot(page, os.path.join(tmp, "retake.jpg"))
+        _make_page(os.path.join(tmp, "other.png"), seed=3)
+        index_path = os.path.join(tmp, "cache", "phash_index.json")
+
+        index = PerceptualHashIndex(index_path=index_path)
+        result = {"ocr": {"full_text": "なつ"}, "audio_urls": {}}
+        index.add(index.compute(os.path.join(tmp, "page.png")), result, "task-1", "page.png",
+                  signature=text_signature("なつ"))
+
+        reloaded = PerceptualHashIndex(index_path=index_path)
+        match = reloaded.find(reloaded.compute(os.path.join(tmp, "retake.jpg")), signature=text_signature("な つ\n"))
+        assert match['result'] == result
+        assert match['task_id'] == "task-1" and match['confirmed_by'] == "text_signature"
+        assert reloaded.find(reloaded.compute(os.path.join(tmp, "other.png")), signature=text_signature("なつ")) is None
+        assert reloaded.stats()['matches'] == 1
+
+
+def test_same_layout_different_text_not_reused():
+    """同一版式、文字不同的两页哈希相似度超过阈值，但 OCR 文本签名不同，不复用"""
+    with tempfile.TemporaryDirectory() as tmp:
+        first, second = os.path.join(tmp, "sheet1.png"), os.path.join(tmp, "sheet2.png")
+        _make_worksheet(first, ["1. cat", "2. dog", "3. fish", "4. bird"])
+        _make_worksheet(second, ["1. sun", "2. moon", "3. star", "4. rain"])
+
+        index = PerceptualHashIndex(index_path="")
+        first_hash, second_hash = index.compute(first), index.compute(second)
+        assert index.similarity(first_hash, second_hash) >= index.min_similarity
+
+        index.add(first_hash, {"ocr": {"full_text": "ねこ いぬ"}}, "task-1", "sheet1.png",
+                  content_hash="a" * 64, signature=text_signature("ねこ いぬ"))
+        assert index.find(second_hash) is None
+        assert index.find(second_hash, content_hash="b" * 64, signature=text_signature("そら つき")) is None
+        assert index.find(second_hash, content_hash="a" * 64)['confirmed_by'] == "content_hash"
+        assert text_signature("  \n") is None
+        stats = index.stats()
+        assert stats['unconfirmed'] == 2 and stats['matches'] == 1
+
+
+def test_index_bounded():
+    """超过上限时淘汰最早登记的页面"""
+    index = PerceptualHashIndex(index_path="", max_entries=2)
+    for i in range(3):
+        index.add(1 << i, {"i": i}, f"task-{i}", f"{i}.png")
+    assert index.stats()['entries'] == 2
+
+
+if __name__ == "__main__":
+    test_reshot_page_is_similar()
+    test_index_finds_and_persists_results()
+    test_same_layout_different_text_not_reused()
+    test_index_bounded()
+    print("✅ 感知哈希索引测试通过")
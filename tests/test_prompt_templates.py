@@ -0,0 +1,115 @@
+"""
+测试 prompt 模板注册表和自适应 max_tokens，并提供模板对比基准测试
+
+pytest 只运行离线测试；直接运行本脚本会打印各模板的共享前缀比例，
+配置了 SUPER_MIND_API_KEY 时还会用真实 LLM 对比两种模板的耗时和 token 用量
+（cached_tokens 为命中上游 prompt 缓存的 token 数）。
+"""
+
+import sys
+import os
+import time
+import statistics
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_templates import PromptTemplate, get_prompt_template, prompt_template_names
+from text_processor import TextProcessor
+
+SAMPLES = [
+    "でてきたものは?\nげんき よく よみましょう。\nなつにすなはまで すいかわりを します。",
+    "しろい かもめが とんで います。あおい そらが とても きれいです。",
+]
+
+
+def _shared_prefix(template: PromptTemplate) -> int:
+    """两次不同输入的请求中，序列化后 messages 的共同前缀长度"""
+    first, second = (
+        "".join(m['role'] + m['content'] for m in template.build_messages(text)) for text in SAMPLES
+    )
+    return len(os.path.commonprefix([first, second]))
+
+
+def test_system_first_shares_prefix():
+    """system_first 模板的固定说明在前，不同请求共享几乎整个 prompt 前缀"""
+    system_first = get_prompt_template("system_first")
+    legacy = get_prompt_template("legacy")
+
+    messages = system_first.build_messages(SAMPLES[0])
+    assert messages[0]['role'] == "system"
+    assert messages[-1]['content'].endswith(SAMPLES[0])
+    assert _shared_prefix(system_first) > len(system_first.system)
+    assert _shared_prefix(legacy) < 40
+
+
+def test_template_selection_changes_request_and_version():
+    """模板可按名称选择，不同模板的 prompt 版本不同"""
+    legacy = TextProcessor(api_key="test-key", use_cache=False, prompt_template="legacy")
+    system_first = TextProcessor(api_key="test-key", use_cache=False, prompt_template="system_first")
+
+    _, payload, _ = legacy._prepare_request(SAMPLES[0])
+    assert [m['role'] for m in payload['messages']] == ["user"]
+    _, payload, _ = system_first._prepare_request(SAMPLES[0])
+    assert [m['role'] for m in payload['messages']] == ["system", "user"]
+    assert legacy.prompt_version != system_first.prompt_version
+    assert set(prompt_template_names()) >= {"legacy", "system_first"}
+
+    try:
+        TextProcessor(api_key="test-key", use_cache=False, prompt_template="unknown")
+    except ValueError:
+        return
+    raise AssertionError("应当拒绝未知模板")
+
+
+def test_max_tokens_scales_with_input():
+    """max_tokens 随输入长度增长，并限制在上下限之间"""
+    processor = TextProcessor(api_key="test-key", use_cache=False)
+    short = processor._max_tokens("なつ")
+    medium = processor._max_tokens("な" * 300)
+    long = processor._max_tokens("な" * 5000)
+
+    assert short == processor.MIN_TOKENS
+    assert short < medium < long
+    assert long == processor.MAX_TOKENS
+
+
+def benchmark_templates(runs: int = 3):
+    """对比 legacy 和 system_first 模板"""
+    print("=" * 60)
+    print("Prompt 模板对比")
+    print("=" * 60)
+    for name in ("legacy", "system_first"):
+        template = get_prompt_template(name)
+        prompt = "".join(m['content'] for m in template.build_messages(SAMPLES[0]))
+        print(f"{name:>13}: prompt {len(prompt)} 字符，跨请求共享前缀 {_shared_prefix(template)} 字符")
+
+    if not (os.getenv('SUPER_MIND_API_KEY') or os.getenv('AI_BUILDER_TOKEN')):
+        print("\n⚠️  未设置 SUPER_MIND_API_KEY，跳过真实 LLM 对比")
+        return
+
+    print(f"\n真实 LLM 对比（每个模板 {runs} 轮 × {len(SAMPLES)} 条文本，关闭结果缓存）")
+    for name in ("legacy", "system_first"):
+        processor = TextProcessor(use_cache=False, prompt_template=name)
+        times, prompt_tokens, completion_tokens, cached_tokens = [], [], [], []
+        for _ in range(runs):
+            for text in SAMPLES:
+                start = time.time()
+                result = processor.process_ocr_text(text)
+                times.append(time.time() - start)
+                usage = result.get('_performance', {}).get('usage') or {}
+                prompt_tokens.append(usage.get('prompt_tokens') or 0)
+                completion_tokens.append(usage.get('completion_tokens') or 0)
+                cached_tokens.append(usage.get('cached_tokens') or 0)
+        print(f"{name:>13}: 中位耗时 {statistics.median(times):6.2f} 秒  "
+              f"prompt_tokens {statistics.mean(prompt_tokens):7.0f}  "
+              f"completion_tokens {statistics.mean(completion_tokens):7.0f}  "
+              f"cached_tokens {statistics.mean(cached_tokens):7.0f}")
+
+
+if __name__ == "__main__":
+    test_system_first_shares_prefix()
+    test_template_selection_changes_request_and_version()
+    test_max_tokens_scales_with_input()
+    print("✅ prompt 模板测试通过\n")
+    benchmark_templates(int(os.getenv('BENCH_RUNS', '3')))
@@ -0,0 +1,144 @@
+"""
+测试结构化输出（JSON）模式：解析、校验、本地修复和流式增量解析
+本地模拟 LLM 服务器（mock_llm_server.py）按顺序返回预设回复，
+验证 json 模板发送 response_format、格式有误的输出在本地修复而不重新请求
+"""
+
+import sys
+import os
+import json
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_output import StreamingJsonParser, StructuredOutputError, parse_structured_output, repair_json
+from tests.mock_llm_server import MockLLMServer
+from text_processor import TextProcessor
+
+PAGE = {
+    "instruction": "げんきよく読みましょう。",
+    "main_text": "正文：くまの こが いいました。「分段：ここから」",
+    "segments": ["正文：くまの こが いいました。", "「分段：ここから」"],
+    "chinese_translation": "正文：小熊说。“分段：从这里开始”"
+}
+
+
+def test_parse_valid_output():
+    """内容中出现分节标题一样的词不影响解析"""
+    parsed, repaired = parse_structured_output(json.dumps(PAGE, ensure_ascii=False))
+    assert repaired is False
+    assert parsed['segments'] == PAGE['segments']
+    assert parsed['main_text'] == PAGE['main_text']
+    assert parsed['japanese_text'] == PAGE['main_text']
+    assert parsed['chinese_translation'] == PAGE['chinese_translation']
+
+
+def test_repair_malformed_output():
+    """代码块标记、多余的逗号、字符串中的换行和被截断的输出在本地修复"""
+    fenced = "```json\n" + json.dumps(PAGE, ensure_ascii=False) + "\n```"
+    assert parse_structured_output(fenced) == (parse_structured_output(json.dumps(PAGE))[0], True)
+
+    sloppy = '{"instruction": "", "main_text": "しろい\nかもめ", "segments": ["しろい かもめ",], "chinese_translation": "白色的海鸥",}'
+    parsed, repaired = parse_structured_output(sloppy)
+    assert repaired is True
+    assert parsed['main_text'] == "しろい\nかもめ"
+    assert parsed['segments'] == ["しろい かもめ"]
+
+    truncated = '{"instruction": "", "main_text": "しろい かもめ", "segments": ["しろい かもめ"], "chinese_translation": "白色的'
+    parsed, _ = parse_structured_output(truncated)
+    assert parsed['chinese_translation'] == "白色的"
+    assert json.loads(repair_json('{"main_text": "a", "segments": ["a"], "chinese'))['segments'] == ["a"]
+
+
+def test_invalid_output_raises():
+    """缺少正文或分段、字段类型错误时报错，不生成降级的分段"""
+    for content in [
+        "指导语：\n\n正文：\nしろい かもめ",
+        '{"instruction": "", "main_text": "", "segments": [], "chinese_translation": ""}',
+        '{"instruction": "", "main_text": "しろい", "segments": "しろい", "chinese_translation": ""}',
+        '["しろい"]',
+    ]:
+        try:
+            parse_structured_output(content)
+        except StructuredOutputError:
+            continue
+        raise AssertionError(f"应当报错: {content}")
+
+
+def test_streaming_parser_emits_segments():
+    """流式解析器在每个分段字符串结束时回调，与分块位置无关"""
+    content = json.dumps(PAGE, ensure_ascii=False, indent=1)
+    for size in [1, 3, 7, len(content)]:
+        events = []
+        parser = StreamingJsonParser(lambda event, data: events.append((event, data)))
+        for i in range(0, len(content), size):
+            parser.feed(content[i:i + size])
+        assert parser.finish() == content
+        assert events == [
+            ('instruction', {'text': PAGE['instruction']}),
+            ('main_text', {'text': PAGE['main_text']}),
+            ('segment', {'index': 0, 'text': PAGE['segments'][0]}),
+            ('segment', {'index': 1, 'text': PAGE['segments'][1]}),
+            ('chinese_translation', {'text': PAGE['chinese_translation']}),
+        ]
+
+
+def test_streaming_parser_raw_control_characters():
+    """字符串中有未转义的换行时照常回调，与最终解析的分段一致"""
+    # JSON 字符串中直接出现换行和制表符（Python 字面量中的 \n、\t 是真实的控制字符）
+    content = '{"instruction": "", "main_text": "しろい\nくも", "segments": ["しろい\nくも", "あおい\tそら"], ' \
+              '"chinese_translation": "白云"}'
+    events = []
+    parser = StreamingJsonParser(lambda event, data: events.append((event, data)))
+    parser.feed(content)
+    result, repaired = parse_structured_output(parser.finish())
+    assert repaired
+    assert [data for event, data in events if event == 'segment'] == [
+        {'index': index, 'text': text} for index, text in enumerate(result['segments'])
+    ]
+    assert ('main_text', {'text': "しろい\nくも"}) in events
+
+
+def _server(replies):
+    """按顺序返回预设的回复"""
+    replies = list(replies)
+    return MockLLMServer(latency=0, responder=lambda request: replies.pop(0))
+
+
+def _processor(server, **kwargs):
+    processor = TextProcessor(api_key="test-key", use_cache=False, use_translation_memory=False,
+                              prompt_template="json", **kwargs)
+    processor.api_url = server.url
+    return processor
+
+
+def test_json_mode_request_and_repair():
+    """json 模板发送 response_format；格式有误的输出修复后使用，只请求一次"""
+    malformed = json.dumps(PAGE, ensure_ascii=False)[:-1] + ",}"
+    with _server([malformed]) as server:
+        result = _processor(server).process_ocr_text("くまの こが いいました。")
+        assert len(server.requests) == 1
+        assert server.requests[0]['response_format']['type'] == "json_schema"
+        assert result['segments'] == PAGE['segments']
+        assert result['_performance']['structured_output'] is True
+        assert result['_performance']['json_repaired'] is True
+
+
+def test_json_mode_invalid_output_is_error():
+    """修复后仍无效的输出返回错误，response_format 可以关闭"""
+    with _server(["しろい かもめ"]) as server:
+        result = _processor(server, response_format_mode="none").process_ocr_text("しろい かもめ")
+        assert 'response_format' not in server.requests[0]
+        assert result['error'].startswith("结构化输出无效")
+        assert result['segments'] == []
+
+
+if __name__ == "__main__":
+    test_parse_valid_output()
+    test_repair_malformed_output()
+    test_invalid_output_raises()
+    test_streaming_parser_emits_segments()
+    test_streaming_parser_raw_control_characters()
+    test_json_mode_request_and_repair()
+    test_json_mode_invalid_output_is_error()
+    print("✅ 结构化输出测试通过")
@@ -0,0 +1,120 @@
+"""
+测试调用 LLM 前的规则去噪
+语料来自已有的测试文本（text_processor.main、test_text_processing_performance、test_segmentation）
+以及常见的 OCR 噪音变体；直接运行本脚本会打印每条语料的压缩比例
+"""
+
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_processor import TextProcessor, denoise_ocr_text
+
+# (名称, OCR 原文, 期望的去噪结果)
+CORPUS = [
+    (
+        "公文练习册（text_processor.main）",
+        """4A 101-a
+☆☆
+でてきた
+ものは?
+げんき よく よみましょう。
+なつにすなはまで
+すいかわりを します。
+しろい かもめが
+とんで います。""",
+        """でてきたものは?
+げんき よく よみましょう。
+なつにすなはまで すいかわりを します。
+しろい かもめが とんで います。"""
+    ),
+    (
+        "无噪音的连续正文（test_segmentation）",
+        "なつにすなはまですいかわりをします。しろいかもめがとんでいます。あおいそらがとてもきれいです。",
+        "なつにすなはまですいかわりをします。しろいかもめがとんでいます。あおいそらがとてもきれいです。"
+    ),
+    (
+        "页码、全角级别和星级",
+        """１２
+- 13 -
+p.14
+３Ａ　２５ｂ
+★★★
+なつに すなはまで すいかわりを します。☆""",
+        "なつに すなはまで すいかわりを します。"
+    ),
+    (
+        "重复注音",
+        """よ
+げんきよく読みましょう。
+げんきよく読(よ)みましょう。
+げんきよく読(よ)みましょう。""",
+        "げんきよく読みましょう。"
+    ),
+    (
+        "单独成行的注音（同页括号注音给出读音）",
+        """せんせい
+先生(せんせい)が 来ました。
+せんせい
+先生が 言いました。""",
+        """先生が 来ました。
+先生が 言いました。"""
+    ),
+    (
+        "短平假名行是正文，不是注音",
+        """はい
+先生が言いました。""",
+        "はい先生が言いました。"
+    ),
+    (
+        "分隔线删除，标点行保留",
+        """ほんとうに
+！？
+-----
+・・・
+びっくりしました。
+＝＝＝＝""",
+        """ほんとうに！？
+びっくりしました。"""
+    ),
+]
+
+
+def test_denoiser_corpus():
+    """语料逐条与期望结果一致"""
+    for name, raw_text, expected in CORPUS:
+        assert denoise_ocr_text(raw_text) == expected, name
+
+
+def test_denoiser_keeps_story_text():
+    """没有把握的内容原样保留（数字句子、短平假名行后不是汉字行）"""
+    text = "かもめが 3わ とんで います。\nはい。\nそうです。"
+    assert denoise_ocr_text(text) == text
+
+
+def test_prepare_input_reports_lengths():
+    """预处理统计输入/输出长度；全部是噪音时保留原文"""
+    processor = TextProcessor(api_key="test-key", use_cache=False)
+    text, stats = processor._prepare_input(CORPUS[0][1])
+    assert text == CORPUS[0][2]
+    assert stats['input_length'] == len(CORPUS[0][1])
+    assert stats['denoised_length'] == len(CORPUS[0][2])
+
+    text, _ = processor._prepare_input("4A 101-a\n☆☆")
+    assert text == "4A 101-a\n☆☆"
+
+    raw = TextProcessor(api_key="test-key", use_cache=False, denoise=False)
+    assert raw._prepare_input(CORPUS[0][1])[0] == CORPUS[0][1]
+    assert raw.prompt_version != processor.prompt_version
+
+
+if __name__ == "__main__":
+    test_denoiser_corpus()
+    test_denoiser_keeps_story_text()
+    test_prepare_input_reports_lengths()
+    print("✅ 去噪测试通过\n")
+    for name, raw_text, _ in CORPUS:
+        cleaned = denoise_ocr_text(raw_text)
+        print(f"{name}: {len(raw_text)} → {len(cleaned)} 字符 ({len(cleaned) / len(raw_text):.0%})")
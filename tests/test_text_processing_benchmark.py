@@ -0,0 +1,245 @@
+"""
+文本处理基准测试（离线）
+使用本地模拟 LLM 服务器（mock_llm_server.py），在不同并发数和输入长度下驱动 TextProcessor，
+报告 p50/p95/p99 延迟和吞吐量；并在大量合成页面上对 _parse_response 和 _auto_segment 做微基准测试。
+
+pytest 只运行规模很小的冒烟测试；直接运行本脚本输出完整报告，例如：
+    python tests/test_text_processing_benchmark.py --concurrency 1,4,16 --sizes 100,500,2000 --requests 48
+"""
+
+import sys
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_output import parse_structured_output
+from text_processor import TextProcessor
+from tests.mock_llm_server import MockLLMServer, canned_response
+
+SENTENCES = [
+    "なつに すなはまで すいかわりを します。",
+    "しろい かもめが とんで います。",
+    "くまの こが もりの なかで はちみつを みつけました。",
+    "おかあさんが「ごはんですよ」と よびました。",
+    "あめが ふって きたので いそいで かえりました。",
+    "きの うえには ことりが うたって います。",
+    "みんなで たのしく あそびました。",
+    "おおきな くじらが うみを およいで います。",
+]
+NOISE = ["4A 101-a", "☆☆", "12", "p.3"]
+
+
+def synthetic_page(chars: int, seed: int) -> str:
+    """生成约 chars 字符的 OCR 风格文本（断行、噪音行），不同 seed 的文本不同"""
+    rng = random.Random(seed)
+    lines = [rng.choice(NOISE)]
+    length = 0
+    while length < chars:
+        sentence = rng.choice(SENTENCES)
+        cut = rng.randrange(4, len(sentence) - 2)
+        lines.extend([sentence[:cut], sentence[cut:]])
+        length += len(sentence)
+    lines.append(f"{seed % 90 + 1}")
+    return "\n".join(lines)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩法的分位数"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def _processor(server: MockLLMServer, **kwargs) -> TextProcessor:
+    processor = TextProcessor(api_key="bench-key", use_cache=False, use_translation_memory=False, **kwargs)
+    processor.api_url = server.url
+    return processor
+
+
+def run_load(server: MockLLMServer, concurrency: int, input_chars: int, requests: int,
+             mode: str = "sync", seed: int = 0, **processor_kwargs) -> Dict:
+    """
+    以固定并发数发送 requests 个不同的页面
+
+    Args:
+        server: 模拟 LLM 服务器
+        concurrency: 同时处理的页面数
+        input_chars: 每个页面的大致长度
+        requests: 页面总数
+        mode: sync（线程池调用 process_ocr_text）/ async（process_ocr_text_async）/ stream（process_ocr_text_stream）
+        seed: 页面生成种子
+        processor_kwargs: 传给 TextProcessor 的参数
+
+    Returns:
+        延迟分位数（秒）、吞吐量（页/秒）、错误数、平均首个分段时间（stream 模式）
+    """
+    processor = _processor(server, **processor_kwargs)
+    pages = [synthetic_page(input_chars, seed + i) for i in range(requests)]
+    latencies, first_segments, errors = [], [], 0
+
+    def one(page: str) -> Dict:
+        start = time.time()
+        first = []
+        if mode == "stream":
+            result = processor.process_ocr_text_stream(
+                page, on_event=lambda event, data: first.append(time.time() - start) if event == 'segment' else None
+            )
+        else:
+            result = processor.process_ocr_text(page)
+        return {'latency': time.time() - start, 'first_segment': first[0] if first else None,
+                'error': result.get('error')}
+
+    async def run_async() -> List[Dict]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(page: str) -> Dict:
+            async with semaphore:
+                start = time.time()
+                result = await processor.process_ocr_text_async(page)
+                return {'latency': time.time() - start, 'first_segment': None, 'error': result.get('error')}
+        return await asyncio.gather(*(bounded(page) for page in pages))
+
+    start = time.time()
+    if mode == "async":
+        outcomes = asyncio.run(run_async())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(one, pages))
+    wall = time.time() - start
+
+    for outcome in outcomes:
+        latencies.append(outcome['latency'])
+        if outcome['first_segment'] is not None:
+            first_segments.append(outcome['first_segment'])
+        errors += 1 if outcome['error'] else 0
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'input_chars': input_chars,
+        'requests': requests,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'throughput': requests / wall,
+        'errors': errors,
+        'first_segment': statistics.mean(first_segments) if first_segments else None,
+        'llm_requests': len(server.requests)
+    }
+
+
+def bench_parser(pages: int = 2000, seed: int = 0) -> Dict:
+    """
+    在合成页面上测量 _parse_response、_auto_segment 和结构化输出解析的耗时
+
+    Args:
+        pages: 合成页面数
+        seed: 页面生成种子
+
+    Returns:
+        各函数每次调用的平均耗时（微秒）和处理的总字符数
+    """
+    processor = TextProcessor(api_key="bench-key", use_cache=False, use_translation_memory=False)
+    texts = [synthetic_page(random.Random(seed + i).choice([100, 500, 2000]), seed + i) for i in range(pages)]
+    sections = [canned_response(text) for text in texts]
+    documents = [canned_response(text, json_output=True) for text in texts]
+    main_texts = [processor._parse_response(content)['main_text'] for content in sections]
+
+    def measure(function, inputs) -> float:
+        start = time.perf_counter()
+        for item in inputs:
+            function(item)
+        return (time.perf_counter() - start) / len(inputs) * 1e6
+
+    return {
+        'pages': pages,
+        'chars': sum(len(content) for content in sections),
+        'parse_response_us': measure(processor._parse_response, sections),
+        'auto_segment_us': measure(processor._auto_segment, main_texts),
+        'structured_output_us': measure(parse_structured_output, documents)
+    }
+
+
+def print_load_report(rows: List[Dict]):
+    print(f"{'模式':<7}{'并发':>5}{'输入字符':>9}{'请求数':>7}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}"
+          f"{'吞吐(页/s)':>12}{'首段(s)':>9}{'错误':>5}")
+    for row in rows:
+        first = f"{row['first_segment']:.3f}" if row['first_segment'] is not None else "-"
+        print(f"{row['mode']:<7}{row['concurrency']:>5}{row['input_chars']:>9}{row['requests']:>7}"
+              f"{row['p50']:>9.3f}{row['p95']:>9.3f}{row['p99']:>9.3f}{row['throughput']:>12.2f}"
+              f"{first:>9}{row['errors']:>5}")
+
+
+def test_load_smoke():
+    """并发处理提升吞吐量，所有请求都成功，分位数有序"""
+    with MockLLMServer(latency=0.1) as server:
+        serial = run_load(server, concurrency=1, input_chars=100, requests=4)
+        parallel = run_load(server, concurrency=4, input_chars=100, requests=8, seed=100)
+        streamed = run_load(server, concurrency=2, input_chars=100, requests=2, mode="stream", seed=200)
+        asynchronous = run_load(server, concurrency=2, input_chars=100, requests=2, mode="async", seed=300)
+    for row in (serial, parallel, streamed, asynchronous):
+        assert row['errors'] == 0, row
+        assert row['p50'] <= row['p95'] <= row['p99']
+    assert parallel['throughput'] > 1.5 * serial['throughput']
+    assert streamed['first_segment'] is not None
+
+
+def test_parser_microbenchmark_smoke():
+    """微基准测试的合成页面可以被三种解析器正确处理"""
+    stats = bench_parser(pages=30)
+    assert stats['chars'] > 0
+    assert stats['parse_response_us'] > 0 and stats['structured_output_us'] > 0
+    processor = TextProcessor(api_key="bench-key", use_cache=False, use_translation_memory=False)
+    page = synthetic_page(300, 1)
+    assert processor._parse_response(canned_response(page))['segments'] == \
+        parse_structured_output(canned_response(page, json_output=True))[0]['segments']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本处理基准测试（本地模拟 LLM）")
+    parser.add_argument('--concurrency', default="1,4,16", help="并发数列表（逗号分隔）")
+    parser.add_argument('--sizes', default="100,500,2000", help="输入长度列表（字符，逗号分隔）")
+    parser.add_argument('--requests', type=int, default=32, help="每组的页面数")
+    parser.add_argument('--modes', default="sync,stream", help="sync / async / stream（逗号分隔）")
+    parser.add_argument('--latency', type=float, default=0.3, help="模拟首字延迟（秒）")
+    parser.add_argument('--tokens-per-second', type=float, default=400, help="模拟输出速度")
+    parser.add_argument('--jitter', type=float, default=0.2, help="延迟随机波动比例")
+    parser.add_argument('--parser-pages', type=int, default=5000, help="解析器微基准测试的页面数")
+    args = parser.parse_args()
+
+    # 基准测试只关心耗时，关闭处理过程中的逐条日志
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        rows = []
+        with MockLLMServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                           jitter=args.jitter) as server:
+            for mode in args.modes.split(','):
+                for size in [int(s) for s in args.sizes.split(',')]:
+                    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+                        rows.append(run_load(server, concurrency, size, args.requests, mode=mode,
+                                             seed=len(rows) * 1000))
+        parser_stats = bench_parser(args.parser_pages)
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+
+    print("=" * 90)
+    print(f"文本处理负载测试 (模拟 LLM: 首字延迟 {args.latency}s, {args.tokens_per_second} token/s, "
+          f"波动 ±{args.jitter:.0%})")
+    print("=" * 90)
+    print_load_report(rows)
+    print()
+    print(f"解析器微基准测试 ({parser_stats['pages']} 页, {parser_stats['chars']} 字符)")
+    print(f"  _parse_response:          {parser_stats['parse_response_us']:.1f} µs/页")
+    print(f"  _auto_segment:            {parser_stats['auto_segment_us']:.1f} µs/页")
+    print(f"  parse_structured_output:  {parser_stats['structured_output_us']:.1f} µs/页")
+
+
+if __name__ == "__main__":
+    main()
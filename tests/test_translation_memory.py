@@ -0,0 +1,121 @@
+"""
+测试句子级翻译记忆
+使用本地模拟 LLM 服务器（mock_llm_server.py），验证学习、全部命中时不请求 LLM、部分命中时只发送未知部分
+"""
+
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import ResultCache
+from tests.mock_llm_server import MockLLMServer, request_text
+from text_processor import TextProcessor
+from translation_memory import TranslationMemory, split_sentences, group_segments
+
+INSTRUCTION = "げんきよく よみましょう。"
+TRANSLATIONS = {
+    "なつに すなはまで すいかわりを します。": "夏天在沙滩上玩劈西瓜。",
+    "しろい かもめが とんで います。": "白色的海鸥在飞。",
+    "あおい うみで およぎます。": "在蓝色的大海里游泳。",
+    "おおきな ふねが みえます。": "能看见一艘大船。",
+}
+
+
+def _respond(request):
+    """按句子生成规范格式的回复（含「よみましょう」的句子视为指导语）"""
+    sentences = split_sentences(request_text(request))
+    instruction = ' '.join(s for s in sentences if 'よみましょう' in s)
+    main = [s for s in sentences if 'よみましょう' not in s]
+    return f"指导语：\n{instruction}\n\n正文：\n" + '\n'.join(main) + \
+        "\n\n分段：\n" + '\n'.join(main) + \
+        "\n\n中文翻译：\n" + '\n'.join(TRANSLATIONS.get(s, "未知。") for s in main)
+
+
+def _received(server):
+    """LLM 收到的 OCR 文本"""
+    return [request_text(request) for request in server.requests]
+
+
+def _processor(server):
+    processor = TextProcessor(api_key="test-key", cache=ResultCache("LLM"), denoise=False,
+                              translation_memory=TranslationMemory(cache_dir=''), use_fuzzy_match=False)
+    processor.api_url = server.url
+    return processor
+
+
+def test_split_sentences():
+    """按句末标点和换行切分，右引号跟随句末标点"""
+    assert split_sentences("「いくよ！」と いいました。\nつぎの ぎょう") == \
+        ["「いくよ！」", "と いいました。", "つぎの ぎょう"]
+    assert split_sentences("夏天来了。海鸥在飞！") == ["夏天来了。", "海鸥在飞！"]
+    assert group_segments(["あ。", "い。", "う。"]) == ["あ。い。", "う。"]
+    assert group_segments(["あ い。", "う。"]) == ["あ い。 う。"]
+
+
+def test_full_hit_skips_llm():
+    """页面的句子全部已知时在本地组装，不再请求 LLM（空格、全角半角不同也能命中）"""
+    with MockLLMServer(latency=0, responder=_respond) as server:
+        processor = _processor(server)
+        page = INSTRUCTION + "\n" + "\n".join(list(TRANSLATIONS)[:2])
+        first = processor.process_ocr_text(page)
+        assert 'error' not in first
+        assert processor.translation_memory.stats()['sentences_learned'] == 3
+
+        # 同一页重新识别：空格不同，LLM 结果缓存不会命中，但每个句子都已知
+        reshot = page.replace(' ', '').replace("げんきよく", "げんき よく")
+        result = processor.process_ocr_text(reshot)
+        assert len(server.requests) == 1
+        assert result['instruction'] == INSTRUCTION
+        assert result['main_text'] == first['main_text']
+        assert result['chinese_translation'] == first['chinese_translation']
+        assert result['segments'] == [' '.join(list(TRANSLATIONS)[:2])]
+        assert result['_performance']['translation_memory']['reused'] == 3
+        assert result['_performance']['api_time'] == 0.0
+
+
+def test_partial_hit_sends_only_unknown_sentences():
+    """只有指导语已知时，只把正文交给 LLM，结果按原文顺序组装"""
+    with MockLLMServer(latency=0, responder=_respond) as server:
+        processor = _processor(server)
+        processor.process_ocr_text(INSTRUCTION + "\n" + list(TRANSLATIONS)[0])
+
+        new_page = INSTRUCTION + "\n" + "\n".join(list(TRANSLATIONS)[2:])
+        result = processor.process_ocr_text(new_page)
+        assert _received(server)[-1] == "\n".join(list(TRANSLATIONS)[2:])
+        assert result['instruction'] == INSTRUCTION
+        assert result['main_text'] == "\n".join(list(TRANSLATIONS)[2:])
+        assert result['chinese_translation'] == "在蓝色的大海里游泳。\n能看见一艘大船。"
+        assert result['_performance']['translation_memory']['reused'] == 1
+
+        # 流式模式：已知部分先回调，LLM 输出的分段接着编号
+        other_page = "\n".join(list(TRANSLATIONS)[:2]) + "\nあたらしい ぶん です。"
+        processor.process_ocr_text("\n".join(list(TRANSLATIONS)[:2]))
+        events = []
+        streamed = processor.process_ocr_text_stream(other_page, on_event=lambda e, d: events.append((e, d)))
+        segments = [data for event, data in events if event == 'segment']
+        assert [data['index'] for data in segments] == list(range(len(streamed['segments'])))
+        assert [data['text'] for data in segments] == streamed['segments']
+        assert _received(server)[-1] == "あたらしい ぶん です。"
+
+
+def test_learn_skips_misaligned_results():
+    """句数对不上（LLM 合并了句子）时不学习"""
+    memory = TranslationMemory(cache_dir='')
+    merged = {
+        'instruction': '',
+        'main_text': "なつに すなはまで すいかわりを します。しろい かもめが とんで います。",
+        'chinese_translation': "夏天在沙滩上玩劈西瓜，白色的海鸥在飞。"
+    }
+    assert memory.learn("\n".join(list(TRANSLATIONS)[:2]), merged) == 0
+    assert memory.stats()['pages_skipped'] == 1
+    assert memory.plan(list(TRANSLATIONS)[0]) is None
+
+
+if __name__ == "__main__":
+    test_split_sentences()
+    test_full_hit_skips_llm()
+    test_partial_hit_sends_only_unknown_sentences()
+    test_learn_skips_misaligned_results()
+    print("✅ 翻译记忆测试通过")
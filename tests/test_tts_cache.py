@@ -0,0 +1,140 @@
+"""
+测试按内容寻址的 TTS 音频缓存
+使用本地模拟 TTS 服务器（mock_tts_server.py），验证同一段文本和语音参数只合成一次，缓存文件的 URL 固定不变
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_cache import AudioCache
+from tests.mock_tts_server import MockTTSServer
+from text_to_speech import TextToSpeech
+
+
+def _tts(server, cache):
+    tts = TextToSpeech(api_key="test-key", cache=cache)
+    tts.api_url = server.url
+    return tts
+
+
+def test_cache_key():
+    """全角/半角和空白差异得到相同的键，语音参数不同时键不同"""
+    args = ("ja-JP-Neural2-B", 0.75, 2.0, 1.0, None, "mp3")
+    assert AudioCache.key("しろい　かもめ！", *args) == AudioCache.key(" しろい かもめ!\n", *args)
+    assert AudioCache.key("しろい かもめ", *args) != AudioCache.key("しろい かもめ", "ja-JP-Neural2-C", *args[1:])
+    assert AudioCache.key("しろい かもめ", *args) != AudioCache.key("しろい かもめ", args[0], 1.0, *args[2:])
+
+
+def test_replay_hits_cache():
+    """重放同一段文本不再请求 API，URL 固定；新实例从磁盘命中"""
+    with MockTTSServer(latency=0) as server, tempfile.TemporaryDirectory() as directory:
+        cache_dir = os.path.join(directory, 'static', 'audio', 'cache')
+        tts = _tts(server, AudioCache(cache_dir=cache_dir, url_prefix="/static/audio/cache"))
+
+        first = tts.synthesize_japanese("しろい かもめが とんで います。")
+        second = tts.synthesize_japanese("しろい かもめが  とんで います。")
+        assert len(server.requests) == 1
+        assert first['cache_hit'] is False and second['cache_hit'] is True
+        assert first['audio_url'] == second['audio_url']
+        assert first['audio_url'].startswith("/static/audio/cache/") and first['audio_url'].endswith(".mp3")
+        assert second['audio_content'] == first['audio_content']
+
+        # 语速不同时重新合成
+        tts.synthesize_japanese("しろい かもめが とんで います。", speaking_rate=1.0)
+        assert len(server.requests) == 2
+        assert server.requests[-1]['audioConfig']['speakingRate'] == 1.0
+
+        restarted = _tts(server, AudioCache(cache_dir=cache_dir))
+        third = asyncio.run(restarted.synthesize_japanese_async("しろい かもめが とんで います。"))
+        assert len(server.requests) == 2
+        assert third['cache_hit'] is True
+        assert restarted.cache_stats()['disk_hits'] == 1
+
+
+def test_memory_limit_and_memory_only():
+    """内存层按字节数淘汰；未启用磁盘层时没有 URL"""
+    cache = AudioCache(cache_dir="", max_memory_bytes=10)
+    cache.set("a", "mp3", b"12345")
+    cache.set("b", "mp3", b"67890")
+    cache.set("c", "mp3", b"abc")
+    assert cache.get("a", "mp3") is None
+    assert cache.get("c", "mp3") == b"abc"
+    assert cache.stats()['evictions'] == 1
+    assert cache.url("c", "mp3") is None
+
+    with MockTTSServer(latency=0) as server:
+        tts = _tts(server, AudioCache(cache_dir=""))
+        result = tts.synthesize_japanese("かもめ")
+        assert result['audio_url'] is None
+        assert tts.synthesize_japanese("かもめ")['cache_hit'] is True
+        assert len(server.requests) == 1
+
+
+def test_disk_limit():
+    """磁盘层超出字节上限时删除最久未使用的文件；写入失败不留下临时文件"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AudioCache(cache_dir=cache_dir, max_memory_bytes=0, max_disk_bytes=10)
+        cache.set("a", "mp3", b"1234")
+        cache.set("b", "mp3", b"5678")
+        os.utime(cache.path("a", "mp3"), (1, 1))
+        os.utime(cache.path("b", "mp3"), (2, 2))
+        assert cache.get("a", "mp3") == b"1234"  # 命中刷新修改时间，b 成为最旧的文件
+        cache.set("c", "mp3", b"9abc")
+        assert sorted(os.listdir(cache_dir)) == ["a.mp3", "c.mp3"]
+        stats = cache.stats()
+        assert stats['disk_evictions'] == 1 and stats['disk_bytes'] == 8
+
+        # 重启后按目录中已有的文件计算字节数
+        assert AudioCache(cache_dir=cache_dir, max_disk_bytes=10).stats()['disk_bytes'] == 8
+
+        os.makedirs(cache.path("d", "mp3"))
+        assert cache.set("d", "mp3", b"def") is None
+        assert not [name for name in os.listdir(cache_dir) if name.endswith('.tmp')]
+
+        # 启动时只删除过期的临时文件，新的可能正被其他进程写入
+        for name, mtime in (("old.tmp", 1), ("writing.tmp", time.time())):
+            with open(os.path.join(cache_dir, name), 'wb') as f:
+                f.write(b"partial")
+            os.utime(os.path.join(cache_dir, name), (mtime, mtime))
+        AudioCache(cache_dir=cache_dir, max_disk_bytes=10)
+        assert "old.tmp" not in os.listdir(cache_dir) and "writing.tmp" in os.listdir(cache_dir)
+
+
+def test_task_audio_survives_eviction():
+    """任务音频由缓存文件硬链接得到，缓存淘汰后任务 URL 仍然可用，相同文本仍只合成一次"""
+    import app_fastapi
+
+    original = app_fastapi.tts
+    with MockTTSServer(latency=0) as server, tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            os.makedirs(app_fastapi.AUDIO_FOLDER)
+            cache = AudioCache(cache_dir="static/audio/cache", max_memory_bytes=0, max_disk_bytes=1)
+            app_fastapi.tts = _tts(server, cache)
+            first = app_fastapi.synthesize_to_file("しろい かもめ", "task1_segment_0.mp3")
+            assert first == "/static/audio/task1_segment_0.mp3"
+            app_fastapi.synthesize_to_file("くろい からす", "task1_segment_1.mp3")
+            assert cache.stats()['disk_evictions'] == 1
+            assert len(os.listdir("static/audio/cache")) == 1
+            with open(first.lstrip('/'), 'rb') as f:
+                assert f.read()
+            assert len(server.requests) == 2
+        finally:
+            os.chdir(cwd)
+            app_fastapi.tts = original
+
+
+if __name__ == "__main__":
+    test_cache_key()
+    test_replay_hits_cache()
+    test_memory_limit_and_memory_only()
+    test_disk_limit()
+    test_task_audio_survives_eviction()
+    print("✅ TTS 音频缓存测试通过")
@@ -0,0 +1,121 @@
+"""
+测试语音合成的并发控制和逐段进度
+本地模拟 TTS 服务器（mock_tts_server.py）模拟较慢的 Google TTS API 并记录同时进行的请求数，
+验证全局并发上限（同步和异步调用共用，异步等待不占用线程）、单个任务内的并发合成，以及每段完成时发布的进度和音频 URL
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_cache import AudioCache
+from task_manager import task_manager
+from tests.mock_tts_server import MockTTSServer
+from text_to_speech import TextToSpeech
+
+DELAY = 0.2
+
+
+def _tts(server, cache_dir="", max_concurrency=2):
+    tts = TextToSpeech(api_key="test-key", cache=AudioCache(cache_dir=cache_dir),
+                       max_concurrency=max_concurrency)
+    tts.api_url = server.url
+    return tts
+
+
+def test_global_limit_sync_and_async():
+    """同步和异步调用共用全局上限，超出的请求排队等待"""
+    with MockTTSServer(latency=DELAY) as server:
+        tts = _tts(server, max_concurrency=2)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(tts.synthesize_japanese, [f"ぶん{i}" for i in range(6)]))
+        assert all('error' not in r for r in results)
+        assert server.peak == 2
+        assert time.time() - start >= 3 * DELAY * 0.9
+
+        async def run():
+            return await asyncio.gather(*(tts.synthesize_japanese_async(f"いそぐ{i}") for i in range(4)))
+        assert all('error' not in r for r in asyncio.run(run()))
+        assert server.peak == 2
+        assert tts.concurrency_stats() == {'max_concurrency': 2, 'in_flight': 0, 'waiting': 0, 'requests': 10}
+
+
+def test_async_waiters_do_not_use_threads():
+    """名额已满时等待的协程不占用线程池，asyncio.to_thread 仍然可以执行；名额归还后依次获得"""
+    tts = TextToSpeech(api_key="test-key", use_cache=False, max_concurrency=1)
+
+    async def scenario():
+        tts._acquire_slot()
+        waiters = [asyncio.create_task(tts._acquire_slot_async()) for _ in range(64)]
+        await asyncio.sleep(0.05)
+        assert tts.concurrency_stats()['waiting'] == 64
+        assert await asyncio.wait_for(asyncio.to_thread(lambda: "ok"), timeout=1) == "ok"
+
+        # 取消的等待不占用名额
+        waiters[0].cancel()
+        await asyncio.gather(waiters[0], return_exceptions=True)
+        for _ in range(63):
+            tts._release_slot()
+            done, _ = await asyncio.wait(waiters[1:], timeout=1, return_when=asyncio.FIRST_COMPLETED)
+            assert done
+            for task in done:
+                waiters.remove(task)
+        tts._release_slot()
+        assert tts.concurrency_stats() == {'max_concurrency': 1, 'in_flight': 0, 'waiting': 0, 'requests': 64}
+
+    asyncio.run(scenario())
+
+
+def test_task_audio_progress():
+    """同一任务的分段并发合成，每段完成时更新进度和部分结果"""
+    import app_fastapi
+
+    original_tts = app_fastapi.tts
+    with MockTTSServer(latency=DELAY) as server, tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            os.makedirs(app_fastapi.AUDIO_FOLDER)
+            app_fastapi.tts = _tts(server, cache_dir="static/audio/cache", max_concurrency=8)
+            task_id = task_manager.create_task("page.png", "page.png")
+            task_audio = app_fastapi.TaskAudio(task_id, time.time())
+
+            snapshots = []
+            start = time.time()
+            for i in range(4):
+                task_audio.submit(f"segment_{i}", f"だい{i}だん。")
+            task_audio.submit('main', "ほんぶん。")
+            while True:
+                progress = dict(task_manager.get_task(task_id)['progress'])
+                snapshots.append(progress.get('tts_done', 0))
+                if progress.get('tts_done') == 5:
+                    break
+                time.sleep(0.02)
+            audio_urls = task_audio.results()
+
+            # 5 段并发（每任务上限 TTS_STREAM_WORKERS），耗时远小于逐段合成
+            assert time.time() - start < 5 * DELAY
+            assert server.peak >= 2
+            task = task_manager.get_task(task_id)
+            assert task['progress']['tts_total'] == 5
+            assert set(task['progress']['tts_items'].values()) == {'completed'}
+            assert task['partial_result']['audio_urls'] == audio_urls
+            assert list(audio_urls) == ['segment_0', 'segment_1', 'segment_2', 'segment_3', 'main']
+            assert snapshots == sorted(snapshots)
+        finally:
+            os.chdir(cwd)
+            app_fastapi.tts = original_tts
+
+
+if __name__ == "__main__":
+    test_global_limit_sync_and_async()
+    test_async_waiters_do_not_use_threads()
+    test_task_audio_progress()
+    print("✅ 语音合成并发测试通过")
@@ -0,0 +1,132 @@
+"""
+测试按需合成语音（TTS_LAZY）
+使用本地模拟 LLM 和 TTS 服务器，验证任务在文本处理后即完成并返回占位 URL、不请求 TTS；
+某段音频第一次被请求时才合成，同一段的并发请求只合成一次，并在后台预取下一段
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+from audio_cache import AudioCache
+from task_manager import task_manager
+from tests.mock_llm_server import MockLLMServer
+from tests.mock_tts_server import MockTTSServer
+from text_processor import TextProcessor
+from text_to_speech import TextToSpeech
+
+OCR_TEXT = "あおい そら。しろい くも。きいろい はな。みどりの き。ちゃいろの つち。"
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+async def _gather_async(*coroutines):
+    return await asyncio.gather(*coroutines)
+
+
+def _gather(*coroutines):
+    return asyncio.run(_gather_async(*coroutines))
+
+
+async def _requests_with_ticker(requests):
+    """并发执行请求，同时记录事件循环在等待合成期间是否仍在运行"""
+    ticks = 0
+    requests = asyncio.gather(*requests)
+    while not requests.done():
+        ticks += 1
+        await asyncio.sleep(0.01)
+    return await requests, ticks
+
+
+def test_lazy_task_and_single_flight():
+    """任务只返回占位 URL；并发请求同一段只合成一次，并预取下一段"""
+    import app_fastapi
+
+    original = (app_fastapi.tts, app_fastapi.text_processor, app_fastapi.TTS_LAZY, app_fastapi.lazy_audio)
+    with MockTTSServer(latency=0.2) as tts_server, MockLLMServer(latency=0) as llm_server, \
+            tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            os.makedirs(app_fastapi.AUDIO_FOLDER)
+            tts = TextToSpeech(api_key="test-key", cache=AudioCache(cache_dir="static/audio/cache"))
+            tts.api_url = tts_server.url
+            processor = TextProcessor(api_key="test-key", use_cache=False, use_translation_memory=False)
+            processor.api_url = llm_server.url
+            app_fastapi.tts, app_fastapi.text_processor, app_fastapi.TTS_LAZY = tts, processor, True
+            app_fastapi.lazy_audio = lazy_audio = app_fastapi.LazyAudio(prefetch=1)
+
+            task_id = task_manager.create_task("page.png", "page.png")
+            app_fastapi.process_image_task(task_id, "page.png", ocr_result={'full_text': OCR_TEXT})
+            task = task_manager.get_task(task_id)
+            assert task['status'] == 'completed'
+            assert tts_server.requests == []
+            audio_urls = task['result']['audio_urls']
+            segments = task['result']['processed_text']['segments']
+            assert len(segments) == 3
+            assert audio_urls['segment_0'] == f'/api/task/{task_id}/audio/segment_0'
+            assert set(audio_urls) == {'main', 'segment_0', 'segment_1', 'segment_2'}
+
+            # 5 个并发请求同一段：只合成一次，返回同一个文件
+            # 等待合成时事件循环不被阻塞
+            responses, ticks = asyncio.run(_requests_with_ticker(
+                [app_fastapi.api_task_audio(task_id, 'segment_0') for _ in range(5)]))
+            assert ticks >= 5
+            assert len({response.path for response in responses}) == 1
+            assert os.path.exists(responses[0].path)
+            assert responses[0].headers['X-Audio-Url'] == f'/static/audio/{task_id}_segment_0.mp3'
+
+            # 后台预取 segment_1，不预取 segment_2
+            _wait_for(lambda: lazy_audio.stats()['inflight'] == 0 and lazy_audio.stats()['prefetched'] == 1)
+            texts = [request['input']['text'] for request in tts_server.requests]
+            assert texts == [segments[0], segments[1]]
+            stats = lazy_audio.stats()
+            assert stats['requests'] == 5 and stats['synthesized'] == 1
+            assert stats['coalesced'] + stats['ready'] == 4
+
+            # 已预取的分段直接返回；请求 segment_1 时预取的 segment_2 也不再重复合成
+            _gather(app_fastapi.api_task_audio(task_id, 'segment_1'))
+            _gather(app_fastapi.api_task_audio(task_id, 'segment_2'))
+            _wait_for(lambda: lazy_audio.stats()['inflight'] == 0)
+            assert [request['input']['text'] for request in tts_server.requests] == segments
+            stats = lazy_audio.stats()
+            assert stats['synthesized'] == 1 and stats['prefetched'] == 2
+        finally:
+            os.chdir(cwd)
+            app_fastapi.tts, app_fastapi.text_processor, app_fastapi.TTS_LAZY, app_fastapi.lazy_audio = original
+
+
+def test_unknown_audio():
+    """任务或音频不存在时返回 404"""
+    import app_fastapi
+
+    original = app_fastapi.tts
+    app_fastapi.tts = TextToSpeech(api_key="test-key", use_cache=False)
+    try:
+        for task_id, key in (("missing-task", "segment_0"),
+                             (task_manager.create_task("page.png", "page.png"), "segment_9")):
+            try:
+                _gather(app_fastapi.api_task_audio(task_id, key))
+                assert False, "应当返回 404"
+            except HTTPException as e:
+                assert e.status_code == 404
+    finally:
+        app_fastapi.tts = original
+
+
+if __name__ == "__main__":
+    test_lazy_task_and_single_flight()
+    test_unknown_audio()
+    print("✅ 按需合成测试通过")
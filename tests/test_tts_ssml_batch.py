@@ -0,0 +1,139 @@
+"""
+测试 SSML 一次合成整页音频并在本地切分
+使用本地模拟 TTS 服务器（mock_tts_server.py，确定性的音频和 <mark> 时间点），验证：
+SSML 文档和时间点请求、按时间点逐帧切分（含 bit reservoir 前置帧）、一页只请求一次 TTS、
+切出的分段写入音频缓存、正文偏移表，以及请求失败时退回逐段合成
+"""
+
+import sys
+import os
+import io
+import time
+import wave
+import tempfile
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_assembly import mp3_frames, slice_audio
+from audio_cache import AudioCache
+from tests.mock_tts_server import MockTTSServer, MP3_HEADER, SECONDS_PER_CHAR, encode, parse_ssml, part_of_frame
+from task_manager import task_manager
+from text_to_speech import TextToSpeech, build_marked_ssml
+
+PAGE = {
+    'instruction': "よんで みよう。",
+    'main_text': "あおい そら。しろい くも。きいろい はな。",
+    'segments': ["あおい そら。", "しろい くも。", "きいろい はな。"]
+}
+
+
+def _parts_in(audio: bytes) -> set:
+    frames, _ = mp3_frames(audio)
+    return {part_of_frame(frame) for frame in frames}
+
+
+def test_marked_ssml_and_timepoints():
+    """SSML 文档转义文本并插入标记和停顿；时间点请求走 v1beta1 端点"""
+    document = build_marked_ssml([("a", "ねこ & いぬ"), ("b", "<とり>")], break_ms=240)
+    assert document == '<speak><mark name="a"/>ねこ &amp; いぬ<break time="240ms"/><mark name="b"/>&lt;とり&gt;</speak>'
+    frames, timepoints = parse_ssml(document)
+    assert timepoints == {"a": 0.0, "b": round((len("ねこ&いぬ") + 10) * SECONDS_PER_CHAR, 6)}
+
+    with MockTTSServer(latency=0) as server:
+        tts = TextToSpeech(api_key="test-key", use_cache=False)
+        tts.api_url = server.url
+        result = tts.synthesize_marked([("a", "ねこ"), ("empty", " "), ("b", "いぬ")], break_ms=0)
+        assert 'error' not in result
+        assert result['timepoints'] == {"a": 0.0, "b": round(2 * SECONDS_PER_CHAR, 6)}
+        assert len(server.requests) == 1
+        assert server.requests[0]['input']['ssml'].startswith('<speak><mark name="a"/>')
+        assert server.requests[0]['enableTimePointing'] == ["SSML_MARK"]
+
+        too_long = tts.synthesize_marked([("a", "あ" * 2000)])
+        assert 'error' in too_long and len(server.requests) == 1
+
+
+def test_slice_audio():
+    """按时间点切分：MP3 对齐到帧并带上 bit reservoir 前置帧，WAV 精确到采样"""
+    frames, _ = parse_ssml(build_marked_ssml([("a", "あいう"), ("b", "えお")]))
+    audio = encode(frames, "MP3")
+    first, second = slice_audio(audio, "mp3", [(0.0, 3 * SECONDS_PER_CHAR), (3 * SECONDS_PER_CHAR, None)])
+    assert first[1:] == (0.0, round(3 * SECONDS_PER_CHAR, 3)) and _parts_in(first[0]) == {1}
+    assert second[2] == round(5 * SECONDS_PER_CHAR, 3) and _parts_in(second[0]) == {2}
+
+    # 第 4 帧借用前面 150 字节的主数据（每帧 83 字节），切分时要带上前 2 帧
+    borrowing = MP3_HEADER + bytes([150]) + b'\x00' * 8 + bytes([9]) * 83
+    audio = MP3_HEADER + b'\x00' * 92 + audio[96:288] + borrowing + audio[384:]
+    sliced, start, _ = slice_audio(audio, "mp3", [(3 * SECONDS_PER_CHAR, None)])[0]
+    assert start == round(3 * SECONDS_PER_CHAR, 3)
+    assert len(mp3_frames(sliced)[0]) == 2 + 2
+
+    wav = encode(frames, "LINEAR16")
+    (chunk, start, end), = slice_audio(wav, "wav", [(3 * SECONDS_PER_CHAR, None)])
+    with wave.open(io.BytesIO(chunk), 'rb') as reader:
+        assert reader.getnframes() == 2 * 576
+    assert (start, end) == (round(3 * SECONDS_PER_CHAR, 3), round(5 * SECONDS_PER_CHAR, 3))
+
+
+def test_task_audio_single_request():
+    """一页只请求一次 TTS；再次处理同一页全部命中缓存；请求失败时退回逐段合成"""
+    import app_fastapi
+
+    original = (app_fastapi.tts, app_fastapi.TTS_SSML_BATCH)
+    with MockTTSServer(latency=0.02) as server, tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            os.makedirs(app_fastapi.AUDIO_FOLDER)
+            tts = TextToSpeech(api_key="test-key", cache=AudioCache(cache_dir="static/audio/cache"))
+            tts.api_url = server.url
+            app_fastapi.tts, app_fastapi.TTS_SSML_BATCH = tts, True
+
+            task_id = task_manager.create_task("page.png", "page.png")
+            task_audio = app_fastapi.TaskAudio(task_id, time.time())
+            task_audio.submit_page(PAGE)
+            task_audio.submit_page(PAGE)
+            audio_urls = task_audio.results()
+            assert len(server.requests) == 1
+            assert set(audio_urls) == {'instruction', 'segment_0', 'segment_1', 'segment_2', 'main'}
+            assert audio_urls['segment_0'] == f'/static/audio/{task_id}_segment_0.mp3'
+
+            # 指导语是第 1 个标记，分段依次为 2、3、4；段尾的停顿帧为 0
+            for key, part in (('instruction', 1), ('segment_0', 2), ('segment_1', 3), ('segment_2', 4)):
+                with open(audio_urls[key].lstrip('/'), 'rb') as f:
+                    assert _parts_in(f.read()) - {0} == {part}
+            with open(audio_urls['main'].lstrip('/'), 'rb') as f:
+                assert _parts_in(f.read()) - {0} == {2, 3, 4}
+            offsets = task_audio.audio_offsets['main']
+            assert [o['key'] for o in offsets] == ['segment_0', 'segment_1', 'segment_2']
+            assert offsets[0]['start'] == 0.0 and offsets[1]['start'] == offsets[0]['end']
+            task = task_manager.get_task(task_id)
+            assert set(task['progress']['tts_items'].values()) == {'completed'}
+            assert task['partial_result']['audio_offsets']['main'] == offsets
+
+            # 同一页再次处理：各段都在缓存中，不再请求 TTS，正文由缓存的分段拼接
+            task_audio = app_fastapi.TaskAudio(task_manager.create_task("page.png", "page.png"), time.time())
+            task_audio.submit_page(PAGE)
+            assert set(task_audio.results()) == set(audio_urls)
+            assert len(server.requests) == 1
+
+            # SSML 请求失败：退回逐段合成
+            server.fail_next = 1
+            page = dict(PAGE, segments=["みどりの き。", "ちゃいろの つち。"], main_text="みどりの き。ちゃいろの つち。")
+            task_audio = app_fastapi.TaskAudio(task_manager.create_task("page.png", "page.png"), time.time())
+            task_audio.submit_page(page)
+            audio_urls = task_audio.results()
+            assert set(audio_urls) == {'instruction', 'segment_0', 'segment_1', 'main'}
+            assert len(server.requests) == 1 + 1 + 2
+            assert [o['key'] for o in task_audio.audio_offsets['main']] == ['segment_0', 'segment_1']
+        finally:
+            os.chdir(cwd)
+            app_fastapi.tts, app_fastapi.TTS_SSML_BATCH = original
+
+
+if __name__ == "__main__":
+    test_marked_ssml_and_timepoints()
+    test_slice_audio()
+    test_task_audio_single_request()
+    print("✅ SSML 整页合成测试通过")
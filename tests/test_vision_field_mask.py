@@ -0,0 +1,230 @@
+"""
+测试 Vision 部分响应字段掩码，并对响应体积和解析耗时做微基准测试
+
+pytest 运行离线测试：在本地按 fields 语法裁剪一个合成的"密集练习册"响应，
+验证裁剪后解析结果与完整响应一致。
+直接运行本脚本会打印完整/裁剪响应的字节数、json 解码和解析耗时；
+传入图片路径且配置了 GOOGLE_CLOUD_API_KEY 时，会用真实 API 对比两种请求。
+"""
+
+import sys
+import os
+import json
+import time
+import statistics
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from picture_to_text import PictureToText
+
+KANA = "なつにすなはまですいかわりをしますしろいかもめがとんでいます"
+
+
+def parse_fields(mask: str) -> dict:
+    """把 fields 掩码解析为嵌套字典（叶子为 None）"""
+    position = 0
+
+    def parse_list():
+        nonlocal position
+        tree = {}
+        while position < len(mask):
+            # 读取 a/b/c 路径
+            path = []
+            name = ""
+            while position < len(mask) and mask[position] not in ",()":
+                if mask[position] == "/":
+                    path.append(name)
+                    name = ""
+                else:
+                    name += mask[position]
+                position += 1
+            path.append(name)
+
+            subtree = None
+            if position < len(mask) and mask[position] == "(":
+                position += 1
+                subtree = parse_list()
+                position += 1  # 跳过 ')'
+
+            node = tree
+            for part in path[:-1]:
+                if node.get(part) is None:
+                    node[part] = {}
+                node = node[part]
+            node[path[-1]] = subtree
+
+            if position < len(mask) and mask[position] == ",":
+                position += 1
+                continue
+            break
+        return tree
+
+    return parse_list()
+
+
+def apply_fields(value, tree):
+    """按字段树裁剪 JSON（模拟服务端的部分响应）"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [apply_fields(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: apply_fields(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+def _box(x, y):
+    return {"vertices": [{"x": x, "y": y}, {"x": x + 40, "y": y}, {"x": x + 40, "y": y + 40}, {"x": x, "y": y + 40}]}
+
+
+def make_dense_response(blocks: int = 40, paragraphs: int = 3, words: int = 6, symbols: int = 3) -> dict:
+    """生成一个类似密集练习册页面的 DOCUMENT_TEXT_DETECTION 响应"""
+    language = [{"languageCode": "ja", "confidence": 0.98}]
+    text_parts = []
+    page_blocks = []
+    k = 0
+    for b in range(blocks):
+        block_paragraphs = []
+        for p in range(paragraphs):
+            paragraph_words = []
+            for w in range(words):
+                word_symbols = []
+                for s in range(symbols):
+                    char = KANA[k % len(KANA)]
+                    k += 1
+                    text_parts.append(char)
+                    symbol = {
+                        "property": {"detectedLanguages": language},
+                        "boundingBox": _box(s * 40, b * 50),
+                        "text": char,
+                        "confidence": 0.97
+                    }
+                    if s == symbols - 1:
+                        symbol["property"]["detectedBreak"] = {"type": "SPACE"}
+                    word_symbols.append(symbol)
+                paragraph_words.append({
+                    "property": {"detectedLanguages": language},
+                    "boundingBox": _box(w * 120, b * 50),
+                    "symbols": word_symbols,
+                    "confidence": 0.97
+                })
+            block_paragraphs.append({
+                "boundingBox": _box(0, b * 50 + p * 10),
+                "words": paragraph_words,
+                "confidence": 0.96
+            })
+        text_parts.append("\n")
+        page_blocks.append({
+            "boundingBox": _box(0, b * 50),
+            "paragraphs": block_paragraphs,
+            "blockType": "TEXT",
+            "confidence": 0.96
+        })
+
+    return {
+        "responses": [{
+            "textAnnotations": [{"locale": "ja", "description": "".join(text_parts), "boundingPoly": _box(0, 0)}],
+            "fullTextAnnotation": {
+                "pages": [{
+                    "property": {"detectedLanguages": language},
+                    "width": 2048,
+                    "height": 1536,
+                    "blocks": page_blocks,
+                    "confidence": 0.96
+                }],
+                "text": "".join(text_parts)
+            }
+        }]
+    }
+
+
+def _measure(body: bytes, ocr: PictureToText, runs: int = 20):
+    """返回 (json 解码耗时中位数, 解析耗时中位数, 解析结果)，单位毫秒"""
+    decode_times, parse_times = [], []
+    parsed = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        data = json.loads(body)
+        decode_times.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        parsed = ocr._parse_image_response(data['responses'][0], "DOCUMENT_TEXT_DETECTION")
+        parse_times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(decode_times), statistics.median(parse_times), parsed
+
+
+def test_field_mask_keeps_parsed_result():
+    """裁剪后的响应解析结果与完整响应一致，且体积显著变小"""
+    ocr = PictureToText(api_key="test-key", use_cache=False)
+    full = make_dense_response(blocks=10)
+    masked = apply_fields(full, parse_fields(ocr.RESPONSE_FIELDS["DOCUMENT_TEXT_DETECTION"]))
+
+    full_result = ocr._parse_image_response(full['responses'][0], "DOCUMENT_TEXT_DETECTION")
+    masked_result = ocr._parse_image_response(masked['responses'][0], "DOCUMENT_TEXT_DETECTION")
+
+    assert masked_result == full_result
+    assert len(json.dumps(masked)) < len(json.dumps(full)) * 0.4
+    assert 'boundingBox' not in json.dumps(masked)
+
+
+def test_text_detection_mask_keeps_bounding_poly():
+    """TEXT_DETECTION 的结果本身包含 bounding_box，掩码需要保留 boundingPoly"""
+    ocr = PictureToText(api_key="test-key", use_cache=False)
+    tree = parse_fields(ocr.RESPONSE_FIELDS["TEXT_DETECTION"])
+    assert tree == {"responses": {"error": None, "textAnnotations": {"description": None, "boundingPoly": None}}}
+
+
+def test_full_geometry_adds_bounding_box():
+    """需要完整几何信息时，文本块附加段落 bounding_box"""
+    ocr = PictureToText(api_key="test-key", use_cache=False)
+    response = make_dense_response(blocks=1)['responses'][0]
+
+    result = ocr._parse_image_response(response, "DOCUMENT_TEXT_DETECTION", full_geometry=True)
+
+    assert result['text_blocks'][0]['bounding_box']['vertices'][0] == {"x": 0, "y": 0}
+    assert ocr._response_fields("DOCUMENT_TEXT_DETECTION", full_geometry=True) is None
+
+
+def benchmark_dense_page():
+    """离线微基准：完整响应 vs 字段掩码响应"""
+    ocr = PictureToText(api_key="test-key", use_cache=False)
+    full = make_dense_response()
+    masked = apply_fields(full, parse_fields(ocr.RESPONSE_FIELDS["DOCUMENT_TEXT_DETECTION"]))
+
+    print("=" * 60)
+    print("Vision 部分响应微基准（合成密集练习册页面）")
+    print("=" * 60)
+    for label, data in (("完整响应", full), ("字段掩码", masked)):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        decode_ms, parse_ms, _ = _measure(body, ocr)
+        print(f"{label}: {len(body):>10,} 字节  json解码 {decode_ms:6.2f} ms  解析 {parse_ms:6.2f} ms")
+
+
+def benchmark_live(image_path: str):
+    """真实 API：同一图片分别请求完整响应和字段掩码响应"""
+    from http_pool import http_pool
+
+    ocr = PictureToText(use_cache=False)
+    image_request, _ = ocr._build_image_request(image_path, "DOCUMENT_TEXT_DETECTION")
+    print(f"\n📷 真实 API 对比: {image_path}")
+    for label, fields in (("完整响应", None), ("字段掩码", ocr.RESPONSE_FIELDS["DOCUMENT_TEXT_DETECTION"])):
+        start = time.perf_counter()
+        response = http_pool.post(ocr.api_url, json={"requests": [image_request]},
+                                  params={"fields": fields} if fields else None, timeout=30)
+        total_ms = (time.perf_counter() - start) * 1000
+        response.raise_for_status()
+        decode_ms, parse_ms, parsed = _measure(response.content, ocr, runs=5)
+        print(f"{label}: {len(response.content):>10,} 字节  请求 {total_ms:7.0f} ms  "
+              f"json解码 {decode_ms:6.2f} ms  解析 {parse_ms:6.2f} ms  文本块 {len(parsed['text_blocks'])}")
+
+
+if __name__ == "__main__":
+    test_field_mask_keeps_parsed_result()
+    test_text_detection_mask_keeps_bounding_poly()
+    test_full_geometry_adds_bounding_box()
+    print("✅ 字段掩码测试通过\n")
+    benchmark_dense_page()
+
+    if len(sys.argv) > 1 and os.getenv('GOOGLE_CLOUD_API_KEY'):
+        benchmark_live(sys.argv[1])
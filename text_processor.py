@@ -3,24 +3,220 @@
 """
 
 import os
+import re
 import json
-from typing import Dict, Optional
+import time
+import asyncio
+import threading
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import requests
+from http_pool import http_pool, raise_for_status
+from result_cache import ResultCache, make_cache_key
+from prompt_templates import PromptTemplate, get_prompt_template
+from structured_output import StreamingJsonParser, StructuredOutputError, parse_structured_output, response_format
+from translation_memory import TranslationMemory
+from minhash_index import MinHashIndex
+from llm_router import ModelRouter
 
 # 加载环境变量
 load_dotenv()
 
+# 去噪规则版本（参与 prompt 版本计算，规则变化后旧的 LLM 缓存自动失效）
+DENOISER_VERSION = "2"
+
+# 整行噪音：页码、教材级别/编号（4A、101-a、4A 101-a）、星级评分、分隔线
+# 只删除图形符号和分隔线，「！？」这类标点行属于正文，保留
+_NOISE_LINE_PATTERNS = [
+    re.compile(r'^[-‐―ー—\s]*\d{1,4}[-‐―ー—\s]*$'),            # 页码：12、- 12 -
+    re.compile(r'^(p|P|ページ)\.?\s*\d{1,4}$'),                    # 页码：p.12
+    re.compile(r'^(\d{1,2}[A-Za-z]{1,2}\s*)?(\d{1,4}\s*-?\s*[a-z]?)?$'),  # 级别：4A、4A 101-a、101-a
+    re.compile(r'^[☆★○●◎◇◆□■△▲▽▼※\s]+$'),                        # 星级、图形符号
+    re.compile(r'^[-‐―ー—_=~〜・.\s]{2,}$'),                      # 分隔线：-----、・・・、====
+]
+_STARS = re.compile(r'[☆★]+')
+# 汉字后面括号中的注音假名：読(よ)み → 読み
+_INLINE_FURIGANA = re.compile(r'(?<=[\u4e00-\u9fff々])[（(][\u3041-\u309f]+[)）]')
+# 带括号注音的汉字及其读音：先生(せんせい) → ("先生", "せんせい")
+_INLINE_READING = re.compile(r'([\u4e00-\u9fff々]+)[（(]([\u3041-\u309f]+)[)）]')
+_HIRAGANA_LINE = re.compile(r'^[\u3041-\u309f]+$')
+_SENTENCE_END = ('。', '！', '？', '!', '?', '」', '』', '…')
+
+
+def _is_noise_line(line: str) -> bool:
+    """判断一行是否为整行噪音（用 NFKC 统一全角数字和字母后匹配）"""
+    normalized = unicodedata.normalize('NFKC', line).strip()
+    return any(pattern.match(normalized) for pattern in _NOISE_LINE_PATTERNS)
+
+
+def denoise_ocr_text(raw_text: str) -> str:
+    """
+    在调用 LLM 之前用确定性规则清理 OCR 文本
+    
+    - 删除页码、教材级别（如 4A 101-a）、星级评分（☆☆）、图形符号行和分隔线（-----、・・・）
+    - 删除重复的注音假名：括号注音、连续重复的行，以及紧邻含汉字行之前、
+      正好是该行某个汉字读音（同一页的括号注音中出现过）的平假名行
+    - 合并断行：上一行没有以句末标点结尾时与下一行合并（分写文本用空格连接）
+    
+    Args:
+        raw_text: OCR识别的原始文本
+        
+    Returns:
+        清理后的文本；无法判断的内容原样保留，交给 LLM 处理
+    """
+    # 没有版面坐标时，只有同一页括号注音给出的读音能证明短假名行是注音（「はい」这类短行是正文）
+    readings = {}
+    for kanji, reading in _INLINE_READING.findall(raw_text):
+        readings.setdefault(reading, set()).add(kanji)
+    
+    lines = []
+    for line in raw_text.splitlines():
+        line = re.sub(r'[ \t\u3000]+', ' ', _STARS.sub('', line)).strip()
+        if not line or _is_noise_line(line):
+            continue
+        line = _INLINE_FURIGANA.sub('', line)
+        if lines and line == lines[-1]:
+            continue
+        lines.append(line)
+    
+    # 注音假名单独成行时，OCR 通常把它放在对应汉字所在行之前
+    lines = [
+        line for i, line in enumerate(lines)
+        if not (_HIRAGANA_LINE.match(line) and i + 1 < len(lines)
+                and any(kanji in lines[i + 1] for kanji in readings.get(line, ())))
+    ]
+    
+    merged = []
+    for line in lines:
+        if merged and not merged[-1].endswith(_SENTENCE_END):
+            separator = ' ' if (' ' in merged[-1] or ' ' in line) else ''
+            merged[-1] = merged[-1] + separator + line
+        else:
+            merged.append(line)
+    return '\n'.join(merged)
+
+
+# 长文本分块的切分层级：段落（空行）→ 行 → 句子 → 逗号，仍然过长时按字数硬切
+_CHUNK_SPLITTERS = [
+    re.compile(r'\n\s*\n'),
+    re.compile(r'\n'),
+    re.compile(r'(?<=[。！？!?」』…])'),
+    re.compile(r'(?<=[、，,])'),
+]
+
+
+def _split_units(text: str, level: int, size: int) -> Tuple[List[str], str]:
+    """按第 level 层规则切分，返回 (片段列表, 重新拼接时使用的分隔符)"""
+    for depth in range(level, len(_CHUNK_SPLITTERS)):
+        parts = [part.strip() for part in _CHUNK_SPLITTERS[depth].split(text) if part.strip()]
+        if len(parts) > 1:
+            if depth == 0:
+                separator = '\n\n'
+            elif depth == 1:
+                separator = '\n'
+            else:
+                separator = ' ' if ' ' in text else ''
+            return parts, separator
+    return [text[i:i + size] for i in range(0, len(text), size)], ''
+
+
+def split_text_chunks(text: str, max_chars: int, _level: int = 0) -> List[str]:
+    """
+    将长文本在段落/句子边界切分为不超过 max_chars 的块
+    
+    优先在段落（空行）处切分，其次是换行、句末标点和逗号，都不可行时才按字数硬切。
+    各块长度尽量均衡（并发处理时总耗时取决于最长的一块）。
+    
+    Args:
+        text: 要切分的文本
+        max_chars: 每块的最大字符数，<= 0 时不切分
+        
+    Returns:
+        按原文顺序排列的块列表；文本不超过 max_chars 时只有一块
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+    
+    # 按预计块数均分，避免最后剩下很短的一块
+    count = -(-len(text) // max_chars)
+    target = -(-len(text) // count)
+    
+    parts, separator = _split_units(text, _level, target)
+    chunks = []
+    current = ""
+    for part in parts:
+        pieces = split_text_chunks(part, max_chars, _level + 1) if len(part) > max_chars else [part]
+        for piece in pieces:
+            combined = len(current) + len(separator) + len(piece)
+            # 超出目标长度时，比较超出和不足的多少决定是否另起一块（不超过 max_chars）
+            if current and combined > target and (combined > max_chars or combined - target > target - len(current)):
+                chunks.append(current)
+                current = piece
+            else:
+                current = current + separator + piece if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
 class TextProcessor:
     """文本处理器，使用space.ai-builders.com的LLM API"""
     
-    def __init__(self, api_key: Optional[str] = None, model: str = "grok-4-fast"):
+    # LLM 生成参数（参与 prompt 版本计算，修改后旧缓存自动失效）
+    TEMPERATURE = 0.3  # 降低温度以获得更稳定的输出
+    # max_tokens 按输入长度估算：输出包含正文、分段（各约等于输入）和翻译，
+    # 约为输入字符数的3倍 token，再加上分节标题的余量，限制在 [MIN_TOKENS, MAX_TOKENS]
+    # （下限留出余量，避免推理型模型的思考 token 占满额度导致输出被截断）
+    OUTPUT_TOKENS_PER_CHAR = 3.0
+    OUTPUT_TOKENS_BASE = 150
+    MIN_TOKENS = int(os.getenv('LLM_MIN_TOKENS', '800'))
+    MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', '2000'))
+    
+    def __init__(self, api_key: Optional[str] = None, model: str = "grok-4-fast",
+                 fallback_models: Optional[List[str]] = None,
+                 router: Optional[ModelRouter] = None,
+                 cache: Optional[ResultCache] = None,
+                 use_cache: bool = True,
+                 denoise: Optional[bool] = None,
+                 prompt_template: Optional[str] = None,
+                 chunk_chars: Optional[int] = None,
+                 chunk_workers: Optional[int] = None,
+                 translation_memory: Optional[TranslationMemory] = None,
+                 use_translation_memory: Optional[bool] = None,
+                 fuzzy_index: Optional[MinHashIndex] = None,
+                 use_fuzzy_match: Optional[bool] = None,
+                 split_translation: Optional[bool] = None,
+                 response_format_mode: Optional[str] = None):
         """
         初始化文本处理器
         
         Args:
             api_key: Super Mind API Key，如果不提供则从环境变量读取
             model: 使用的LLM模型，默认为grok-4-fast
+            fallback_models: 备用模型（按优先级），默认读取 LLM_FALLBACK_MODELS（逗号分隔，默认为空）。
+                             当前模型超过对冲延迟仍未返回时向下一个模型发出同样的请求，失败时立即切换
+            router: 模型路由器（按 EWMA 延迟排序并给出对冲延迟），不提供则按环境变量创建
+            cache: LLM结果缓存，不提供则按环境变量创建默认缓存
+            use_cache: 是否启用LLM结果缓存
+            denoise: 调用 LLM 前是否先用规则去噪，默认读取 LLM_DENOISE（默认开启）
+            prompt_template: prompt 模板名称（见 prompt_templates.py），
+                             默认读取 LLM_PROMPT_TEMPLATE（默认 "system_first"）
+            chunk_chars: 超过该长度的文本在段落/句子边界切块并发处理，
+                         默认读取 LLM_CHUNK_CHARS（默认500），0 表示不分块
+            chunk_workers: 分块处理的最大并发数，默认读取 LLM_CHUNK_WORKERS（默认4）
+            translation_memory: 句子级翻译记忆，不提供则按环境变量创建默认实例
+            use_translation_memory: 是否启用翻译记忆，默认读取 LLM_TRANSLATION_MEMORY（默认开启）
+            fuzzy_index: 近似文本索引，不提供则创建默认索引（与 LLM 缓存保存在同一目录）
+            use_fuzzy_match: 是否复用近似文本的结果，默认读取 LLM_FUZZY_MATCH（默认关闭），需要启用 LLM 缓存
+            split_translation: 是否把日语清理/分段和中文翻译拆成两个并发请求，日语部分先返回，
+                               默认读取 LLM_SPLIT_TRANSLATION（默认关闭）
+            response_format_mode: 使用 json 模板时请求的 response_format（json_schema / json_object / none），
+                                  默认读取 LLM_RESPONSE_FORMAT（默认 "json_schema"）
         """
         # 优先使用传入的 api_key，然后尝试 SUPER_MIND_API_KEY，最后尝试 AI_BUILDER_TOKEN（部署平台注入）
         self.api_key = api_key or os.getenv('SUPER_MIND_API_KEY') or os.getenv('AI_BUILDER_TOKEN')
@@ -28,172 +224,1241 @@ class TextProcessor:
             raise ValueError("API Key未设置，请设置 SUPER_MIND_API_KEY 或 AI_BUILDER_TOKEN 环境变量")
         
         self.model = model
-        self.base_url = "https://space.ai-builders.com/backend/v1"
+        if fallback_models is None:
+            fallback_models = [m.strip() for m in os.getenv('LLM_FALLBACK_MODELS', '').split(',') if m.strip()]
+        self.fallback_models = fallback_models
+        self.router = router or ModelRouter()
+        # LLM 服务地址（OpenAI 兼容），可指向本地模拟服务器做离线基准测试
+        self.base_url = os.getenv('LLM_BASE_URL', 'https://space.ai-builders.com/backend/v1').rstrip('/')
         self.api_url = f"{self.base_url}/chat/completions"
+        self.denoise = denoise if denoise is not None else os.getenv('LLM_DENOISE', '1') == '1'
+        self.prompt_template: PromptTemplate = get_prompt_template(
+            prompt_template or os.getenv('LLM_PROMPT_TEMPLATE', 'system_first')
+        )
+        
+        # 拆分模式：日语清理/分段和中文翻译并发请求
+        if split_translation is None:
+            split_translation = os.getenv('LLM_SPLIT_TRANSLATION', '0') == '1'
+        self.split_translation = split_translation
+        self.cleanup_template: PromptTemplate = get_prompt_template('cleanup')
+        self.translate_template: PromptTemplate = get_prompt_template('translate')
+        
+        # 结构化输出（json 模板）：请求时附带 response_format，响应按 JSON 解析和校验
+        self.response_format_mode = (response_format_mode or os.getenv('LLM_RESPONSE_FORMAT', 'json_schema')).strip()
+        self.response_format = response_format(self.response_format_mode)
+        
+        # 长文本分块并发处理
+        self.chunk_chars = chunk_chars if chunk_chars is not None else int(os.getenv('LLM_CHUNK_CHARS', '500'))
+        self.chunk_workers = max(1, chunk_workers or int(os.getenv('LLM_CHUNK_WORKERS', '4')))
+        
+        # prompt 模板、生成参数、去噪规则、分块长度和拆分模式的指纹，修改后不会命中旧结果
+        self.prompt_version = make_cache_key(
+            self.prompt_template.version, self.TEMPERATURE,
+            self.OUTPUT_TOKENS_PER_CHAR, self.OUTPUT_TOKENS_BASE, self.MIN_TOKENS, self.MAX_TOKENS,
+            DENOISER_VERSION if self.denoise else "raw", self.chunk_chars,
+            f"split:{self.cleanup_template.version}:{self.translate_template.version}" if self.split_translation else "",
+            self.response_format_mode if self.prompt_template.output_format == "json" else ""
+        )[:12]
+        
+        # LLM结果缓存（按规范化文本 + 模型 + prompt 版本）
+        self.cache = None
+        if use_cache:
+            self.cache = cache or ResultCache(
+                name="LLM",
+                max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '256')),
+                cache_dir=os.getenv('LLM_CACHE_DIR', 'cache/llm') or None,
+                ttl=float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+            )
+        
+        # 近似文本索引（MinHash/LSH）：同一页重新识别的文本略有不同时复用已有结果
+        if use_fuzzy_match is None:
+            use_fuzzy_match = os.getenv('LLM_FUZZY_MATCH', '0') == '1'
+        self.fuzzy_index = None
+        if use_fuzzy_match and self.cache is not None:
+            self.fuzzy_index = fuzzy_index or MinHashIndex(
+                index_path=os.path.join(self.cache.cache_dir, 'minhash_index.jsonl') if self.cache.cache_dir else None
+            )
+        
+        # 句子级翻译记忆（已知句子在本地组装，只把未知部分交给 LLM）
+        if use_translation_memory is None:
+            use_translation_memory = os.getenv('LLM_TRANSLATION_MEMORY', '1') == '1'
+        self.translation_memory = None
+        if use_translation_memory:
+            self.translation_memory = translation_memory or TranslationMemory()
     
-    def process_ocr_text(self, raw_text: str) -> Dict[str, str]:
+    @staticmethod
+    def normalize_text(raw_text: str) -> str:
         """
-        处理OCR识别的原始文本
+        规范化OCR文本用于缓存键：NFKC（统一全角/半角）并折叠空白
         
         Args:
             raw_text: OCR识别的原始文本
             
         Returns:
-            包含处理后的日语正文和中文翻译的字典，以及指导语和分段信息
+            规范化后的文本
         """
-        import time
-        start_time = time.time()
+        return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', raw_text)).strip()
+    
+    def _template_name(self) -> str:
+        """统计中记录的 prompt 模板名称"""
+        if self.split_translation:
+            return f"{self.cleanup_template.name}+{self.translate_template.name}"
+        return self.prompt_template.name
+    
+    def _prepare_input(self, raw_text: str) -> Tuple[str, Dict]:
+        """
+        调用 LLM 前的预处理（规则去噪）
         
-        if not raw_text or not raw_text.strip():
-            return {
-                "japanese_text": "",
-                "chinese_translation": "",
-                "instruction": "",
-                "main_text": "",
-                "segments": [],
-                "error": "输入文本为空"
-            }
+        Args:
+            raw_text: OCR识别的原始文本
+            
+        Returns:
+            (发送给 LLM 的文本, 输入统计)，统计包含 input_length、denoised_length、denoise_time、
+            prompt_template、max_tokens
+        """
+        stats = {"input_length": len(raw_text), "prompt_template": self._template_name()}
+        if not self.denoise:
+            stats["max_tokens"] = self._max_tokens(raw_text)
+            return raw_text, stats
         
-        # 记录输入文本长度
-        text_length = len(raw_text)
-        print(f"[文本处理] 开始处理，输入文本长度: {text_length} 字符")
+        denoise_start = time.time()
+        text = denoise_ocr_text(raw_text)
+        stats["denoise_time"] = time.time() - denoise_start
+        if not text.strip():
+            # 全部被判定为噪音时保留原文，由 LLM 判断
+            text = raw_text
+        stats["denoised_length"] = len(text)
+        stats["max_tokens"] = self._max_tokens(text)
+        print(f"[文本处理] 规则去噪: {len(raw_text)} → {len(text)} 字符")
+        return text, stats
+    
+    def _cache_key(self, raw_text: str) -> str:
+        """生成LLM缓存键：规范化文本 + 模型 + prompt 版本"""
+        return make_cache_key(self.normalize_text(raw_text), self.model, self.prompt_version)
+    
+    def cache_stats(self) -> Dict:
+        """获取LLM结果缓存统计"""
+        if self.cache is None:
+            return {'enabled': False}
+        stats = self.cache.stats()
+        stats['enabled'] = True
+        stats['prompt_version'] = self.prompt_version
+        return stats
+    
+    def fuzzy_index_stats(self) -> Dict:
+        """获取近似文本索引统计"""
+        if self.fuzzy_index is None:
+            return {'enabled': False}
+        stats = self.fuzzy_index.stats()
+        stats['enabled'] = True
+        return stats
+    
+    def router_stats(self) -> Dict:
+        """获取各模型的延迟和对冲统计"""
+        stats = self.router.stats()
+        stats['models_configured'] = self._models()
+        return stats
+    
+    def translation_memory_stats(self) -> Dict:
+        """获取翻译记忆统计"""
+        if self.translation_memory is None:
+            return {'enabled': False}
+        stats = self.translation_memory.stats()
+        stats['enabled'] = True
+        return stats
+    
+    def _cached_result(self, raw_text: str, start_time: float,
+                       input_stats: Dict) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        查询缓存
         
-        # 构建prompt
-        prompt = f"""你是一个日语绘本专家。以下是从图片中 OCR 提取的碎片内容：{raw_text}
-
-请执行：
-
-1. 去噪：删除页码、教材级别（如 4A）、水印等无关信息。
-2. 去重：删除重复的注音假名。
-3. 合并：将断行合并为自然的句子。
-4. 识别指导语：识别出指导语（如"でてきたものは？げんきよく読みましょう。"这类教学指导），如果没有指导语则留空。
-5. 识别正文：识别出实际的故事内容。
-6. 分段：将正文按语义分成合适的段落，每段2-3句，适合单独朗读。
-
-请严格按照以下格式输出（不要添加任何其他说明）：
-
-指导语：
-[指导语内容，如果没有则留空]
-
-正文：
-[处理后的日语正文]
-
-分段：
-[段落1]
-[段落2]
-[段落3]
-...
-
-中文翻译：
-[对应的中文翻译]"""
+        Args:
+            raw_text: 发送给 LLM 的文本（去噪后）
+            start_time: 处理开始时间
+            input_stats: 输入统计（见 _prepare_input）
+            
+        Returns:
+            (缓存键, 命中的结果)；未启用缓存时缓存键为 None，未命中时结果为 None
+        """
+        if self.cache is None:
+            return None, None
+        cache_key = self._cache_key(raw_text)
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        
+        total_duration = time.time() - start_time
+        print(f"[文本处理] 命中缓存，耗时: {total_duration:.3f} 秒")
+        cached['_performance'] = {
+            "total_time": total_duration,
+            "api_time": 0.0,
+            "parse_time": 0.0,
+            **input_stats,
+            "cache_hit": True
+        }
+        return cache_key, cached
+    
+    def _fuzzy_cached_result(self, raw_text: str, start_time: float,
+                             input_stats: Dict) -> Tuple[Optional[List[int]], Optional[Dict]]:
+        """
+        精确缓存未命中时，查找近似文本（同一页重新识别）的已有结果
+        
+        Args:
+            raw_text: 发送给 LLM 的文本（去噪后）
+            start_time: 处理开始时间
+            input_stats: 输入统计（见 _prepare_input）
+            
+        Returns:
+            (文本签名, 命中的结果)；未启用或文本过短时签名为 None，未命中时结果为 None，
+            命中时 _performance 包含 fuzzy_match_score
+        """
+        if self.fuzzy_index is None:
+            return None, None
+        signature = self.fuzzy_index.signature(raw_text)
+        if signature is None:
+            return None, None
+        match = self.fuzzy_index.find(signature, raw_text, self._fuzzy_scope())
+        if match is None:
+            return signature, None
+        cached = self.cache.get(match['key'])
+        if cached is None:
+            return signature, None
+        
+        total_duration = time.time() - start_time
+        print(f"[文本处理] 命中近似文本 (相似度 {match['similarity']:.2%})，耗时: {total_duration:.3f} 秒")
+        cached['_performance'] = {
+            "total_time": total_duration,
+            "api_time": 0.0,
+            "parse_time": 0.0,
+            **input_stats,
+            "cache_hit": True,
+            "fuzzy_match_score": match['similarity']
+        }
+        return signature, cached
+    
+    def _fuzzy_scope(self) -> str:
+        """近似匹配的作用域：模型和 prompt 版本不同的结果不互相复用"""
+        return make_cache_key(self.model, self.prompt_version)[:12]
+    
+    def _index_text(self, raw_text: str, signature: Optional[List[int]], cache_key: Optional[str], result: Dict):
+        """将新写入缓存的结果登记到近似文本索引"""
+        if signature is not None and cache_key and not result.get('error'):
+            self.fuzzy_index.add(signature, cache_key, raw_text, self._fuzzy_scope())
+    
+    def _store(self, cache_key: Optional[str], result: Dict):
+        """写入缓存（出错的结果不缓存，性能数据不缓存）"""
+        if cache_key and not result.get('error'):
+            self.cache.set(cache_key, {k: v for k, v in result.items() if k != '_performance'})
+    
+    def _empty_result(self, error: str) -> Dict:
+        """返回带错误信息的空结果"""
+        return {
+            "japanese_text": "",
+            "chinese_translation": "",
+            "instruction": "",
+            "main_text": "",
+            "segments": [],
+            "error": error
+        }
+    
+    def _max_tokens(self, raw_text: str) -> int:
+        """
+        按输入长度估算 max_tokens
+        
+        Args:
+            raw_text: 发送给 LLM 的文本
+            
+        Returns:
+            max_tokens
+        """
+        estimate = int(len(raw_text) * self.OUTPUT_TOKENS_PER_CHAR) + self.OUTPUT_TOKENS_BASE
+        return max(self.MIN_TOKENS, min(self.MAX_TOKENS, estimate))
+    
+    def _prepare_request(self, raw_text: str, model: Optional[str] = None,
+                         template: Optional[PromptTemplate] = None) -> Tuple[Dict, Dict, int]:
+        """
+        构建 LLM 请求
+        
+        Args:
+            raw_text: 发送给 LLM 的文本
+            model: 请求的模型，默认为 self.model
+            template: prompt 模板，默认为 self.prompt_template
+            
+        Returns:
+            (请求头, 请求体, prompt长度)
+        """
+        template = template or self.prompt_template
+        messages = template.build_messages(raw_text)
         
-        # 构建请求
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         
         payload = {
-            "model": self.model,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": self.TEMPERATURE,
+            "max_tokens": self._max_tokens(raw_text)
+        }
+        if template.output_format == "json" and self.response_format:
+            payload["response_format"] = self.response_format
+        
+        # 记录 prompt 长度（所有消息合计）
+        prompt_length = sum(len(message['content']) for message in messages)
+        print(f"[文本处理] Prompt 长度: {prompt_length} 字符 (模板: {template.name}, "
+              f"max_tokens: {payload['max_tokens']})")
+        return headers, payload, prompt_length
+    
+    def _build_result(self, result: Dict, start_time: float, api_duration: float,
+                      input_stats: Dict, prompt_length: int,
+                      template: Optional[PromptTemplate] = None) -> Dict:
+        """
+        从 LLM 返回的 JSON 构建最终结果
+        
+        Args:
+            result: API 返回的 JSON
+            start_time: 处理开始时间
+            api_duration: API 调用耗时
+            input_stats: 输入统计（见 _prepare_input）
+            prompt_length: prompt 长度
+            template: 请求使用的 prompt 模板（决定按分节还是按 JSON 解析），默认为 self.prompt_template
+            
+        Returns:
+            process_ocr_text 的返回结构；JSON 输出修复后仍无效时返回错误结果（不把降级的分段交给 TTS）
+        """
+        template = template or self.prompt_template
+        parse_start_time = time.time()
+        
+        # 提取回复内容
+        if 'choices' in result and len(result['choices']) > 0:
+            content = result['choices'][0]['message']['content']
+            response_length = len(content)
+            print(f"[文本处理] LLM 响应长度: {response_length} 字符")
+            
+            # 解析输出
+            structured = {}
+            if template.output_format == "json":
+                try:
+                    parsed_result, repaired = parse_structured_output(content)
+                except StructuredOutputError as e:
+                    print(f"[文本处理] ❌ 结构化输出无效: {str(e)}")
+                    return self._empty_result(f"结构化输出无效: {str(e)}")
+                if repaired:
+                    print("[文本处理] 结构化输出格式有误，已在本地修复")
+                structured = {"structured_output": True, "json_repaired": repaired}
+            else:
+                parsed_result = self._parse_response(content)
+            parse_duration = time.time() - parse_start_time
+            print(f"[文本处理] 响应解析耗时: {parse_duration:.2f} 秒")
+            
+            total_duration = time.time() - start_time
+            print(f"[文本处理] 总耗时: {total_duration:.2f} 秒")
+            
+            return {
+                "japanese_text": parsed_result.get("japanese_text", ""),
+                "chinese_translation": parsed_result.get("chinese_translation", ""),
+                "instruction": parsed_result.get("instruction", ""),
+                "main_text": parsed_result.get("main_text", ""),
+                "segments": parsed_result.get("segments", []),
+                "raw_response": content,
+                "_performance": {
+                    "total_time": total_duration,
+                    "api_time": api_duration,
+                    "parse_time": parse_duration,
+                    **input_stats,
+                    "prompt_length": prompt_length,
+                    "response_length": response_length,
+                    "usage": self._usage(result),
+                    **structured,
+                    "cache_hit": False
                 }
-            ],
-            "temperature": 0.3,  # 降低温度以获得更稳定的输出
-            "max_tokens": 2000
+            }
+        
+        return self._empty_result("API返回格式异常")
+    
+    @staticmethod
+    def _usage(result: Dict) -> Optional[Dict]:
+        """
+        提取 token 用量（上游未返回时为 None）
+        
+        Returns:
+            包含 prompt_tokens、completion_tokens、cached_tokens（命中上游 prompt 缓存的 token 数）的字典
+        """
+        usage = result.get('usage')
+        if not usage:
+            return None
+        details = usage.get('prompt_tokens_details') or {}
+        return {
+            "prompt_tokens": usage.get('prompt_tokens'),
+            "completion_tokens": usage.get('completion_tokens'),
+            "cached_tokens": details.get('cached_tokens', 0)
         }
+    
+    def _error_result(self, e: Exception, start_time: float) -> Dict:
+        """
+        将请求过程中的异常转换为错误结果
         
-        # 记录 prompt 长度
-        prompt_length = len(prompt)
-        print(f"[文本处理] Prompt 长度: {prompt_length} 字符")
+        Args:
+            e: 异常
+            start_time: 处理开始时间
+            
+        Returns:
+            带 error 字段的空结果
+        """
+        total_duration = time.time() - start_time
+        if isinstance(e, requests.exceptions.Timeout):
+            print(f"[文本处理] ❌ API 请求超时，总耗时: {total_duration:.2f} 秒")
+            return self._empty_result(f"API请求超时: {str(e)}")
+        if isinstance(e, requests.exceptions.RequestException):
+            print(f"[文本处理] ❌ API 请求失败，总耗时: {total_duration:.2f} 秒，错误: {str(e)}")
+            return self._empty_result(f"API请求失败: {str(e)}")
+        print(f"[文本处理] ❌ 处理失败，总耗时: {total_duration:.2f} 秒，错误: {str(e)}")
+        return self._empty_result(f"处理失败: {str(e)}")
+    
+    def _call_model(self, model: str, raw_text: str, start_time: float, input_stats: Dict,
+                    template: Optional[PromptTemplate] = None) -> Dict:
+        """
+        调用一次指定的模型（不查询缓存），异常转换为错误结果
+        
+        Args:
+            model: 模型名称
+            raw_text: 发送给 LLM 的文本
+            start_time: 处理开始时间
+            input_stats: 输入统计（见 _prepare_input）
+            template: prompt 模板，默认为 self.prompt_template
+        
+        Returns:
+            process_ocr_text 的返回结构
+        """
+        headers, payload, prompt_length = self._prepare_request(raw_text, model, template)
         
         try:
             api_start_time = time.time()
-            print(f"[文本处理] 开始调用 LLM API (模型: {self.model})...")
-            response = requests.post(self.api_url, json=payload, headers=headers, timeout=60)
-            api_end_time = time.time()
-            api_duration = api_end_time - api_start_time
+            print(f"[文本处理] 开始调用 LLM API (模型: {model})...")
+            response = http_pool.post(self.api_url, json=payload, headers=headers, timeout=60)
+            api_duration = time.time() - api_start_time
             print(f"[文本处理] LLM API 调用完成，耗时: {api_duration:.2f} 秒")
             response.raise_for_status()
             
-            parse_start_time = time.time()
-            result = response.json()
+            return self._build_result(response.json(), start_time, api_duration, input_stats, prompt_length,
+                                      template)
+        except Exception as e:
+            return self._error_result(e, start_time)
+    
+    async def _call_model_async(self, model: str, raw_text: str, start_time: float, input_stats: Dict,
+                                template: Optional[PromptTemplate] = None) -> Dict:
+        """_call_model 的异步版本"""
+        headers, payload, prompt_length = self._prepare_request(raw_text, model, template)
+        
+        try:
+            api_start_time = time.time()
+            print(f"[文本处理] 开始调用 LLM API (模型: {model})...")
+            response = await http_pool.async_post(self.api_url, json=payload, headers=headers, timeout=60)
+            api_duration = time.time() - api_start_time
+            print(f"[文本处理] LLM API 调用完成，耗时: {api_duration:.2f} 秒")
+            raise_for_status(response)
             
-            # 提取回复内容
-            if 'choices' in result and len(result['choices']) > 0:
-                content = result['choices'][0]['message']['content']
-                response_length = len(content)
-                print(f"[文本处理] LLM 响应长度: {response_length} 字符")
-                
-                # 解析输出
-                parsed_result = self._parse_response(content)
-                parse_duration = time.time() - parse_start_time
-                print(f"[文本处理] 响应解析耗时: {parse_duration:.2f} 秒")
-                
-                total_duration = time.time() - start_time
-                print(f"[文本处理] 总耗时: {total_duration:.2f} 秒")
+            return self._build_result(response.json(), start_time, api_duration, input_stats, prompt_length,
+                                      template)
+        except Exception as e:
+            return self._error_result(e, start_time)
+    
+    def _call_model_stream(self, model: str, raw_text: str, start_time: float, input_stats: Dict,
+                           on_event: Optional[Callable[[str, Dict], None]],
+                           template: Optional[PromptTemplate] = None) -> Dict:
+        """
+        以流式方式调用一次指定的模型（不查询缓存），每个分节完成时回调
+        
+        Args:
+            model: 模型名称
+            raw_text: 发送给 LLM 的文本
+            start_time: 处理开始时间
+            input_stats: 输入统计（见 _prepare_input）
+            on_event: 回调（见 process_ocr_text_stream）
+            template: prompt 模板，默认为 self.prompt_template
+        
+        Returns:
+            process_ocr_text 的返回结构，_performance 额外包含 first_token_time 和 stream
+        """
+        headers, payload, prompt_length = self._prepare_request(raw_text, model, template)
+        payload['stream'] = True
+        if (template or self.prompt_template).output_format == "json":
+            parser = StreamingJsonParser(on_event)
+        else:
+            parser = StreamingSectionParser(on_event)
+        
+        try:
+            api_start_time = time.time()
+            first_token_time = None
+            usage = None
+            print(f"[文本处理] 开始调用 LLM API (模型: {model}, 流式)...")
+            with http_pool.post(self.api_url, json=payload, headers=headers, timeout=60, stream=True) as response:
+                response.raise_for_status()
                 
-                return {
-                    "japanese_text": parsed_result.get("japanese_text", ""),
-                    "chinese_translation": parsed_result.get("chinese_translation", ""),
-                    "instruction": parsed_result.get("instruction", ""),
-                    "main_text": parsed_result.get("main_text", ""),
-                    "segments": parsed_result.get("segments", []),
-                    "raw_response": content,
-                    "_performance": {
-                        "total_time": total_duration,
-                        "api_time": api_duration,
-                        "parse_time": parse_duration,
-                        "input_length": text_length,
-                        "prompt_length": prompt_length,
-                        "response_length": response_length
-                    }
-                }
+                if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                    # 服务端没有按流式返回时，按普通响应处理
+                    first_token_time = time.time() - api_start_time
+                    result = response.json()
+                    usage = result.get('usage')
+                    if 'choices' in result and len(result['choices']) > 0:
+                        parser.feed(result['choices'][0]['message']['content'])
+                else:
+                    for raw_line in response.iter_lines():
+                        line = raw_line.decode('utf-8').strip()
+                        if not line.startswith('data:'):
+                            continue
+                        data = line[5:].strip()
+                        if data == '[DONE]':
+                            break
+                        chunk = json.loads(data)
+                        usage = chunk.get('usage') or usage
+                        choices = chunk.get('choices') or [{}]
+                        delta = (choices[0].get('delta') or {}).get('content') or ''
+                        if delta:
+                            if first_token_time is None:
+                                first_token_time = time.time() - api_start_time
+                                print(f"[文本处理] 首个 token 到达，耗时: {first_token_time:.2f} 秒")
+                            parser.feed(delta)
+            
+            content = parser.finish()
+            api_duration = time.time() - api_start_time
+            print(f"[文本处理] LLM 流式输出完成，耗时: {api_duration:.2f} 秒")
+            if not content.strip():
+                return self._empty_result("API返回格式异常")
+            
+            result = self._build_result({'choices': [{'message': {'content': content}}], 'usage': usage},
+                                        start_time, api_duration, input_stats, prompt_length, template)
+            result['_performance']['first_token_time'] = first_token_time
+            result['_performance']['stream'] = True
+            return result
+        except Exception as e:
+            return self._error_result(e, start_time)
+    
+    def _models(self) -> List[str]:
+        """配置的模型列表：主模型 + 备用模型"""
+        return [self.model] + [m for m in self.fallback_models if m != self.model]
+    
+    @staticmethod
+    def _valid(result: Dict) -> bool:
+        """是否为有效的解析结果（没有错误且解析出了正文）"""
+        return not result.get('error') and bool(result.get('main_text') or result.get('japanese_text'))
+    
+    @staticmethod
+    def _valid_translation(result: Dict) -> bool:
+        """拆分模式的翻译请求是否返回了有效结果"""
+        return not result.get('error') and bool(result.get('chinese_translation') or
+                                                result.get('raw_response', '').strip())
+    
+    def _timed_attempt(self, attempt: Callable[[str], Dict], model: str,
+                       valid: Callable[[Dict], bool]) -> Dict:
+        """调用一个模型并把耗时计入路由器"""
+        started = time.time()
+        result = attempt(model)
+        self.router.record(model, time.time() - started, valid(result))
+        return result
+    
+    def _accept(self, result: Dict, model: str, hedged: bool, attempts: int) -> Dict:
+        """采用某个模型的结果并记录来源"""
+        self.router.record_win(model, hedged)
+        result['_performance']['model'] = model
+        result['_performance']['hedged'] = hedged
+        result['_performance']['attempts'] = attempts
+        if attempts > 1:
+            print(f"[文本处理] 采用模型 {model} 的结果 (共发出 {attempts} 个请求)")
+        return result
+    
+    def _hedged(self, attempt: Callable[[str], Dict],
+                valid: Optional[Callable[[Dict], bool]] = None) -> Dict:
+        """
+        按路由顺序调用模型，采用最先返回的有效结果
+        
+        当前模型超过对冲延迟（默认为其最近延迟的 p90）仍未返回时，向下一个模型发出同样的请求，
+        之前的请求继续等待；某个模型失败时立即换下一个模型。未被采用的请求在后台完成，只用于更新延迟统计。
+        
+        Args:
+            attempt: attempt(模型名称) 调用一次指定模型并返回结果
+            valid: 判断结果是否有效，默认为 _valid
+            
+        Returns:
+            最先返回的有效结果；全部失败时返回最后一个错误结果
+        """
+        valid = valid or self._valid
+        remaining = self.router.order(self._models())
+        if len(remaining) == 1:
+            result = self._timed_attempt(attempt, remaining[0], valid)
+            return self._accept(result, remaining[0], False, 1) if valid(result) else result
+        
+        executor = ThreadPoolExecutor(max_workers=len(remaining))
+        pending = {}
+        attempts = 0
+        hedged = False
+        last_result = None
+        
+        def launch() -> str:
+            nonlocal attempts
+            model = remaining.pop(0)
+            pending[executor.submit(self._timed_attempt, attempt, model, valid)] = model
+            attempts += 1
+            return model
+        
+        try:
+            current = launch()
+            while pending:
+                delay = self.router.hedge_delay(current) if remaining else None
+                done, _ = wait(list(pending), timeout=delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    print(f"[文本处理] 模型 {current} 超过 {delay:.1f} 秒未返回，向 {remaining[0]} 发出对冲请求")
+                    hedged = True
+                    current = launch()
+                    continue
+                for future in done:
+                    model = pending.pop(future)
+                    result = future.result()
+                    if valid(result):
+                        return self._accept(result, model, hedged, attempts)
+                    last_result = result
+                    print(f"[文本处理] 模型 {model} 没有返回有效结果: {result.get('error', '未解析出正文')}")
+                    if remaining:
+                        current = launch()
+            return last_result
+        finally:
+            executor.shutdown(wait=False)
+    
+    async def _hedged_async(self, attempt: Callable[[str], "asyncio.Future"],
+                            valid: Optional[Callable[[Dict], bool]] = None) -> Dict:
+        """_hedged 的异步版本，采用结果后取消其余仍在进行的请求"""
+        valid = valid or self._valid
+        remaining = self.router.order(self._models())
+        pending = {}
+        attempts = 0
+        hedged = False
+        last_result = None
+        
+        async def timed(model: str) -> Dict:
+            started = time.time()
+            result = await attempt(model)
+            self.router.record(model, time.time() - started, valid(result))
+            return result
+        
+        def launch() -> str:
+            nonlocal attempts
+            model = remaining.pop(0)
+            pending[asyncio.ensure_future(timed(model))] = model
+            attempts += 1
+            return model
+        
+        try:
+            current = launch()
+            while pending:
+                delay = self.router.hedge_delay(current) if remaining else None
+                done, _ = await asyncio.wait(list(pending), timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print(f"[文本处理] 模型 {current} 超过 {delay:.1f} 秒未返回，向 {remaining[0]} 发出对冲请求")
+                    hedged = True
+                    current = launch()
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    result = task.result()
+                    if valid(result):
+                        return self._accept(result, model, hedged, attempts)
+                    last_result = result
+                    print(f"[文本处理] 模型 {model} 没有返回有效结果: {result.get('error', '未解析出正文')}")
+                    if remaining:
+                        current = launch()
+            return last_result
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _call(self, raw_text: str, start_time: float, input_stats: Dict,
+              template: Optional[PromptTemplate] = None) -> Dict:
+        """
+        调用 LLM（不查询缓存），多个模型时按路由顺序对冲
+        
+        Args:
+            raw_text: 发送给 LLM 的文本
+            start_time: 处理开始时间
+            input_stats: 输入统计
+            template: prompt 模板；不指定且启用拆分模式时，日语和翻译两个请求并发
+        
+        Returns:
+            process_ocr_text 的返回结构
+        """
+        if template is None and self.split_translation:
+            return self._call_split(raw_text, start_time, input_stats)
+        return self._hedged(
+            lambda model: self._call_model(model, raw_text, start_time, input_stats, template),
+            self._valid_translation if template is self.translate_template else None
+        )
+    
+    async def _call_async(self, raw_text: str, start_time: float, input_stats: Dict,
+                          template: Optional[PromptTemplate] = None) -> Dict:
+        """_call 的异步版本"""
+        if template is None and self.split_translation:
+            japanese, translation = await asyncio.gather(
+                self._call_async(raw_text, start_time, input_stats, self.cleanup_template),
+                self._call_async(raw_text, start_time, input_stats, self.translate_template)
+            )
+            if japanese.get('error'):
+                return japanese
+            return self._merge_split(japanese, translation, start_time, japanese['_performance']['total_time'])
+        return await self._hedged_async(
+            lambda model: self._call_model_async(model, raw_text, start_time, input_stats, template),
+            self._valid_translation if template is self.translate_template else None
+        )
+    
+    def _call_stream(self, raw_text: str, start_time: float, input_stats: Dict,
+                     on_event: Optional[Callable[[str, Dict], None]],
+                     template: Optional[PromptTemplate] = None) -> Dict:
+        """
+        以流式方式调用 LLM（不查询缓存），多个模型时按路由顺序对冲
+        
+        最先输出内容的请求获得回调通道，其他请求的事件被丢弃；
+        最终采用的结果来自其他模型时，按顺序重放该结果的事件。
+        """
+        if template is None and self.split_translation:
+            return self._call_split(raw_text, start_time, input_stats, on_event, stream=True)
+        if on_event is None:
+            return self._hedged(
+                lambda model: self._call_model_stream(model, raw_text, start_time, input_stats, None, template)
+            )
+        
+        owner = []
+        lock = threading.Lock()
+        
+        def attempt(model: str) -> Dict:
+            def gate(event: str, data: Dict):
+                with lock:
+                    if not owner:
+                        owner.append(model)
+                if owner[0] == model:
+                    on_event(event, data)
+            return self._call_model_stream(model, raw_text, start_time, input_stats, gate, template)
+        
+        result = self._hedged(attempt)
+        if self._valid(result) and owner and result['_performance']['model'] != owner[0]:
+            self._replay_events(result, on_event)
+        return result
+    
+    def _call_split(self, raw_text: str, start_time: float, input_stats: Dict,
+                    on_event: Optional[Callable[[str, Dict], None]] = None,
+                    stream: bool = False) -> Dict:
+        """
+        拆分模式：日语清理/分段请求和中文翻译请求并发
+        
+        日语部分返回后立即触发 japanese_result 事件（包含 instruction、main_text、segments），
+        调用方不必等待翻译就可以发布日语结果并开始合成语音。
+        
+        Args:
+            raw_text: 发送给 LLM 的文本
+            start_time: 处理开始时间
+            input_stats: 输入统计
+            on_event: 回调；流式模式下日语请求的分节事件也通过它触发
+            stream: 日语请求是否以流式方式调用
+        
+        Returns:
+            合并后的结果，_performance 额外包含 split、japanese_time 和 translation_time
+        """
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            translation_future = executor.submit(self._call, raw_text, start_time, input_stats,
+                                                 self.translate_template)
+            if stream:
+                japanese = self._call_stream(raw_text, start_time, input_stats, on_event, self.cleanup_template)
             else:
-                return {
-                    "japanese_text": "",
-                    "chinese_translation": "",
-                    "instruction": "",
-                    "main_text": "",
-                    "segments": [],
-                    "error": "API返回格式异常"
-                }
+                japanese = self._call(raw_text, start_time, input_stats, self.cleanup_template)
+            if japanese.get('error'):
+                return japanese
+            
+            japanese_time = time.time() - start_time
+            print(f"[文本处理] 日语部分完成，耗时: {japanese_time:.2f} 秒，等待翻译...")
+            if on_event:
+                on_event('japanese_result', {
+                    'instruction': japanese['instruction'],
+                    'main_text': japanese['main_text'],
+                    'japanese_text': japanese['japanese_text'],
+                    'segments': japanese['segments']
+                })
+            translation = translation_future.result()
+        finally:
+            executor.shutdown(wait=False)
         
-        except requests.exceptions.Timeout as e:
-            total_duration = time.time() - start_time
-            print(f"[文本处理] ❌ API 请求超时，总耗时: {total_duration:.2f} 秒")
-            return {
-                "japanese_text": "",
-                "chinese_translation": "",
-                "instruction": "",
-                "main_text": "",
-                "segments": [],
-                "error": f"API请求超时: {str(e)}"
+        result = self._merge_split(japanese, translation, start_time, japanese_time)
+        if on_event and result.get('chinese_translation'):
+            on_event('chinese_translation', {'text': result['chinese_translation']})
+        return result
+    
+    def _merge_split(self, japanese: Dict, translation: Dict, start_time: float,
+                     japanese_time: float) -> Dict:
+        """
+        合并拆分模式的两个结果
+        
+        Args:
+            japanese: 日语清理/分段请求的结果
+            translation: 翻译请求的结果
+            start_time: 处理开始时间
+            japanese_time: 日语部分完成的时间（相对开始时间）
+        
+        Returns:
+            process_ocr_text 的返回结构；翻译请求失败或没有返回翻译时返回错误结果
+        """
+        if not self._valid_translation(translation):
+            return self._empty_result(f"翻译请求失败: {translation.get('error', '未返回翻译')}")
+        
+        result = dict(japanese)
+        result['chinese_translation'] = translation.get('chinese_translation') or \
+            translation.get('raw_response', '').strip()
+        result['raw_response'] = f"{japanese.get('raw_response', '')}\n\n{translation.get('raw_response', '')}"
+        
+        performance = dict(japanese['_performance'])
+        translation_performance = translation.get('_performance', {})
+        usages = [p.get('usage') for p in (performance, translation_performance) if p.get('usage')]
+        if usages:
+            performance['usage'] = {
+                field: sum(usage.get(field) or 0 for usage in usages)
+                for field in ('prompt_tokens', 'completion_tokens', 'cached_tokens')
             }
-        except requests.exceptions.RequestException as e:
-            total_duration = time.time() - start_time
-            print(f"[文本处理] ❌ API 请求失败，总耗时: {total_duration:.2f} 秒，错误: {str(e)}")
-            return {
-                "japanese_text": "",
-                "chinese_translation": "",
-                "instruction": "",
-                "main_text": "",
-                "segments": [],
-                "error": f"API请求失败: {str(e)}"
+        performance['total_time'] = time.time() - start_time
+        performance['split'] = True
+        performance['japanese_time'] = japanese_time
+        performance['translation_time'] = translation_performance.get('total_time')
+        performance['translation_model'] = translation_performance.get('model')
+        result['_performance'] = performance
+        return result
+    
+    def _plan(self, raw_text: str) -> Optional[Dict]:
+        """查询翻译记忆，返回组装计划（见 TranslationMemory.plan）；未启用或没有已知句子时为 None"""
+        if self.translation_memory is None:
+            return None
+        return self.translation_memory.plan(raw_text)
+    
+    def _learn(self, raw_text: str, result: Dict):
+        """从成功的 LLM 结果中学习句子"""
+        if self.translation_memory is not None and not result.get('error'):
+            learned = self.translation_memory.learn(raw_text, result)
+            if learned:
+                print(f"[翻译记忆] 学习了 {learned} 个句子")
+    
+    def _assemble(self, plan: Dict, llm_result: Optional[Dict], start_time: float,
+                  input_stats: Dict) -> Dict:
+        """
+        用翻译记忆中的已知句子和 LLM 处理未知部分的结果组装最终结果
+        
+        Args:
+            plan: 翻译记忆的组装计划
+            llm_result: 未知部分的处理结果，全部已知时为 None
+            start_time: 处理开始时间
+            input_stats: 整段文本的输入统计
+            
+        Returns:
+            process_ocr_text 的返回结构，_performance.translation_memory 记录复用的句子数；
+            LLM 部分失败时返回其错误结果
+        """
+        if llm_result is not None and llm_result.get('error'):
+            return llm_result
+        
+        result = self.translation_memory.assemble(plan, llm_result)
+        performance = dict(llm_result['_performance']) if llm_result else {"api_time": 0.0, "parse_time": 0.0}
+        performance.update(input_stats)
+        performance["total_time"] = time.time() - start_time
+        performance["cache_hit"] = False
+        performance["translation_memory"] = {
+            "sentences": plan['sentences'],
+            "reused": len(plan['prefix']) + len(plan['suffix']),
+            "llm_input_length": len(plan['remainder'])
+        }
+        result['_performance'] = performance
+        if llm_result is None:
+            print(f"[文本处理] 全部句子命中翻译记忆，耗时: {performance['total_time']:.3f} 秒")
+        return result
+    
+    def _split_chunks(self, raw_text: str) -> List[str]:
+        """按 chunk_chars 切分文本（未启用分块或文本较短时只有一块）"""
+        if self.chunk_chars <= 0 or len(raw_text) <= self.chunk_chars:
+            return [raw_text]
+        chunks = split_text_chunks(raw_text, self.chunk_chars)
+        print(f"[文本处理] 文本较长 ({len(raw_text)} 字符)，分为 {len(chunks)} 块并发处理 "
+              f"(每块长度: {[len(chunk) for chunk in chunks]}，并发数: {min(self.chunk_workers, len(chunks))})")
+        return chunks
+    
+    def _chunk_input_stats(self, chunk: str) -> Dict:
+        """单个分块的输入统计"""
+        return {
+            "input_length": len(chunk),
+            "prompt_template": self._template_name(),
+            "max_tokens": self._max_tokens(chunk)
+        }
+    
+    def _process_chunk(self, chunk: str,
+                       on_event: Optional[Callable[[str, Dict], None]] = None,
+                       stream: bool = False) -> Dict:
+        """
+        处理一个分块（每块单独缓存，重复出现的页面不需要重新请求）
+        
+        Args:
+            chunk: 分块文本
+            on_event: 流式回调，缓存命中时重放事件
+            stream: 是否以流式方式调用 LLM
+        
+        Returns:
+            该分块的处理结果
+        """
+        chunk_start = time.time()
+        input_stats = self._chunk_input_stats(chunk)
+        cache_key, cached = self._cached_result(chunk, chunk_start, input_stats)
+        if cached is not None:
+            if on_event:
+                self._replay_events(cached, on_event)
+            return cached
+        
+        if stream:
+            result = self._call_stream(chunk, chunk_start, input_stats, on_event)
+        else:
+            result = self._call(chunk, chunk_start, input_stats)
+        self._store(cache_key, result)
+        self._learn(chunk, result)
+        return result
+    
+    async def _process_chunk_async(self, chunk: str, semaphore: asyncio.Semaphore) -> Dict:
+        """_process_chunk 的异步版本，由 semaphore 限制并发数"""
+        async with semaphore:
+            chunk_start = time.time()
+            input_stats = self._chunk_input_stats(chunk)
+            cache_key, cached = self._cached_result(chunk, chunk_start, input_stats)
+            if cached is not None:
+                return cached
+            
+            result = await self._call_async(chunk, chunk_start, input_stats)
+            self._store(cache_key, result)
+            self._learn(chunk, result)
+            return result
+    
+    def _merge_chunk_results(self, results: List[Dict], start_time: float, api_duration: float,
+                             input_stats: Dict) -> Dict:
+        """
+        按原文顺序合并各分块的结果
+        
+        Args:
+            results: 各分块的结果（与分块顺序一致）
+            start_time: 处理开始时间
+            api_duration: 并发调用阶段的总耗时
+            input_stats: 整段文本的输入统计（见 _prepare_input）
+        
+        Returns:
+            process_ocr_text 的返回结构，_performance 额外包含 chunks、chunk_workers、
+            chunk_api_times 和 chunk_cache_hits；任意一块失败时返回带 error 的空结果
+        """
+        for index, result in enumerate(results):
+            if result.get('error'):
+                print(f"[文本处理] ❌ 第 {index + 1}/{len(results)} 块处理失败: {result['error']}")
+                return self._empty_result(f"第 {index + 1}/{len(results)} 块处理失败: {result['error']}")
+        
+        def join(field: str, separator: str) -> str:
+            return separator.join(result[field] for result in results if result.get(field))
+        
+        # 指导语通常只在第一页出现，各块重复识别出的相同指导语只保留一次
+        instructions = []
+        for result in results:
+            if result.get('instruction') and result['instruction'] not in instructions:
+                instructions.append(result['instruction'])
+        
+        performances = [result.get('_performance', {}) for result in results]
+        usages = [performance['usage'] for performance in performances if performance.get('usage')]
+        usage = None
+        if usages:
+            usage = {
+                field: sum(item.get(field) or 0 for item in usages)
+                for field in ('prompt_tokens', 'completion_tokens', 'cached_tokens')
             }
-        except Exception as e:
-            total_duration = time.time() - start_time
-            print(f"[文本处理] ❌ 处理失败，总耗时: {total_duration:.2f} 秒，错误: {str(e)}")
-            return {
-                "japanese_text": "",
-                "chinese_translation": "",
-                "instruction": "",
-                "main_text": "",
-                "segments": [],
-                "error": f"处理失败: {str(e)}"
+        
+        total_duration = time.time() - start_time
+        print(f"[文本处理] {len(results)} 块处理完成，总耗时: {total_duration:.2f} 秒")
+        return {
+            "japanese_text": join('japanese_text', '\n'),
+            "chinese_translation": join('chinese_translation', '\n'),
+            "instruction": ' '.join(instructions),
+            "main_text": join('main_text', '\n'),
+            "segments": [segment for result in results for segment in result.get('segments', [])],
+            "raw_response": join('raw_response', '\n\n'),
+            "_performance": {
+                "total_time": total_duration,
+                "api_time": api_duration,
+                "parse_time": sum(performance.get('parse_time', 0.0) for performance in performances),
+                **input_stats,
+                "prompt_length": sum(performance.get('prompt_length', 0) for performance in performances),
+                "response_length": sum(performance.get('response_length', 0) for performance in performances),
+                "usage": usage,
+                "cache_hit": False,
+                "chunks": len(results),
+                "chunk_workers": min(self.chunk_workers, len(results)),
+                "chunk_api_times": [performance.get('api_time', 0.0) for performance in performances],
+                "chunk_cache_hits": sum(1 for performance in performances if performance.get('cache_hit'))
             }
+        }
+    
+    def _process_chunks(self, chunks: List[str], start_time: float, input_stats: Dict,
+                        on_event: Optional[Callable[[str, Dict], None]] = None,
+                        stream: bool = False) -> Dict:
+        """
+        有界并发地处理各分块并按顺序合并
+        
+        流式模式下分段事件按原文顺序转发（后面的块先完成时先缓存，等前面的块完成后再触发），
+        分段序号在整段文本中连续；指导语、正文和翻译事件在合并后统一触发。
+        
+        Args:
+            chunks: 分块文本
+            start_time: 处理开始时间
+            input_stats: 整段文本的输入统计
+            on_event: 流式回调
+            stream: 是否以流式方式调用 LLM
+        
+        Returns:
+            合并后的结果
+        """
+        relay = OrderedSegmentRelay(len(chunks), on_event) if on_event else None
+        
+        def run(index: int) -> Dict:
+            try:
+                return self._process_chunk(chunks[index], relay.callback(index) if relay else None, stream)
+            finally:
+                if relay:
+                    relay.finish(index)
+        
+        api_start_time = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.chunk_workers, len(chunks))) as executor:
+            results = list(executor.map(run, range(len(chunks))))
+        api_duration = time.time() - api_start_time
+        
+        result = self._merge_chunk_results(results, start_time, api_duration, input_stats)
+        if on_event and not result.get('error'):
+            self._replay_events(result, on_event, include_segments=False)
+        if stream and not result.get('error'):
+            first_token_time = results[0].get('_performance', {}).get('first_token_time')
+            result['_performance']['first_token_time'] = first_token_time
+            result['_performance']['stream'] = True
+        return result
+    
+    def process_ocr_text(self, raw_text: str) -> Dict[str, str]:
+        """
+        处理OCR识别的原始文本
+        
+        超过 chunk_chars 的文本在段落/句子边界切块，有界并发地调用 LLM 后按顺序合并。
+        
+        Args:
+            raw_text: OCR识别的原始文本
+        
+        Returns:
+            包含处理后的日语正文和中文翻译的字典，以及指导语和分段信息
+        """
+        start_time = time.time()
+        
+        if not raw_text or not raw_text.strip():
+            return self._empty_result("输入文本为空")
+        
+        # 记录输入文本长度
+        text_length = len(raw_text)
+        print(f"[文本处理] 开始处理，输入文本长度: {text_length} 字符")
+        
+        raw_text, input_stats = self._prepare_input(raw_text)
+        cache_key, cached = self._cached_result(raw_text, start_time, input_stats)
+        if cached is not None:
+            return cached
+        signature, cached = self._fuzzy_cached_result(raw_text, start_time, input_stats)
+        if cached is not None:
+            self._store(cache_key, cached)
+            return cached
+        
+        plan = self._plan(raw_text)
+        llm_result = None
+        if plan is None or plan['remainder']:
+            llm_text = plan['remainder'] if plan else raw_text
+            chunks = self._split_chunks(llm_text)
+            if len(chunks) > 1:
+                llm_result = self._process_chunks(chunks, start_time, input_stats)
+            else:
+                llm_result = self._call(llm_text, start_time, input_stats)
+                self._learn(llm_text, llm_result)
+        
+        result = self._assemble(plan, llm_result, start_time, input_stats) if plan else llm_result
+        self._store(cache_key, result)
+        self._index_text(raw_text, signature, cache_key, result)
+        return result
+    
+    async def process_ocr_text_async(self, raw_text: str) -> Dict[str, str]:
+        """
+        process_ocr_text 的异步版本，LLM 请求不阻塞事件循环
+        
+        Args:
+            raw_text: OCR识别的原始文本
+        
+        Returns:
+            与 process_ocr_text 相同结构的字典
+        """
+        start_time = time.time()
+        
+        if not raw_text or not raw_text.strip():
+            return self._empty_result("输入文本为空")
+        
+        text_length = len(raw_text)
+        print(f"[文本处理] 开始处理，输入文本长度: {text_length} 字符")
+        
+        raw_text, input_stats = self._prepare_input(raw_text)
+        cache_key, cached = self._cached_result(raw_text, start_time, input_stats)
+        if cached is not None:
+            return cached
+        signature, cached = self._fuzzy_cached_result(raw_text, start_time, input_stats)
+        if cached is not None:
+            self._store(cache_key, cached)
+            return cached
+        
+        plan = self._plan(raw_text)
+        llm_result = None
+        if plan is None or plan['remainder']:
+            llm_text = plan['remainder'] if plan else raw_text
+            chunks = self._split_chunks(llm_text)
+            if len(chunks) > 1:
+                semaphore = asyncio.Semaphore(self.chunk_workers)
+                api_start_time = time.time()
+                results = await asyncio.gather(*(self._process_chunk_async(chunk, semaphore) for chunk in chunks))
+                llm_result = self._merge_chunk_results(list(results), start_time,
+                                                       time.time() - api_start_time, input_stats)
+            else:
+                llm_result = await self._call_async(llm_text, start_time, input_stats)
+                self._learn(llm_text, llm_result)
+        
+        result = self._assemble(plan, llm_result, start_time, input_stats) if plan else llm_result
+        self._store(cache_key, result)
+        self._index_text(raw_text, signature, cache_key, result)
+        return result
+    
+    def _replay_events(self, result: Dict, on_event: Callable[[str, Dict], None],
+                       include_segments: bool = True):
+        """对完整结果（如缓存命中）按流式解析的顺序依次触发事件"""
+        if result.get('instruction'):
+            on_event('instruction', {'text': result['instruction']})
+        if result.get('main_text'):
+            on_event('main_text', {'text': result['main_text']})
+        if include_segments:
+            for index, segment in enumerate(result.get('segments', [])):
+                on_event('segment', {'index': index, 'text': segment})
+        if result.get('chinese_translation'):
+            on_event('chinese_translation', {'text': result['chinese_translation']})
+    
+    def process_ocr_text_stream(self, raw_text: str,
+                                on_event: Optional[Callable[[str, Dict], None]] = None) -> Dict[str, str]:
+        """
+        以流式方式（stream: true）处理OCR文本，每个分节完成时立即回调
+        
+        指导语、正文、每个分段和中文翻译在各自完成时触发 on_event，
+        调用方可以在 LLM 还在输出翻译时就开始为第一个分段合成语音。
+        返回值与 process_ocr_text 相同（由完整输出重新解析，分段回调只是提前通知）。
+        长文本分块并发处理时，分段事件仍按原文顺序触发。
+        
+        Args:
+            raw_text: OCR识别的原始文本
+            on_event: 回调 on_event(事件类型, 数据)，事件类型为 instruction / main_text /
+                      segment / japanese_text / chinese_translation，数据包含 text，segment 另含 index；
+                      拆分模式下日语部分完成时另有 japanese_result（数据包含 instruction、main_text、
+                      japanese_text 和 segments），此时翻译请求仍在进行
+        
+        Returns:
+            与 process_ocr_text 相同结构的字典，_performance 额外包含 first_token_time 和 stream
+        """
+        start_time = time.time()
+        
+        if not raw_text or not raw_text.strip():
+            return self._empty_result("输入文本为空")
+        
+        text_length = len(raw_text)
+        print(f"[文本处理] 开始流式处理，输入文本长度: {text_length} 字符")
+        
+        raw_text, input_stats = self._prepare_input(raw_text)
+        cache_key, cached = self._cached_result(raw_text, start_time, input_stats)
+        if cached is None:
+            signature, cached = self._fuzzy_cached_result(raw_text, start_time, input_stats)
+            if cached is not None:
+                self._store(cache_key, cached)
+        if cached is not None:
+            if on_event:
+                self._replay_events(cached, on_event)
+            return cached
+        
+        plan = self._plan(raw_text)
+        if plan is None:
+            result = self._stream_text(raw_text, start_time, input_stats, on_event)
+            self._store(cache_key, result)
+            self._index_text(raw_text, signature, cache_key, result)
+            return result
+        
+        # 已知的开头部分立即回调，LLM 输出的分段接着编号，其余事件在组装完成后触发
+        prefix_segments = self.translation_memory.compose(plan['prefix'])['segments']
+        streamed = 0
+        
+        def forward(event: str, data: Dict):
+            nonlocal streamed
+            if event == 'segment':
+                on_event('segment', {'index': len(prefix_segments) + data['index'], 'text': data['text']})
+                streamed += 1
+        
+        if on_event:
+            for index, segment in enumerate(prefix_segments):
+                on_event('segment', {'index': index, 'text': segment})
+        llm_result = None
+        if plan['remainder']:
+            llm_result = self._stream_text(plan['remainder'], start_time, input_stats,
+                                           forward if on_event else None)
+        
+        result = self._assemble(plan, llm_result, start_time, input_stats)
+        if on_event and not result.get('error'):
+            self._replay_events(result, on_event, include_segments=False)
+            for index in range(len(prefix_segments) + streamed, len(result['segments'])):
+                on_event('segment', {'index': index, 'text': result['segments'][index]})
+        self._store(cache_key, result)
+        self._index_text(raw_text, signature, cache_key, result)
+        return result
+    
+    def _stream_text(self, raw_text: str, start_time: float, input_stats: Dict,
+                     on_event: Optional[Callable[[str, Dict], None]]) -> Dict:
+        """流式处理一段文本（较长时分块并发），并写入翻译记忆"""
+        chunks = self._split_chunks(raw_text)
+        if len(chunks) > 1:
+            return self._process_chunks(chunks, start_time, input_stats, on_event, stream=True)
+        result = self._call_stream(raw_text, start_time, input_stats, on_event)
+        self._learn(raw_text, result)
+        return result
+    
+    @staticmethod
+    def _section_header(line: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        判断一行是否为分节标题
+        
+        Args:
+            line: 去掉首尾空白的一行
+            
+        Returns:
+            (分节名称, 标题同一行冒号后的内容)；不是标题时返回 None。
+            分节名称为 instruction / main_text / segments / japanese / chinese，
+            没有冒号时内容为 None
+        """
+        def inline(line):
+            if '：' in line or ':' in line:
+                sep = '：' if '：' in line else ':'
+                return line.split(sep, 1)[1].strip()
+            return None
+        
+        if '指导语' in line:
+            return 'instruction', inline(line)
+        if '正文' in line and '分段' not in line:
+            return 'main_text', inline(line)
+        if '分段' in line:
+            return 'segments', None
+        if '日语正文' in line or '日语：' in line or '日语文本' in line:
+            return 'japanese', inline(line)
+        if '中文翻译' in line or '中文：' in line or '中文文本' in line:
+            return 'chinese', inline(line)
+        return None
     
     def _parse_response(self, content: str) -> Dict:
         """
@@ -219,36 +1484,17 @@ class TextProcessor:
             line = line.strip()
             
             # 识别各个部分
-            if '指导语' in line:
-                current_section = 'instruction'
-                if '：' in line or ':' in line:
-                    sep = '：' if '：' in line else ':'
-                    instruction = line.split(sep, 1)[1].strip()
-                continue
-            
-            if '正文' in line and '分段' not in line:
-                current_section = 'main_text'
-                if '：' in line or ':' in line:
-                    sep = '：' if '：' in line else ':'
-                    main_text = line.split(sep, 1)[1].strip()
-                continue
-            
-            if '分段' in line:
-                current_section = 'segments'
-                continue
-            
-            if '日语正文' in line or '日语：' in line or '日语文本' in line:
-                current_section = 'japanese'
-                if '：' in line or ':' in line:
-                    sep = '：' if '：' in line else ':'
-                    japanese_text = line.split(sep, 1)[1].strip()
-                continue
-            
-            if '中文翻译' in line or '中文：' in line or '中文文本' in line:
-                current_section = 'chinese'
-                if '：' in line or ':' in line:
-                    sep = '：' if '：' in line else ':'
-                    chinese_translation = line.split(sep, 1)[1].strip()
+            header = self._section_header(line)
+            if header is not None:
+                current_section, inline_text = header
+                if current_section == 'instruction' and inline_text is not None:
+                    instruction = inline_text
+                elif current_section == 'main_text' and inline_text is not None:
+                    main_text = inline_text
+                elif current_section == 'japanese' and inline_text is not None:
+                    japanese_text = inline_text
+                elif current_section == 'chinese' and inline_text is not None:
+                    chinese_translation = inline_text
                 continue
             
             # 根据当前部分添加内容
@@ -369,6 +1615,150 @@ class TextProcessor:
         return segments
 
 
+class StreamingSectionParser:
+    """
+    LLM 输出的增量解析器
+    按行接收流式文本，使用与 _parse_response 相同的分节规则，
+    每个分节结束（遇到下一个标题或输出结束）时回调一次，分段区每完成一行回调一次
+    """
+    
+    # 分节名称 → 回调事件类型
+    EVENTS = {
+        'instruction': 'instruction',
+        'main_text': 'main_text',
+        'japanese': 'japanese_text',
+        'chinese': 'chinese_translation'
+    }
+    
+    def __init__(self, on_event: Optional[Callable[[str, Dict], None]] = None):
+        """
+        初始化
+        
+        Args:
+            on_event: 回调 on_event(事件类型, 数据)
+        """
+        self.on_event = on_event
+        self.content = ""
+        self._buffer = ""
+        self._section = None
+        self._lines = []
+        self.segment_count = 0
+    
+    def _emit(self, event: str, data: Dict):
+        """触发回调，回调中的异常不影响继续接收 LLM 输出"""
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event, data)
+        except Exception as e:
+            print(f"[文本处理] 流式回调失败 ({event}): {str(e)}")
+    
+    def feed(self, chunk: str):
+        """
+        接收一段流式输出
+        
+        Args:
+            chunk: LLM 增量输出的文本
+        """
+        self.content += chunk
+        self._buffer += chunk
+        while '\n' in self._buffer:
+            line, self._buffer = self._buffer.split('\n', 1)
+            self._handle_line(line.strip())
+    
+    def finish(self) -> str:
+        """
+        输出结束：处理最后一行并关闭当前分节
+        
+        Returns:
+            完整的 LLM 输出
+        """
+        if self._buffer:
+            self._handle_line(self._buffer.strip())
+            self._buffer = ""
+        self._close_section()
+        return self.content
+    
+    def _handle_line(self, line: str):
+        """处理一行完整的输出"""
+        header = TextProcessor._section_header(line)
+        if header is not None:
+            self._close_section()
+            self._section, inline_text = header
+            self._lines = [inline_text] if inline_text else []
+            return
+        
+        if not line:
+            return
+        
+        if self._section == 'segments':
+            if not line.startswith('[') and not line.endswith(']'):
+                self._emit('segment', {'index': self.segment_count, 'text': line})
+                self.segment_count += 1
+        elif self._section in self.EVENTS:
+            self._lines.append(line)
+    
+    def _close_section(self):
+        """当前分节结束时触发对应事件"""
+        if self._section in self.EVENTS and self._lines:
+            separator = ' ' if self._section == 'instruction' else '\n'
+            self._emit(self.EVENTS[self._section], {'text': separator.join(self._lines)})
+        self._section = None
+        self._lines = []
+
+
+class OrderedSegmentRelay:
+    """
+    分块并发处理时按原文顺序转发分段事件
+    各块的分段先缓存，前面的块全部完成后才转发，转发时重新编号为整段文本中的连续序号
+    """
+    
+    def __init__(self, count: int, on_event: Callable[[str, Dict], None]):
+        """
+        初始化
+        
+        Args:
+            count: 分块数
+            on_event: 原始回调 on_event(事件类型, 数据)
+        """
+        self.on_event = on_event
+        self.lock = threading.Lock()
+        self._pending = [[] for _ in range(count)]
+        self._finished = [False] * count
+        self._current = 0
+        self._next_index = 0
+    
+    def callback(self, chunk_index: int) -> Callable[[str, Dict], None]:
+        """第 chunk_index 块使用的回调（只转发分段事件）"""
+        def on_chunk_event(event: str, data: Dict):
+            if event != 'segment':
+                return
+            with self.lock:
+                self._pending[chunk_index].append(data['text'])
+                self._flush()
+        return on_chunk_event
+    
+    def finish(self, chunk_index: int):
+        """第 chunk_index 块处理结束（无论成功与否）"""
+        with self.lock:
+            self._finished[chunk_index] = True
+            self._flush()
+    
+    def _flush(self):
+        """转发当前块已缓存的分段，当前块结束后继续转发下一块（调用方需持有锁）"""
+        while self._current < len(self._pending):
+            for text in self._pending[self._current]:
+                try:
+                    self.on_event('segment', {'index': self._next_index, 'text': text})
+                except Exception as e:
+                    print(f"[文本处理] 流式回调失败 (segment): {str(e)}")
+                self._next_index += 1
+            self._pending[self._current] = []
+            if not self._finished[self._current]:
+                break
+            self._current += 1
+
+
 def main():
     """测试函数"""
     processor = TextProcessor()
@@ -2,34 +2,93 @@
 文本转语音模块 - 使用 Google Cloud Text-to-Speech API
 将日语文本转换为音频，适合儿童绘本朗读
 支持 API Key 方式（REST API）
+支持 SSML 输入和 <mark> 时间点：多段文本放进一个 SSML 文档一次合成，再按时间点在本地切分
 """
 
 import os
 import json
 import base64
-from typing import Optional, Dict
+import asyncio
+import threading
+from collections import deque
+from typing import Optional, Dict, List, Tuple
+from xml.sax.saxutils import escape, quoteattr
 from dotenv import load_dotenv
 import requests
+from http_pool import http_pool
+from audio_cache import AudioCache
 
 # 加载环境变量
 load_dotenv()
 
+# REST API 音频编码 → 输出格式
+AUDIO_FORMATS = {
+    "MP3": "mp3",
+    "LINEAR16": "wav",
+    "OGG_OPUS": "ogg"
+}
+
+# text:synthesize 单次请求的输入上限（字节，SSML 标签也计入）
+MAX_INPUT_BYTES = 5000
+
+# 异步调用方等待全局并发名额时的重试间隔（秒）
+_ASYNC_SLOT_POLL = 0.05
+
+
+def build_marked_ssml(parts: List[Tuple[str, str]], break_ms: int = 0) -> str:
+    """
+    把多段文本放进一个 SSML 文档，每段前插入 <mark>，段间插入停顿
+    
+    Args:
+        parts: (标记名, 文本) 列表，按朗读顺序
+        break_ms: 段间停顿（毫秒），0 表示不插入
+    
+    Returns:
+        SSML 文档
+    """
+    pause = f'<break time="{break_ms}ms"/>' if break_ms > 0 else ''
+    body = pause.join(f'<mark name={quoteattr(name)}/>{escape(text.strip())}' for name, text in parts)
+    return f'<speak>{body}</speak>'
+
+
 class TextToSpeech:
     """文本转语音类，使用Google Cloud Text-to-Speech API (REST API + API Key)"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    PITCH = 2.0  # 稍微提高音调，更适合儿童
+    VOLUME_GAIN_DB = 1.0  # 稍微增加音量
+    
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[AudioCache] = None,
+                 use_cache: bool = True, max_concurrency: Optional[int] = None):
         """
         初始化文本转语音客户端
         
         Args:
             api_key: Google Cloud API Key，如果不提供则从环境变量读取
+            cache: 音频缓存，不提供则按环境变量创建默认缓存
+            use_cache: 是否启用音频缓存
+            max_concurrency: 同时进行的 TTS API 请求上限（所有任务和接口共用，按 API 配额设置），
+                             默认读取 TTS_MAX_CONCURRENCY（默认8）；命中缓存的请求不占用
         """
         self.api_key = api_key or os.getenv('GOOGLE_CLOUD_API_KEY')
         if not self.api_key:
             raise ValueError("Google Cloud API Key未设置，请检查.env文件")
         
-        # Google Cloud Text-to-Speech API REST端点
-        self.api_url = f"https://texttospeech.googleapis.com/v1/text:synthesize?key={self.api_key}"
+        # Google Cloud Text-to-Speech API REST端点（TTS_BASE_URL 可指向本地模拟服务器 tests/mock_tts_server.py）
+        base_url = os.getenv('TTS_BASE_URL', 'https://texttospeech.googleapis.com').rstrip('/')
+        self.api_url = f"{base_url}/v1/text:synthesize?key={self.api_key}"
+        
+        # 按内容寻址的音频缓存（文本 + 语音参数），重放同一段文本不再请求 API
+        self.cache = (cache or AudioCache()) if use_cache else None
+        
+        # 全局并发上限
+        self.max_concurrency = max(1, max_concurrency or int(os.getenv('TTS_MAX_CONCURRENCY', '8')))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        self._requests = 0
+        # 等待名额的协程：(事件循环, Future)，归还名额时唤醒最早的一个
+        self._async_waiters: "deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]" = deque()
     
     def synthesize_japanese(
         self, 
@@ -37,7 +96,9 @@ class TextToSpeech:
         voice_name: str = "ja-JP-Neural2-B",
         speaking_rate: float = 0.75,
         output_format: str = "mp3",
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        ssml: bool = False,
+        timepoints: bool = False
     ) -> Dict:
         """
         将日语文本转换为音频
@@ -48,6 +109,8 @@ class TextToSpeech:
             speaking_rate: 语速，0.25-4.0，默认0.75（适合儿童）
             output_format: 输出格式，'mp3' 或 'wav'，默认 'mp3'
             model: 模型类型，如 'chirp-3-hd' 用于 Chirp 3 HD 模型，None 使用默认模型
+            ssml: text 是否为 SSML 文档
+            timepoints: 是否返回 SSML <mark> 的时间点（使用 v1beta1 端点，结果不写入音频缓存）
         
         Returns:
             包含音频数据和元信息的字典:
@@ -55,13 +118,114 @@ class TextToSpeech:
             - audio_format: 音频格式
             - voice_name: 使用的语音名称
             - model: 使用的模型类型
+            - cache_hit: 是否命中音频缓存
+            - audio_url: 缓存文件的静态 URL（未启用磁盘缓存时为 None）
+            - timepoints: 标记名 → 秒数（仅 timepoints=True 时）
             - error: 错误信息（如果有）
         """
-        if not text or not text.strip():
+        request_body = self._build_request_body(text, voice_name, speaking_rate, output_format, model,
+                                                ssml, timepoints)
+        if request_body is None:
             return {
                 "audio_content": None,
                 "error": "输入文本为空"
             }
+        cached = None if timepoints else self._cached_result(request_body)
+        if cached is not None:
+            return cached
+        
+        # 发送请求
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            self._acquire_slot()
+            try:
+                response = http_pool.post(self._endpoint(timepoints), json=request_body, headers=headers, timeout=30)
+            finally:
+                self._release_slot()
+            result = self._handle_response(response, request_body, voice_name, speaking_rate, model)
+            return result if timepoints else self._store(request_body, result)
+        except requests.exceptions.RequestException as e:
+            return {
+                "audio_content": None,
+                "error": f"TTS API请求失败: {str(e)}"
+            }
+        except Exception as e:
+            return {
+                "audio_content": None,
+                "error": f"TTS API调用失败: {str(e)}"
+            }
+    
+    async def synthesize_japanese_async(
+        self,
+        text: str,
+        voice_name: str = "ja-JP-Neural2-B",
+        speaking_rate: float = 0.75,
+        output_format: str = "mp3",
+        model: Optional[str] = None,
+        ssml: bool = False,
+        timepoints: bool = False
+    ) -> Dict:
+        """
+        synthesize_japanese 的异步版本，请求不阻塞事件循环
+        
+        参数和返回值与 synthesize_japanese 相同
+        """
+        request_body = self._build_request_body(text, voice_name, speaking_rate, output_format, model,
+                                                ssml, timepoints)
+        if request_body is None:
+            return {
+                "audio_content": None,
+                "error": "输入文本为空"
+            }
+        cached = None if timepoints else self._cached_result(request_body)
+        if cached is not None:
+            return cached
+        
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        try:
+            await self._acquire_slot_async()
+            try:
+                response = await http_pool.async_post(self._endpoint(timepoints), json=request_body,
+                                                      headers=headers, timeout=30)
+            finally:
+                self._release_slot()
+            result = self._handle_response(response, request_body, voice_name, speaking_rate, model)
+            return result if timepoints else self._store(request_body, result)
+        except requests.exceptions.RequestException as e:
+            return {
+                "audio_content": None,
+                "error": f"TTS API请求失败: {str(e)}"
+            }
+        except Exception as e:
+            return {
+                "audio_content": None,
+                "error": f"TTS API调用失败: {str(e)}"
+            }
+    
+    def _build_request_body(
+        self,
+        text: str,
+        voice_name: str,
+        speaking_rate: float,
+        output_format: str,
+        model: Optional[str],
+        ssml: bool = False,
+        timepoints: bool = False
+    ) -> Optional[Dict]:
+        """
+        构建 text:synthesize 请求体
+        
+        Returns:
+            请求体字典，文本为空时返回 None
+        """
+        if not text or not text.strip():
+            return None
         
         # 设置音频编码格式（REST API 格式）
         audio_encoding_map = {
@@ -78,7 +242,7 @@ class TextToSpeech:
         # 构建请求体
         request_body = {
             "input": {
-                "text": text
+                "ssml" if ssml else "text": text
             },
             "voice": {
                 "languageCode": "ja-JP",
@@ -87,8 +251,8 @@ class TextToSpeech:
             "audioConfig": {
                 "audioEncoding": audio_encoding,
                 "speakingRate": speaking_rate,
-                "pitch": 2.0,  # 稍微提高音调，更适合儿童
-                "volumeGainDb": 1.0  # 稍微增加音量
+                "pitch": self.PITCH,
+                "volumeGainDb": self.VOLUME_GAIN_DB
             }
         }
         
@@ -96,71 +260,285 @@ class TextToSpeech:
         if model:
             request_body["audioConfig"]["model"] = model
         
-        # 发送请求
-        headers = {
-            "Content-Type": "application/json"
+        # 返回 <mark> 的时间点（仅 v1beta1 端点支持）
+        if timepoints:
+            request_body["enableTimePointing"] = ["SSML_MARK"]
+        
+        return request_body
+    
+    def _endpoint(self, timepoints: bool = False) -> str:
+        """请求地址：需要时间点时使用 v1beta1 端点"""
+        if timepoints:
+            return self.api_url.replace('/v1/text:synthesize', '/v1beta1/text:synthesize')
+        return self.api_url
+    
+    def synthesize_marked(
+        self,
+        parts: List[Tuple[str, str]],
+        voice_name: str = "ja-JP-Neural2-B",
+        speaking_rate: float = 0.75,
+        output_format: str = "mp3",
+        model: Optional[str] = None,
+        break_ms: Optional[int] = None
+    ) -> Dict:
+        """
+        把多段文本放进一个带 <mark> 的 SSML 文档，一次请求合成整条音轨
+        
+        Args:
+            parts: (标记名, 文本) 列表，按朗读顺序（空文本会被跳过）
+            break_ms: 段间停顿（毫秒），默认读取 TTS_SSML_BREAK_MS（默认400）
+            其余参数同 synthesize_japanese
+        
+        Returns:
+            synthesize_japanese 的结果，timepoints 为每段的起点（秒）；
+            文档超过 MAX_INPUT_BYTES 或缺少某段的时间点时返回 error
+        """
+        parts = [(name, text) for name, text in parts if text and text.strip()]
+        if not parts:
+            return {
+                "audio_content": None,
+                "error": "输入文本为空"
+            }
+        if break_ms is None:
+            break_ms = int(os.getenv('TTS_SSML_BREAK_MS', '400'))
+        document = build_marked_ssml(parts, break_ms)
+        if len(document.encode('utf-8')) > MAX_INPUT_BYTES:
+            return {
+                "audio_content": None,
+                "error": f"SSML 文档超过 {MAX_INPUT_BYTES} 字节"
+            }
+        
+        result = self.synthesize_japanese(document, voice_name, speaking_rate, output_format, model,
+                                          ssml=True, timepoints=True)
+        if 'error' in result:
+            return result
+        missing = [name for name, _ in parts if name not in result.get('timepoints', {})]
+        if missing:
+            return {
+                "audio_content": None,
+                "error": f"TTS 返回的时间点不完整，缺少: {', '.join(missing)}"
+            }
+        return result
+    
+    def lookup_cached(self, text: str, voice_name: str = "ja-JP-Neural2-B", speaking_rate: float = 0.75,
+                      output_format: str = "mp3", model: Optional[str] = None) -> Optional[Dict]:
+        """
+        只查询音频缓存，不请求 API
+        
+        Returns:
+            与 synthesize_japanese 相同结构的字典，未启用缓存或未命中时返回 None
+        """
+        request_body = self._build_request_body(text, voice_name, speaking_rate, output_format, model)
+        if request_body is None:
+            return None
+        return self._cached_result(request_body)
+    
+    def cache_audio(self, text: str, audio_content: bytes, voice_name: str = "ja-JP-Neural2-B",
+                    speaking_rate: float = 0.75, output_format: str = "mp3",
+                    model: Optional[str] = None) -> Dict:
+        """
+        把本地得到的音频（如从 SSML 整条音轨切出的分段）按文本和语音参数写入音频缓存
+        
+        Returns:
+            与 synthesize_japanese 相同结构的字典（cache_hit 为 False）
+        """
+        request_body = self._build_request_body(text, voice_name, speaking_rate, output_format, model)
+        result = {
+            "audio_content": audio_content,
+            "audio_format": AUDIO_FORMATS.get(request_body["audioConfig"]["audioEncoding"], "mp3"),
+            "voice_name": voice_name,
+            "speaking_rate": speaking_rate,
+            "model": model or "default"
         }
+        return self._store(request_body, result)
+    
+    def _acquire_slot(self):
+        """等待一个全局并发名额"""
+        with self._stats_lock:
+            self._waiting += 1
+        self._slots.acquire()
+        with self._stats_lock:
+            self._waiting -= 1
+            self._in_flight += 1
+            self._requests += 1
+    
+    async def _acquire_slot_async(self):
+        """
+        在事件循环中等待全局并发名额：不阻塞事件循环，也不占用线程池中的线程
+        （默认线程池还要运行 asyncio.to_thread 的任务）
         
+        名额用非阻塞方式获取，拿不到时等待归还名额的通知；名额也可能被同步调用方先拿走，
+        所以同时每隔 _ASYNC_SLOT_POLL 秒重试一次。等待期间被取消时不占用名额
+        """
+        loop = asyncio.get_running_loop()
+        with self._stats_lock:
+            self._waiting += 1
         try:
-            response = requests.post(self.api_url, json=request_body, headers=headers, timeout=30)
-            
-            # 如果状态码不是 200，尝试解析错误响应
-            if response.status_code != 200:
+            while not self._slots.acquire(blocking=False):
+                waiter = loop.create_future()
+                with self._stats_lock:
+                    self._async_waiters.append((loop, waiter))
                 try:
-                    error_data = response.json()
-                    error_message = error_data.get('error', {}).get('message', f'HTTP {response.status_code}')
-                    error_details = error_data.get('error', {}).get('details', [])
-                    return {
-                        "audio_content": None,
-                        "error": f"TTS API错误 ({response.status_code}): {error_message}",
-                        "error_details": str(error_details) if error_details else None,
-                        "request_body": request_body  # 用于调试
-                    }
-                except:
-                    return {
-                        "audio_content": None,
-                        "error": f"TTS API请求失败: HTTP {response.status_code} - {response.text[:200]}",
-                        "request_body": request_body  # 用于调试
-                    }
-            
-            result = response.json()
-            
-            # 检查是否有错误
-            if 'error' in result:
+                    await asyncio.wait({waiter}, timeout=_ASYNC_SLOT_POLL)
+                finally:
+                    with self._stats_lock:
+                        if (loop, waiter) in self._async_waiters:
+                            self._async_waiters.remove((loop, waiter))
+        finally:
+            with self._stats_lock:
+                self._waiting -= 1
+        with self._stats_lock:
+            self._in_flight += 1
+            self._requests += 1
+    
+    def _release_slot(self):
+        """归还全局并发名额，并唤醒最早等待的协程"""
+        with self._stats_lock:
+            self._in_flight -= 1
+            waiter = self._async_waiters.popleft() if self._async_waiters else None
+        self._slots.release()
+        if waiter is not None:
+            loop, future = waiter
+            try:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+    
+    def concurrency_stats(self) -> Dict:
+        """全局并发统计：上限、进行中和排队中的 API 请求数"""
+        with self._stats_lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'requests': self._requests
+            }
+    
+    def _cache_key(self, request_body: Dict) -> str:
+        """由请求体生成音频缓存键（文本、语音、语速、音调、音量、模型、编码）"""
+        config = request_body["audioConfig"]
+        text = request_body["input"].get("text")
+        if text is None:
+            text = "ssml:" + request_body["input"]["ssml"]
+        return self.cache.key(
+            text, request_body["voice"]["name"], config["speakingRate"],
+            config["pitch"], config["volumeGainDb"], config.get("model"),
+            AUDIO_FORMATS.get(config["audioEncoding"], "mp3")
+        )
+    
+    def _cached_result(self, request_body: Dict) -> Optional[Dict]:
+        """
+        查询音频缓存
+        
+        Returns:
+            与 synthesize_japanese 相同结构的字典，未启用缓存或未命中时返回 None
+        """
+        if self.cache is None:
+            return None
+        audio_format = AUDIO_FORMATS.get(request_body["audioConfig"]["audioEncoding"], "mp3")
+        key = self._cache_key(request_body)
+        audio_content = self.cache.get(key, audio_format)
+        if audio_content is None:
+            return None
+        url = self.cache.url(key, audio_format)
+        return {
+            "audio_content": audio_content,
+            "audio_format": audio_format,
+            "voice_name": request_body["voice"]["name"],
+            "speaking_rate": request_body["audioConfig"]["speakingRate"],
+            "model": request_body["audioConfig"].get("model") or "default",
+            "cache_key": key,
+            "cache_hit": True,
+            # 只命中内存层时磁盘文件可能已被删除
+            "audio_url": url if url and os.path.exists(self.cache.path(key, audio_format)) else None
+        }
+    
+    def _store(self, request_body: Dict, result: Dict) -> Dict:
+        """合成成功时写入音频缓存，并在结果中记录缓存键和静态 URL"""
+        result["cache_hit"] = False
+        result["audio_url"] = None
+        if self.cache is None or result.get("error"):
+            return result
+        key = self._cache_key(request_body)
+        result["cache_key"] = key
+        result["audio_url"] = self.cache.set(key, result["audio_format"], result["audio_content"])
+        return result
+    
+    def cache_stats(self) -> Dict:
+        """获取音频缓存统计"""
+        if self.cache is None:
+            return {'enabled': False}
+        stats = self.cache.stats()
+        stats['enabled'] = True
+        return stats
+    
+    def _handle_response(
+        self,
+        response,
+        request_body: Dict,
+        voice_name: str,
+        speaking_rate: float,
+        model: Optional[str]
+    ) -> Dict:
+        """
+        解析 text:synthesize 响应（requests 和 httpx 的响应均可）
+        
+        Returns:
+            与 synthesize_japanese 相同结构的字典
+        """
+        # 如果状态码不是 200，尝试解析错误响应
+        if response.status_code != 200:
+            try:
+                error_data = response.json()
+                error_message = error_data.get('error', {}).get('message', f'HTTP {response.status_code}')
+                error_details = error_data.get('error', {}).get('details', [])
                 return {
                     "audio_content": None,
-                    "error": result['error'].get('message', '未知错误')
+                    "error": f"TTS API错误 ({response.status_code}): {error_message}",
+                    "error_details": str(error_details) if error_details else None,
+                    "request_body": request_body  # 用于调试
                 }
-            
-            # 解码 base64 音频数据
-            audio_content_base64 = result.get('audioContent', '')
-            if not audio_content_base64:
+            except:
                 return {
                     "audio_content": None,
-                    "error": "API返回中没有音频数据"
+                    "error": f"TTS API请求失败: HTTP {response.status_code} - {response.text[:200]}",
+                    "request_body": request_body  # 用于调试
                 }
-            
-            # 解码 base64 字符串为二进制数据
-            audio_content = base64.b64decode(audio_content_base64)
-            
-            return {
-                "audio_content": audio_content,
-                "audio_format": output_format.lower(),
-                "voice_name": voice_name,
-                "speaking_rate": speaking_rate,
-                "model": model or "default"
-            }
         
-        except requests.exceptions.RequestException as e:
+        result = response.json()
+        
+        # 检查是否有错误
+        if 'error' in result:
             return {
                 "audio_content": None,
-                "error": f"TTS API请求失败: {str(e)}"
+                "error": result['error'].get('message', '未知错误')
             }
-        except Exception as e:
+        
+        # 解码 base64 音频数据
+        audio_content_base64 = result.get('audioContent', '')
+        if not audio_content_base64:
             return {
                 "audio_content": None,
-                "error": f"TTS API调用失败: {str(e)}"
+                "error": "API返回中没有音频数据"
+            }
+        
+        # 解码 base64 字符串为二进制数据
+        audio_content = base64.b64decode(audio_content_base64)
+        
+        output = {
+            "audio_content": audio_content,
+            "audio_format": AUDIO_FORMATS.get(request_body["audioConfig"]["audioEncoding"], "mp3"),
+            "voice_name": voice_name,
+            "speaking_rate": speaking_rate,
+            "model": model or "default"
+        }
+        if request_body.get("enableTimePointing"):
+            output["timepoints"] = {
+                point.get('markName'): float(point.get('timeSeconds', 0.0))
+                for point in result.get('timepoints', [])
             }
+        return output
     
     def save_audio(self, audio_content: bytes, output_path: str) -> bool:
         """
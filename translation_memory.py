@@ -0,0 +1,257 @@
+"""
+句子级翻译记忆模块 - 已经见过的句子不再请求 LLM
+- 从成功的文本处理结果中学习：规范化的日语句子 → 清理后的句子、中文翻译、是否为指导语
+- 新页面的句子全部已知时直接在本地组装结果；只有部分已知时，只把未知的部分交给 LLM
+- 条目保存在 ResultCache（内存 LRU + 磁盘 JSON）中，重启后仍然有效
+"""
+
+import os
+import re
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+from result_cache import ResultCache, make_cache_key
+
+# 条目格式或句子切分规则的版本，修改后旧条目自动失效
+TM_VERSION = "1"
+
+# 一个句子：到句末标点（及其后的右引号/括号）或换行为止
+_SENTENCE = re.compile(r'[^。！？!?\n]+(?:[。！？!?]+[」』”’）)]*)?|[。！？!?]+[」』”’）)]*')
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    按句末标点和换行切分句子（日语、中文通用）
+
+    Args:
+        text: 要切分的文本
+
+    Returns:
+        去掉首尾空白后的非空句子列表
+    """
+    if not text:
+        return []
+    return [sentence.strip() for sentence in _SENTENCE.findall(text) if sentence.strip()]
+
+
+def normalize_sentence(sentence: str) -> str:
+    """规范化句子用于查找：NFKC 并去掉所有空白（分写和不分写的同一句视为相同）"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', sentence))
+
+
+def _similar(a: str, b: str, threshold: float = 0.6) -> bool:
+    """OCR 原句与 LLM 清理后的句子是否对应（清理只删除少量字符，大部分应当相同）"""
+    return SequenceMatcher(None, normalize_sentence(a), normalize_sentence(b)).ratio() >= threshold
+
+
+def group_segments(sentences: List[str], sentences_per_segment: int = 2) -> List[str]:
+    """
+    将句子按每段 sentences_per_segment 句组合成朗读分段
+
+    Args:
+        sentences: 句子列表
+        sentences_per_segment: 每段的句子数
+
+    Returns:
+        分段列表（分写文本用空格连接）
+    """
+    segments = []
+    for i in range(0, len(sentences), sentences_per_segment):
+        group = sentences[i:i + sentences_per_segment]
+        separator = ' ' if any(' ' in sentence for sentence in group) else ''
+        segments.append(separator.join(group))
+    return segments
+
+
+class TranslationMemory:
+    """句子级翻译记忆"""
+
+    def __init__(self, cache: Optional[ResultCache] = None,
+                 cache_dir: Optional[str] = None,
+                 max_entries: Optional[int] = None):
+        """
+        初始化翻译记忆
+
+        Args:
+            cache: 条目存储，不提供则按环境变量创建
+            cache_dir: 磁盘目录，默认读取 TM_DIR（默认 cache/tm），为空字符串时只保存在内存中
+            max_entries: 内存层最多保留的句子数，默认读取 TM_MAX_ENTRIES（默认4096）
+        """
+        if cache_dir is None:
+            cache_dir = os.getenv('TM_DIR', 'cache/tm')
+        self.cache = cache or ResultCache(
+            name="TM",
+            max_entries=max_entries or int(os.getenv('TM_MAX_ENTRIES', '4096')),
+            cache_dir=cache_dir or None
+        )
+        self.lock = threading.Lock()
+        self._stats = {
+            'lookups': 0,
+            'full_hits': 0,
+            'partial_hits': 0,
+            'sentences_reused': 0,
+            'pages_learned': 0,
+            'sentences_learned': 0,
+            'pages_skipped': 0
+        }
+
+    def _count(self, **increments):
+        """累加统计计数"""
+        with self.lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def _key(self, sentence: str) -> str:
+        return make_cache_key(TM_VERSION, normalize_sentence(sentence))
+
+    def get(self, sentence: str) -> Optional[Dict]:
+        """
+        查询一个句子
+
+        Returns:
+            包含 text（清理后的句子）、translation、role（instruction / main）的字典；未知时返回 None
+        """
+        return self.cache.get(self._key(sentence))
+
+    def plan(self, text: str) -> Optional[Dict]:
+        """
+        查询页面中的已知句子，规划哪些部分需要交给 LLM
+
+        首尾连续的已知句子在本地组装，从第一个未知句子到最后一个未知句子之间的部分
+        （包括夹在中间的已知句子，以保证顺序）交给 LLM。
+
+        Args:
+            text: 发送给 LLM 之前的文本（去噪后）
+
+        Returns:
+            包含 prefix、suffix（已知条目列表）、remainder（需要 LLM 处理的文本，全部已知时为空）、
+            sentences（句子总数）的字典；没有可复用的句子时返回 None
+        """
+        sentences = split_sentences(text)
+        if not sentences:
+            return None
+        entries = [self.get(sentence) for sentence in sentences]
+
+        unknown = [i for i, entry in enumerate(entries) if entry is None]
+        if not unknown:
+            first, last = len(entries), len(entries) - 1
+        else:
+            first, last = unknown[0], unknown[-1]
+        prefix, suffix = entries[:first], entries[last + 1:]
+        if not prefix and not suffix:
+            self._count(lookups=1)
+            return None
+
+        self._count(lookups=1, partial_hits=1 if unknown else 0, full_hits=0 if unknown else 1,
+                    sentences_reused=len(prefix) + len(suffix))
+        remainder = '\n'.join(sentences[first:last + 1])
+        print(f"[翻译记忆] {len(sentences)} 句中 {len(prefix) + len(suffix)} 句已知"
+              f"{'，全部在本地组装' if not unknown else f'，{last - first + 1} 句交给 LLM'}")
+        return {
+            'prefix': prefix,
+            'suffix': suffix,
+            'remainder': remainder,
+            'sentences': len(sentences)
+        }
+
+    def learn(self, text: str, result: Dict) -> int:
+        """
+        从成功的文本处理结果中学习句子
+
+        输入句子按顺序与 LLM 识别出的指导语句子和正文句子一一对应，正文句子再与翻译句子一一对应；
+        句数对不上或内容差异过大（LLM 合并/拆分了句子）时不学习。
+
+        Args:
+            text: 发送给 LLM 的文本
+            result: 文本处理结果
+
+        Returns:
+            学到的句子数
+        """
+        if result.get('error'):
+            return 0
+        inputs = split_sentences(text)
+        instructions = split_sentences(result.get('instruction', ''))
+        main = split_sentences(result.get('main_text', ''))
+        translations = split_sentences(result.get('chinese_translation', ''))
+        if not inputs or not main or len(inputs) != len(instructions) + len(main) \
+                or len(translations) != len(main):
+            self._count(pages_skipped=1)
+            return 0
+
+        entries = [{'text': s, 'translation': '', 'role': 'instruction'} for s in instructions] + \
+                  [{'text': s, 'translation': t, 'role': 'main'} for s, t in zip(main, translations)]
+        # 指导语通常在页面开头，也可能在末尾
+        orders = [entries]
+        if instructions:
+            orders.append(entries[len(instructions):] + entries[:len(instructions)])
+        for order in orders:
+            if all(_similar(source, entry['text']) for source, entry in zip(inputs, order)):
+                for source, entry in zip(inputs, order):
+                    self.cache.set(self._key(source), entry)
+                self._count(pages_learned=1, sentences_learned=len(order))
+                return len(order)
+
+        self._count(pages_skipped=1)
+        return 0
+
+    @staticmethod
+    def compose(entries: List[Dict]) -> Dict:
+        """
+        由已知条目组装一部分结果
+
+        Args:
+            entries: 按原文顺序排列的条目
+
+        Returns:
+            包含 instruction、main_text、segments、chinese_translation 的字典
+        """
+        main = [entry for entry in entries if entry['role'] == 'main']
+        return {
+            'instruction': ' '.join(entry['text'] for entry in entries if entry['role'] == 'instruction'),
+            'main_text': '\n'.join(entry['text'] for entry in main),
+            'segments': group_segments([entry['text'] for entry in main]),
+            'chinese_translation': '\n'.join(entry['translation'] for entry in main)
+        }
+
+    def assemble(self, plan: Dict, llm_result: Optional[Dict] = None) -> Dict:
+        """
+        按原文顺序组装结果：已知的开头部分 + LLM 处理的中间部分 + 已知的结尾部分
+
+        Args:
+            plan: plan() 的返回值
+            llm_result: 中间部分的处理结果，全部已知时为 None
+
+        Returns:
+            包含 instruction、main_text、segments、japanese_text、chinese_translation、raw_response 的字典
+        """
+        parts = [self.compose(plan['prefix'])]
+        if llm_result is not None:
+            parts.append({
+                'instruction': llm_result.get('instruction', ''),
+                'main_text': llm_result.get('main_text', '') or llm_result.get('japanese_text', ''),
+                'segments': llm_result.get('segments', []),
+                'chinese_translation': llm_result.get('chinese_translation', '')
+            })
+        parts.append(self.compose(plan['suffix']))
+
+        def join(field: str, separator: str) -> str:
+            return separator.join(p[field] for p in parts if p[field])
+
+        main_text = join('main_text', '\n')
+        return {
+            'instruction': join('instruction', ' '),
+            'main_text': main_text,
+            'segments': [segment for p in parts for segment in p['segments']],
+            'japanese_text': main_text,
+            'chinese_translation': join('chinese_translation', '\n'),
+            'raw_response': llm_result.get('raw_response', '') if llm_result else ''
+        }
+
+    def stats(self) -> Dict:
+        """翻译记忆统计"""
+        with self.lock:
+            stats = dict(self._stats)
+        stats['store'] = self.cache.stats()
+        return stats